@@ -0,0 +1,128 @@
+"""Index user_events lookups and partition the table by month
+
+Adds the composite indexes behind the content path, (user_id, timestamp DESC),
+and the anonymous session path, (session_id, timestamp).
+
+On PostgreSQL the table is also rebuilt as RANGE ("timestamp") partitioned,
+one partition per month, so app.db.partitions can drop expired months instead
+of deleting rows. The rebuild copies every row, so run it in a maintenance
+window. The primary key becomes (id, timestamp) because a partitioned table's
+unique constraints must include the partition key. Other databases only get
+the indexes.
+
+The baseline schema is the one created by app.db.create_tables.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17 09:00:00
+
+"""
+from datetime import date
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.core.config import settings
+from app.db.partitions import add_months, ensure_partitions, month_start
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = 'id, user_id, event_type, product_id, session_id, "timestamp", metadata'
+
+
+LOOKUP_INDEXES = ("ix_user_events_user_id_timestamp", "ix_user_events_session_id_timestamp")
+
+
+def _create_lookup_indexes() -> None:
+    # Databases created by create_tables after this revision already have them
+    existing = {index["name"] for index in sa.inspect(op.get_bind()).get_indexes("user_events")}
+    if "ix_user_events_user_id_timestamp" not in existing:
+        op.create_index("ix_user_events_user_id_timestamp", "user_events", ["user_id", sa.text('"timestamp" DESC')])
+    if "ix_user_events_session_id_timestamp" not in existing:
+        op.create_index("ix_user_events_session_id_timestamp", "user_events", ["session_id", "timestamp"])
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        _create_lookup_indexes()
+        return
+
+    # Move the old table and its index names out of the way; the id sequence is kept
+    op.execute("ALTER TABLE user_events RENAME TO user_events_unpartitioned")
+    op.execute("ALTER INDEX user_events_pkey RENAME TO user_events_unpartitioned_pkey")
+    for name in ("ix_user_events_id",) + LOOKUP_INDEXES:
+        op.execute(f"ALTER INDEX IF EXISTS {name} RENAME TO {name.replace('user_events', 'user_events_unpartitioned', 1)}")
+    op.execute("ALTER SEQUENCE user_events_id_seq OWNED BY NONE")
+
+    op.execute("""
+        CREATE TABLE user_events (
+            id INTEGER NOT NULL DEFAULT nextval('user_events_id_seq'),
+            user_id INTEGER NOT NULL REFERENCES users (id),
+            event_type VARCHAR NOT NULL,
+            product_id INTEGER REFERENCES products (id),
+            session_id VARCHAR NOT NULL,
+            "timestamp" TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now(),
+            metadata JSON,
+            PRIMARY KEY (id, "timestamp")
+        ) PARTITION BY RANGE ("timestamp")
+    """)
+
+    # Partitions for every month that has data, through EVENT_PARTITIONS_AHEAD months from now
+    first, last = bind.execute(sa.text(
+        'SELECT min("timestamp"), max("timestamp") FROM user_events_unpartitioned'
+    )).one()
+    this_month = month_start(date.today())
+    first = month_start(first.date()) if first else this_month
+    last = max(month_start(last.date()) if last else this_month, add_months(this_month, settings.EVENT_PARTITIONS_AHEAD))
+    ensure_partitions(bind, first, last)
+
+    op.execute(
+        f"INSERT INTO user_events ({COLUMNS}) "
+        f"SELECT id, user_id, event_type, product_id, session_id, COALESCE(\"timestamp\", now()), metadata "
+        f"FROM user_events_unpartitioned"
+    )
+
+    # Indexes on the parent are created on every partition, including future ones
+    op.create_index("ix_user_events_id", "user_events", ["id"])
+    _create_lookup_indexes()
+    op.execute("ALTER SEQUENCE user_events_id_seq OWNED BY user_events.id")
+    op.execute("DROP TABLE user_events_unpartitioned")
+    op.execute("ANALYZE user_events")
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        op.drop_index("ix_user_events_session_id_timestamp", table_name="user_events")
+        op.drop_index("ix_user_events_user_id_timestamp", table_name="user_events")
+        return
+
+    op.execute("ALTER TABLE user_events RENAME TO user_events_partitioned")
+    op.execute("ALTER INDEX user_events_pkey RENAME TO user_events_partitioned_pkey")
+    for name in ("ix_user_events_id",) + LOOKUP_INDEXES:
+        op.execute(f"ALTER INDEX {name} RENAME TO {name.replace('user_events', 'user_events_partitioned', 1)}")
+    op.execute("ALTER SEQUENCE user_events_id_seq OWNED BY NONE")
+
+    op.execute("""
+        CREATE TABLE user_events (
+            id INTEGER NOT NULL DEFAULT nextval('user_events_id_seq') PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users (id),
+            event_type VARCHAR NOT NULL,
+            product_id INTEGER REFERENCES products (id),
+            session_id VARCHAR NOT NULL,
+            "timestamp" TIMESTAMP WITHOUT TIME ZONE DEFAULT now(),
+            metadata JSON
+        )
+    """)
+    op.execute(f"INSERT INTO user_events ({COLUMNS}) SELECT {COLUMNS} FROM user_events_partitioned")
+    op.create_index("ix_user_events_id", "user_events", ["id"])
+    op.execute("ALTER SEQUENCE user_events_id_seq OWNED BY user_events.id")
+    # Dropping the parent drops every partition
+    op.execute("DROP TABLE user_events_partitioned")
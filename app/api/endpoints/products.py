@@ -5,6 +5,8 @@ from app.db.session import get_db
 from app.schemas.product import Product, ProductCreate, ProductUpdate
 from app.crud import product as crud_product
 from app.core.auth import get_current_user
+from app.ml.recommender import get_trending_products as trending_products
+from app.services.catalog import product_catalog
 
 router = APIRouter()
 
@@ -44,7 +46,9 @@ def create_product(
     """
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Not authorized")
-    return crud_product.create_product(db=db, product=product)
+    db_product = crud_product.create_product(db=db, product=product)
+    product_catalog.invalidate()
+    return db_product
 
 @router.put("/{product_id}", response_model=Product)
 def update_product(
@@ -61,7 +65,9 @@ def update_product(
     db_product = crud_product.get_product(db, product_id=product_id)
     if db_product is None:
         raise HTTPException(status_code=404, detail="Product not found")
-    return crud_product.update_product(db=db, product_id=product_id, product=product)
+    db_product = crud_product.update_product(db=db, product_id=product_id, product=product)
+    product_catalog.invalidate()
+    return db_product
 
 @router.delete("/{product_id}")
 def delete_product(
@@ -78,14 +84,16 @@ def delete_product(
     if db_product is None:
         raise HTTPException(status_code=404, detail="Product not found")
     crud_product.delete_product(db=db, product_id=product_id)
+    product_catalog.invalidate()
     return {"detail": "Product deleted successfully"}
 
 @router.get("/trending/", response_model=List[Product])
 def get_trending_products(
     db: Session = Depends(get_db),
-    limit: int = 10
+    limit: int = 10,
+    category_id: Optional[int] = None
 ):
     """
-    Get trending products based on recent user activity
+    Get trending products based on recent user activity, optionally within one category
     """
-    return crud_product.get_trending_products(db, limit=limit)
\ No newline at end of file
+    return trending_products(db, limit=limit, category_id=category_id)
\ No newline at end of file
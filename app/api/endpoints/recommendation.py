@@ -1,32 +1,92 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Body, Depends, HTTPException, Query
+from fastapi.responses import Response, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+import json
 from typing import List, Optional
-from app.db.session import get_db
+from app.db.session import get_async_db, get_db
 from app.schemas.recommendation import Recommendation, UserRecommendation
 from app.schemas.product import Product
 from app.crud import recommendation as crud_recommendation
 from app.core.auth import get_current_user, get_optional_user
-from app.ml.recommender import get_personalized_recommendations, get_similar_products
+from app.core.config import settings
+from app.ml.recommender import (
+    get_personalized_recommendations,
+    get_personalized_recommendations_batch,
+    get_session_recommendations,
+    get_similar_products_async
+)
+from app.models.product import Product as ProductModel
 from app.models.user import User
+from app.services.cache import recommendation_cache
+from app.services.catalog import ProductFilter
+from app.services.coalescing import request_coalescer
+from app.services.ingestion import event_ingestor
 
 router = APIRouter()
 
-@router.get("/user/", response_model=List[UserRecommendation])
+def product_filters(
+    category: Optional[List[int]] = Query(None, description="Only recommend products in one of these categories"),
+    exclude_category: Optional[List[int]] = Query(None, description="Never recommend products in these categories"),
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    exclude_purchased: bool = Query(True, description="Skip products the user bought recently")
+) -> ProductFilter:
+    """Business rules shared by the recommendation endpoints; out-of-stock products are always skipped"""
+    return ProductFilter(
+        categories=category,
+        exclude_categories=exclude_category,
+        min_price=min_price,
+        max_price=max_price,
+        exclude_purchased=exclude_purchased
+    )
+
+@router.get("/user/", response_model=List[Product])
 def get_user_recommendations(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
     limit: int = 10,
-    algorithm: Optional[str] = None
+    algorithm: Optional[str] = None,
+    filters: ProductFilter = Depends(product_filters)
 ):
     """
     Get personalized recommendations for the current logged-in user
     """
-    return crud_recommendation.get_user_recommendations(
-        db, 
-        user_id=current_user.id, 
+    return get_personalized_recommendations(
+        db,
+        user_id=current_user.id,
         limit=limit,
-        algorithm=algorithm
+        algorithm=algorithm,
+        filters=filters
+    )
+
+@router.post("/batch/")
+def get_batch_recommendations(
+    user_ids: List[int] = Body(..., embed=True),
+    limit: int = Body(10, embed=True),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Collaborative recommendations for many users in one call (admin only).
+
+    Streams one NDJSON line per user, in request order:
+    {"user_id": 1, "recommendations": [{"product_id": 7, "score": 0.93}, ...]}
+    """
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    if len(user_ids) > settings.BATCH_MAX_USERS:
+        raise HTTPException(status_code=413, detail=f"At most {settings.BATCH_MAX_USERS} user IDs per request")
+    
+    results = get_personalized_recommendations_batch(db, user_ids, limit=limit)
+    lines = (
+        json.dumps({
+            "user_id": user_id,
+            "recommendations": [{"product_id": pid, "score": score} for pid, score in recommendations]
+        }) + "\n"
+        for user_id, recommendations in results
     )
+    return StreamingResponse(lines, media_type="application/x-ndjson")
 
 @router.get("/anonymous/", response_model=List[Product])
 def get_anonymous_recommendations(
@@ -35,44 +95,65 @@ def get_anonymous_recommendations(
     limit: int = 10
 ):
     """
-    Get recommendations for anonymous users based on session data
+    Get recommendations for anonymous users based on the items their session
+    recently viewed, added to cart or purchased
     """
-    return crud_recommendation.get_anonymous_recommendations(
-        db,
-        session_id=session_id,
-        limit=limit
-    )
+    return get_session_recommendations(db, session_id=session_id, limit=limit)
 
 @router.get("/similar/{product_id}", response_model=List[Product])
-def get_similar_product_recommendations(
+async def get_similar_product_recommendations(
     product_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     limit: int = 5,
-    current_user: Optional[User] = Depends(get_optional_user)
+    current_user: Optional[User] = Depends(get_optional_user),
+    filters: ProductFilter = Depends(product_filters)
 ):
     """
     Get similar products to the one specified
     """
     # Check if product exists
-    product = db.query(Product).filter(Product.id == product_id).first()
+    product = await db.get(ProductModel, product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
     user_id = current_user.id if current_user else None
-    return get_similar_products(db, product_id=product_id, user_id=user_id, limit=limit)
+    return await get_similar_products_async(db, product_id=product_id, user_id=user_id, limit=limit, filters=filters)
 
-@router.post("/event/")
+@router.post("/event/", responses={202: {"description": "Event queued for writing"},
+                                    429: {"description": "Event queue is full, retry later"}})
 def record_user_event(
     event: UserEvent,
+    response: Response,
     db: Session = Depends(get_db),
     current_user: Optional[User] = Depends(get_optional_user)
 ):
     """
-    Record a user event for recommendation system training
+    Record a user event for recommendation system training.
+
+    With EVENT_INGESTION_BUFFERED the event is queued and written in batches
+    by app.services.ingestion: the response is 202, or 429 with Retry-After
+    when the queue is full.
     """
     # If user is logged in, use their ID
     if current_user:
         event.user_id = current_user.id
     
+    if settings.EVENT_INGESTION_BUFFERED:
+        # Checked here, since a queued event can no longer be refused
+        if event.user_id is None or not event.session_id:
+            raise HTTPException(status_code=422, detail="user_id and session_id are required")
+        if not event_ingestor.submit(event.dict()):
+            raise HTTPException(status_code=429, detail="Too many events, retry later", headers={"Retry-After": "1"})
+        response.status_code = 202
+        return {"detail": "Event accepted"}
+    
     crud_recommendation.record_user_event(db, event)
-    return {"detail": "Event recorded successfully"}
\ No newline at end of file
+    return {"detail": "Event recorded successfully"}
+
+@router.get("/cache/stats")
+def get_cache_stats():
+    """
+    Hit-rate counters for the recommendation cache, and for the in-process
+    cache and request coalescing in this worker
+    """
+    return {**recommendation_cache.stats(), "local": request_coalescer.stats()}
\ No newline at end of file
@@ -12,6 +12,7 @@ class Settings(BaseSettings):
     DEBUG: bool = os.getenv("DEBUG", "False").lower() == "true"
     HOST: str = os.getenv("HOST", "0.0.0.0")
     PORT: int = int(os.getenv("PORT", "8000"))
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "True").lower() == "true"  # Stage timings exported on /metrics
     
     # CORS settings
     CORS_ORIGINS: List[AnyHttpUrl] = [
@@ -26,9 +27,22 @@ class Settings(BaseSettings):
     POSTGRES_DB: str = os.getenv("POSTGRES_DB", "recommendation_engine")
     DATABASE_URI: Optional[PostgresDsn] = Field(None)
     
+    # Query profiling (app.db.profiler); off in production, it times every statement
+    DB_PROFILING_ENABLED: bool = os.getenv("DB_PROFILING_ENABLED", "False").lower() == "true"
+    DB_SLOW_QUERY_MS: float = float(os.getenv("DB_SLOW_QUERY_MS", "100"))  # Logged with the statement and parameters
+    DB_N_PLUS_ONE_THRESHOLD: int = int(os.getenv("DB_N_PLUS_ONE_THRESHOLD", "5"))  # Executions of one statement shape per request
+    
     # Redis settings for caching
     REDIS_HOST: str = os.getenv("REDIS_HOST", "localhost")
     REDIS_PORT: int = int(os.getenv("REDIS_PORT", "6379"))
+    CACHE_ENABLED: bool = os.getenv("CACHE_ENABLED", "True").lower() == "true"
+    CACHE_SOCKET_TIMEOUT: float = float(os.getenv("CACHE_SOCKET_TIMEOUT", "0.05"))  # Seconds; a slow cache counts as a miss
+    RECOMMENDATION_CACHE_TTL: int = int(os.getenv("RECOMMENDATION_CACHE_TTL", "300"))  # Seconds
+    SIMILAR_CACHE_TTL: int = int(os.getenv("SIMILAR_CACHE_TTL", "3600"))  # Seconds
+    LOCAL_CACHE_ENABLED: bool = os.getenv("LOCAL_CACHE_ENABLED", "True").lower() == "true"  # In-process LRU and request coalescing
+    LOCAL_CACHE_MAX_ENTRIES: int = int(os.getenv("LOCAL_CACHE_MAX_ENTRIES", "10000"))
+    LOCAL_CACHE_TTL: float = float(os.getenv("LOCAL_CACHE_TTL", "5"))  # Seconds; invalidation only reaches Redis, so keep it short
+    COALESCE_WAIT_SECONDS: float = float(os.getenv("COALESCE_WAIT_SECONDS", "10"))  # Max wait for an identical in-flight request
     
     # Authentication
     SECRET_KEY: str = os.getenv("SECRET_KEY", "your-secret-key-for-jwt")
@@ -42,11 +56,106 @@ class Settings(BaseSettings):
     
     # ML Model settings
     MODEL_PATH: str = os.getenv("MODEL_PATH", "./app/ml/models")
+    MODEL_WATCH_INTERVAL: float = float(os.getenv("MODEL_WATCH_INTERVAL", "30"))  # Seconds between checks for a new published version, 0 = off
+    SIMILAR_TOP_N: int = int(os.getenv("SIMILAR_TOP_N", "50"))  # Neighbours precomputed per product
+    
+    # Implicit-feedback confidence per event type, shared by online updates and training
+    EVENT_WEIGHTS: Dict[str, float] = {
+        "view": 1.0,
+        "cart_add": 3.0,
+        "purchase": 5.0
+    }
+    
+    RECOMMENDATIONS_PER_USER: int = int(os.getenv("RECOMMENDATIONS_PER_USER", "20"))  # Rows stored per user in the recommendations table
+    CATALOG_REFRESH_SECONDS: float = float(os.getenv("CATALOG_REFRESH_SECONDS", "60"))  # Max age of the in-memory catalog
+    CANDIDATE_OVERFETCH: int = int(os.getenv("CANDIDATE_OVERFETCH", "2"))  # Candidates per slot, to survive availability filtering
+    EXCLUDE_PURCHASED_DAYS: int = int(os.getenv("EXCLUDE_PURCHASED_DAYS", "30"))  # Purchases this recent are not recommended again
+    BATCH_SCORING_BLOCK_SIZE: int = int(os.getenv("BATCH_SCORING_BLOCK_SIZE", "256"))  # Users scored per matrix product in batch recommendations
+    BATCH_MAX_USERS: int = int(os.getenv("BATCH_MAX_USERS", "100000"))  # Max user IDs per batch recommendation request
+    
+    # algorithm="hybrid": candidates from every source, blended in one scored pass
+    HYBRID_CF_WEIGHT: float = float(os.getenv("HYBRID_CF_WEIGHT", "0.6"))
+    HYBRID_CONTENT_WEIGHT: float = float(os.getenv("HYBRID_CONTENT_WEIGHT", "0.3"))
+    HYBRID_POPULARITY_WEIGHT: float = float(os.getenv("HYBRID_POPULARITY_WEIGHT", "0.1"))
+    HYBRID_CONTENT_AGGREGATION: str = os.getenv("HYBRID_CONTENT_AGGREGATION", "max")  # "max" or "mean" similarity to the recent products
+    HYBRID_CANDIDATES: int = int(os.getenv("HYBRID_CANDIDATES", "100"))  # Candidates taken from each source
+    
+    # Precomputed recommendations (python -m app.ml.precompute)
+    PRECOMPUTED_ENABLED: bool = os.getenv("PRECOMPUTED_ENABLED", "True").lower() == "true"  # Serve /user/ from the recommendations table
+    PRECOMPUTED_MAX_AGE_HOURS: float = float(os.getenv("PRECOMPUTED_MAX_AGE_HOURS", "24"))  # Older rows fall back to live scoring
+    PRECOMPUTE_ACTIVE_DAYS: int = int(os.getenv("PRECOMPUTE_ACTIVE_DAYS", "90"))  # Users with events in this window are precomputed
+    PRECOMPUTE_CHUNK_SIZE: int = int(os.getenv("PRECOMPUTE_CHUNK_SIZE", "5000"))  # Users per worker task
+    PRECOMPUTE_INSERT_BATCH: int = int(os.getenv("PRECOMPUTE_INSERT_BATCH", "10000"))  # Rows per multi-row INSERT without COPY
+    
+    ONLINE_UPDATES_ENABLED: bool = os.getenv("ONLINE_UPDATES_ENABLED", "True").lower() == "true"  # Fold streamed events into CF user factors
+    ONLINE_REGULARIZATION: float = float(os.getenv("ONLINE_REGULARIZATION", "10.0"))  # Pull towards the previous user vector
+    
+    # Offline training (python -m app.ml.train)
+    ALS_FACTORS: int = int(os.getenv("ALS_FACTORS", "64"))
+    ALS_ITERATIONS: int = int(os.getenv("ALS_ITERATIONS", "15"))
+    ALS_REGULARIZATION: float = float(os.getenv("ALS_REGULARIZATION", "0.1"))
+    ALS_ALPHA: float = float(os.getenv("ALS_ALPHA", "40.0"))  # Confidence scaling: c = 1 + alpha * weight
+    TRAIN_CHUNK_SIZE: int = int(os.getenv("TRAIN_CHUNK_SIZE", "100000"))  # Rows per server-side cursor fetch
+    TFIDF_DIM: int = int(os.getenv("TFIDF_DIM", "128"))  # Product vector size after SVD of the TF-IDF matrix
+    
+    # Approximate nearest-neighbour retrieval
+    ANN_ENABLED: bool = os.getenv("ANN_ENABLED", "True").lower() == "true"
+    ANN_NLIST: int = int(os.getenv("ANN_NLIST", "0"))  # Clusters per index, 0 = sqrt(n_items)
+    ANN_NPROBE: int = int(os.getenv("ANN_NPROBE", "8"))  # Clusters scanned per query; higher = better recall, slower
+    ANN_MASK_OVERFETCH: int = int(os.getenv("ANN_MASK_OVERFETCH", "4"))  # Filtered requests fetch k * this ANN candidates before the mask
+    
+    # Quantized factor storage for full scans (see app/ml/quantize.py)
+    FACTOR_QUANTIZATION: str = os.getenv("FACTOR_QUANTIZATION", "")  # "", "float16" or "int8"
+    QUANTIZED_RERANK: int = int(os.getenv("QUANTIZED_RERANK", "4"))  # Re-score the top k * this exactly in float32, 0 = use quantized scores
+    
+    # Anonymous session profiles, fed by the event consumer
+    SESSION_STORE_REDIS: bool = os.getenv("SESSION_STORE_REDIS", "False").lower() == "true"  # Share profiles across processes through Redis
+    SESSION_MAX_PROFILES: int = int(os.getenv("SESSION_MAX_PROFILES", "100000"))  # Least recently updated sessions are evicted beyond this
+    SESSION_TTL_SECONDS: int = int(os.getenv("SESSION_TTL_SECONDS", "1800"))  # Sessions without events for this long expire
+    SESSION_MAX_ITEMS: int = int(os.getenv("SESSION_MAX_ITEMS", "50"))  # Items kept per session, lowest weights dropped first
+    SESSION_HALF_LIFE_SECONDS: float = float(os.getenv("SESSION_HALF_LIFE_SECONDS", "600"))  # Item weights halve over this long
+    SESSION_REDIS_REFRESH_SECONDS: float = float(os.getenv("SESSION_REDIS_REFRESH_SECONDS", "2"))  # Max age of a local copy of a Redis profile
+    SESSION_NEIGHBORS: int = int(os.getenv("SESSION_NEIGHBORS", "20"))  # Neighbours aggregated per session item
+    
+    # Trending products, counted by the event consumer
+    TRENDING_HALF_LIFE_SECONDS: float = float(os.getenv("TRENDING_HALF_LIFE_SECONDS", "21600"))  # Event weights halve over this long
+    TRENDING_MAX_TRACKED: int = int(os.getenv("TRENDING_MAX_TRACKED", "100000"))  # Products with counters; the lowest are pruned beyond this
+    TRENDING_TOP_K: int = int(os.getenv("TRENDING_TOP_K", "500"))  # Products in the published overall ranking
+    TRENDING_CATEGORY_TOP_K: int = int(os.getenv("TRENDING_CATEGORY_TOP_K", "100"))  # Products in each published category ranking
+    TRENDING_SNAPSHOT_SECONDS: float = float(os.getenv("TRENDING_SNAPSHOT_SECONDS", "10"))  # How often the consumer publishes the rankings
+    TRENDING_SNAPSHOT_REDIS: bool = os.getenv("TRENDING_SNAPSHOT_REDIS", "False").lower() == "true"  # Publish to Redis instead of TRENDING_SNAPSHOT_PATH
+    TRENDING_SNAPSHOT_PATH: str = os.getenv("TRENDING_SNAPSHOT_PATH", "./spool/trending.json")
+    TRENDING_REFRESH_SECONDS: float = float(os.getenv("TRENDING_REFRESH_SECONDS", "10"))  # Max age of an API worker's copy of the rankings
+    
+    # user_events partition maintenance (python -m app.db.partitions)
+    EVENT_RETENTION_DAYS: int = int(os.getenv("EVENT_RETENTION_DAYS", "365"))  # Monthly partitions older than this are dropped
+    EVENT_PARTITIONS_AHEAD: int = int(os.getenv("EVENT_PARTITIONS_AHEAD", "3"))  # Future months kept pre-created
+    
+    # Write-behind event ingestion (app.services.ingestion)
+    EVENT_INGESTION_BUFFERED: bool = os.getenv("EVENT_INGESTION_BUFFERED", "False").lower() == "true"  # POST /event/ returns 202
+    EVENT_QUEUE_SIZE: int = int(os.getenv("EVENT_QUEUE_SIZE", "10000"))  # Events waiting to be written; beyond it 429
+    EVENT_FLUSH_BATCH_SIZE: int = int(os.getenv("EVENT_FLUSH_BATCH_SIZE", "500"))  # Rows per INSERT and Kafka batch
+    EVENT_FLUSH_INTERVAL_MS: int = int(os.getenv("EVENT_FLUSH_INTERVAL_MS", "200"))  # Longest wait for a batch to fill
+    EVENT_DRAIN_TIMEOUT_SECONDS: float = float(os.getenv("EVENT_DRAIN_TIMEOUT_SECONDS", "10"))  # Shutdown budget for the queue
     
     # Kafka settings
     KAFKA_BOOTSTRAP_SERVERS: List[str] = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092").split(",")
     KAFKA_TOPIC_EVENTS: str = os.getenv("KAFKA_TOPIC_EVENTS", "user-events")
     KAFKA_TOPIC_RECOMMENDATIONS: str = os.getenv("KAFKA_TOPIC_RECOMMENDATIONS", "recommendations")
+    KAFKA_PRODUCER_ASYNC: bool = os.getenv("KAFKA_PRODUCER_ASYNC", "True").lower() == "true"  # Fire-and-forget sends
+    KAFKA_PRODUCER_LINGER_MS: int = int(os.getenv("KAFKA_PRODUCER_LINGER_MS", "5"))
+    KAFKA_PRODUCER_BATCH_SIZE: int = int(os.getenv("KAFKA_PRODUCER_BATCH_SIZE", "65536"))  # Bytes per partition batch
+    KAFKA_PRODUCER_COMPRESSION: str = os.getenv("KAFKA_PRODUCER_COMPRESSION", "gzip")
+    KAFKA_PRODUCER_MAX_BLOCK_MS: int = int(os.getenv("KAFKA_PRODUCER_MAX_BLOCK_MS", "100"))
+    KAFKA_RECONNECT_BACKOFF_SECONDS: float = float(os.getenv("KAFKA_RECONNECT_BACKOFF_SECONDS", "30"))
+    KAFKA_SPOOL_PATH: str = os.getenv("KAFKA_SPOOL_PATH", "./spool/events.jsonl")
+    KAFKA_SPOOL_MAX_BYTES: int = int(os.getenv("KAFKA_SPOOL_MAX_BYTES", str(100 * 1024 * 1024)))
+    KAFKA_CONSUMER_BATCH_SIZE: int = int(os.getenv("KAFKA_CONSUMER_BATCH_SIZE", "500"))  # max_records per poll
+    KAFKA_CONSUMER_POLL_TIMEOUT_MS: int = int(os.getenv("KAFKA_CONSUMER_POLL_TIMEOUT_MS", "1000"))
+    KAFKA_CONSUMER_MAX_RETRIES: int = int(os.getenv("KAFKA_CONSUMER_MAX_RETRIES", "5"))  # Failed attempts before a batch is bisected
+    KAFKA_CONSUMER_BACKOFF_SECONDS: float = float(os.getenv("KAFKA_CONSUMER_BACKOFF_SECONDS", "0.5"))  # Wait after a failed batch, doubled per consecutive failure
+    KAFKA_CONSUMER_MAX_BACKOFF_SECONDS: float = float(os.getenv("KAFKA_CONSUMER_MAX_BACKOFF_SECONDS", "30"))  # Cap on that wait
+    KAFKA_TOPIC_DEAD_LETTER: str = os.getenv("KAFKA_TOPIC_DEAD_LETTER", "user-events-dead-letter")  # "" = log skipped records only
     
     class Config:
         case_sensitive = True
@@ -0,0 +1,109 @@
+import os
+import time
+from functools import lru_cache
+from typing import Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest
+
+from app.core.config import settings
+
+# From 0.25 ms (a cache hit) to 10 s (a stuck query)
+LATENCY_BUCKETS = (0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REQUEST_SECONDS = Histogram(
+    "recommendation_request_seconds",
+    "End-to-end duration of recommendation requests, consumer batches and producer sends",
+    ["operation", "outcome"],
+    buckets=LATENCY_BUCKETS
+)
+STAGE_SECONDS = Histogram(
+    "recommendation_stage_seconds",
+    "Duration of each stage of an operation; path is primary, or fallback once the operation failed over",
+    ["operation", "stage", "path"],
+    buckets=LATENCY_BUCKETS
+)
+FALLBACKS = Counter(
+    "recommendation_fallbacks_total",
+    "Operations that failed over to their fallback path, by the exception that caused it",
+    ["operation", "reason"]
+)
+
+@lru_cache(maxsize=None)
+def _request_histogram(operation: str, outcome: str):
+    # Resolving labels takes a lock, so every label set is resolved once
+    return REQUEST_SECONDS.labels(operation, outcome)
+
+@lru_cache(maxsize=None)
+def _stage_histogram(operation: str, stage: str, path: str):
+    return STAGE_SECONDS.labels(operation, stage, path)
+
+class _Stage:
+    __slots__ = ("timer", "name", "start")
+
+    def __init__(self, timer: "RequestTimer", name: str):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if settings.METRICS_ENABLED:
+            _stage_histogram(self.timer.operation, self.name, self.timer.path).observe(
+                time.perf_counter() - self.start)
+        return False
+
+class RequestTimer:
+    """
+    Times one operation and its stages.
+
+        with RequestTimer("personalized") as timer:
+            with timer.stage("score"):
+                ...
+
+    Stages are recorded with path="primary" until fallback() is called, and
+    with path="fallback" after it, so the time spent recovering from a
+    failure is never mixed into the normal stage latencies. The operation
+    itself is recorded with outcome "primary", "fallback" or "error" (an
+    exception escaped). A stage costs two perf_counter calls and one
+    histogram observation, a few microseconds.
+    """
+
+    __slots__ = ("operation", "path", "start")
+
+    def __init__(self, operation: str):
+        self.operation = operation
+        self.path = "primary"
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if settings.METRICS_ENABLED:
+            outcome = "error" if exc_type is not None else self.path
+            _request_histogram(self.operation, outcome).observe(time.perf_counter() - self.start)
+        return False
+
+    def stage(self, name: str) -> _Stage:
+        return _Stage(self, name)
+
+    def fallback(self, error: BaseException = None, reason: str = None):
+        """Switch to the fallback path, counting why"""
+        self.path = "fallback"
+        if settings.METRICS_ENABLED:
+            FALLBACKS.labels(self.operation, reason or type(error).__name__).inc()
+
+def render_metrics() -> Tuple[bytes, str]:
+    """
+    The Prometheus exposition of this process, or of every worker when
+    PROMETHEUS_MULTIPROC_DIR is set (uvicorn/gunicorn with several workers)
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
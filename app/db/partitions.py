@@ -0,0 +1,118 @@
+"""
+Monthly range partitions of user_events, and the retention job that maintains them.
+
+On PostgreSQL, user_events is partitioned by RANGE ("timestamp") into one
+partition per calendar month named user_events_yYYYYmMM (see the Alembic
+migration that converts the table). This job should run daily, e.g. from cron:
+
+  * creates the partitions for the next EVENT_PARTITIONS_AHEAD months, so
+    inserts never hit a month without a partition
+  * drops whole partitions that end before the EVENT_RETENTION_DAYS cut-off,
+    which is a cheap metadata operation instead of a large DELETE
+
+Usage:
+    python -m app.db.partitions [--retention-days N] [--ahead N] [--dry-run]
+"""
+import argparse
+import logging
+from datetime import date, datetime, timedelta
+from typing import Dict, List
+
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.db.session import engine
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = "user_events"
+NAME_FORMAT = f"{PARENT_TABLE}_y%Ym%m"
+
+def month_start(day: date) -> date:
+    return date(day.year, day.month, 1)
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+def partition_name(month: date) -> str:
+    return month.strftime(NAME_FORMAT)
+
+def is_partitioned(connection) -> bool:
+    if connection.dialect.name != "postgresql":
+        return False
+    return connection.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table))"
+    ), {"table": PARENT_TABLE}).scalar()
+
+def existing_partitions(connection) -> Dict[date, str]:
+    """Map each partition's first day to its name; partitions not following NAME_FORMAT are ignored"""
+    names = connection.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(:table)"
+    ), {"table": PARENT_TABLE}).scalars().all()
+
+    partitions = {}
+    for name in names:
+        try:
+            partitions[datetime.strptime(name, NAME_FORMAT).date()] = name
+        except ValueError:
+            continue
+    return partitions
+
+def ensure_partitions(connection, first: date, last: date) -> List[str]:
+    """Create the missing monthly partitions covering first..last (inclusive); returns the new names"""
+    existing = existing_partitions(connection)
+    created = []
+    month = month_start(first)
+    while month <= last:
+        if month not in existing:
+            name = partition_name(month)
+            connection.execute(text(
+                f"CREATE TABLE {name} PARTITION OF {PARENT_TABLE} "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+            ))
+            created.append(name)
+        month = add_months(month, 1)
+    return created
+
+def expired_partitions(connection, retention_days: int, today: date = None) -> List[str]:
+    """Partitions whose whole month ends on or before the retention cut-off"""
+    cutoff = (today or date.today()) - timedelta(days=retention_days)
+    return [name for month, name in sorted(existing_partitions(connection).items())
+            if add_months(month, 1) <= cutoff]
+
+def run_maintenance(retention_days: int = None, ahead: int = None, dry_run: bool = False) -> dict:
+    retention_days = settings.EVENT_RETENTION_DAYS if retention_days is None else retention_days
+    ahead = settings.EVENT_PARTITIONS_AHEAD if ahead is None else ahead
+
+    with engine.begin() as connection:
+        if not is_partitioned(connection):
+            logger.warning(f"{PARENT_TABLE} is not partitioned; run `alembic upgrade head` first")
+            return {"created": [], "dropped": []}
+
+        this_month = month_start(date.today())
+        created = [] if dry_run else ensure_partitions(connection, this_month, add_months(this_month, ahead))
+        dropped = expired_partitions(connection, retention_days)
+        if not dry_run:
+            for name in dropped:
+                connection.execute(text(f"DROP TABLE {name}"))
+
+    return {"created": created, "dropped": dropped}
+
+def main():
+    parser = argparse.ArgumentParser(description="Create upcoming and drop expired user_events partitions")
+    parser.add_argument("--retention-days", type=int, default=settings.EVENT_RETENTION_DAYS)
+    parser.add_argument("--ahead", type=int, default=settings.EVENT_PARTITIONS_AHEAD)
+    parser.add_argument("--dry-run", action="store_true", help="Only report the partitions that would be dropped")
+    args = parser.parse_args()
+
+    result = run_maintenance(args.retention_days, args.ahead, args.dry_run)
+    for name in result["created"]:
+        logger.info(f"Created partition {name}")
+    for name in result["dropped"]:
+        logger.info(f"{'Would drop' if args.dry_run else 'Dropped'} partition {name}")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,145 @@
+"""
+Opt-in SQL profiling built on SQLAlchemy engine events.
+
+With DB_PROFILING_ENABLED, main.py installs the engine listeners and
+QueryProfilerMiddleware. Every request then gets a QueryProfile that counts
+its statements and their total time, groups them by shape (the statement
+with IN lists and VALUES rows collapsed), and keeps those slower than
+DB_SLOW_QUERY_MS. The totals go out as response headers:
+
+    X-DB-Query-Count: 3
+    X-DB-Time-Ms: 4.21
+    X-DB-N-Plus-One: 1     (only when a shape ran DB_N_PLUS_ONE_THRESHOLD times or more)
+
+and every slow query and N+1 shape is logged as a warning. Code outside a
+request (scripts, the consumer, benchmarks) can profile a block with
+
+    with profile_queries("precompute") as profile:
+        ...
+"""
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_PLACEHOLDER = r"(?:\?|%s|%\(\w+\)s|\$\d+|:\w+)"
+# IN (?, ?, ?) and multi-row VALUES (?, ?), (?, ?) vary in length with the data, not with the code
+_TUPLE = rf"\(\s*{_PLACEHOLDER}(?:\s*,\s*{_PLACEHOLDER})*\s*\)"
+_PLACEHOLDER_LIST = re.compile(rf"{_TUPLE}(?:\s*,\s*{_TUPLE})*")
+_WHITESPACE = re.compile(r"\s+")
+
+_current: ContextVar[Optional["QueryProfile"]] = ContextVar("query_profile", default=None)
+
+def statement_shape(statement: str) -> str:
+    """The statement with whitespace normalized and placeholder lists collapsed to (?)"""
+    return _PLACEHOLDER_LIST.sub("(?)", _WHITESPACE.sub(" ", statement).strip())
+
+class QueryProfile:
+    """Statements executed while the profile was active, see profile_queries"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+        self.slow: List[tuple] = []
+        # Statements of one request can run in several threads (asyncio.to_thread, the threadpool)
+        self._lock = threading.Lock()
+
+    def record(self, statement: str, parameters, seconds: float):
+        with self._lock:
+            self.count += 1
+            self.seconds += seconds
+            self.shapes[statement_shape(statement)] += 1
+            if seconds * 1000 >= settings.DB_SLOW_QUERY_MS:
+                self.slow.append((seconds, statement, parameters))
+
+    def n_plus_one(self) -> List[tuple]:
+        """(shape, executions) for every shape that ran DB_N_PLUS_ONE_THRESHOLD times or more"""
+        return [(shape, n) for shape, n in self.shapes.most_common() if n >= settings.DB_N_PLUS_ONE_THRESHOLD]
+
+    def headers(self) -> dict:
+        headers = {"X-DB-Query-Count": str(self.count), "X-DB-Time-Ms": f"{self.seconds * 1000:.2f}"}
+        repeated = self.n_plus_one()
+        if repeated:
+            headers["X-DB-N-Plus-One"] = str(len(repeated))
+        return headers
+
+    def log(self):
+        """Warn about N+1 shapes; slow queries were logged as they finished"""
+        for shape, n in self.n_plus_one():
+            logger.warning(f"Possible N+1 in {self.name}: {n} executions of {shape[:500]}")
+        logger.debug(f"{self.name}: {self.count} queries, {self.seconds * 1000:.2f} ms")
+
+def current_profile() -> Optional[QueryProfile]:
+    return _current.get()
+
+@contextmanager
+def profile_queries(name: str):
+    """Collect the statements run inside the block, in this context and in threads started from it"""
+    profile = QueryProfile(name)
+    token = _current.set(profile)
+    try:
+        yield profile
+    finally:
+        _current.reset(token)
+        profile.log()
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info["query_start_time"].pop()
+    profile = _current.get()
+    if profile is not None:
+        profile.record(statement, parameters, seconds)
+    if seconds * 1000 >= settings.DB_SLOW_QUERY_MS:
+        where = f" in {profile.name}" if profile is not None else ""
+        statement = _WHITESPACE.sub(" ", statement)[:1000]
+        logger.warning(f"Slow query{where} ({seconds * 1000:.1f} ms): {statement} {str(parameters)[:200]}")
+
+def _handle_error(context):
+    # A failed statement never reaches after_cursor_execute
+    starts = context.connection.info.get("query_start_time") if context.connection is not None else None
+    if starts:
+        starts.pop()
+
+def install(*engines: Engine):
+    """Time every statement of the given engines (for an AsyncEngine, pass its sync_engine)"""
+    for engine in engines:
+        if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+            event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+            event.listen(engine, "handle_error", _handle_error)
+
+class QueryProfilerMiddleware:
+    """ASGI middleware giving each HTTP request its own QueryProfile and X-DB-* response headers"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with profile_queries(f"{scope['method']} {scope['path']}") as profile:
+            async def send_with_headers(message):
+                # The response body is serialized before it starts, so its lazy loads are counted too
+                if message["type"] == "http.response.start":
+                    extra = [(k.lower().encode(), v.encode()) for k, v in profile.headers().items()]
+                    message = {**message, "headers": list(message.get("headers", [])) + extra}
+                await send(message)
+
+            await self.app(scope, receive, send_with_headers)
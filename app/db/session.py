@@ -1,4 +1,5 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
@@ -17,6 +18,28 @@ engine = create_engine(
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+def _async_url(url: str) -> str:
+    """Same database through an asyncio driver: asyncpg for PostgreSQL, aiosqlite for SQLite"""
+    for prefix, async_prefix in (("postgresql+psycopg2://", "postgresql+asyncpg://"),
+                                 ("postgresql://", "postgresql+asyncpg://"),
+                                 ("sqlite://", "sqlite+aiosqlite://")):
+        if url.startswith(prefix):
+            return async_prefix + url[len(prefix):]
+    return url
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", _async_url(DATABASE_URL))
+
+# Async engine for `async def` endpoints; requests wait on the database without holding a threadpool slot
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_pre_ping=True,
+    pool_size=10,
+    max_overflow=20
+)
+
+# expire_on_commit=False so returned objects stay readable without lazy loads after commit
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 # Create base class for models
 Base = declarative_base()
 
@@ -27,3 +50,7 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -1,66 +1,219 @@
 import json
+from collections import defaultdict
 from kafka import KafkaConsumer
 from app.core.config import settings
+from app.core.metrics import RequestTimer
 import threading
 import logging
-from app.ml.recommender import update_recommendations
+from typing import Callable, Dict, Iterator, List
+from sqlalchemy.exc import InterfaceError, OperationalError
+from app.kafka.producer import event_producer
+from app.ml.recommender import update_recommendations_batch
 from app.db.session import SessionLocal
+from app.services.sessions import session_store
+from app.services.trending import trending_counters
 
 logger = logging.getLogger(__name__)
 
+# Event types that change a user's recommendations
+RECOMMENDATION_EVENTS = ('view', 'purchase', 'cart_add')
+
+def _is_transient(error: Exception) -> bool:
+    """Database outages and lock timeouts fail every record alike, so they never mark a record as poison"""
+    return isinstance(error, (OperationalError, InterfaceError))
+
 class EventConsumer(threading.Thread):
-    def __init__(self):
+    """
+    Consumes user events in batches.
+
+    Each poll returns up to batch_size records. The batch is grouped by user and
+    applied with one DB session and one bulk write, and offsets are committed
+    only after the write succeeds. If the batch fails, the consumer seeks back
+    to the first offset of the batch on each partition so it is retried, after
+    a wait that doubles with each consecutive failure up to max_backoff. After
+    max_retries failed attempts the batch is bisected: the records that can
+    be applied are, and a record that fails on its own is sent to the
+    dead-letter topic and skipped, so one poison record cannot stall its
+    partition.
+    Events carrying a session_id also update the anonymous session profiles,
+    and every event is counted towards trending products.
+    """
+
+    def __init__(self, batch_size: int = None, poll_timeout_ms: int = None, consumer=None,
+                 max_retries: int = None, dead_letter: Callable[[dict], bool] = None,
+                 backoff: float = None, max_backoff: float = None):
         threading.Thread.__init__(self)
         self.stop_event = threading.Event()
         self.daemon = True
-        
+        self.batch_size = batch_size or settings.KAFKA_CONSUMER_BATCH_SIZE
+        self.poll_timeout_ms = poll_timeout_ms or settings.KAFKA_CONSUMER_POLL_TIMEOUT_MS
+        # An already constructed consumer (e.g. an in-memory fake) can be injected
+        self.consumer = consumer
+        self.max_retries = settings.KAFKA_CONSUMER_MAX_RETRIES if max_retries is None else max_retries
+        self.dead_letter = dead_letter or event_producer.send_dead_letter
+        self.backoff = settings.KAFKA_CONSUMER_BACKOFF_SECONDS if backoff is None else backoff
+        self.max_backoff = settings.KAFKA_CONSUMER_MAX_BACKOFF_SECONDS if max_backoff is None else max_backoff
+        # Consecutive failed attempts at the batch at the head of the partitions
+        self.failures = 0
+        self.skipped = 0
+
     def stop(self):
         self.stop_event.set()
-        
+
+    def _create_consumer(self):
+        return KafkaConsumer(
+            settings.KAFKA_TOPIC_EVENTS,
+            bootstrap_servers=settings.KAFKA_BOOTSTRAP_SERVERS,
+            auto_offset_reset='latest',
+            enable_auto_commit=False,
+            max_poll_records=self.batch_size,
+            group_id='recommendation_processor',
+            value_deserializer=lambda m: json.loads(m.decode('utf-8'))
+        )
+
+    @staticmethod
+    def _recommendation_events(messages) -> Iterator[tuple]:
+        """Yield (data, event_type) for every event that affects recommendations, skipping malformed messages"""
+        for message in messages:
+            try:
+                event = message.value
+                event_type = event.get('event_type')
+                data = event.get('data', {})
+                if event_type in RECOMMENDATION_EVENTS and data.get('product_id'):
+                    yield data, event_type
+            except Exception as e:
+                logger.error(f"Skipping malformed Kafka message at offset {message.offset}: {str(e)}")
+
+    @staticmethod
+    def group_events(events, key: str = 'user_id') -> Dict[object, List[tuple]]:
+        """Group the (product_id, event_type) pairs of parsed events by user_id or session_id"""
+        grouped = defaultdict(list)
+        for data, event_type in events:
+            if data.get(key):
+                grouped[data[key]].append((data['product_id'], event_type))
+        return grouped
+
+    def process_batch(self, messages, timer: RequestTimer = None):
+        """Apply a batch of messages with a single session and transaction"""
+        timer = timer or RequestTimer("consumer_batch")
+        with timer.stage("parse"):
+            events = list(self._recommendation_events(messages))
+            events_by_user = self.group_events(events, 'user_id')
+
+        if events_by_user:
+            db = SessionLocal()
+            try:
+                with timer.stage("db_write"):
+                    update_recommendations_batch(db, events_by_user)
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+
+        # After the DB write, so a retried batch is not counted twice
+        with timer.stage("sessions"):
+            session_store.record_batch(self.group_events(events, 'session_id'))
+        with timer.stage("trending"):
+            trending_counters.record_batch((data['product_id'], event_type) for data, event_type in events)
+
+    def _dead_letter(self, message, error: Exception):
+        record = {"topic": message.topic, "partition": message.partition, "offset": message.offset,
+                  "value": message.value, "error": str(error)}
+        self.skipped += 1
+        if self.dead_letter(record):
+            logger.error(f"Dead-lettered record {message.topic}/{message.partition}@{message.offset}: {str(error)}")
+        else:
+            logger.error(f"Skipping record {json.dumps(record, default=str)}")
+
+    def _isolate(self, messages, timer: RequestTimer):
+        """
+        Apply a batch that keeps failing by bisection. Halves that succeed are
+        written; a single record that fails is dead-lettered and skipped.
+        Transient errors stop the bisection, recording the messages not yet
+        applied on the error as `unapplied`.
+        """
+        chunks = [messages]
+        handled = 0
+        while chunks:
+            chunk = chunks.pop()
+            try:
+                self.process_batch(chunk, timer)
+            except Exception as e:
+                if _is_transient(e):
+                    e.unapplied = messages[handled:]
+                    raise
+                if len(chunk) > 1:
+                    # First half on top, so records are still applied in order
+                    middle = len(chunk) // 2
+                    chunks += [chunk[middle:], chunk[:middle]]
+                    continue
+                self._dead_letter(chunk[0], e)
+            handled += len(chunk)
+
+    def _rewind(self, records, messages=None):
+        """
+        Seek every partition in a failed batch back to its first offset, or to
+        the first offset among `messages` when only those are left to apply
+        """
+        first = {}
+        for message in messages if messages is not None else (m for ms in records.values() for m in ms):
+            first.setdefault((message.topic, message.partition), message.offset)
+        for partition in records:
+            offset = first.get((partition.topic, partition.partition))
+            if offset is not None:
+                self.consumer.seek(partition, offset)
+
+    def retry_delay(self) -> float:
+        """Seconds to wait before retrying after self.failures consecutive failures, doubling up to max_backoff"""
+        if not self.failures:
+            return 0.0
+        # Capped before exponentiating, so a long outage cannot overflow the float
+        return min(self.backoff * 2 ** min(self.failures - 1, 64), self.max_backoff)
+
+    def consume(self, records) -> bool:
+        """Apply and commit one poll's records, or rewind them for a retry; returns whether it succeeded"""
+        messages = [message for partition_messages in records.values() for message in partition_messages]
+        # Timed from the end of the poll, so idle waits are not counted
+        with RequestTimer("consumer_batch") as timer:
+            try:
+                if self.failures >= self.max_retries:
+                    self._isolate(messages, timer)
+                else:
+                    self.process_batch(messages, timer)
+                with timer.stage("commit"):
+                    self.consumer.commit()
+                self.failures = 0
+                logger.debug(f"Processed batch of {len(messages)} events")
+                return True
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Error processing Kafka batch of {len(messages)} events "
+                             f"(attempt {self.failures}): {str(e)}")
+                timer.fallback(e)
+                with timer.stage("rewind"):
+                    self._rewind(records, getattr(e, 'unapplied', None))
+                return False
+
     def run(self):
         try:
-            consumer = KafkaConsumer(
-                settings.KAFKA_TOPIC_EVENTS,
-                bootstrap_servers=settings.KAFKA_BOOTSTRAP_SERVERS,
-                auto_offset_reset='latest',
-                enable_auto_commit=True,
-                group_id='recommendation_processor',
-                value_deserializer=lambda m: json.loads(m.decode('utf-8'))
-            )
-            
-            logger.info("Kafka consumer started successfully")
-            
+            if self.consumer is None:
+                self.consumer = self._create_consumer()
+
+            logger.info(f"Kafka consumer started successfully (batch size {self.batch_size})")
+            trending_counters.start()
+
             while not self.stop_event.is_set():
-                for message in consumer:
-                    if self.stop_event.is_set():
-                        break
-                    
-                    try:
-                        # Process the event
-                        event = message.value
-                        event_type = event.get('event_type')
-                        data = event.get('data', {})
-                        
-                        logger.info(f"Processing event: {event_type}")
-                        
-                        # Create a new DB session for this event
-                        db = SessionLocal()
-                        try:
-                            if event_type in ['view', 'purchase', 'cart_add']:
-                                # Update recommendations based on user activity
-                                user_id = data.get('user_id')
-                                product_id = data.get('product_id')
-                                
-                                if user_id and product_id:
-                                    update_recommendations(db, user_id, product_id, event_type)
-                            
-                        finally:
-                            db.close()
-                            
-                    except Exception as e:
-                        logger.error(f"Error processing Kafka message: {str(e)}")
-            
-            consumer.close()
-            
+                records = self.consumer.poll(timeout_ms=self.poll_timeout_ms, max_records=self.batch_size)
+                if not records:
+                    continue
+
+                if not self.consume(records):
+                    # Back off so a persistent DB failure does not spin; not part of the batch's latency
+                    self.stop_event.wait(self.retry_delay())
+
+            self.consumer.close()
+            trending_counters.stop()
+
         except Exception as e:
-            logger.error(f"Kafka consumer error: {str(e)}")
\ No newline at end of file
+            logger.error(f"Kafka consumer error: {str(e)}")
@@ -1,62 +1,207 @@
 import json
-from typing import Dict, Any
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
 from kafka import KafkaProducer
 from app.core.config import settings
+from app.core.metrics import RequestTimer
+from app.kafka.spool import EventSpool
 import logging
 
 logger = logging.getLogger(__name__)
 
 class EventProducer:
-    def __init__(self):
-        self.producer = None
-        self.connected = False
-        self.connect()
-    
+    """
+    Publishes user events to Kafka.
+
+    In async mode (KAFKA_PRODUCER_ASYNC, the default) send_event hands the event
+    to the client's batching buffer and returns immediately; delivery is
+    confirmed by callbacks. Events that cannot be delivered - broker down,
+    delivery error - are written to a bounded on-disk spool and replayed on
+    the next successful (re)connect. Sync mode keeps the old behaviour of
+    waiting for the broker acknowledgement on every event.
+    """
+
+    def __init__(self, async_send: bool = None, producer=None, spool: EventSpool = None):
+        self.async_send = settings.KAFKA_PRODUCER_ASYNC if async_send is None else async_send
+        self.spool = spool or EventSpool(settings.KAFKA_SPOOL_PATH, settings.KAFKA_SPOOL_MAX_BYTES)
+        self.producer = producer
+        self.connected = producer is not None
+        self._last_connect_attempt = 0.0
+        self._lock = threading.Lock()
+        self.delivered = 0
+        self.failed = 0
+        # Set when something was spooled, so the next successful delivery triggers a replay
+        self._spooled = self.spool.has_events()
+        if not self.connected:
+            self.connect()
+
     def connect(self):
+        self._last_connect_attempt = time.monotonic()
         try:
             self.producer = KafkaProducer(
                 bootstrap_servers=settings.KAFKA_BOOTSTRAP_SERVERS,
                 value_serializer=lambda v: json.dumps(v).encode('utf-8'),
                 key_serializer=lambda v: v.encode('utf-8') if v else None,
                 acks='all',
-                retries=3
+                retries=3,
+                linger_ms=settings.KAFKA_PRODUCER_LINGER_MS,
+                batch_size=settings.KAFKA_PRODUCER_BATCH_SIZE,
+                compression_type=settings.KAFKA_PRODUCER_COMPRESSION or None,
+                # In async mode send() must not stall the request waiting for metadata or buffer space
+                max_block_ms=settings.KAFKA_PRODUCER_MAX_BLOCK_MS if self.async_send else 60000
             )
             self.connected = True
             logger.info("Successfully connected to Kafka")
+            self._spooled = False
+            self._replay_spool()
         except Exception as e:
             logger.error(f"Failed to connect to Kafka: {str(e)}")
             self.connected = False
-    
-    def send_event(self, event_type: str, data: Dict[str, Any], key: str = None):
-        if not self.connected:
+
+    def _ensure_connected(self) -> bool:
+        if self.connected:
+            return True
+        # Connecting to a dead broker blocks, so only retry after a backoff
+        if time.monotonic() - self._last_connect_attempt >= settings.KAFKA_RECONNECT_BACKOFF_SECONDS:
             self.connect()
-            if not self.connected:
+        return self.connected
+
+    def _replay_spool(self):
+        if not self.spool.has_events():
+            return
+
+        def replay():
+            try:
+                replayed = self.spool.replay(lambda event: self._publish(event['payload'], event.get('key')))
+                logger.info(f"Replayed {replayed} spooled events to Kafka")
+            except Exception as e:
+                logger.error(f"Failed to replay spooled events: {str(e)}")
+
+        threading.Thread(target=replay, name="event-spool-replay", daemon=True).start()
+
+    def _spool(self, payload: Dict[str, Any], key: str = None) -> bool:
+        self._spooled = True
+        return self.spool.append({"payload": payload, "key": key})
+
+    def _on_delivery(self, record_metadata):
+        with self._lock:
+            self.delivered += 1
+            replay = self._spooled
+            self._spooled = False
+        if replay:
+            # The broker is reachable again
+            self._replay_spool()
+
+    def _on_delivery_error(self, payload: Dict[str, Any], key: Optional[str], exc: Exception):
+        with self._lock:
+            self.failed += 1
+        logger.error(f"Failed to deliver event to Kafka: {str(exc)}")
+        if self.async_send:
+            self._spool(payload, key)
+
+    def _publish(self, payload: Dict[str, Any], key: str = None):
+        """Queue a payload on the client without waiting; outcome arrives via callbacks"""
+        future = self.producer.send(settings.KAFKA_TOPIC_EVENTS, key=key, value=payload)
+        future.add_callback(self._on_delivery)
+        # Called as _on_delivery_error(payload, key, exception)
+        future.add_errback(self._on_delivery_error, payload, key)
+        return future
+
+    def send_event(self, event_type: str, data: Dict[str, Any], key: str = None):
+        # Prepare event payload
+        event_payload = {
+            "event_type": event_type,
+            "data": data,
+            "timestamp": datetime.now().isoformat()
+        }
+
+        with RequestTimer("producer_send") as timer:
+            if not self._ensure_connected():
+                if self.async_send:
+                    # Keep the event for replay instead of losing it
+                    timer.fallback(reason="spooled")
+                    with timer.stage("spool"):
+                        return self._spool(event_payload, key)
                 logger.error("Cannot send event: not connected to Kafka")
+                timer.fallback(reason="disconnected")
+                return False
+
+            try:
+                with timer.stage("publish"):
+                    future = self._publish(event_payload, key)
+                if self.async_send:
+                    return True
+
+                # Wait for the result
+                with timer.stage("ack"):
+                    record_metadata = future.get(timeout=10)
+                logger.info(f"Event sent to {record_metadata.topic} partition {record_metadata.partition} offset {record_metadata.offset}")
+                return True
+
+            except Exception as e:
+                logger.error(f"Failed to send event to Kafka: {str(e)}")
+                timer.fallback(e)
+                if self.async_send:
+                    with timer.stage("spool"):
+                        return self._spool(event_payload, key)
                 return False
-        
+
+    def send_events(self, events: List[Tuple[str, Dict[str, Any], Optional[str]]]) -> int:
+        """
+        Publish many (event_type, data, key) events at once, e.g. a batch from
+        the write-behind ingestion queue. Connectivity is checked once and the
+        events go into the client's batching buffer together; without a
+        connection they are spooled. Returns the number handed to Kafka.
+        """
+        timestamp = datetime.now().isoformat()
+        payloads = [({"event_type": event_type, "data": data, "timestamp": timestamp}, key)
+                    for event_type, data, key in events]
+
+        with RequestTimer("producer_batch") as timer:
+            if not self._ensure_connected():
+                timer.fallback(reason="spooled")
+                with timer.stage("spool"):
+                    for payload, key in payloads:
+                        self._spool(payload, key)
+                return 0
+
+            sent = 0
+            with timer.stage("publish"):
+                for payload, key in payloads:
+                    try:
+                        self._publish(payload, key)
+                        sent += 1
+                    except Exception as e:
+                        logger.error(f"Failed to send event to Kafka: {str(e)}")
+                        self._spool(payload, key)
+            if not self.async_send:
+                # Sync mode waits for the broker, once for the whole batch
+                with timer.stage("ack"):
+                    self.producer.flush(timeout=10)
+            if sent < len(payloads):
+                timer.fallback(reason="spooled")
+            return sent
+
+    def send_dead_letter(self, record: Dict[str, Any]) -> bool:
+        """
+        Park a record the consumer could not apply on the dead-letter topic.
+        Never spooled: a replay would send it back to the events topic.
+        """
+        if not settings.KAFKA_TOPIC_DEAD_LETTER or not self._ensure_connected():
+            return False
         try:
-            # Prepare event payload
-            event_payload = {
-                "event_type": event_type,
-                "data": data,
-                "timestamp": datetime.now().isoformat()
-            }
-            
-            # Send to Kafka
-            future = self.producer.send(
-                settings.KAFKA_TOPIC_EVENTS,
-                key=key,
-                value=event_payload
-            )
-            
-            # Wait for the result
-            record_metadata = future.get(timeout=10)
-            logger.info(f"Event sent to {record_metadata.topic} partition {record_metadata.partition} offset {record_metadata.offset}")
+            self.producer.send(settings.KAFKA_TOPIC_DEAD_LETTER, value=record)
             return True
-            
         except Exception as e:
-            logger.error(f"Failed to send event to Kafka: {str(e)}")
+            logger.error(f"Failed to send record to the dead-letter topic: {str(e)}")
             return False
 
+    def flush(self, timeout: float = None):
+        """Block until buffered events are delivered (e.g. on shutdown)"""
+        if self.connected:
+            self.producer.flush(timeout=timeout)
+
 # Singleton instance
-event_producer = EventProducer()
\ No newline at end of file
+event_producer = EventProducer()
@@ -0,0 +1,79 @@
+import json
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+class EventSpool:
+    """
+    Bounded append-only JSON-lines file for events that could not reach Kafka.
+
+    Appends are dropped (and counted) once the file reaches max_bytes, so a long
+    broker outage cannot fill the disk. replay() moves the file aside before
+    reading it, so events spooled while a replay is running are kept for the
+    next one.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._replay_lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _size(self) -> int:
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def has_events(self) -> bool:
+        return self._size() > 0
+
+    def append(self, event: Dict[str, Any]) -> bool:
+        line = (json.dumps(event) + "\n").encode('utf-8')
+        with self._lock:
+            if self._size() + len(line) > self.max_bytes:
+                self.dropped += 1
+                logger.error(f"Event spool full ({self.max_bytes} bytes); dropping event")
+                return False
+            with open(self.path, 'ab') as f:
+                f.write(line)
+            return True
+
+    def replay(self, send: Callable[[Dict[str, Any]], None]) -> int:
+        """
+        Pass every spooled event to send(), returning the number replayed.
+
+        If send() raises, the remaining events stay on disk and the next replay
+        starts from the beginning of the moved file (at-least-once delivery).
+        """
+        if not self._replay_lock.acquire(blocking=False):
+            return 0
+        try:
+            replay_path = f"{self.path}.replay"
+            with self._lock:
+                if not os.path.exists(replay_path):
+                    if not self.has_events():
+                        return 0
+                    os.replace(self.path, replay_path)
+
+            replayed = 0
+            with open(replay_path, 'rb') as f:
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        logger.error("Skipping corrupt line in event spool")
+                        continue
+                    send(event)
+                    replayed += 1
+            os.remove(replay_path)
+            return replayed
+        finally:
+            self._replay_lock.release()
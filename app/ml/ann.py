@@ -0,0 +1,202 @@
+"""
+Approximate nearest-neighbour index for candidate retrieval.
+
+A small inverted-file (IVF) index in pure NumPy: item vectors are clustered
+with k-means, and a query only scores the items in the `nprobe` clusters whose
+centroids match it best. Raising `nprobe` trades latency for recall; setting it
+to `nlist` makes the search exact.
+
+The CF index is built over item factors and ranks by inner product; the CB
+index is built over normalised product vectors, so inner product is cosine.
+
+Usage:
+    python -m app.ml.ann [--nlist N]
+
+Rebuilding the index of the live version in place is picked up on the next
+model reload.
+"""
+import argparse
+import logging
+import os
+import pickle
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.ml.artifacts import current_version, is_artifact_dir, load_arrays, save_arrays, version_dir
+
+logger = logging.getLogger(__name__)
+
+# Index artifact names, stored next to the cf/cb model artifacts
+CF_INDEX = "cf_ann"
+CB_INDEX = "cb_ann"
+
+def _kmeans(vectors: np.ndarray, nlist: int, iterations: int = 20, seed: int = 0) -> np.ndarray:
+    """Plain Lloyd's k-means, returning an (nlist, dim) centroid matrix"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=nlist, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignments = _assign(vectors, centroids)
+        counts = np.bincount(assignments, minlength=nlist)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+
+        # Re-seed empty clusters with random points so every list stays usable
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = vectors[rng.choice(len(vectors), size=int(empty.sum()), replace=False)]
+            counts[empty] = 1
+        centroids = sums / counts[:, None]
+
+    return centroids.astype(np.float32)
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray, block_size: int = 8192) -> np.ndarray:
+    """Assign each vector to its nearest centroid (L2), in blocks to bound memory"""
+    centroid_norms = (centroids ** 2).sum(axis=1)
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), block_size):
+        block = vectors[start:start + block_size]
+        # ||x - c||^2 = ||x||^2 - 2x.c + ||c||^2, and ||x||^2 does not change the argmin
+        distances = centroid_norms[None, :] - 2.0 * (block @ centroids.T)
+        assignments[start:start + block_size] = distances.argmin(axis=1)
+    return assignments
+
+class IVFIndex:
+    """Inverted-file index with inner-product scoring over the probed clusters"""
+
+    def __init__(self, centroids: np.ndarray, offsets: np.ndarray, ids: np.ndarray,
+                 vectors: np.ndarray, normalize: bool = False):
+        self.centroids = centroids
+        # Items of cluster c live in ids/vectors[offsets[c]:offsets[c + 1]]
+        self.offsets = offsets
+        self.ids = ids
+        self.vectors = vectors
+        self.normalize = normalize
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, ids: np.ndarray, vectors: np.ndarray, nlist: Optional[int] = None,
+              normalize: bool = False, train_size: int = 100_000, seed: int = 0) -> "IVFIndex":
+        """Cluster the vectors and lay each cluster out contiguously"""
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if normalize:
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.where(norms == 0, 1.0, norms)
+
+        if nlist is None:
+            # sqrt(N) lists is the usual starting point for IVF
+            nlist = int(np.sqrt(len(ids)))
+        nlist = max(1, min(nlist, len(ids)))
+
+        # Train on a sample; assignment of the full set is cheap by comparison
+        rng = np.random.default_rng(seed)
+        sample = vectors if len(vectors) <= train_size else vectors[rng.choice(len(vectors), train_size, replace=False)]
+        centroids = _kmeans(sample, nlist, seed=seed)
+
+        assignments = _assign(vectors, centroids)
+        order = np.argsort(assignments, kind='stable')
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignments, minlength=nlist), out=offsets[1:])
+
+        return cls(centroids, offsets, ids[order], np.ascontiguousarray(vectors[order]), normalize)
+
+    def _probe(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        """Return the item rows that belong to the nprobe best-matching clusters"""
+        nprobe = max(1, min(nprobe, self.nlist))
+        centroid_scores = self.centroids @ query
+        clusters = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        return np.concatenate([np.arange(self.offsets[c], self.offsets[c + 1]) for c in clusters])
+
+    def search(self, query: np.ndarray, k: int, nprobe: int = 8,
+               exclude: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (ids, scores) of the approximate top-k items for a query vector, best first"""
+        query = np.asarray(query, dtype=np.float32)
+        if self.normalize:
+            norm = np.linalg.norm(query)
+            query = query / norm if norm else query
+
+        rows = self._probe(query, nprobe)
+        ids = self.ids[rows]
+        scores = self.vectors[rows] @ query
+        if exclude is not None and len(exclude):
+            scores[np.isin(ids, exclude)] = -np.inf
+
+        k = min(k, len(rows))
+        if k <= 0:
+            return ids[:0], scores[:0]
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(rows) else np.arange(len(rows))
+        top = top[np.argsort(-scores[top], kind='stable')]
+        top = top[np.isfinite(scores[top])]
+        return ids[top], scores[top]
+
+    def save(self, path: str):
+        save_arrays(path, {
+            'centroids': self.centroids,
+            'offsets': self.offsets,
+            'ids': self.ids,
+            'vectors': self.vectors
+        }, meta={'normalize': self.normalize})
+
+    @classmethod
+    def load(cls, path: str) -> Optional["IVFIndex"]:
+        """
+        Load a persisted index (memory-mapped artifact directory, or a legacy
+        <path>.pkl), or return None so callers fall back to exact scoring
+        """
+        try:
+            if is_artifact_dir(path):
+                return cls(**load_arrays(path))
+            if os.path.exists(f"{path}.pkl"):
+                with open(f"{path}.pkl", 'rb') as f:
+                    return cls(**pickle.load(f))
+            return None
+        except Exception as e:
+            logger.error(f"Error loading ANN index from {path}: {str(e)}")
+            return None
+
+def build_indexes(directory: str, nlist: Optional[int] = None) -> List[str]:
+    """
+    Build the CF and CB indexes for the model artifacts in `directory` (a
+    version directory, or a MODEL_PATH holding legacy pickles) and write them
+    alongside
+    """
+    from app.ml.recommender import CollaborativeFilteringModel, ContentBasedModel
+
+    written = []
+
+    cf_path = os.path.join(directory, "cf")
+    cf = CollaborativeFilteringModel(cf_path if is_artifact_dir(cf_path) else os.path.join(directory, "cf_model.pkl"))
+    if len(cf.model['item_ids']):
+        path = os.path.join(directory, CF_INDEX)
+        IVFIndex.build(cf.model['item_ids'], cf.model['item_factors'], nlist=nlist).save(path)
+        written.append(path)
+
+    cb_path = os.path.join(directory, "cb")
+    cb = ContentBasedModel(cb_path if is_artifact_dir(cb_path) else os.path.join(directory, "cb_model.pkl"))
+    if cb.model['product_vectors'].size:
+        path = os.path.join(directory, CB_INDEX)
+        IVFIndex.build(cb.model['product_ids'], cb.model['product_vectors'], nlist=nlist, normalize=True).save(path)
+        written.append(path)
+
+    return written
+
+def main():
+    parser = argparse.ArgumentParser(description="Build ANN indexes next to the live model artifacts")
+    parser.add_argument("--model-path", default=settings.MODEL_PATH)
+    parser.add_argument("--nlist", type=int, default=settings.ANN_NLIST or None)
+    args = parser.parse_args()
+
+    version = current_version(args.model_path)
+    directory = version_dir(args.model_path, version) if version else args.model_path
+    for path in build_indexes(directory, args.nlist):
+        logger.info(f"Wrote ANN index {path}")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
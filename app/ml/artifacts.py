@@ -0,0 +1,104 @@
+"""
+Versioned, memory-mappable model artifacts.
+
+Layout under MODEL_PATH:
+
+    CURRENT                     name of the live version (replaced atomically)
+    versions/<version>/cf/      one .npy file per array + manifest.json
+    versions/<version>/cb/
+    versions/<version>/cf_ann/  optional ANN indexes, same format
+    versions/<version>/cb_ann/
+
+Arrays are loaded with mmap_mode='r', so every worker process on a host maps
+the same files and shares their pages through the OS page cache instead of
+holding a private copy.
+"""
+import json
+import logging
+import os
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+
+def current_version(model_path: str) -> Optional[str]:
+    try:
+        with open(os.path.join(model_path, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def version_dir(model_path: str, version: str) -> str:
+    return os.path.join(model_path, "versions", version)
+
+def resolve_artifact(model_path: str, name: str, legacy_file: str) -> str:
+    """Path of the live `name` artifact: the current version's directory, or the legacy pickle"""
+    version = current_version(model_path)
+    if version:
+        return os.path.join(version_dir(model_path, version), name)
+    return os.path.join(model_path, legacy_file)
+
+def is_artifact_dir(path: str) -> bool:
+    return os.path.isfile(os.path.join(path, MANIFEST_FILE))
+
+def _write_array(directory: str, key: str, array: np.ndarray) -> Dict[str, Any]:
+    array = np.ascontiguousarray(array)
+    # Rename into place: processes mapping the old file keep their pages intact
+    tmp_path = os.path.join(directory, f"{key}.npy.tmp")
+    with open(tmp_path, "wb") as f:
+        np.save(f, array, allow_pickle=False)
+    os.replace(tmp_path, os.path.join(directory, f"{key}.npy"))
+    return {"dtype": str(array.dtype), "shape": list(array.shape)}
+
+def _write_manifest(directory: str, manifest: Dict[str, Any]):
+    tmp_path = os.path.join(directory, f"{MANIFEST_FILE}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(directory, MANIFEST_FILE))
+
+def save_arrays(directory: str, arrays: Dict[str, np.ndarray], meta: Optional[Dict[str, Any]] = None):
+    """Write each array as <key>.npy plus a manifest describing them"""
+    os.makedirs(directory, exist_ok=True)
+    manifest = {"arrays": {}, "meta": meta or {}}
+    for key, array in arrays.items():
+        manifest["arrays"][key] = _write_array(directory, key, array)
+
+    # The manifest is written last, so a directory with a manifest is complete
+    _write_manifest(directory, manifest)
+
+def add_arrays(directory: str, arrays: Dict[str, np.ndarray]):
+    """Add arrays to a saved artifact directory, leaving its other arrays and meta untouched"""
+    with open(os.path.join(directory, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    for key, array in arrays.items():
+        manifest["arrays"][key] = _write_array(directory, key, array)
+    _write_manifest(directory, manifest)
+
+def save_model(directory: str, model: Dict[str, Any]):
+    """Save a model dict: ndarray values become .npy files, the rest goes to the manifest"""
+    arrays = {key: value for key, value in model.items() if isinstance(value, np.ndarray)}
+    meta = {key: value for key, value in model.items() if key not in arrays}
+    save_arrays(directory, arrays, meta)
+
+def load_arrays(directory: str, mmap: bool = True) -> Dict[str, Any]:
+    """Load an artifact directory as {key: array, **meta}, memory-mapping the arrays by default"""
+    with open(os.path.join(directory, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+
+    loaded = dict(manifest.get("meta", {}))
+    for key in manifest["arrays"]:
+        loaded[key] = np.load(os.path.join(directory, f"{key}.npy"), mmap_mode="r" if mmap else None,
+                              allow_pickle=False)
+    return loaded
+
+def publish_version(model_path: str, version: str):
+    """Atomically point CURRENT at a fully written version"""
+    tmp_path = os.path.join(model_path, f"{CURRENT_FILE}.tmp")
+    with open(tmp_path, "w") as f:
+        f.write(version)
+    os.replace(tmp_path, os.path.join(model_path, CURRENT_FILE))
+    logger.info(f"Published model version {version}")
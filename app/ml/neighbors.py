@@ -0,0 +1,173 @@
+"""
+Offline build step for the content-based nearest-neighbour index.
+
+Computes every product's top-N most similar products from the content model's
+product vectors and stores them as fixed-width (ids, scores) arrays, so a
+similarity lookup at request time is a single row slice.
+
+Usage:
+    python -m app.ml.neighbors [--model-path PATH] [--top-n N] [--block-size B]
+"""
+import argparse
+import logging
+import os
+import pickle
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.ml.ann import CB_INDEX, IVFIndex
+from app.ml.artifacts import is_artifact_dir, load_arrays, resolve_artifact, save_model
+
+logger = logging.getLogger(__name__)
+
+# Padding value for rows with fewer than top_n neighbours
+NO_NEIGHBOR = -1
+
+def stack_vectors(product_vectors: Dict[int, np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """Convert {product_id: vector} into sorted ids and an aligned float32 matrix"""
+    ids = np.fromiter(product_vectors.keys(), dtype=np.int64, count=len(product_vectors))
+    if not len(ids):
+        return ids, np.zeros((0, 0), dtype=np.float32)
+
+    matrix = np.vstack(list(product_vectors.values())).astype(np.float32)
+    order = np.argsort(ids, kind='stable')
+    return ids[order], np.ascontiguousarray(matrix[order])
+
+def build_neighbor_index(product_ids: np.ndarray, vectors: np.ndarray, top_n: int = 50,
+                         block_size: int = 1024) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Compute the top_n cosine neighbours of every product in blocks of rows.
+
+    Peak memory is block_size x len(product_ids) scores rather than the full
+    N x N similarity matrix. Returns (neighbor_ids, neighbor_scores), both of
+    shape (N, top_n), best first and padded with NO_NEIGHBOR / -inf.
+    """
+    n = len(product_ids)
+    width = max(top_n, 0)
+    neighbor_ids = np.full((n, width), NO_NEIGHBOR, dtype=np.int64)
+    neighbor_scores = np.full((n, width), -np.inf, dtype=np.float32)
+    if n < 2 or width == 0:
+        return neighbor_ids, neighbor_scores
+
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    normalized = (vectors / np.where(norms == 0, 1.0, norms)).astype(np.float32)
+    k = min(width, n - 1)
+
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        scores = normalized[start:stop] @ normalized.T
+
+        # A product is never its own neighbour
+        rows = np.arange(stop - start)
+        scores[rows, rows + start] = -np.inf
+
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+
+        neighbor_ids[start:stop, :k] = product_ids[np.take_along_axis(top, order, axis=1)]
+        neighbor_scores[start:stop, :k] = np.take_along_axis(top_scores, order, axis=1)
+
+    return neighbor_ids, neighbor_scores
+
+def build_neighbor_index_ann(product_ids: np.ndarray, vectors: np.ndarray, index: IVFIndex,
+                             top_n: int = 50, nprobe: int = 8) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Approximate variant of build_neighbor_index that only scores the items in
+    each product's probed IVF clusters, for catalogs where N x N is too slow.
+    """
+    neighbor_ids = np.full((len(product_ids), top_n), NO_NEIGHBOR, dtype=np.int64)
+    neighbor_scores = np.full((len(product_ids), top_n), -np.inf, dtype=np.float32)
+
+    for row in range(len(product_ids)):
+        ids, scores = index.search(vectors[row], top_n, nprobe, exclude=product_ids[row:row + 1])
+        neighbor_ids[row, :len(ids)] = ids
+        neighbor_scores[row, :len(ids)] = scores
+
+    return neighbor_ids, neighbor_scores
+
+def index_from_similarity_matrix(similarity_matrix: Dict[int, Dict[int, float]],
+                                 top_n: int = 50) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Convert a legacy dict-of-dicts similarity matrix into fixed-width neighbour arrays"""
+    product_ids = np.array(sorted(similarity_matrix.keys()), dtype=np.int64)
+    neighbor_ids = np.full((len(product_ids), top_n), NO_NEIGHBOR, dtype=np.int64)
+    neighbor_scores = np.full((len(product_ids), top_n), -np.inf, dtype=np.float32)
+
+    for row, product_id in enumerate(product_ids.tolist()):
+        similarities = [(pid, score) for pid, score in similarity_matrix[product_id].items() if pid != product_id]
+        similarities.sort(key=lambda x: x[1], reverse=True)
+        similarities = similarities[:top_n]
+        if similarities:
+            neighbor_ids[row, :len(similarities)] = [pid for pid, _ in similarities]
+            neighbor_scores[row, :len(similarities)] = [score for _, score in similarities]
+
+    return product_ids, neighbor_ids, neighbor_scores
+
+def build_model_index(model: dict, top_n: int = 50, block_size: int = 1024,
+                      ann_index: Optional[IVFIndex] = None, nprobe: int = 8) -> dict:
+    """Add a neighbour index to a content model dict, dropping the dense similarity matrix"""
+    vectors = model.get('product_vectors', {})
+    if isinstance(vectors, dict):
+        product_ids, vectors = stack_vectors(vectors)
+    else:
+        product_ids = np.asarray(model['product_ids'], dtype=np.int64)
+
+    if len(product_ids) and ann_index is not None:
+        neighbor_ids, neighbor_scores = build_neighbor_index_ann(product_ids, vectors, ann_index, top_n, nprobe)
+    elif len(product_ids):
+        neighbor_ids, neighbor_scores = build_neighbor_index(product_ids, vectors, top_n, block_size)
+    else:
+        product_ids, neighbor_ids, neighbor_scores = index_from_similarity_matrix(
+            model.get('similarity_matrix', {}), top_n
+        )
+
+    model.pop('similarity_matrix', None)
+    model.update({
+        'product_ids': product_ids,
+        'product_vectors': vectors,
+        'neighbor_ids': neighbor_ids,
+        'neighbor_scores': neighbor_scores
+    })
+    return model
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute top-N neighbours for the content model")
+    parser.add_argument("--model-path", default=resolve_artifact(settings.MODEL_PATH, "cb", "cb_model.pkl"))
+    parser.add_argument("--top-n", type=int, default=settings.SIMILAR_TOP_N)
+    parser.add_argument("--block-size", type=int, default=1024)
+    parser.add_argument("--ann", action="store_true", help="Use the persisted CB ANN index instead of exact search")
+    args = parser.parse_args()
+
+    artifact_dir = is_artifact_dir(args.model_path)
+    if artifact_dir:
+        model = load_arrays(args.model_path, mmap=False)
+    else:
+        with open(args.model_path, 'rb') as f:
+            model = pickle.load(f)
+
+    ann_index = None
+    if args.ann:
+        ann_index = IVFIndex.load(os.path.join(os.path.dirname(args.model_path), CB_INDEX))
+        if ann_index is None:
+            parser.error("No CB ANN index found; run `python -m app.ml.ann` first")
+
+    model = build_model_index(model, top_n=args.top_n, block_size=args.block_size,
+                              ann_index=ann_index, nprobe=settings.ANN_NPROBE)
+    logger.info(f"Built neighbour index for {len(model['product_ids'])} products (top {args.top_n})")
+
+    if artifact_dir:
+        # Arrays are renamed into place, so workers mapping the old files are unaffected
+        save_model(args.model_path, model)
+        return
+
+    # Write next to the original and rename so running workers never read a partial file
+    tmp_path = f"{args.model_path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, args.model_path)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,240 @@
+"""
+Offline job that materializes collaborative top-K lists into the recommendations table.
+
+Active users (any event in the last PRECOMPUTE_ACTIVE_DAYS) are split into
+chunks and scored by a pool of worker processes, each memory-mapping the live
+CF model and scoring its chunk with batched matrix products. Results go into a
+staging table - on PostgreSQL each worker streams its rows with COPY - which
+then replaces the live table in one short transaction:
+
+    1. lock the live table against writes
+    2. carry over rows written since the job started (online updates from the
+       event consumer) and rows of other algorithms
+    3. rename live -> old, staging -> live, drop old
+
+Readers see either the complete old table or the complete new one. Other
+databases (SQLite in development) skip the staging table and replace the
+collaborative rows inside a single transaction.
+
+Usage:
+    python -m app.ml.precompute [--workers W] [--chunk-size N] [--top-k K]
+"""
+import argparse
+import csv
+import io
+import logging
+import multiprocessing
+import os
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import Table, create_engine, delete, func, insert, select, text
+from sqlalchemy.pool import NullPool
+
+from app.core.config import settings
+from app.db.session import DATABASE_URL, SessionLocal, engine
+from app.models.product import Product
+from app.models.recommendation import Recommendation
+from app.models.user import User
+from app.models.user_event import UserEvent
+from app.services.catalog import CatalogSnapshot, product_catalog
+
+logger = logging.getLogger(__name__)
+
+ALGORITHM = "collaborative"
+LIVE_TABLE = Recommendation.__tablename__
+STAGING_TABLE = f"{LIVE_TABLE}_staging"
+COLUMNS = ("user_id", "product_id", "score", "algorithm", "created_at")
+
+# Per-process state of the pool workers, set by _init_worker
+_worker = {}
+
+def active_user_ids(db, days: int = None) -> List[int]:
+    """Users with at least one event in the activity window"""
+    days = days or settings.PRECOMPUTE_ACTIVE_DAYS
+    query = select(UserEvent.user_id).where(
+        UserEvent.timestamp >= datetime.now() - timedelta(days=days)
+    ).distinct()
+    return [user_id for user_id, in db.execute(query)]
+
+def _init_worker(catalog: CatalogSnapshot, top_k: int, created_at: datetime, copy: bool):
+    # Imported here so the parent does not load the models it never uses
+    from app.ml.recommender import CollaborativeFilteringModel
+
+    _worker.update({
+        "model": CollaborativeFilteringModel(),
+        "catalog": catalog,
+        "top_k": top_k,
+        "created_at": created_at,
+        "engine": create_engine(DATABASE_URL, poolclass=NullPool) if copy else None
+    })
+
+def _score_chunk(user_ids: List[int]) -> list:
+    """Score one chunk of users; COPY the rows into staging, or return them to the parent"""
+    from app.ml.recommender import _available
+
+    model, catalog, top_k = _worker["model"], _worker["catalog"], _worker["top_k"]
+    created_at = _worker["created_at"]
+    rows = []
+    for user_id, candidates in model.top_k_batch(user_ids, top_k * settings.CANDIDATE_OVERFETCH,
+                                                 exclude=catalog.out_of_stock_ids):
+        for product_id, score in _available(catalog, candidates)[:top_k]:
+            rows.append((user_id, product_id, score, ALGORITHM, created_at))
+
+    if _worker["engine"] is None:
+        return rows
+    _copy_rows(_worker["engine"], rows)
+    return [len(rows)]
+
+def _copy_rows(target_engine, rows: list):
+    """Stream rows into the staging table with PostgreSQL COPY"""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    connection = target_engine.raw_connection()
+    try:
+        with connection.cursor() as cursor:
+            cursor.copy_expert(f"COPY {STAGING_TABLE} ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer)
+        connection.commit()
+    finally:
+        connection.close()
+
+def _create_staging(connection):
+    connection.execute(text(f"DROP TABLE IF EXISTS {STAGING_TABLE}"))
+    # Indexes and constraints are added after the load, which is much faster than maintaining them
+    connection.execute(text(
+        f"CREATE TABLE {STAGING_TABLE} (LIKE {LIVE_TABLE} INCLUDING DEFAULTS)"
+    ))
+    # The live id sequence is owned by the live table and dropped with it, so staging gets its own
+    connection.execute(text(f"CREATE SEQUENCE {STAGING_TABLE}_id_seq OWNED BY {STAGING_TABLE}.id"))
+    connection.execute(text(
+        f"ALTER TABLE {STAGING_TABLE} ALTER COLUMN id SET DEFAULT nextval('{STAGING_TABLE}_id_seq')"
+    ))
+
+def _index_staging(connection):
+    """Give staging the live table's constraints and indexes, under temporary names"""
+    constraints = connection.execute(text(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = CAST(:table AS regclass) AND contype IN ('p', 'f')"
+    ), {"table": LIVE_TABLE}).all()
+    for name, definition in constraints:
+        connection.execute(text(f"ALTER TABLE {STAGING_TABLE} ADD CONSTRAINT {name}_staging {definition}"))
+
+    indexes = connection.execute(text(
+        "SELECT i.relname, pg_get_indexdef(i.oid) FROM pg_index x "
+        "JOIN pg_class i ON i.oid = x.indexrelid "
+        "WHERE x.indrelid = CAST(:table AS regclass) AND NOT x.indisprimary"
+    ), {"table": LIVE_TABLE}).all()
+    for name, definition in indexes:
+        definition = definition.replace(f"INDEX {name} ON", f"INDEX {name}_staging ON", 1)
+        definition = definition.replace(f".{LIVE_TABLE} USING", f".{STAGING_TABLE} USING", 1)
+        connection.execute(text(definition))
+    connection.execute(text(f"ANALYZE {STAGING_TABLE}"))
+
+def _swap_staging(connection, started: datetime):
+    """Replace the live table with staging; runs inside one transaction"""
+    connection.execute(text(f"LOCK TABLE {LIVE_TABLE} IN EXCLUSIVE MODE"))
+
+    # Keep what the job does not own: other algorithms, and users the consumer refreshed meanwhile
+    carried = "algorithm <> :algorithm OR created_at >= :started"
+    params = {"algorithm": ALGORITHM, "started": started}
+    connection.execute(text(
+        f"DELETE FROM {STAGING_TABLE} WHERE user_id IN "
+        f"(SELECT user_id FROM {LIVE_TABLE} WHERE algorithm = :algorithm AND created_at >= :started)"
+    ), params)
+    connection.execute(text(
+        f"INSERT INTO {STAGING_TABLE} ({', '.join(COLUMNS)}) "
+        f"SELECT {', '.join(COLUMNS)} FROM {LIVE_TABLE} WHERE {carried}"
+    ), params)
+
+    connection.execute(text(f"ALTER TABLE {LIVE_TABLE} RENAME TO {LIVE_TABLE}_old"))
+    connection.execute(text(f"ALTER TABLE {STAGING_TABLE} RENAME TO {LIVE_TABLE}"))
+    connection.execute(text(f"DROP TABLE {LIVE_TABLE}_old"))
+
+    # Restore the canonical names so the next run can reuse the staging ones
+    for name, in connection.execute(text(
+        "SELECT conname FROM pg_constraint WHERE conrelid = CAST(:table AS regclass) AND conname LIKE '%\\_staging'"
+    ), {"table": LIVE_TABLE}).all():
+        connection.execute(text(f"ALTER TABLE {LIVE_TABLE} RENAME CONSTRAINT {name} TO {name[:-len('_staging')]}"))
+    for name, in connection.execute(text(
+        "SELECT indexname FROM pg_indexes WHERE tablename = :table AND indexname LIKE '%\\_staging'"
+    ), {"table": LIVE_TABLE}).all():
+        connection.execute(text(f"ALTER INDEX {name} RENAME TO {name[:-len('_staging')]}"))
+    connection.execute(text(f"ALTER SEQUENCE {STAGING_TABLE}_id_seq RENAME TO {LIVE_TABLE}_id_seq"))
+
+def _replace_in_place(connection, rows: list, started: datetime):
+    """Fallback for databases without COPY and transactional renames"""
+    table: Table = Recommendation.__table__
+    refreshed = select(table.c.user_id).where(table.c.algorithm == ALGORITHM, table.c.created_at >= started)
+    connection.execute(delete(table).where(table.c.algorithm == ALGORITHM, table.c.user_id.notin_(refreshed)))
+    skip = {user_id for user_id, in connection.execute(refreshed)}
+    batch = [dict(zip(COLUMNS, row)) for row in rows if row[0] not in skip]
+    for start in range(0, len(batch), settings.PRECOMPUTE_INSERT_BATCH):
+        connection.execute(insert(table), batch[start:start + settings.PRECOMPUTE_INSERT_BATCH])
+
+def precompute(workers: Optional[int] = None, chunk_size: int = None, top_k: int = None) -> int:
+    """Run the job and return the number of rows written"""
+    workers = workers or os.cpu_count()
+    chunk_size = chunk_size or settings.PRECOMPUTE_CHUNK_SIZE
+    top_k = top_k or settings.RECOMMENDATIONS_PER_USER
+    copy = engine.dialect.name == "postgresql"
+
+    db = SessionLocal()
+    try:
+        # Database time, so the carry-over compares against the same clock as created_at
+        started = db.execute(select(func.now())).scalar()
+        if isinstance(started, str):
+            # SQLite returns CURRENT_TIMESTAMP as text
+            started = datetime.fromisoformat(started)
+        user_ids = active_user_ids(db)
+        catalog = product_catalog.get(db)
+    finally:
+        db.close()
+    logger.info(f"Precomputing top-{top_k} for {len(user_ids)} active users with {workers} workers")
+
+    if copy:
+        with engine.begin() as connection:
+            _create_staging(connection)
+
+    chunks = [user_ids[i:i + chunk_size] for i in range(0, len(user_ids), chunk_size)]
+    context = multiprocessing.get_context("spawn")
+    written, rows = 0, []
+    try:
+        with context.Pool(workers, initializer=_init_worker, initargs=(catalog, top_k, started, copy)) as pool:
+            for result in pool.imap_unordered(_score_chunk, chunks):
+                if copy:
+                    written += result[0]
+                else:
+                    rows.extend(result)
+        if copy:
+            with engine.begin() as connection:
+                _index_staging(connection)
+            with engine.begin() as connection:
+                _swap_staging(connection, started)
+        else:
+            with engine.begin() as connection:
+                _replace_in_place(connection, rows, started)
+            written = len(rows)
+    except Exception:
+        if copy:
+            with engine.begin() as connection:
+                connection.execute(text(f"DROP TABLE IF EXISTS {STAGING_TABLE}"))
+        raise
+
+    return written
+
+def main():
+    parser = argparse.ArgumentParser(description="Materialize collaborative top-K lists into the recommendations table")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunk-size", type=int, default=settings.PRECOMPUTE_CHUNK_SIZE)
+    parser.add_argument("--top-k", type=int, default=settings.RECOMMENDATIONS_PER_USER)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    written = precompute(args.workers, args.chunk_size, args.top_k)
+    logger.info(f"Wrote {written} recommendations in {time.perf_counter() - started:.1f}s")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
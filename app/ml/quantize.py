@@ -0,0 +1,181 @@
+"""
+Quantized storage for the CF item factors and the content model's product vectors.
+
+FACTOR_QUANTIZATION selects the representation full scans read:
+
+    float16   2 bytes per value
+    int8      1 byte per value plus one float32 scale per row (symmetric,
+              scale = max |x| / 127)
+
+The quantized arrays are stored next to the float32 ones in the artifact
+directory (item_factors_int8.npy, item_factors_int8_scale.npy, ...). Both
+are memory-mapped, and scans only touch the quantized pages. The float32
+rows are read only to re-rank the best k * QUANTIZED_RERANK candidates
+exactly, so the page cache each host keeps warm shrinks to about a half
+(float16) or a quarter (int8). Gathers of a few rows (predict, hybrid
+candidates, online updates) keep using float32.
+
+Usage:
+    python -m app.ml.quantize [--model-path PATH] [--dtype int8|float16]
+"""
+import argparse
+import logging
+import os
+from typing import List, Optional
+
+import numpy as np
+
+from app.core.config import settings
+from app.ml.artifacts import add_arrays, current_version, is_artifact_dir, load_arrays, version_dir
+
+logger = logging.getLogger(__name__)
+
+QUANTIZED_DTYPES = ("float16", "int8")
+# Matrix arrays that get a quantized copy, per artifact
+QUANTIZED_ARRAYS = {"cf": "item_factors", "cb": "product_vectors"}
+# Rows dequantized per step of a scan: small enough for the float32 block to stay in cache
+SCAN_BLOCK_ROWS = 2048
+
+class QuantizedMatrix:
+    """A float16 matrix, or an int8 matrix with per-row float32 scales"""
+
+    def __init__(self, codes: np.ndarray, scales: Optional[np.ndarray] = None):
+        self.codes = codes
+        self.scales = scales
+
+    @classmethod
+    def quantize(cls, matrix: np.ndarray, dtype: str, block_size: int = SCAN_BLOCK_ROWS) -> "QuantizedMatrix":
+        if dtype not in QUANTIZED_DTYPES:
+            raise ValueError(f"Unknown quantization dtype: {dtype} (expected one of {', '.join(QUANTIZED_DTYPES)})")
+        if dtype == "float16":
+            return cls(np.asarray(matrix, dtype=np.float16))
+
+        codes = np.empty(matrix.shape, dtype=np.int8)
+        scales = np.empty(matrix.shape[0], dtype=np.float32)
+        for start in range(0, matrix.shape[0], block_size):
+            block = np.asarray(matrix[start:start + block_size], dtype=np.float32)
+            peak = np.abs(block).max(axis=1) if block.shape[1] else np.zeros(len(block), dtype=np.float32)
+            scale = np.where(peak > 0, peak / 127, 1.0).astype(np.float32)
+            codes[start:start + block_size] = np.clip(np.rint(block / scale[:, None]), -127, 127)
+            scales[start:start + block_size] = scale
+        return cls(codes, scales)
+
+    @property
+    def dtype(self) -> str:
+        return str(self.codes.dtype)
+
+    @property
+    def shape(self) -> tuple:
+        return self.codes.shape
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def __len__(self) -> int:
+        return self.codes.shape[0]
+
+    def take(self, rows: np.ndarray) -> np.ndarray:
+        """Dequantized float32 copies of some rows"""
+        values = self.codes[rows].astype(np.float32)
+        if self.scales is not None:
+            values *= self.scales[rows, None]
+        return values
+
+    def scores(self, queries: np.ndarray, block_size: int = SCAN_BLOCK_ROWS) -> np.ndarray:
+        """
+        Dot products of every row with a query (d,) or with each of several
+        queries (m, d), returning (n,) or (m, n) float32. Rows are converted
+        block by block, so the full float32 matrix never exists.
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        out = np.empty(queries.shape[:-1] + (len(self),), dtype=np.float32)
+        for start in range(0, len(self), block_size):
+            block = self.codes[start:start + block_size].astype(np.float32)
+            if queries.ndim == 1:
+                np.matmul(block, queries, out=out[start:start + block_size])
+            else:
+                np.matmul(queries, block.T, out=out[:, start:start + block_size])
+        if self.scales is not None:
+            out *= self.scales
+        return out
+
+    def row_norms(self, block_size: int = SCAN_BLOCK_ROWS) -> np.ndarray:
+        norms = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), block_size):
+            norms[start:start + block_size] = np.linalg.norm(self.codes[start:start + block_size].astype(np.float32),
+                                                             axis=1)
+        if self.scales is not None:
+            norms *= self.scales
+        return norms
+
+    def arrays(self, key: str) -> dict:
+        """The arrays to store for matrix `key`, named as load_quantized expects them"""
+        arrays = {f"{key}_{self.dtype}": self.codes}
+        if self.scales is not None:
+            arrays[f"{key}_{self.dtype}_scale"] = self.scales
+        return arrays
+
+def reranks(quantized: Optional[QuantizedMatrix]) -> bool:
+    return quantized is not None and settings.QUANTIZED_RERANK > 0
+
+def candidate_depth(quantized: Optional[QuantizedMatrix], k: int) -> int:
+    """Candidates to take from a scan: k, or k * QUANTIZED_RERANK when they are re-ranked exactly"""
+    return k * settings.QUANTIZED_RERANK if reranks(quantized) else k
+
+def load_quantized(model: dict, key: str, dtype: Optional[str] = None) -> Optional[QuantizedMatrix]:
+    """
+    The quantized copy of model[key] in the FACTOR_QUANTIZATION dtype, or None
+    when quantization is off. Artifacts without the arrays are quantized at
+    load time, which costs memory in every worker; run this module once to
+    store them instead.
+    """
+    dtype = settings.FACTOR_QUANTIZATION if dtype is None else dtype
+    if not dtype:
+        return None
+    if dtype not in QUANTIZED_DTYPES:
+        logger.error(f"Unknown FACTOR_QUANTIZATION {dtype!r}; scanning float32 {key}")
+        return None
+    matrix = model.get(key)
+    if not isinstance(matrix, np.ndarray) or not matrix.size:
+        return None
+    codes = model.get(f"{key}_{dtype}")
+    if codes is not None and codes.shape == matrix.shape:
+        return QuantizedMatrix(codes, model.get(f"{key}_{dtype}_scale"))
+
+    logger.warning(f"Model has no {dtype} copy of {key}; quantizing at load time. "
+                   "Run `python -m app.ml.quantize` to store it with the artifact.")
+    return QuantizedMatrix.quantize(matrix, dtype)
+
+def quantize_artifacts(directory: str, dtype: str) -> List[str]:
+    """Add quantized copies of the matrices in a version directory's cf/ and cb/ artifacts"""
+    written = []
+    for name, key in QUANTIZED_ARRAYS.items():
+        path = os.path.join(directory, name)
+        if not is_artifact_dir(path):
+            continue
+        matrix = load_arrays(path).get(key)
+        if matrix is None or not matrix.size:
+            continue
+        quantized = QuantizedMatrix.quantize(matrix, dtype)
+        add_arrays(path, quantized.arrays(key))
+        logger.info(f"Stored {dtype} {key} for {name}: {matrix.nbytes / 2**20:.1f} MiB -> "
+                    f"{quantized.nbytes / 2**20:.1f} MiB")
+        written.append(path)
+    return written
+
+def main():
+    parser = argparse.ArgumentParser(description="Store quantized copies of the live model matrices")
+    parser.add_argument("--model-path", default=settings.MODEL_PATH)
+    parser.add_argument("--dtype", choices=QUANTIZED_DTYPES, default=settings.FACTOR_QUANTIZATION or "int8")
+    args = parser.parse_args()
+
+    version = current_version(args.model_path)
+    if not version:
+        parser.error("No published model version; legacy pickles are quantized at load time instead")
+    if not quantize_artifacts(version_dir(args.model_path, version), args.dtype):
+        logger.warning("Nothing to quantize")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -1,32 +1,108 @@
 import pandas as pd
 import numpy as np
+import asyncio
 import logging
-from typing import List, Optional
-from sqlalchemy.orm import Session
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+from sqlalchemy import func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
 import pickle
 import os
+import threading
+import time
+from collections import defaultdict
 from datetime import datetime, timedelta
 
 from app.core.config import settings
+from app.core.metrics import RequestTimer
+from app.db.session import SessionLocal
+from app.ml.ann import CB_INDEX, CF_INDEX, IVFIndex
+from app.ml.artifacts import current_version, is_artifact_dir, load_arrays, resolve_artifact
+from app.ml.neighbors import NO_NEIGHBOR, build_model_index
+from app.ml.quantize import candidate_depth, load_quantized, reranks
 from app.models.user_event import UserEvent
-from app.models.product import Product
+from app.models.product import Category, Product
 from app.models.user import User
+from app.models.recommendation import Recommendation
 from app.schemas.recommendation import RecommendationCreate
+from app.services.cache import recommendation_cache
+from app.services.catalog import ProductFilter, product_catalog
+from app.services.coalescing import request_coalescer
+from app.services.sessions import session_store
+from app.services.trending import trending_counters
 
 logger = logging.getLogger(__name__)
 
+# Default business rules: in stock, nothing else
+IN_STOCK = ProductFilter()
+
+def _select_top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Return the indices of the k highest scores, best first"""
+    n = scores.shape[0]
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.int64)
+    if k < n:
+        # Partial selection is O(n); only the k winners get sorted
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(n)
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+def _load_ann_index(model_path: str, name: str) -> Optional[IVFIndex]:
+    """Load the ANN index stored next to a model artifact, if ANN retrieval is enabled"""
+    if not settings.ANN_ENABLED:
+        return None
+    return IVFIndex.load(os.path.join(os.path.dirname(model_path), name))
+
+def _ann_search_masked(ann: IVFIndex, query: np.ndarray, k: int, exclude: Optional[np.ndarray],
+                       mask: np.ndarray, rows: Callable[[np.ndarray], np.ndarray]) -> Optional[tuple]:
+    """
+    ANN search under a mask over the model's rows: over-fetch k * ANN_MASK_OVERFETCH
+    candidates and keep the allowed ones. Returns None when fewer than k survive,
+    so the caller scores the allowed items exactly instead.
+    """
+    ids, scores = ann.search(query, k * settings.ANN_MASK_OVERFETCH, settings.ANN_NPROBE, exclude)
+    candidate_rows = rows(ids)
+    keep = candidate_rows >= 0
+    keep[keep] = mask[candidate_rows[keep]]
+    if keep.sum() < k:
+        return None
+    return ids[keep][:k], scores[keep][:k]
+
+def _read_artifact(model_path: str) -> dict:
+    """Memory-map a versioned artifact directory, or unpickle a legacy model file"""
+    if is_artifact_dir(model_path):
+        return load_arrays(model_path)
+    with open(model_path, 'rb') as f:
+        return pickle.load(f)
+
+def _model_version(model_path: str, model: dict) -> str:
+    """Identify a loaded artifact so cached results are tied to the model that produced them"""
+    if model.get('version'):
+        return str(model['version'])
+    if os.path.exists(model_path):
+        return str(int(os.path.getmtime(model_path)))
+    return "fallback"
+
 class CollaborativeFilteringModel:
     """Collaborative filtering recommendation model using matrix factorization"""
     
     def __init__(self, model_path=None):
-        self.model_path = model_path or os.path.join(settings.MODEL_PATH, "cf_model.pkl")
+        self.model_path = model_path or resolve_artifact(settings.MODEL_PATH, "cf", "cf_model.pkl")
+        self.loaded = False
         self.model = self._load_model()
+        self.version = _model_version(self.model_path, self.model)
+        self._build_index()
+        self.ann = _load_ann_index(self.model_path, CF_INDEX)
+        # Read by full scans instead of item_factors when FACTOR_QUANTIZATION is set
+        self.quantized = load_quantized(self.model, 'item_factors')
     
     def _load_model(self):
         try:
             if os.path.exists(self.model_path):
-                with open(self.model_path, 'rb') as f:
-                    return pickle.load(f)
+                model = self._to_matrix_format(_read_artifact(self.model_path))
+                self.loaded = True
+                return model
             else:
                 logger.warning(f"Model file not found at {self.model_path}. Using fallback model.")
                 return self._create_fallback_model()
@@ -36,49 +112,366 @@ class CollaborativeFilteringModel:
     
     def _create_fallback_model(self):
         # Simple fallback model when the real model is not available
-        return {
+        return self._to_matrix_format({
             'user_factors': {},
             'item_factors': {},
             'global_mean': 0.0
-        }
+        })
+    
+    @staticmethod
+    def _stack_factors(factors, ids=None):
+        """Convert {id: vector} (or an already stacked matrix) into sorted ids and a contiguous matrix"""
+        if isinstance(factors, dict):
+            ids = np.fromiter(factors.keys(), dtype=np.int64, count=len(factors))
+            vectors = list(factors.values())
+            matrix = np.vstack(vectors).astype(np.float32) if vectors else np.zeros((0, 0), dtype=np.float32)
+        else:
+            ids = np.asarray(ids, dtype=np.int64)
+            matrix = np.asarray(factors, dtype=np.float32)
+        
+        # Keep rows ordered by id so batches of ids can be resolved with searchsorted.
+        # Artifacts are written sorted; leaving them as-is keeps memory-mapped arrays shared.
+        if len(ids) > 1 and (ids[1:] < ids[:-1]).any():
+            order = np.argsort(ids, kind='stable')
+            ids, matrix = ids[order], matrix[order]
+        return ids, np.ascontiguousarray(matrix)
+    
+    def _to_matrix_format(self, model):
+        """Normalise legacy dict-of-vectors pickles into the matrix layout used for scoring"""
+        user_ids, user_factors = self._stack_factors(model['user_factors'], model.get('user_ids'))
+        item_ids, item_factors = self._stack_factors(model['item_factors'], model.get('item_ids'))
+        
+        if user_factors.shape[1] != item_factors.shape[1] and user_factors.size and item_factors.size:
+            raise ValueError("User and item factors have different dimensions")
+        
+        model.update({
+            'user_ids': user_ids,
+            'user_factors': user_factors,
+            'item_ids': item_ids,
+            'item_factors': item_factors,
+            'global_mean': float(model.get('global_mean', 0.0))
+        })
+        return model
+    
+    def _build_index(self):
+        # Readers take (user_index, user_factors) in one tuple read, so online
+        # updates can swap both together without readers taking a lock
+        user_index = {int(uid): row for row, uid in enumerate(self.model['user_ids'])}
+        self._user_state = (user_index, self.model['user_factors'])
+        self._write_lock = threading.Lock()
+        self.item_index = {int(pid): row for row, pid in enumerate(self.model['item_ids'])}
+    
+    @property
+    def user_index(self) -> Dict[int, int]:
+        return self._user_state[0]
+    
+    def _user_vector(self, user_id: int) -> Optional[np.ndarray]:
+        user_index, user_factors = self._user_state
+        row = user_index.get(user_id)
+        return None if row is None else user_factors[row]
+    
+    def _set_user_vector(self, user_id: int, vector: np.ndarray):
+        """Write a user's factors; callers must hold _write_lock"""
+        user_index, user_factors = self._user_state
+        if not user_factors.flags.writeable:
+            # Copy read-only (e.g. memory-mapped) factors on the first write
+            user_factors = np.array(user_factors)
+            self._user_state = (user_index, user_factors)
+        
+        row = user_index.get(user_id)
+        if row is not None:
+            # In-place row copy: small enough that readers never see a torn vector
+            user_factors[row] = vector
+            return
+        
+        row = len(user_index)
+        if row >= len(user_factors):
+            # Grow with spare capacity and publish a new (index, matrix) pair;
+            # readers still holding the old pair keep a consistent view
+            capacity = max(2 * len(user_factors), row + 1024)
+            grown = np.zeros((capacity, len(vector)), dtype=np.float32)
+            grown[:row] = user_factors[:row]
+            user_index = dict(user_index)
+            user_factors = grown
+            self._user_state = (user_index, user_factors)
+        
+        # Fill the row before the index points at it
+        user_factors[row] = vector
+        user_index[user_id] = row
+    
+    def fold_in(self, events_by_user: Dict[int, List[tuple]], regularization: Optional[float] = None) -> Dict[int, np.ndarray]:
+        """
+        Compute user factors that fold in streamed (product_id, event_type) events,
+        without applying them.
+
+        Item factors stay fixed. Each user gets one weighted least-squares step
+        that fits the new interactions while staying close to their current
+        vector:
+
+            (sum_i c_i y_i y_i^T + lambda I) x = sum_i c_i y_i + lambda x_prev
+
+        with c_i the summed settings.EVENT_WEIGHTS per product. Users without factors
+        start from zero, so a first event creates them. Users whose events touch
+        no known product are left out.
+        """
+        item_factors = self.model['item_factors']
+        if not item_factors.size:
+            return {}
+        
+        regularization = settings.ONLINE_REGULARIZATION if regularization is None else regularization
+        identity = np.eye(item_factors.shape[1])
+        vectors = {}
+        
+        for user_id, events in events_by_user.items():
+            confidence = {}
+            for product_id, event_type in events:
+                confidence[product_id] = confidence.get(product_id, 0.0) + settings.EVENT_WEIGHTS.get(event_type, 0.0)
+            
+            rows = self._item_rows(np.fromiter(confidence.keys(), dtype=np.int64, count=len(confidence)))
+            weights = np.fromiter(confidence.values(), dtype=np.float64, count=len(confidence))
+            known = (rows >= 0) & (weights > 0)
+            if not known.any():
+                continue
+            
+            factors = item_factors[rows[known]].astype(np.float64)
+            weights = weights[known]
+            previous = self._user_vector(user_id)
+            previous = np.zeros(item_factors.shape[1]) if previous is None else previous.astype(np.float64)
+            
+            a = (factors.T * weights) @ factors + regularization * identity
+            b = factors.T @ weights + regularization * previous
+            vectors[user_id] = np.linalg.solve(a, b).astype(np.float32)
+        
+        return vectors
+    
+    def apply_user_vectors(self, vectors: Dict[int, np.ndarray]):
+        """Write user factors computed by fold_in"""
+        with self._write_lock:
+            for user_id, vector in vectors.items():
+                self._set_user_vector(user_id, vector)
+    
+    def partial_fit(self, events_by_user: Dict[int, List[tuple]], regularization: Optional[float] = None) -> int:
+        """Fold streamed events into user factors (see fold_in), returning the number of users updated"""
+        vectors = self.fold_in(events_by_user, regularization)
+        self.apply_user_vectors(vectors)
+        return len(vectors)
+    
+    def _item_rows(self, product_ids: np.ndarray) -> np.ndarray:
+        """Map product IDs to item factor rows, -1 for products the model has not seen"""
+        item_ids = self.model['item_ids']
+        if not len(item_ids):
+            return np.full(len(product_ids), -1, dtype=np.int64)
+        
+        rows = np.searchsorted(item_ids, product_ids)
+        rows = np.minimum(rows, len(item_ids) - 1)
+        return np.where(item_ids[rows] == product_ids, rows, -1)
     
-    def predict(self, user_id: int, product_ids: List[int]) -> List[tuple]:
+    def _scan(self, query: np.ndarray) -> np.ndarray:
+        """Raw scores of every item for a query vector, from the quantized factors when they are loaded"""
+        if self.quantized is not None:
+            return self.quantized.scores(query)
+        return self.model['item_factors'] @ query
+    
+    def _best(self, scores: np.ndarray, query: np.ndarray, k: int, offset: float = 0.0) -> tuple:
+        """
+        Rows and scores of the k best finite scores of a scan. Quantized scores
+        are approximate, so the best k * QUANTIZED_RERANK are re-scored exactly
+        from the float32 factors before the final cut.
+        """
+        top = _select_top_k(scores, candidate_depth(self.quantized, k))
+        top = top[np.isfinite(scores[top])]
+        if not reranks(self.quantized):
+            return top, scores[top]
+        exact = self.model['item_factors'][top] @ query + offset
+        best = _select_top_k(exact, k)
+        return top[best], exact[best]
+    
+    def predict(self, user_id: int, product_ids: List[int], limit: Optional[int] = None) -> List[tuple]:
         """Predict scores for user-item pairs"""
         try:
-            if user_id not in self.model['user_factors']:
+            global_mean = self.model['global_mean']
+            user_vector = self._user_vector(user_id)
+            if user_vector is None:
                 # Cold start - return default scores
-                return [(product_id, self.model['global_mean']) for product_id in product_ids]
-                
-            user_vector = self.model['user_factors'][user_id]
-            
-            # Calculate scores for each product
-            scores = []
-            for product_id in product_ids:
-                if product_id in self.model['item_factors']:
-                    item_vector = self.model['item_factors'][product_id]
-                    score = np.dot(user_vector, item_vector) + self.model['global_mean']
-                    scores.append((product_id, float(score)))
-                else:
-                    scores.append((product_id, self.model['global_mean']))
+                selected = product_ids if limit is None else product_ids[:limit]
+                return [(product_id, global_mean) for product_id in selected]
+            
+            ids = np.asarray(product_ids, dtype=np.int64)
+            rows = self._item_rows(ids)
+            known = rows >= 0
+            
+            # Products without factors keep the global mean
+            scores = np.full(len(ids), global_mean, dtype=np.float32)
+            scores[known] = self.model['item_factors'][rows[known]] @ user_vector + global_mean
             
-            # Sort by score in descending order
-            return sorted(scores, key=lambda x: x[1], reverse=True)
+            top = _select_top_k(scores, len(ids) if limit is None else limit)
+            return list(zip(ids[top].tolist(), scores[top].tolist()))
         except Exception as e:
             logger.error(f"Error in prediction: {str(e)}")
             return [(product_id, 0.5) for product_id in product_ids]
+    
+    def score_candidates(self, user_id: int, product_ids: np.ndarray) -> Optional[np.ndarray]:
+        """Raw scores of the given products for a user, NaN for products without factors; None without user factors"""
+        user_vector = self._user_vector(user_id)
+        if user_vector is None:
+            return None
+        rows = self._item_rows(product_ids)
+        known = rows >= 0
+        scores = np.full(len(product_ids), np.nan, dtype=np.float32)
+        scores[known] = self.model['item_factors'][rows[known]] @ user_vector
+        return scores
+    
+    def top_k(self, user_id: int, k: int, exclude: Optional[Iterable[int]] = None,
+              mask: Optional[np.ndarray] = None, user_vector: Optional[np.ndarray] = None) -> List[tuple]:
+        """
+        Return the k best scoring products across the whole model for a user.
+
+        mask is an optional boolean array over the item index; items where it is
+        False are never returned, so filtering does not shrink the result.
+        With a mask the ANN candidates are over-fetched and filtered; when too
+        few of them are allowed, the allowed items are scored exactly.
+        user_vector, if given, is scored instead of the user's stored factors,
+        e.g. a fold_in result that is not applied yet.
+        """
+        try:
+            if user_vector is None:
+                user_vector = self._user_vector(user_id)
+            if user_vector is None:
+                return []
+            
+            if self.ann is not None:
+                # Only score the items in the probed clusters
+                excluded = None if exclude is None else np.fromiter(exclude, dtype=np.int64)
+                if mask is None:
+                    found = self.ann.search(user_vector, k, settings.ANN_NPROBE, excluded)
+                else:
+                    found = _ann_search_masked(self.ann, user_vector, k, excluded, mask, self._item_rows)
+                if found is not None:
+                    ids, scores = found
+                    return list(zip(ids.tolist(), (scores + self.model['global_mean']).tolist()))
+            
+            global_mean = self.model['global_mean']
+            scores = self._scan(user_vector) + global_mean
+            if mask is not None:
+                scores[~mask] = -np.inf
+            if exclude is not None:
+                rows = self._item_rows(np.fromiter(exclude, dtype=np.int64))
+                scores[rows[rows >= 0]] = -np.inf
+            
+            top, top_scores = self._best(scores, user_vector, k, global_mean)
+            return list(zip(self.model['item_ids'][top].tolist(), top_scores.tolist()))
+        except Exception as e:
+            logger.error(f"Error in top-k prediction: {str(e)}")
+            return []
+    
+    def top_k_batch(self, user_ids: List[int], k: int, exclude: Optional[Iterable[int]] = None,
+                    block_size: Optional[int] = None) -> Iterator[tuple]:
+        """
+        Yield (user_id, [(product_id, score), ...]) for every user, in input order.
+
+        Users are scored block_size at a time with one matrix-matrix product and a
+        row-wise partial top-k, instead of one matrix-vector product per user.
+        Exact scoring is used even when an ANN index is loaded: over a block of
+        users the dense product is cheaper than per-user probing. Users without
+        factors get an empty list.
+        """
+        block_size = block_size or settings.BATCH_SCORING_BLOCK_SIZE
+        item_ids = self.model['item_ids']
+        item_factors = self.model['item_factors']
+        excluded_rows = None
+        if exclude is not None:
+            rows = self._item_rows(np.fromiter(exclude, dtype=np.int64))
+            excluded_rows = rows[rows >= 0]
+        
+        for start in range(0, len(user_ids), block_size):
+            block = user_ids[start:start + block_size]
+            user_index, user_factors = self._user_state
+            rows = np.array([user_index.get(int(user_id), -1) for user_id in block], dtype=np.int64)
+            known = np.flatnonzero(rows >= 0)
+            
+            results = {}
+            k_block = min(candidate_depth(self.quantized, k), len(item_ids))
+            if len(known) and k_block > 0:
+                queries = user_factors[rows[known]]
+                if self.quantized is not None:
+                    scores = self.quantized.scores(queries) + self.model['global_mean']
+                else:
+                    scores = queries @ item_factors.T + self.model['global_mean']
+                if excluded_rows is not None:
+                    scores[:, excluded_rows] = -np.inf
+                
+                if k_block < scores.shape[1]:
+                    top = np.argpartition(-scores, k_block - 1, axis=1)[:, :k_block]
+                else:
+                    top = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+                top_scores = np.take_along_axis(scores, top, axis=1)
+                if reranks(self.quantized):
+                    # Re-score the quantized candidates exactly; excluded ones stay out
+                    exact = np.einsum('md,mkd->mk', queries, item_factors[top]) + self.model['global_mean']
+                    top_scores = np.where(np.isfinite(top_scores), exact, -np.inf).astype(np.float32)
+                order = np.argsort(-top_scores, axis=1, kind='stable')[:, :k]
+                top = np.take_along_axis(top, order, axis=1)
+                top_scores = np.take_along_axis(top_scores, order, axis=1)
+                
+                for position, row in enumerate(known):
+                    valid = np.isfinite(top_scores[position])
+                    results[row] = list(zip(item_ids[top[position][valid]].tolist(), top_scores[position][valid].tolist()))
+            
+            for position, user_id in enumerate(block):
+                yield user_id, results.get(position, [])
+    
+    def top_k_for_items(self, item_weights: Dict[int, float], k: int, exclude: Optional[Iterable[int]] = None) -> List[tuple]:
+        """
+        Return the k best scoring products for a weighted set of items, e.g. an
+        anonymous session, scored against the weighted sum of their item factors
+        """
+        try:
+            ids = np.fromiter(item_weights.keys(), dtype=np.int64, count=len(item_weights))
+            weights = np.fromiter(item_weights.values(), dtype=np.float32, count=len(item_weights))
+            rows = self._item_rows(ids)
+            known = rows >= 0
+            if not known.any():
+                return []
+            
+            item_factors = self.model['item_factors']
+            query = weights[known] @ item_factors[rows[known]]
+            if self.ann is not None:
+                excluded = None if exclude is None else np.fromiter(exclude, dtype=np.int64)
+                ids, scores = self.ann.search(query, k, settings.ANN_NPROBE, excluded)
+                return list(zip(ids.tolist(), scores.tolist()))
+            
+            scores = self._scan(query)
+            if exclude is not None:
+                rows = self._item_rows(np.fromiter(exclude, dtype=np.int64))
+                scores[rows[rows >= 0]] = -np.inf
+            
+            top, top_scores = self._best(scores, query, k)
+            return list(zip(self.model['item_ids'][top].tolist(), top_scores.tolist()))
+        except Exception as e:
+            logger.error(f"Error in item-based top-k prediction: {str(e)}")
+            return []
 
 class ContentBasedModel:
     """Content-based recommendation model using product features"""
     
     def __init__(self, model_path=None):
-        self.model_path = model_path or os.path.join(settings.MODEL_PATH, "cb_model.pkl")
+        self.model_path = model_path or resolve_artifact(settings.MODEL_PATH, "cb", "cb_model.pkl")
+        self.loaded = False
         self.model = self._load_model()
+        self.version = _model_version(self.model_path, self.model)
+        self.product_index = {int(pid): row for row, pid in enumerate(self.model['product_ids'])}
+        self.ann = _load_ann_index(self.model_path, CB_INDEX)
+        self.quantized = load_quantized(self.model, 'product_vectors')
+        # Built on the first filtered lookup
+        self._id_order = None
+        self._norms = None
     
     def _load_model(self):
         try:
             if os.path.exists(self.model_path):
-                with open(self.model_path, 'rb') as f:
-                    return pickle.load(f)
+                model = self._ensure_neighbor_index(_read_artifact(self.model_path))
+                self.loaded = True
+                return model
             else:
                 logger.warning(f"Model file not found at {self.model_path}. Using fallback model.")
                 return self._create_fallback_model()
@@ -88,18 +481,110 @@ class ContentBasedModel:
     
     def _create_fallback_model(self):
         # Simple fallback model when the real model is not available
-        return {
+        return self._ensure_neighbor_index({
             'product_vectors': {},
             'similarity_matrix': {}
-        }
+        })
+    
+    def _ensure_neighbor_index(self, model):
+        """Build the top-N neighbour arrays if the artifact predates the offline index step"""
+        if 'neighbor_ids' not in model:
+            logger.warning("Content model has no neighbour index; building it at load time. "
+                           "Run `python -m app.ml.neighbors` to precompute it.")
+            model = build_model_index(model, top_n=settings.SIMILAR_TOP_N)
+        return model
     
-    def find_similar(self, product_id: int, limit: int = 5) -> List[tuple]:
-        """Find products similar to the given product"""
+    def neighbors(self, product_ids: List[int], limit: int) -> tuple:
+        """
+        (neighbour_ids, similarities) of several products in one gather from the
+        precomputed neighbour arrays, flattened; products not in the model are skipped
+        """
+        rows = [self.product_index[pid] for pid in product_ids if pid in self.product_index]
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        ids = self.model['neighbor_ids'][rows, :limit].ravel()
+        scores = self.model['neighbor_scores'][rows, :limit].ravel()
+        valid = ids != NO_NEIGHBOR
+        return ids[valid].astype(np.int64), scores[valid]
+    
+    def _rows(self, product_ids: np.ndarray) -> np.ndarray:
+        """Map product IDs to model rows, -1 for products not in the model"""
+        if self._id_order is None:
+            order = np.argsort(self.model['product_ids'], kind='stable')
+            self._id_order = (order, np.asarray(self.model['product_ids'])[order])
+        order, sorted_ids = self._id_order
+        if not len(sorted_ids):
+            return np.full(len(product_ids), -1, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(sorted_ids, product_ids), len(sorted_ids) - 1)
+        return np.where(sorted_ids[positions] == product_ids, order[positions], -1)
+    
+    def _find_similar_masked(self, row: int, limit: int, mask: np.ndarray, exclude: np.ndarray) -> List[tuple]:
+        """
+        Best allowed neighbours: the precomputed list when enough of it passes the
+        mask, then the filtered ANN candidates, otherwise an exact cosine scan of
+        the allowed products
+        """
+        ids = self.model['neighbor_ids'][row]
+        scores = self.model['neighbor_scores'][row]
+        valid = ids != NO_NEIGHBOR
+        rows = self._rows(ids)
+        keep = valid & (rows >= 0) & mask[np.maximum(rows, 0)]
+        if len(exclude):
+            keep &= ~np.isin(ids, exclude)
+        vectors = self.model['product_vectors']
+        if keep.sum() >= limit or valid.sum() < len(ids) or len(vectors) != len(self.model['product_ids']):
+            # Enough survivors, the list already holds every product, or there are no vectors to scan
+            return list(zip(ids[keep][:limit].tolist(), scores[keep][:limit].tolist()))
+        
+        if self.ann is not None:
+            product_id = self.model['product_ids'][row]
+            found = _ann_search_masked(self.ann, vectors[row], limit, np.append(exclude, product_id).astype(np.int64),
+                                       mask, self._rows)
+            if found is not None:
+                return list(zip(found[0].tolist(), found[1].tolist()))
+        
+        quantized = self.quantized
+        if self._norms is None:
+            norms = quantized.row_norms() if quantized is not None else np.linalg.norm(vectors, axis=1)
+            self._norms = np.where(norms == 0, 1.0, norms).astype(np.float32)
+        query = vectors[row]
+        dots = quantized.scores(query) if quantized is not None else vectors @ query
+        similarities = dots / (self._norms * self._norms[row])
+        similarities[~mask] = -np.inf
+        similarities[row] = -np.inf
+        if len(exclude):
+            excluded = self._rows(exclude)
+            similarities[excluded[excluded >= 0]] = -np.inf
+        top = _select_top_k(similarities, candidate_depth(quantized, limit))
+        top = top[np.isfinite(similarities[top])]
+        if not reranks(quantized):
+            return list(zip(self.model['product_ids'][top].tolist(), similarities[top].tolist()))
+        
+        # Re-rank the candidates of the quantized scan by exact cosine similarity
+        candidates = np.asarray(vectors[top], dtype=np.float32)
+        norms = np.linalg.norm(candidates, axis=1)
+        query_norm = np.linalg.norm(query)
+        exact = (candidates @ query) / (np.where(norms == 0, 1.0, norms) * (query_norm or 1.0))
+        best = _select_top_k(exact, limit)
+        return list(zip(self.model['product_ids'][top[best]].tolist(), exact[best].tolist()))
+    
+    def find_similar(self, product_id: int, limit: int = 5, mask: Optional[np.ndarray] = None,
+                     exclude: Optional[np.ndarray] = None) -> List[tuple]:
+        """
+        Find products similar to the given product.
+
+        mask is an optional boolean array over the model's product_ids and exclude
+        an optional array of product IDs; neither shrinks the result below limit.
+        """
         try:
-            if product_id not in self.model['similarity_matrix']:
+            exclude = np.empty(0, dtype=np.int64) if exclude is None else exclude
+            row = self.product_index.get(product_id)
+            if row is None:
                 # Product not in model, return random products
-                product_ids = list(self.model['product_vectors'].keys())
-                if not product_ids:
+                product_ids = self.model['product_ids']
+                if mask is not None:
+                    product_ids = product_ids[mask & ~np.isin(product_ids, exclude)]
+                if not len(product_ids):
                     return []
                     
                 # Take random products if available
@@ -108,19 +593,23 @@ class ContentBasedModel:
                 else:
                     selected_ids = product_ids
                 
-                return [(pid, 0.5) for pid in selected_ids]
+                return [(pid, 0.5) for pid in selected_ids.tolist()]
+            
+            if mask is not None:
+                return self._find_similar_masked(row, limit, mask, exclude)
             
-            # Get similarity scores
-            similarities = self.model['similarity_matrix'][product_id]
+            if limit > self.model['neighbor_ids'].shape[1] and self.ann is not None:
+                # Deeper than the precomputed list - fall back to the ANN index
+                ids, scores = self.ann.search(self.model['product_vectors'][row], limit, settings.ANN_NPROBE,
+                                              exclude=np.array([product_id]))
+                return list(zip(ids.tolist(), scores.tolist()))
             
-            # Sort and return top products (excluding the input product)
-            sorted_prods = sorted(
-                [(pid, score) for pid, score in similarities.items() if pid != product_id],
-                key=lambda x: x[1], 
-                reverse=True
-            )
+            # Neighbours are precomputed best first, so the answer is a row slice
+            ids = self.model['neighbor_ids'][row, :limit]
+            scores = self.model['neighbor_scores'][row, :limit]
+            valid = ids != NO_NEIGHBOR
             
-            return sorted_prods[:limit]
+            return list(zip(ids[valid].tolist(), scores[valid].tolist()))
         except Exception as e:
             logger.error(f"Error finding similar products: {str(e)}")
             return []
@@ -129,76 +618,709 @@ class ContentBasedModel:
 cf_model = CollaborativeFilteringModel()
 cb_model = ContentBasedModel()
 
-def get_personalized_recommendations(db: Session, user_id: int, limit: int = 10, algorithm: Optional[str] = None):
-    """Get personalized recommendations for a user"""
+_reload_lock = threading.Lock()
+
+def reload_models() -> bool:
+    """
+    Load the version named by MODEL_PATH/CURRENT and swap it in.
+
+    The new models are fully built before the module globals are rebound, so
+    requests in flight finish on the models they started with and new requests
+    pick up the new ones; nothing is served from a half-loaded model. If either
+    artifact fails to load, the running models are kept.
+    """
+    global cf_model, cb_model
+    with _reload_lock:
+        started = time.perf_counter()
+        new_cf = CollaborativeFilteringModel()
+        new_cb = ContentBasedModel()
+        if not (new_cf.loaded and new_cb.loaded):
+            logger.error(f"Keeping models {cf_model.version}/{cb_model.version}: new version failed to load")
+            return False
+        
+        cf_model, cb_model = new_cf, new_cb
+        logger.info(f"Loaded models {cf_model.version}/{cb_model.version} in {time.perf_counter() - started:.2f}s")
+        return True
+
+class ModelWatcher:
+    """Background thread that hot-swaps the models when a new version is published"""
+    
+    def __init__(self, interval: Optional[float] = None, model_path: Optional[str] = None):
+        self.interval = settings.MODEL_WATCH_INTERVAL if interval is None else interval
+        self.model_path = model_path or settings.MODEL_PATH
+        self._version = current_version(self.model_path)
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def check(self) -> bool:
+        """Reload if CURRENT moved since the last check; returns True on a swap"""
+        version = current_version(self.model_path)
+        if version is None or version == self._version:
+            return False
+        if reload_models():
+            self._version = version
+            return True
+        return False
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"Error checking for a new model version: {str(e)}")
+    
+    def start(self):
+        if self.interval > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="model-watcher", daemon=True)
+            self._thread.start()
+    
+    def stop(self):
+        self._stop.set()
+
+# Singleton instance
+model_watcher = ModelWatcher()
+
+# Relationships the response serializes are loaded up front, with one query for the whole list: lazily
+# they cost a query per product (N+1, see app.db.profiler), and async sessions cannot lazy-load at all
+_EAGER = selectinload(Product.categories)
+
+def _products_query(product_ids: List[int]):
+    return select(Product).where(Product.id.in_(product_ids)).options(_EAGER)
+
+def _in_order(products, product_ids: List[int]):
+    """Sort loaded products into the order of product_ids"""
+    id_to_position = {pid: i for i, pid in enumerate(product_ids)}
+    return sorted(products, key=lambda p: id_to_position.get(p.id, len(id_to_position)))
+
+def _products_in_order(db: Session, product_ids: List[int]):
+    """Load products by ID with one query, keeping the order of product_ids"""
+    return _in_order(db.execute(_products_query(product_ids)).scalars().all(), product_ids)
+
+async def _products_in_order_async(db: AsyncSession, product_ids: List[int]):
+    products = (await db.execute(_products_query(product_ids))).scalars().all()
+    return _in_order(products, product_ids)
+
+def _available(catalog, recommendations: List[tuple]) -> List[tuple]:
+    """Drop (product_id, score) pairs for products that were deleted or are out of stock"""
+    if not recommendations:
+        return recommendations
+    mask = catalog.available([pid for pid, _ in recommendations])
+    return [rec for rec, keep in zip(recommendations, mask) if keep]
+
+def _filter_clauses(filters: ProductFilter) -> list:
+    """The filter's rules as SQL conditions, for the queries that do not go through the catalog snapshot"""
+    clauses = [Product.stock > 0]
+    if filters.categories:
+        clauses.append(Product.categories.any(Category.id.in_(filters.categories)))
+    if filters.exclude_categories:
+        clauses.append(~Product.categories.any(Category.id.in_(filters.exclude_categories)))
+    if filters.min_price is not None:
+        clauses.append(Product.price >= filters.min_price)
+    if filters.max_price is not None:
+        clauses.append(Product.price <= filters.max_price)
+    if len(filters.exclude_ids):
+        clauses.append(Product.id.notin_(filters.exclude_ids.tolist()))
+    return clauses
+
+def _stored_query(user_id: int, limit: int, filters: ProductFilter = IN_STOCK):
+    """
+    Products passing the filters from the user's precomputed rows, best first,
+    with one indexed query; empty when the rows are missing or older than
+    PRECOMPUTED_MAX_AGE_HOURS
+    """
+    return select(Product).join(Recommendation, Recommendation.product_id == Product.id).where(
+        Recommendation.user_id == user_id,
+        Recommendation.algorithm == "collaborative",
+        Recommendation.created_at >= datetime.now() - timedelta(hours=settings.PRECOMPUTED_MAX_AGE_HOURS),
+        *_filter_clauses(filters)
+    ).order_by(Recommendation.score.desc()).limit(limit)
+
+def _uses_stored(algorithm: Optional[str], limit: int) -> bool:
+    # Only RECOMMENDATIONS_PER_USER rows are stored per user, so deeper pages are always scored live
+    return (settings.PRECOMPUTED_ENABLED and limit <= settings.RECOMMENDATIONS_PER_USER
+            and (not algorithm or algorithm.lower() == "collaborative"))
+
+def _stored_is_enough(stored: List[Product], limit: int) -> bool:
+    # Stored rows are a short list; when the filters (stock, purchases, category, price) leave less
+    # than a full page, score live instead so the result is not shortened
+    return len(stored) >= limit
+
+def _recent_products_query(user_id: int):
+    """Products the user viewed or purchased in the last 30 days, most recent first"""
+    return select(UserEvent.product_id).where(
+        UserEvent.user_id == user_id,
+        UserEvent.event_type.in_(["view", "purchase"]),
+        UserEvent.timestamp >= datetime.now() - timedelta(days=30)
+    ).order_by(UserEvent.timestamp.desc()).limit(5)
+
+def _recent_purchases_query(user_id: int):
+    """Products the user bought in the last EXCLUDE_PURCHASED_DAYS days"""
+    return select(UserEvent.product_id).where(
+        UserEvent.user_id == user_id,
+        UserEvent.event_type == "purchase",
+        UserEvent.timestamp >= datetime.now() - timedelta(days=settings.EXCLUDE_PURCHASED_DAYS)
+    ).distinct()
+
+def _newest_products_query(limit: int, category_id: Optional[int] = None, filters: ProductFilter = IN_STOCK):
+    # Until the consumer has published trending counters
+    query = select(Product).where(*_filter_clauses(filters))
+    if category_id is not None:
+        query = query.where(Product.categories.any(Category.id == category_id))
+    return query.order_by(Product.id.desc()).limit(limit)
+
+def _trending_ids(catalog, limit: int, category_id: Optional[int] = None,
+                  filters: ProductFilter = IN_STOCK) -> List[int]:
+    """Best products passing the filters from the trending snapshot; no database query"""
+    # Rules beyond stock can drop most of the list, so read all of it
+    depth = settings.TRENDING_TOP_K if filters.restricts_catalog else limit * settings.CANDIDATE_OVERFETCH
+    candidates = trending_counters.top(depth, category_id=category_id)
+    return [rec[0] for rec in filters.apply(catalog, candidates)[:limit]]
+
+def _load_catalog():
+    # The refresh takes a threading lock, so async callers run it in a thread with a sync session
+    db = SessionLocal()
     try:
-        # Get all available products
-        products = db.query(Product).all()
-        product_ids = [p.id for p in products]
-        
-        if not algorithm or algorithm.lower() == "collaborative":
-            # Use collaborative filtering by default
-            recommendations = cf_model.predict(user_id, product_ids)
-        elif algorithm.lower() == "content":
-            # Use content-based as fallback
-            # Get user's recently viewed or purchased products
-            recent_events = db.query(UserEvent).filter(
-                UserEvent.user_id == user_id,
-                UserEvent.event_type.in_(["view", "purchase"]),
-                UserEvent.timestamp >= datetime.now() - timedelta(days=30)
-            ).order_by(UserEvent.timestamp.desc()).limit(5).all()
-            
-            if not recent_events:
-                # No recent activity, use trending products
-                return db.query(Product).order_by(Product.id.desc()).limit(limit).all()
-            
-            # Get similar products to those the user interacted with
-            similar_products = []
-            for event in recent_events:
-                if event.product_id:
-                    similar = cb_model.find_similar(event.product_id, limit=3)
-                    similar_products.extend(similar)
-            
-            # Sort by similarity score and take top ones
-            recommendations = sorted(similar_products, key=lambda x: x[1], reverse=True)
+        return product_catalog.get(db)
+    finally:
+        db.close()
+
+def _score_collaborative(cf: CollaborativeFilteringModel, catalog, user_id: int, limit: int,
+                         filters: ProductFilter = IN_STOCK) -> List[tuple]:
+    if filters.restricts_catalog:
+        # The allowed items are masked before the top-k, so a narrow filter still fills the list
+        mask = catalog.index_mask(cf.model['item_ids'], filters)
+        recommendations = cf.top_k(user_id, limit, exclude=filters.exclude_ids, mask=mask)
+    else:
+        # Stock alone rarely removes a top item, so keep the ANN path and over-fetch instead
+        exclude = np.concatenate([catalog.out_of_stock_ids, filters.exclude_ids])
+        candidates = cf.top_k(user_id, limit * settings.CANDIDATE_OVERFETCH, exclude=exclude)
+        recommendations = filters.apply(catalog, candidates)
+    if not recommendations:
+        # Cold start - score the allowed catalog with default scores
+        allowed = catalog.ids[catalog.filter_mask(filters)]
+        allowed = allowed[~np.isin(allowed, filters.exclude_ids)]
+        recommendations = cf.predict(user_id, allowed.tolist(), limit=limit)
+    return recommendations
+
+def _score_content(cb: ContentBasedModel, catalog, product_ids: List[int],
+                   filters: ProductFilter = IN_STOCK) -> List[tuple]:
+    mask = catalog.index_mask(cb.model['product_ids'], filters)
+    # Get similar products to those the user interacted with
+    similar_products = {}
+    for product_id in product_ids:
+        if product_id:
+            for similar_id, score in cb.find_similar(product_id, limit=3, mask=mask, exclude=filters.exclude_ids):
+                # A product similar to several recent ones is listed once, with its best score
+                similar_products[similar_id] = max(score, similar_products.get(similar_id, score))
+    
+    # Sort by similarity score and take top ones
+    return sorted(similar_products.items(), key=lambda x: x[1], reverse=True)
+
+def _positions(candidates: np.ndarray, product_ids: np.ndarray) -> tuple:
+    """Positions of product_ids in the sorted candidates array, and which of them were found"""
+    positions = np.minimum(np.searchsorted(candidates, product_ids), len(candidates) - 1)
+    return positions, candidates[positions] == product_ids
+
+def _score_hybrid(cf: CollaborativeFilteringModel, cb: ContentBasedModel, catalog, user_id: int,
+                  recent_products: List[int], limit: int, filters: ProductFilter = IN_STOCK) -> List[tuple]:
+    """
+    Blend collaborative, content and popularity scores in one pass.
+
+    Candidates from CF top-k, the content neighbours of the recent products and
+    the trending list are merged into one deduplicated array, and every
+    candidate is scored by all three sources, each scaled to [0, 1] over the
+    candidates:
+        cf          user-item score, min-max scaled; 0 without factors
+        content     max (or mean) similarity to the recent products
+        popularity  decayed trending counter
+    The weighted sum is ranked with a single top-k. Candidates failing the
+    filters are dropped before scoring; CF candidates are drawn from the
+    allowed items only when the filters go beyond stock.
+    """
+    depth = settings.HYBRID_CANDIDATES
+    recent_products = [pid for pid in recent_products if pid]
+    # Unavailable candidates are masked once below, so the sources skip their own exclusion
+    mask = catalog.index_mask(cf.model['item_ids'], filters) if filters.restricts_catalog else None
+    cf_candidates = cf.top_k(user_id, depth, mask=mask)
+    neighbor_ids, similarities = cb.neighbors(recent_products, depth)
+    popular = trending_counters.top(depth)
+    
+    candidates = np.unique(np.concatenate([
+        np.fromiter((pid for pid, _ in cf_candidates), dtype=np.int64, count=len(cf_candidates)),
+        neighbor_ids,
+        np.fromiter((pid for pid, _ in popular), dtype=np.int64, count=len(popular))
+    ]))
+    candidates = candidates[filters.allows(catalog, candidates)]
+    if not len(candidates):
+        return []
+    
+    cf_scores = np.zeros(len(candidates), dtype=np.float32)
+    raw = cf.score_candidates(user_id, candidates)
+    if raw is not None and np.isfinite(raw).any():
+        known = np.isfinite(raw)
+        low, high = raw[known].min(), raw[known].max()
+        cf_scores[known] = (raw[known] - low) / (high - low) if high > low else 1.0
+    
+    content_scores = np.zeros(len(candidates), dtype=np.float32)
+    if len(neighbor_ids):
+        positions, found = _positions(candidates, neighbor_ids)
+        if settings.HYBRID_CONTENT_AGGREGATION == "mean":
+            np.add.at(content_scores, positions[found], similarities[found])
+            content_scores /= len(recent_products)
         else:
-            # Invalid algorithm
-            raise ValueError(f"Unknown algorithm: {algorithm}")
-        
-        # Get the actual product objects for the recommended IDs
-        recommended_ids = [rec[0] for rec in recommendations[:limit]]
-        recommended_products = db.query(Product).filter(Product.id.in_(recommended_ids)).all()
+            np.maximum.at(content_scores, positions[found], similarities[found])
+    
+    popularity = np.zeros(len(candidates), dtype=np.float32)
+    if popular:
+        positions, found = _positions(candidates, np.array([pid for pid, _ in popular], dtype=np.int64))
+        popularity[positions[found]] = np.array([score for _, score in popular], dtype=np.float32)[found]
+    
+    for component in (content_scores, popularity):
+        peak = component.max()
+        if peak > 0:
+            component /= peak
+    
+    blended = (settings.HYBRID_CF_WEIGHT * cf_scores
+               + settings.HYBRID_CONTENT_WEIGHT * content_scores
+               + settings.HYBRID_POPULARITY_WEIGHT * popularity)
+    top = _select_top_k(blended, limit)
+    return list(zip(candidates[top].tolist(), blended[top].tolist()))
+
+def get_trending_products(db: Session, limit: int = 10, category_id: Optional[int] = None,
+                          filters: Optional[ProductFilter] = None):
+    """Trending products, overall or in one category, from the consumer's decayed event counters"""
+    filters = filters or IN_STOCK
+    product_ids = _trending_ids(product_catalog.get(db), limit, category_id, filters)
+    if not product_ids:
+        return db.execute(_newest_products_query(limit, category_id, filters).options(_EAGER)).scalars().all()
+    return _products_in_order(db, product_ids)
+
+async def get_trending_products_async(db: AsyncSession, limit: int = 10, category_id: Optional[int] = None,
+                                      filters: Optional[ProductFilter] = None):
+    filters = filters or IN_STOCK
+    catalog = product_catalog.current() or await asyncio.to_thread(_load_catalog)
+    product_ids = _trending_ids(catalog, limit, category_id, filters)
+    if not product_ids:
+        return (await db.execute(_newest_products_query(limit, category_id, filters).options(_EAGER))).scalars().all()
+    return await _products_in_order_async(db, product_ids)
+
+def _fallback_ids(db: Session, limit: int, filters: ProductFilter) -> List[int]:
+    """IDs of the trending products, or of the newest ones before the first trending snapshot"""
+    product_ids = _trending_ids(product_catalog.get(db), limit, filters=filters)
+    if product_ids:
+        return product_ids
+    return db.execute(_newest_products_query(limit, filters=filters).with_only_columns(Product.id)).scalars().all()
+
+async def _fallback_ids_async(db: AsyncSession, limit: int, filters: ProductFilter) -> List[int]:
+    catalog = product_catalog.current() or await asyncio.to_thread(_load_catalog)
+    product_ids = _trending_ids(catalog, limit, filters=filters)
+    if product_ids:
+        return product_ids
+    query = _newest_products_query(limit, filters=filters).with_only_columns(Product.id)
+    return (await db.execute(query)).scalars().all()
+
+def _personalized_ids(db: Session, cf: CollaborativeFilteringModel, cb: ContentBasedModel, user_id: int, limit: int,
+                      algorithm: Optional[str], filters: ProductFilter, cache_key: str,
+                      timer: RequestTimer) -> List[int]:
+    with timer.stage("cache_get"):
+        cached_ids = recommendation_cache.get(cache_key)
+    if cached_ids is not None:
+        return cached_ids
+    
+    if filters.exclude_purchased:
+        with timer.stage("purchases_query"):
+            filters = filters.with_excluded(db.execute(_recent_purchases_query(user_id)).scalars().all())
+    
+    if _uses_stored(algorithm, limit):
+        # Rows written by app.ml.precompute or the event consumer; stale users are scored live below
+        with timer.stage("stored_query"):
+            stored = db.execute(_stored_query(user_id, limit, filters).with_only_columns(Product.id)).scalars().all()
+        if _stored_is_enough(stored, limit):
+            with timer.stage("cache_set"):
+                recommendation_cache.set(cache_key, stored, settings.RECOMMENDATION_CACHE_TTL, user_id=user_id)
+            return stored
+    
+    with timer.stage("catalog"):
+        catalog = product_catalog.get(db)
+    
+    if not algorithm or algorithm.lower() == "collaborative":
+        # Use collaborative filtering by default
+        with timer.stage("score"):
+            recommendations = _score_collaborative(cf, catalog, user_id, limit, filters)
+    elif algorithm.lower() == "content":
+        # Use content-based as fallback
+        # Get user's recently viewed or purchased products
+        with timer.stage("recent_query"):
+            recent_products = db.execute(_recent_products_query(user_id)).scalars().all()
         
-        # Sort products in the same order as recommendations
-        id_to_position = {rec[0]: i for i, rec in enumerate(recommendations[:limit])}
-        sorted_products = sorted(recommended_products, key=lambda p: id_to_position.get(p.id, 9999))
+        if not recent_products:
+            # No recent activity, use trending products
+            with timer.stage("trending"):
+                return _fallback_ids(db, limit, filters)
         
-        return sorted_products
-    except Exception as e:
-        logger.error(f"Error generating personalized recommendations: {str(e)}")
-        # Fallback to most popular products
-        return db.query(Product).order_by(Product.id.desc()).limit(limit).all()
+        with timer.stage("score"):
+            recommendations = _score_content(cb, catalog, recent_products, filters)
+    elif algorithm.lower() == "hybrid":
+        # Every source at once; users without history still get CF and trending candidates
+        with timer.stage("recent_query"):
+            recent_products = db.execute(_recent_products_query(user_id)).scalars().all()
+        with timer.stage("score"):
+            recommendations = _score_hybrid(cf, cb, catalog, user_id, recent_products, limit, filters)
+        if not recommendations:
+            with timer.stage("trending"):
+                return _fallback_ids(db, limit, filters)
+    else:
+        # Invalid algorithm
+        raise ValueError(f"Unknown algorithm: {algorithm}")
+    
+    recommended_ids = [rec[0] for rec in recommendations[:limit]]
+    with timer.stage("cache_set"):
+        recommendation_cache.set(cache_key, recommended_ids, settings.RECOMMENDATION_CACHE_TTL, user_id=user_id)
+    return recommended_ids
 
-def get_similar_products(db: Session, product_id: int, user_id: Optional[int] = None, limit: int = 5):
-    """Get products similar to the specified product"""
+def get_personalized_recommendations(db: Session, user_id: int, limit: int = 10, algorithm: Optional[str] = None,
+                                     filters: Optional[ProductFilter] = None):
+    """
+    Get personalized recommendations for a user.
+
+    filters restricts which products may be returned (in stock only by
+    default); its rules are applied before the top-k, so the result is only
+    short when fewer than limit products pass them. Identical concurrent
+    calls share one computation, see RequestCoalescer. Every stage is timed
+    under the "personalized" operation, see app.core.metrics.
+    """
+    filters = filters or IN_STOCK
+    with RequestTimer("personalized") as timer:
+        try:
+            # Hold on to the current models for the whole request, across a hot swap
+            cf, cb = cf_model, cb_model
+            cache_key = recommendation_cache.user_key(user_id, algorithm, limit, f"{cf.version}.{cb.version}",
+                                                      filters.cache_variant())
+            # Includes waiting for an identical request already in flight
+            with timer.stage("compute"):
+                recommended_ids = request_coalescer.run(
+                    cache_key,
+                    lambda: _personalized_ids(db, cf, cb, user_id, limit, algorithm, filters, cache_key, timer)
+                )
+            
+            # Get the actual product objects for the recommended IDs
+            with timer.stage("hydrate"):
+                return _products_in_order(db, recommended_ids)
+        except Exception as e:
+            logger.error(f"Error generating personalized recommendations: {str(e)}")
+            timer.fallback(e)
+            with timer.stage("trending"):
+                return get_trending_products(db, limit, filters=filters)
+
+async def _personalized_ids_async(db: AsyncSession, cf: CollaborativeFilteringModel, cb: ContentBasedModel,
+                                  user_id: int, limit: int, algorithm: Optional[str], filters: ProductFilter,
+                                  cache_key: str, timer: RequestTimer) -> List[int]:
+    with timer.stage("cache_get"):
+        cached_ids = await asyncio.to_thread(recommendation_cache.get, cache_key)
+    if cached_ids is not None:
+        return cached_ids
+    
+    if filters.exclude_purchased:
+        with timer.stage("purchases_query"):
+            filters = filters.with_excluded((await db.execute(_recent_purchases_query(user_id))).scalars().all())
+    
+    if _uses_stored(algorithm, limit):
+        with timer.stage("stored_query"):
+            query = _stored_query(user_id, limit, filters).with_only_columns(Product.id)
+            stored = (await db.execute(query)).scalars().all()
+        if _stored_is_enough(stored, limit):
+            with timer.stage("cache_set"):
+                await asyncio.to_thread(recommendation_cache.set, cache_key, stored,
+                                        settings.RECOMMENDATION_CACHE_TTL, user_id)
+            return stored
+    
+    with timer.stage("catalog"):
+        catalog = product_catalog.current() or await asyncio.to_thread(_load_catalog)
+    
+    if not algorithm or algorithm.lower() == "collaborative":
+        with timer.stage("score"):
+            recommendations = await asyncio.to_thread(_score_collaborative, cf, catalog, user_id, limit, filters)
+    elif algorithm.lower() == "content":
+        with timer.stage("recent_query"):
+            recent_products = (await db.execute(_recent_products_query(user_id))).scalars().all()
+        if not recent_products:
+            with timer.stage("trending"):
+                return await _fallback_ids_async(db, limit, filters)
+        with timer.stage("score"):
+            recommendations = await asyncio.to_thread(_score_content, cb, catalog, recent_products, filters)
+    elif algorithm.lower() == "hybrid":
+        with timer.stage("recent_query"):
+            recent_products = (await db.execute(_recent_products_query(user_id))).scalars().all()
+        with timer.stage("score"):
+            recommendations = await asyncio.to_thread(_score_hybrid, cf, cb, catalog, user_id, recent_products,
+                                                      limit, filters)
+        if not recommendations:
+            with timer.stage("trending"):
+                return await _fallback_ids_async(db, limit, filters)
+    else:
+        raise ValueError(f"Unknown algorithm: {algorithm}")
+    
+    recommended_ids = [rec[0] for rec in recommendations[:limit]]
+    with timer.stage("cache_set"):
+        await asyncio.to_thread(recommendation_cache.set, cache_key, recommended_ids,
+                                settings.RECOMMENDATION_CACHE_TTL, user_id)
+    return recommended_ids
+
+async def get_personalized_recommendations_async(db: AsyncSession, user_id: int, limit: int = 10,
+                                                 algorithm: Optional[str] = None,
+                                                 filters: Optional[ProductFilter] = None):
+    """
+    get_personalized_recommendations for `async def` endpoints.
+
+    Queries are awaited on the AsyncSession; cache lookups and model scoring
+    run in worker threads so they never block the event loop. Products are
+    loaded with their categories eagerly, since lazy loads are not possible
+    once the response is being serialized.
+    """
+    filters = filters or IN_STOCK
+    with RequestTimer("personalized") as timer:
+        try:
+            cf, cb = cf_model, cb_model
+            cache_key = recommendation_cache.user_key(user_id, algorithm, limit, f"{cf.version}.{cb.version}",
+                                                      filters.cache_variant())
+            with timer.stage("compute"):
+                recommended_ids = await request_coalescer.run_async(
+                    cache_key,
+                    lambda: _personalized_ids_async(db, cf, cb, user_id, limit, algorithm, filters, cache_key, timer)
+                )
+            with timer.stage("hydrate"):
+                return await _products_in_order_async(db, recommended_ids)
+        except Exception as e:
+            logger.error(f"Error generating personalized recommendations: {str(e)}")
+            timer.fallback(e)
+            with timer.stage("trending"):
+                return await get_trending_products_async(db, limit, filters=filters)
+
+def get_personalized_recommendations_batch(db: Session, user_ids: List[int], limit: int = 10) -> Iterator[tuple]:
+    """
+    Collaborative recommendations for many users at once, e.g. for email and push jobs.
+
+    Returns an iterator of (user_id, [(product_id, score), ...]) in input order;
+    users are scored lazily in blocks, so results can be streamed while later
+    blocks are still being computed. The catalog is loaded up front, so the
+    iterator does not touch the session. Users without factors get the same
+    in-stock cold-start list as the single-user path.
+    """
+    cf = cf_model
+    catalog = product_catalog.get(db)
+    
+    def recommendations():
+        # Same answer as predict() gives a user without factors, computed once
+        global_mean = cf.model['global_mean']
+        cold_start = [(product_id, global_mean) for product_id in catalog.in_stock_ids()[:limit].tolist()]
+        for user_id, candidates in cf.top_k_batch(user_ids, limit * settings.CANDIDATE_OVERFETCH,
+                                                  exclude=catalog.out_of_stock_ids):
+            yield user_id, _available(catalog, candidates)[:limit] or cold_start
+    
+    return recommendations()
+
+def _score_session(cf: CollaborativeFilteringModel, cb: ContentBasedModel, catalog,
+                   profile: Dict[int, float], limit: int) -> List[tuple]:
+    """
+    Sum the item-to-item neighbours of the session's items, each weighted by
+    the item's decayed session weight. Items the content model does not know
+    are scored with the CF item factors instead.
+    """
+    scores = defaultdict(float)
+    for product_id, weight in profile.items():
+        if product_id in cb.product_index:
+            for neighbor_id, similarity in cb.find_similar(product_id, limit=settings.SESSION_NEIGHBORS):
+                scores[neighbor_id] += weight * similarity
+    
+    if not scores:
+        exclude = np.concatenate([catalog.out_of_stock_ids, np.fromiter(profile, dtype=np.int64)])
+        return _available(catalog, cf.top_k_for_items(profile, limit * settings.CANDIDATE_OVERFETCH, exclude=exclude))
+    
+    # Do not recommend what the session has already seen
+    for product_id in profile:
+        scores.pop(product_id, None)
+    return sorted(_available(catalog, list(scores.items())), key=lambda x: x[1], reverse=True)
+
+def get_session_recommendations(db: Session, session_id: str, limit: int = 10):
+    """Recommendations for an anonymous session, from the items it recently interacted with"""
     try:
-        # Get similar product IDs
-        similar_ids = cb_model.find_similar(product_id, limit=limit)
+        profile = session_store.get(session_id)
+        if not profile:
+            # No events recorded for this session yet, use trending products
+            return get_trending_products(db, limit)
         
-        if not similar_ids:
-            # If no similar products found, return random products
-            return db.query(Product).filter(Product.id != product_id).order_by(func.random()).limit(limit).all()
+        catalog = product_catalog.get(db)
+        recommendations = _score_session(cf_model, cb_model, catalog, profile, limit)
+        if not recommendations:
+            return get_trending_products(db, limit)
         
-        # Get the actual product objects
-        product_ids = [pid for pid, _ in similar_ids]
-        products = db.query(Product).filter(Product.id.in_(product_ids)).all()
-        
-        # Sort products by similarity score
-        id_to_score = {pid: score for pid, score in similar_ids}
-        sorted_products = sorted(products, key=lambda p: id_to_score.get(p.id, 0), reverse=True)
-        
-        return sorted_products
+        return _products_in_order(db, [rec[0] for rec in recommendations[:limit]])
     except Exception as e:
-        logger.error(f"Error finding similar products: {str(e)}")
-        # Fallback to random products
-        return db.query(Product).filter(Product.id != product_id).order_by(func.random()).limit(limit).all()
\ No newline at end of file
+        logger.error(f"Error generating session recommendations: {str(e)}")
+        return get_trending_products(db, limit)
+
+def _random_products_query(product_id: int, limit: int, filters: ProductFilter = IN_STOCK):
+    return select(Product).where(Product.id != product_id, *_filter_clauses(filters)).order_by(
+        func.random()).limit(limit)
+
+def _similar_cache_key(cb: ContentBasedModel, product_id: int, limit: int, filters: ProductFilter,
+                       user_id: Optional[int]) -> str:
+    # Lists without purchase exclusions are shared by all users; the others are per user
+    variant = filters.cache_variant()
+    if user_id is not None and len(filters.exclude_ids):
+        variant = f"{variant}-u{user_id}"
+    return recommendation_cache.similar_key(product_id, limit, cb.version, variant)
+
+def _score_similar(cb: ContentBasedModel, catalog, product_id: int, limit: int,
+                   filters: ProductFilter) -> List[tuple]:
+    mask = catalog.index_mask(cb.model['product_ids'], filters)
+    return cb.find_similar(product_id, limit=limit, mask=mask, exclude=filters.exclude_ids)
+
+def _similar_ids(db: Session, cb: ContentBasedModel, product_id: int, limit: int, filters: ProductFilter,
+                 cache_key: str, user_id: Optional[int], timer: RequestTimer) -> List[int]:
+    with timer.stage("cache_get"):
+        cached_ids = recommendation_cache.get(cache_key)
+    if cached_ids is not None:
+        return cached_ids
+    
+    with timer.stage("catalog"):
+        catalog = product_catalog.get(db)
+    # Get similar product IDs (already ordered by similarity score)
+    with timer.stage("score"):
+        similar_ids = _score_similar(cb, catalog, product_id, limit, filters)
+    
+    if not similar_ids:
+        # If no similar products found, return random products
+        with timer.stage("random_query"):
+            query = _random_products_query(product_id, limit, filters).with_only_columns(Product.id)
+            return db.execute(query).scalars().all()
+    
+    product_ids = [pid for pid, _ in similar_ids]
+    with timer.stage("cache_set"):
+        recommendation_cache.set(cache_key, product_ids, settings.SIMILAR_CACHE_TTL,
+                                 user_id=user_id if len(filters.exclude_ids) else None)
+    return product_ids
+
+def get_similar_products(db: Session, product_id: int, user_id: Optional[int] = None, limit: int = 5,
+                         filters: Optional[ProductFilter] = None):
+    """
+    Get products similar to the specified product.
+
+    filters works as in get_personalized_recommendations; recent purchases are
+    only excluded when a user_id is given. Stages are timed under the
+    "similar" operation.
+    """
+    filters = filters or IN_STOCK
+    with RequestTimer("similar") as timer:
+        try:
+            cb = cb_model
+            if filters.exclude_purchased and user_id is not None:
+                with timer.stage("purchases_query"):
+                    filters = filters.with_excluded(db.execute(_recent_purchases_query(user_id)).scalars().all())
+            cache_key = _similar_cache_key(cb, product_id, limit, filters, user_id)
+            with timer.stage("compute"):
+                product_ids = request_coalescer.run(
+                    cache_key, lambda: _similar_ids(db, cb, product_id, limit, filters, cache_key, user_id, timer)
+                )
+            
+            # Get the actual product objects
+            with timer.stage("hydrate"):
+                return _products_in_order(db, product_ids)
+        except Exception as e:
+            logger.error(f"Error finding similar products: {str(e)}")
+            timer.fallback(e)
+            # Fallback to random products
+            with timer.stage("random_query"):
+                query = _random_products_query(product_id, limit, filters).options(_EAGER)
+                return db.execute(query).scalars().all()
+
+async def _similar_ids_async(db: AsyncSession, cb: ContentBasedModel, product_id: int, limit: int,
+                             filters: ProductFilter, cache_key: str, user_id: Optional[int],
+                             timer: RequestTimer) -> List[int]:
+    with timer.stage("cache_get"):
+        cached_ids = await asyncio.to_thread(recommendation_cache.get, cache_key)
+    if cached_ids is not None:
+        return cached_ids
+    
+    with timer.stage("catalog"):
+        catalog = product_catalog.current() or await asyncio.to_thread(_load_catalog)
+    with timer.stage("score"):
+        similar_ids = await asyncio.to_thread(_score_similar, cb, catalog, product_id, limit, filters)
+    if not similar_ids:
+        with timer.stage("random_query"):
+            query = _random_products_query(product_id, limit, filters).with_only_columns(Product.id)
+            return (await db.execute(query)).scalars().all()
+    
+    product_ids = [pid for pid, _ in similar_ids]
+    with timer.stage("cache_set"):
+        await asyncio.to_thread(recommendation_cache.set, cache_key, product_ids, settings.SIMILAR_CACHE_TTL,
+                                user_id if len(filters.exclude_ids) else None)
+    return product_ids
+
+async def get_similar_products_async(db: AsyncSession, product_id: int, user_id: Optional[int] = None,
+                                     limit: int = 5, filters: Optional[ProductFilter] = None):
+    """get_similar_products for `async def` endpoints; see get_personalized_recommendations_async"""
+    filters = filters or IN_STOCK
+    with RequestTimer("similar") as timer:
+        try:
+            cb = cb_model
+            if filters.exclude_purchased and user_id is not None:
+                with timer.stage("purchases_query"):
+                    purchases = (await db.execute(_recent_purchases_query(user_id))).scalars().all()
+                    filters = filters.with_excluded(purchases)
+            cache_key = _similar_cache_key(cb, product_id, limit, filters, user_id)
+            with timer.stage("compute"):
+                product_ids = await request_coalescer.run_async(
+                    cache_key,
+                    lambda: _similar_ids_async(db, cb, product_id, limit, filters, cache_key, user_id, timer)
+                )
+            with timer.stage("hydrate"):
+                return await _products_in_order_async(db, product_ids)
+        except Exception as e:
+            logger.error(f"Error finding similar products: {str(e)}")
+            timer.fallback(e)
+            with timer.stage("random_query"):
+                query = _random_products_query(product_id, limit, filters).options(_EAGER)
+                return (await db.execute(query)).scalars().all()
+
+def update_recommendations_batch(db: Session, events_by_user: Dict[int, List[tuple]]):
+    """
+    Refresh the stored recommendations of every user touched by a batch of events.
+
+    events_by_user maps user_id to that user's (product_id, event_type) pairs in
+    arrival order. All users are rewritten with one DELETE and one multi-row
+    INSERT and committed. With online updates the batch is folded into the
+    user factors only after the commit, so a batch retried after a failed
+    write is not folded in twice.
+    """
+    if not events_by_user:
+        return
+    
+    cf = cf_model
+    # Fresh behaviour shows up in this batch's recommendations without a retrain
+    vectors = cf.fold_in(events_by_user) if settings.ONLINE_UPDATES_ENABLED else {}
+    
+    catalog = product_catalog.get(db)
+    rows = []
+    for user_id in events_by_user:
+        candidates = cf.top_k(user_id, settings.RECOMMENDATIONS_PER_USER * settings.CANDIDATE_OVERFETCH,
+                              exclude=catalog.out_of_stock_ids, user_vector=vectors.get(user_id))
+        for product_id, score in _available(catalog, candidates)[:settings.RECOMMENDATIONS_PER_USER]:
+            rows.append({"user_id": user_id, "product_id": product_id, "score": score, "algorithm": "collaborative"})
+    
+    user_ids = list(events_by_user)
+    db.query(Recommendation).filter(
+        Recommendation.user_id.in_(user_ids),
+        Recommendation.algorithm == "collaborative"
+    ).delete(synchronize_session=False)
+    if rows:
+        db.execute(insert(Recommendation), rows)
+    db.commit()
+    
+    cf.apply_user_vectors(vectors)
+    for user_id in user_ids:
+        recommendation_cache.invalidate_user(user_id)
+
+def update_recommendations(db: Session, user_id: int, product_id: int, event_type: str):
+    """Apply a single user event; see update_recommendations_batch"""
+    update_recommendations_batch(db, {user_id: [(product_id, event_type)]})
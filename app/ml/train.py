@@ -0,0 +1,249 @@
+"""
+Offline training pipeline for the recommendation model artifacts.
+
+Streams user_events from the database in server-side cursor chunks, builds a
+sparse implicit-feedback matrix weighted by event type, trains implicit ALS,
+builds TF-IDF product vectors from product names and descriptions, and
+publishes a new memory-mappable artifact version (see app.ml.artifacts) that
+running API workers pick up without a restart.
+
+Usage:
+    python -m app.ml.train [--factors F] [--iterations N] [--workers W]
+"""
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Iterable, Iterator, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.ml.ann import build_indexes
+from app.ml.artifacts import publish_version, save_model, version_dir
+from app.ml.neighbors import build_model_index
+from app.ml.quantize import quantize_artifacts
+from app.models.product import Product
+from app.models.user import User
+from app.models.user_event import UserEvent
+
+logger = logging.getLogger(__name__)
+
+def stream_interactions(db: Session, chunk_size: int = None) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """Yield (user_ids, product_ids, weights) arrays, one server-side cursor chunk at a time"""
+    chunk_size = chunk_size or settings.TRAIN_CHUNK_SIZE
+    event_types = list(settings.EVENT_WEIGHTS)
+    type_weights = np.array([settings.EVENT_WEIGHTS[t] for t in event_types], dtype=np.float32)
+
+    query = select(UserEvent.user_id, UserEvent.product_id, UserEvent.event_type).where(
+        UserEvent.product_id.isnot(None),
+        UserEvent.event_type.in_(event_types)
+    ).execution_options(yield_per=chunk_size)
+
+    for rows in db.execute(query).partitions():
+        users, products, types = zip(*rows)
+        # Map event type strings to weights without a per-row dict lookup
+        names, codes = np.unique(np.array(types), return_inverse=True)
+        weights = type_weights[[event_types.index(name) for name in names]][codes]
+        yield np.array(users, dtype=np.int64), np.array(products, dtype=np.int64), weights
+
+def _merge_pairs(matrix: Optional[sp.coo_matrix], users: list, products: list, weights: list) -> sp.coo_matrix:
+    """Fold pending (user, product, weight) arrays into the running matrix, summing duplicates"""
+    if matrix is not None:
+        users.append(matrix.row.astype(np.int64))
+        products.append(matrix.col.astype(np.int64))
+        weights.append(matrix.data)
+    users, products, weights = np.concatenate(users), np.concatenate(products), np.concatenate(weights)
+    merged = sp.coo_matrix((weights, (users, products)), shape=(users.max() + 1, products.max() + 1))
+    merged.sum_duplicates()
+    return merged
+
+def build_interaction_matrix(chunks: Iterable[Tuple[np.ndarray, np.ndarray, np.ndarray]],
+                             merge_threshold: int = 10_000_000):
+    """
+    Sum event weights per (user, product) into a CSR matrix.
+
+    Raw events are buffered and folded into the deduplicated matrix whenever
+    the buffer outgrows both merge_threshold and the matrix itself, so peak
+    memory follows the number of distinct pairs rather than the event count
+    and the total merge cost stays linear. Returns the matrix plus the user
+    and product IDs of its rows and columns.
+    """
+    matrix = None
+    users, products, weights = [], [], []
+    pending = 0
+    for chunk_users, chunk_products, chunk_weights in chunks:
+        users.append(chunk_users)
+        products.append(chunk_products)
+        weights.append(chunk_weights)
+        pending += len(chunk_users)
+        if pending >= max(merge_threshold, matrix.nnz if matrix is not None else 0):
+            matrix = _merge_pairs(matrix, users, products, weights)
+            users, products, weights, pending = [], [], [], 0
+
+    if pending:
+        matrix = _merge_pairs(matrix, users, products, weights)
+    if matrix is None:
+        return sp.csr_matrix((0, 0), dtype=np.float32), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    # Drop IDs with no interactions so factor matrices are dense in active users/products
+    user_ids = np.unique(matrix.row).astype(np.int64)
+    product_ids = np.unique(matrix.col).astype(np.int64)
+    rows = np.searchsorted(user_ids, matrix.row)
+    cols = np.searchsorted(product_ids, matrix.col)
+    interactions = sp.csr_matrix((matrix.data.astype(np.float32), (rows, cols)),
+                                 shape=(len(user_ids), len(product_ids)))
+    interactions.sort_indices()
+    return interactions, user_ids, product_ids
+
+def _solve_side(interactions: sp.csr_matrix, fixed: np.ndarray, regularization: float, alpha: float,
+                workers: int, block_size: int) -> np.ndarray:
+    """
+    One ALS half-step: solve every row's factors against the fixed side.
+
+    For row u with confidences c = 1 + alpha * w over its observed columns:
+        (Y^T Y + Y_u^T (C_u - I) Y_u + lambda I) x_u = Y_u^T c
+    Y^T Y is shared by all rows. Rows are solved in blocks with one batched
+    np.linalg.solve per block, and blocks run in a thread pool (BLAS releases
+    the GIL).
+    """
+    n_rows, dim = interactions.shape[0], fixed.shape[1]
+    fixed64 = fixed.astype(np.float64)
+    gram = fixed64.T @ fixed64 + regularization * np.eye(dim)
+    indptr, indices, data = interactions.indptr, interactions.indices, interactions.data
+    solved = np.zeros((n_rows, dim), dtype=np.float32)
+
+    def solve_block(start: int):
+        stop = min(start + block_size, n_rows)
+        a = np.repeat(gram[None], stop - start, axis=0)
+        b = np.zeros((stop - start, dim))
+        for i in range(stop - start):
+            lo, hi = indptr[start + i], indptr[start + i + 1]
+            if lo == hi:
+                continue
+            y = fixed64[indices[lo:hi]]
+            confidence = 1.0 + alpha * data[lo:hi]
+            a[i] += (y.T * (confidence - 1.0)) @ y
+            b[i] = y.T @ confidence
+        solved[start:stop] = np.linalg.solve(a, b[..., None])[..., 0]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(solve_block, range(0, n_rows, block_size)))
+    return solved
+
+def train_als(interactions: sp.csr_matrix, factors: int = None, iterations: int = None,
+              regularization: float = None, alpha: float = None, workers: Optional[int] = None,
+              block_size: int = 2048, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """Implicit-feedback ALS (Hu, Koren & Volinsky); returns (user_factors, item_factors)"""
+    factors = factors or settings.ALS_FACTORS
+    iterations = iterations or settings.ALS_ITERATIONS
+    regularization = settings.ALS_REGULARIZATION if regularization is None else regularization
+    alpha = settings.ALS_ALPHA if alpha is None else alpha
+    workers = workers or os.cpu_count()
+
+    rng = np.random.default_rng(seed)
+    user_factors = (rng.standard_normal((interactions.shape[0], factors)) * 0.01).astype(np.float32)
+    item_factors = (rng.standard_normal((interactions.shape[1], factors)) * 0.01).astype(np.float32)
+    by_item = interactions.T.tocsr()
+
+    for iteration in range(iterations):
+        start = time.perf_counter()
+        user_factors = _solve_side(interactions, item_factors, regularization, alpha, workers, block_size)
+        item_factors = _solve_side(by_item, user_factors, regularization, alpha, workers, block_size)
+        logger.info(f"ALS iteration {iteration + 1}/{iterations} in {time.perf_counter() - start:.1f}s")
+
+    return user_factors, item_factors
+
+def build_product_vectors(db: Session, dim: int = None, chunk_size: int = None) -> Tuple[np.ndarray, np.ndarray]:
+    """TF-IDF over product name and description, reduced to dense vectors with truncated SVD"""
+    from sklearn.decomposition import TruncatedSVD
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    dim = dim or settings.TFIDF_DIM
+    query = select(Product.id, Product.name, Product.description).order_by(Product.id).execution_options(
+        yield_per=chunk_size or settings.TRAIN_CHUNK_SIZE
+    )
+    product_ids, documents = [], []
+    for rows in db.execute(query).partitions():
+        for product_id, name, description in rows:
+            product_ids.append(product_id)
+            documents.append(f"{name} {description or ''}")
+
+    if not documents:
+        return np.empty(0, dtype=np.int64), np.zeros((0, 0), dtype=np.float32)
+
+    tfidf = TfidfVectorizer(stop_words="english", min_df=1, max_features=200_000, dtype=np.float32)
+    matrix = tfidf.fit_transform(documents)
+    if matrix.shape[1] > dim:
+        vectors = TruncatedSVD(n_components=dim, random_state=0).fit_transform(matrix)
+    else:
+        # Vocabulary is already smaller than the target size
+        vectors = matrix.toarray()
+    return np.array(product_ids, dtype=np.int64), vectors.astype(np.float32)
+
+def save_artifacts(cf_model: dict, cb_model: dict, model_path: str = None, version: str = None,
+                   ann: bool = True) -> str:
+    """
+    Write a new artifact version to <model_path>/versions/<version>/ (plus its
+    ANN indexes and, with FACTOR_QUANTIZATION, quantized matrices) and only
+    then publish it by atomically replacing CURRENT.
+    """
+    model_path = model_path or settings.MODEL_PATH
+    version = version or datetime.utcnow().strftime("%Y%m%d%H%M%S")
+    directory = version_dir(model_path, version)
+
+    for name, model in (("cf", cf_model), ("cb", cb_model)):
+        model['version'] = version
+        save_model(os.path.join(directory, name), model)
+    if settings.FACTOR_QUANTIZATION:
+        quantize_artifacts(directory, settings.FACTOR_QUANTIZATION)
+    if ann:
+        build_indexes(directory, settings.ANN_NLIST or None)
+
+    publish_version(model_path, version)
+    return version
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the CF and CB recommendation models")
+    parser.add_argument("--model-path", default=settings.MODEL_PATH)
+    parser.add_argument("--factors", type=int, default=settings.ALS_FACTORS)
+    parser.add_argument("--iterations", type=int, default=settings.ALS_ITERATIONS)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunk-size", type=int, default=settings.TRAIN_CHUNK_SIZE)
+    parser.add_argument("--skip-ann", action="store_true", help="Do not rebuild the ANN indexes")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    db = SessionLocal()
+    try:
+        interactions, user_ids, item_ids = build_interaction_matrix(stream_interactions(db, args.chunk_size))
+        logger.info(f"Interaction matrix: {len(user_ids)} users x {len(item_ids)} products, {interactions.nnz} pairs")
+
+        user_factors, item_factors = train_als(interactions, factors=args.factors, iterations=args.iterations,
+                                               workers=args.workers)
+        product_ids, product_vectors = build_product_vectors(db, chunk_size=args.chunk_size)
+    finally:
+        db.close()
+
+    cf_model = {
+        'user_ids': user_ids,
+        'user_factors': user_factors,
+        'item_ids': item_ids,
+        'item_factors': item_factors,
+        'global_mean': 0.0
+    }
+    cb_model = build_model_index({'product_ids': product_ids, 'product_vectors': product_vectors},
+                                 top_n=settings.SIMILAR_TOP_N)
+
+    version = save_artifacts(cf_model, cb_model, args.model_path, ann=not args.skip_ann)
+    logger.info(f"Trained model version {version} in {time.perf_counter() - started:.1f}s")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
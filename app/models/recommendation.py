@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.db.session import Base
@@ -13,6 +13,11 @@ class Recommendation(Base):
     algorithm = Column(String, nullable=False)  # Which algorithm generated this recommendation
     created_at = Column(DateTime, server_default=func.now())
     
+    # Serves a user's stored top-K, best first, from the index alone
+    __table_args__ = (
+        Index("ix_recommendations_user_algorithm_score", user_id, algorithm, score.desc()),
+    )
+    
     # Relationships
     user = relationship("User")
     product = relationship("Product")
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey, JSON, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.db.session import Base
@@ -14,6 +14,14 @@ class UserEvent(Base):
     timestamp = Column(DateTime, server_default=func.now())
     metadata = Column(JSON)  # Additional event data
     
+    # Recent events per user (content recommendations) and per session (anonymous
+    # recommendations). On PostgreSQL the table is also partitioned by month;
+    # see alembic/versions/0001 and app.db.partitions.
+    __table_args__ = (
+        Index("ix_user_events_user_id_timestamp", user_id, timestamp.desc()),
+        Index("ix_user_events_session_id_timestamp", session_id, timestamp),
+    )
+    
     # Relationships
     user = relationship("User")
     product = relationship("Product")
\ No newline at end of file
@@ -0,0 +1,482 @@
+"""
+Bulk loader for product catalogs, users and historical events.
+
+Streams CSV, JSON lines or Parquet files (optionally gzipped, except
+Parquet) into the database in chunks. On PostgreSQL every chunk is written
+with COPY; other databases (SQLite in development and tests) get one
+multi-row INSERT per chunk. Files are loaded in dependency order:
+
+    --categories  id, name, description
+    --products    id, name, description, price, image_url, stock, categories
+    --users       id, email, username, hashed_password, is_active, is_admin
+    --events      user_id, product_id, event_type, session_id, timestamp, metadata
+
+The id columns are the source system's IDs. Rows get new database IDs and
+the foreign keys of later files (a product's categories, an event's user
+and product) are remapped through the external -> database ID map, which
+is saved to --id-map so a later run can load more events against the same
+catalog. Rows whose external ID is already in the map are skipped, so a
+rerun does not duplicate them; events have no identity of their own, so
+an events file loaded twice is stored twice. Events that reference unknown
+users or products are skipped and counted, as are records with a value
+that does not parse (a price, ID or timestamp), which are also logged. A
+product's categories are a list (JSON lines, Parquet) or "|"-separated IDs
+(CSV). With --no-remap the IDs in the files are used as database IDs as
+they are.
+
+Maintaining secondary indexes row by row is the slowest part of a large
+load, so on PostgreSQL the non-unique indexes of a table are dropped before
+it is loaded and rebuilt afterwards (--indexes auto does this when the table
+starts empty), and the table is analyzed. Unique indexes stay, since they
+guard the data. Each table reports rows/sec as it goes.
+
+The loader assumes it is the only writer while it runs: database IDs are
+assigned from the current maximum, and sequences are moved past them at
+the end.
+
+Usage:
+    python -m app.scripts.load_data [--categories FILE] [--products FILE] [--users FILE] [--events FILE]
+        [--id-map ids.json] [--chunk-size N] [--indexes auto|drop|keep] [--no-remap]
+"""
+import argparse
+import csv
+import gzip
+import io
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+# Add the parent directory to the path so we can import app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from sqlalchemy import func, insert, select, text
+
+from app.db.session import Base, engine
+from app.models.product import Category, Product, product_category
+from app.models.user import User
+from app.models.user_event import UserEvent
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 50_000
+# Written as NULL by COPY
+_NULL = "\\N"
+
+def _is_null(value) -> bool:
+    # Empty CSV cells and NaN from Parquet/pandas exports count as missing
+    return value is None or value == "" or (isinstance(value, float) and value != value)
+
+def _int(value) -> Optional[int]:
+    return None if _is_null(value) else int(float(value))
+
+def _float(value) -> Optional[float]:
+    return None if _is_null(value) else float(value)
+
+def _bool(value, default: bool = False) -> bool:
+    if _is_null(value):
+        return default
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "t", "yes", "y")
+    return bool(value)
+
+def _str(value) -> Optional[str]:
+    return None if _is_null(value) else str(value)
+
+def _timestamp(value) -> Optional[datetime]:
+    if _is_null(value):
+        return None
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, (int, float)):
+        # Epoch seconds, or milliseconds from most event pipelines
+        return datetime.fromtimestamp(value / 1000 if value > 1e11 else value)
+    return datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+
+def _json(value):
+    if _is_null(value):
+        return None
+    if isinstance(value, str):
+        return json.loads(value)
+    return value
+
+def _id_list(value) -> List[str]:
+    if _is_null(value):
+        return []
+    if isinstance(value, str):
+        value = value.strip()
+        if value.startswith("["):
+            value = json.loads(value)
+        else:
+            return [part.strip() for part in value.split("|") if part.strip()]
+    return [str(_int(v)) if isinstance(v, float) else str(v) for v in value]
+
+def _open_text(path: str):
+    return gzip.open(path, "rt", newline="") if path.endswith(".gz") else open(path, newline="")
+
+def read_rows(path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[List[dict]]:
+    """Yield the file's records as lists of up to chunk_size dicts, without reading it all into memory"""
+    name = path[:-3] if path.endswith(".gz") else path
+    if name.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pylist()
+        return
+
+    with _open_text(path) as f:
+        if name.endswith(".csv"):
+            records = csv.DictReader(f)
+        elif name.endswith((".jsonl", ".ndjson", ".json")):
+            records = (json.loads(line) for line in f if line.strip())
+        else:
+            raise ValueError(f"Unsupported file type: {path} (expected .csv, .jsonl or .parquet)")
+        chunk = []
+        for record in records:
+            chunk.append(record)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+class IdMap:
+    """External -> database IDs per table, kept in a JSON file between runs"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.ids: Dict[str, Dict[str, int]] = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.ids = json.load(f)
+
+    def table(self, name: str) -> Dict[str, int]:
+        return self.ids.setdefault(name, {})
+
+    def save(self):
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Written aside and renamed, so an interrupted save keeps the previous map
+        with open(f"{self.path}.tmp", "w") as f:
+            json.dump(self.ids, f)
+        os.replace(f"{self.path}.tmp", self.path)
+
+class ChunkWriter:
+    """Writes chunks of row tuples with COPY on PostgreSQL, or multi-row INSERTs elsewhere"""
+
+    def __init__(self, target_engine=engine):
+        self.engine = target_engine
+        self.copy = target_engine.dialect.name == "postgresql"
+
+    def write(self, table, columns: tuple, rows: List[tuple]):
+        if not rows:
+            return
+        if self.copy:
+            self._copy(table, columns, rows)
+        else:
+            with self.engine.begin() as connection:
+                connection.execute(insert(table), [dict(zip(columns, row)) for row in rows])
+
+    def _copy(self, table, columns: tuple, rows: List[tuple]):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([_NULL if value is None
+                             else json.dumps(value) if isinstance(value, (dict, list))
+                             else value.isoformat() if isinstance(value, datetime)
+                             else value for value in row])
+        buffer.seek(0)
+        connection = self.engine.raw_connection()
+        try:
+            with connection.cursor() as cursor:
+                cursor.copy_expert(f"COPY {table.name} ({', '.join(columns)}) FROM STDIN "
+                                   f"WITH (FORMAT csv, NULL '{_NULL}')", buffer)
+            connection.commit()
+        finally:
+            connection.close()
+
+class Progress:
+    """Rows/sec of one table's load, logged per chunk and summarized at the end"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.rows = 0
+        self.skipped = 0
+        self.start = time.perf_counter()
+
+    def add(self, rows: int, skipped: int = 0):
+        self.rows += rows
+        self.skipped += skipped
+        logger.info(f"{self.name}: {self.rows:,} rows, {self.rate():,.0f} rows/s")
+
+    def seconds(self) -> float:
+        return time.perf_counter() - self.start
+
+    def rate(self) -> float:
+        seconds = self.seconds()
+        return self.rows / seconds if seconds > 0 else 0.0
+
+    def summary(self) -> dict:
+        return {"rows": self.rows, "skipped": self.skipped, "seconds": round(self.seconds(), 2),
+                "rows_per_sec": round(self.rate())}
+
+def _secondary_indexes(connection, table_name: str) -> List[tuple]:
+    """(name, definition) of the table's indexes that neither back a constraint nor enforce uniqueness"""
+    return connection.execute(text(
+        "SELECT i.relname, pg_get_indexdef(i.oid) FROM pg_index x "
+        "JOIN pg_class i ON i.oid = x.indexrelid "
+        "WHERE x.indrelid = CAST(:table AS regclass) AND NOT x.indisprimary AND NOT x.indisunique "
+        "AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = x.indexrelid)"
+    ), {"table": table_name}).all()
+
+class BulkLoader:
+    """Loads the files of one run; see the module docstring"""
+
+    def __init__(self, id_map: IdMap, chunk_size: int = DEFAULT_CHUNK_SIZE, indexes: str = "auto",
+                 remap: bool = True, target_engine=engine):
+        self.id_map = id_map
+        self.chunk_size = chunk_size
+        self.indexes = indexes
+        self.remap = remap
+        self.engine = target_engine
+        self.writer = ChunkWriter(target_engine)
+        self.postgres = target_engine.dialect.name == "postgresql"
+        self.results: Dict[str, dict] = {}
+
+    def _next_id(self, table) -> int:
+        with self.engine.connect() as connection:
+            return (connection.execute(select(func.max(table.c.id))).scalar() or 0) + 1
+
+    def _is_empty(self, table) -> bool:
+        with self.engine.connect() as connection:
+            return connection.execute(select(table).limit(1)).first() is None
+
+    def _drop_indexes(self, tables: list) -> List[tuple]:
+        if not self.postgres or self.indexes == "keep":
+            return []
+        if self.indexes == "auto" and not all(self._is_empty(table) for table in tables):
+            return []
+        dropped = []
+        with self.engine.begin() as connection:
+            for table in tables:
+                for name, definition in _secondary_indexes(connection, table.name):
+                    connection.execute(text(f'DROP INDEX "{name}"'))
+                    dropped.append((name, definition))
+        if dropped:
+            logger.info(f"Dropped {len(dropped)} indexes of {', '.join(t.name for t in tables)} for the load")
+        return dropped
+
+    def _finish(self, tables: list, dropped: List[tuple]):
+        """Rebuild dropped indexes, move sequences past the loaded IDs and refresh planner statistics"""
+        if not self.postgres:
+            return
+        with self.engine.begin() as connection:
+            for name, definition in dropped:
+                start = time.perf_counter()
+                # The index of a partitioned table is defined ON ONLY the parent; rebuild it on every partition
+                connection.execute(text(definition.replace(" ON ONLY ", " ON ", 1)))
+                logger.info(f"Rebuilt index {name} in {time.perf_counter() - start:.1f}s")
+            for table in tables:
+                if "id" in table.c:
+                    connection.execute(text(
+                        f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+                        f"COALESCE((SELECT MAX(id) FROM {table.name}), 0) + 1, false)"
+                    ))
+        # ANALYZE cannot run inside the transaction block on every server version
+        with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            for table in tables:
+                connection.execute(text(f"ANALYZE {table.name}"))
+
+    def _load(self, name: str, path: str, tables: list, load_chunk):
+        logger.info(f"Loading {name} from {path}")
+        dropped = self._drop_indexes(tables)
+        progress = Progress(name)
+        try:
+            for records in read_rows(path, self.chunk_size):
+                progress.add(*load_chunk(records))
+        finally:
+            # IDs join the map only after their chunk is written, so the map matches what was committed
+            # even when a later chunk failed
+            self.id_map.save()
+            self._finish(tables, dropped)
+        self.results[name] = progress.summary()
+        logger.info(f"Loaded {progress.rows:,} {name} in {progress.seconds():.1f}s "
+                    f"({progress.rate():,.0f} rows/s), skipped {progress.skipped:,}")
+
+    def _assign(self, table_name: str, external, next_id: List[int], staged: Dict[str, int]) -> Optional[int]:
+        """
+        Database ID for a new row, or None when the row was loaded before. New
+        IDs are staged and only join the map once their chunk is written.
+        """
+        external = _str(external)
+        if not self.remap:
+            return _int(external)
+        if external is None:
+            next_id[0] += 1
+            return next_id[0] - 1
+        if external in self.id_map.table(table_name) or external in staged:
+            return None
+        staged[external] = next_id[0]
+        next_id[0] += 1
+        return staged[external]
+
+    def _lookup(self, table_name: str, external) -> Optional[int]:
+        external = _str(external)
+        if external is None:
+            return None
+        if not self.remap:
+            return _int(external)
+        return self.id_map.table(table_name).get(external)
+
+    def load_categories(self, path: str):
+        table = Category.__table__
+        columns = ("id", "name", "description")
+        next_id = [self._next_id(table)]
+
+        def load_chunk(records):
+            rows, staged = [], {}
+            for record in records:
+                if _is_null(record.get("name")):
+                    continue
+                try:
+                    category_id = self._assign("categories", record.get("id"), next_id, staged)
+                except (ValueError, TypeError) as e:
+                    logger.warning(f"Skipping malformed category {record.get('id')}: {str(e)}")
+                    continue
+                if category_id is None:
+                    continue
+                rows.append((category_id, _str(record["name"]), _str(record.get("description"))))
+            self.writer.write(table, columns, rows)
+            self.id_map.table("categories").update(staged)
+            return len(rows), len(records) - len(rows)
+
+        self._load("categories", path, [table], load_chunk)
+
+    def load_products(self, path: str):
+        table = Product.__table__
+        columns = ("id", "name", "description", "price", "image_url", "stock")
+        link_columns = ("product_id", "category_id")
+        next_id = [self._next_id(table)]
+
+        def load_chunk(records):
+            rows, links, staged = [], [], {}
+            for record in records:
+                if _is_null(record.get("name")) or _is_null(record.get("price")):
+                    continue
+                try:
+                    price, stock = _float(record["price"]), _int(record.get("stock")) or 0
+                    category_ids = {self._lookup("categories", c) for c in _id_list(record.get("categories"))}
+                    # Last, so a malformed record never takes an ID
+                    product_id = self._assign("products", record.get("id"), next_id, staged)
+                except (ValueError, TypeError) as e:
+                    logger.warning(f"Skipping malformed product {record.get('id')}: {str(e)}")
+                    continue
+                if product_id is None:
+                    continue
+                rows.append((product_id, _str(record["name"]), _str(record.get("description")),
+                             price, _str(record.get("image_url")), stock))
+                links.extend((product_id, category_id) for category_id in category_ids if category_id is not None)
+            # Products first: the links reference them
+            self.writer.write(table, columns, rows)
+            self.id_map.table("products").update(staged)
+            self.writer.write(product_category, link_columns, links)
+            return len(rows), len(records) - len(rows)
+
+        self._load("products", path, [table, product_category], load_chunk)
+
+    def load_users(self, path: str):
+        table = User.__table__
+        columns = ("id", "email", "username", "hashed_password", "is_active", "is_admin")
+        next_id = [self._next_id(table)]
+
+        def load_chunk(records):
+            rows, staged = [], {}
+            for record in records:
+                if any(_is_null(record.get(c)) for c in ("email", "username", "hashed_password")):
+                    continue
+                try:
+                    user_id = self._assign("users", record.get("id"), next_id, staged)
+                except (ValueError, TypeError) as e:
+                    logger.warning(f"Skipping malformed user {record.get('id')}: {str(e)}")
+                    continue
+                if user_id is None:
+                    continue
+                rows.append((user_id, _str(record["email"]), _str(record["username"]),
+                             _str(record["hashed_password"]), _bool(record.get("is_active"), True),
+                             _bool(record.get("is_admin"))))
+            self.writer.write(table, columns, rows)
+            self.id_map.table("users").update(staged)
+            return len(rows), len(records) - len(rows)
+
+        self._load("users", path, [table], load_chunk)
+
+    def load_events(self, path: str):
+        table = UserEvent.__table__
+        # id comes from the table's sequence; events have no external identity to remap
+        columns = ("user_id", "product_id", "event_type", "session_id", "timestamp", "metadata")
+        loaded_at = datetime.now()
+
+        def load_chunk(records):
+            rows = []
+            for record in records:
+                try:
+                    user_id = self._lookup("users", record.get("user_id"))
+                    product_id = self._lookup("products", record.get("product_id"))
+                    timestamp, metadata = _timestamp(record.get("timestamp")), _json(record.get("metadata"))
+                except (ValueError, TypeError) as e:
+                    logger.warning(f"Skipping malformed event of user {record.get('user_id')}: {str(e)}")
+                    continue
+                if user_id is None or (product_id is None and not _is_null(record.get("product_id"))):
+                    continue
+                if _is_null(record.get("event_type")) or _is_null(record.get("session_id")):
+                    continue
+                rows.append((user_id, product_id, _str(record["event_type"]), _str(record["session_id"]),
+                             timestamp or loaded_at, metadata))
+            self.writer.write(table, columns, rows)
+            return len(rows), len(records) - len(rows)
+
+        self._load("events", path, [table], load_chunk)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--categories", help="Categories file (.csv, .jsonl or .parquet)")
+    parser.add_argument("--products", help="Products file")
+    parser.add_argument("--users", help="Users file")
+    parser.add_argument("--events", help="Events file")
+    parser.add_argument("--id-map", default="./data/id_map.json", help="External -> database ID map, read and updated")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Rows per COPY or INSERT")
+    parser.add_argument("--indexes", choices=("auto", "drop", "keep"), default="auto",
+                        help="Drop and rebuild secondary indexes around each table (PostgreSQL)")
+    parser.add_argument("--no-remap", action="store_true", help="The files already hold database IDs")
+    args = parser.parse_args()
+
+    if not any((args.categories, args.products, args.users, args.events)):
+        parser.error("nothing to load; pass at least one of --categories, --products, --users, --events")
+
+    # Creates missing tables only, as app.db.create_tables does
+    Base.metadata.create_all(engine)
+    loader = BulkLoader(IdMap(None if args.no_remap else args.id_map), args.chunk_size, args.indexes,
+                        remap=not args.no_remap)
+    start = time.perf_counter()
+    for name, load in (("categories", loader.load_categories), ("products", loader.load_products),
+                       ("users", loader.load_users), ("events", loader.load_events)):
+        path = getattr(args, name)
+        if path:
+            load(path)
+
+    print(f"{'table':<12}{'rows':>12}{'skipped':>10}{'seconds':>10}{'rows/s':>12}")
+    for name, result in loader.results.items():
+        print(f"{name:<12}{result['rows']:>12,}{result['skipped']:>10,}{result['seconds']:>10.1f}"
+              f"{result['rows_per_sec']:>12,}")
+    print(f"Done in {time.perf_counter() - start:.1f}s ({engine.dialect.name}, "
+          f"{'COPY' if loader.writer.copy else 'multi-row INSERT'})")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,114 @@
+import json
+import logging
+import threading
+from typing import List, Optional
+
+import redis
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class RecommendationCache:
+    """
+    Redis cache for recommendation results.
+
+    Values are the ordered list of recommended product IDs, so a hit skips model
+    scoring and the catalog queries and only needs a primary-key lookup to
+    hydrate the products. Keys embed the model version, so a new model never
+    serves results computed by the previous one.
+
+    Every user key is also recorded in a per-user set, which lets
+    invalidate_user drop all of a user's entries without a keyspace SCAN.
+    """
+
+    def __init__(self, client: Optional[redis.Redis] = None, enabled: bool = None, prefix: str = "rec"):
+        self.client = client or redis.Redis(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            socket_timeout=settings.CACHE_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.CACHE_SOCKET_TIMEOUT
+        )
+        self.enabled = settings.CACHE_ENABLED if enabled is None else enabled
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.invalidations = 0
+
+    def user_key(self, user_id: int, algorithm: Optional[str], limit: int, version: str, variant: str = "") -> str:
+        key = f"{self.prefix}:user:{user_id}:{(algorithm or 'collaborative').lower()}:{limit}:{version}"
+        # variant names the filters a request applied, e.g. ProductFilter.cache_variant()
+        return f"{key}:{variant}" if variant else key
+
+    def similar_key(self, product_id: int, limit: int, version: str, variant: str = "") -> str:
+        key = f"{self.prefix}:similar:{product_id}:{limit}:{version}"
+        return f"{key}:{variant}" if variant else key
+
+    def _user_keys_set(self, user_id: int) -> str:
+        return f"{self.prefix}:user:{user_id}:keys"
+
+    def _count(self, field: str):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def get(self, key: str) -> Optional[List[int]]:
+        """Return the cached product IDs for a key, or None on a miss or Redis error"""
+        if not self.enabled:
+            return None
+        try:
+            value = self.client.get(key)
+        except redis.RedisError as e:
+            # A cache outage must never fail the request
+            self._count("errors")
+            logger.warning(f"Recommendation cache read failed: {str(e)}")
+            return None
+
+        if value is None:
+            self._count("misses")
+            return None
+        self._count("hits")
+        return json.loads(value)
+
+    def set(self, key: str, product_ids: List[int], ttl: int, user_id: Optional[int] = None):
+        if not self.enabled:
+            return
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.set(key, json.dumps(product_ids), ex=ttl)
+            if user_id is not None:
+                keys_set = self._user_keys_set(user_id)
+                pipe.sadd(keys_set, key)
+                pipe.expire(keys_set, ttl)
+            pipe.execute()
+        except redis.RedisError as e:
+            self._count("errors")
+            logger.warning(f"Recommendation cache write failed: {str(e)}")
+
+    def invalidate_user(self, user_id: int):
+        """Drop every cached recommendation list for a user"""
+        if not self.enabled:
+            return
+        keys_set = self._user_keys_set(user_id)
+        try:
+            keys = self.client.smembers(keys_set)
+            self.client.delete(keys_set, *keys)
+            self._count("invalidations")
+        except redis.RedisError as e:
+            self._count("errors")
+            logger.warning(f"Recommendation cache invalidation failed for user {user_id}: {str(e)}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "errors": self.errors,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+# Singleton instance
+recommendation_cache = RecommendationCache()
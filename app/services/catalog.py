@@ -0,0 +1,254 @@
+import logging
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.product import Product, product_category
+
+logger = logging.getLogger(__name__)
+
+# Filter masks kept per snapshot before the cache is reset
+MAX_CACHED_MASKS = 256
+
+class CatalogSnapshot:
+    """
+    Read-only columnar view of the product catalog.
+
+    Columns are aligned NumPy arrays sorted by product ID. Categories are a
+    many-to-many relationship, so they are stored CSR-style: the category IDs of
+    the product at row i are category_ids[category_indptr[i]:category_indptr[i + 1]].
+    """
+
+    def __init__(self, ids: np.ndarray, prices: np.ndarray, stock: np.ndarray,
+                 category_indptr: np.ndarray, category_ids: np.ndarray):
+        self.ids = ids
+        self.prices = prices
+        self.stock = stock
+        self.category_indptr = category_indptr
+        self.category_ids = category_ids
+        self.in_stock = stock > 0
+        self.out_of_stock_ids = ids[~self.in_stock]
+        self.loaded_at = time.monotonic()
+        # Filter bitsets, built on first use and kept for the life of the snapshot
+        self._category_masks: Dict[int, np.ndarray] = {}
+        self._filter_masks: Dict[tuple, np.ndarray] = {}
+        self._index_masks: Dict[tuple, Tuple[np.ndarray, np.ndarray]] = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def load(cls, db: Session) -> "CatalogSnapshot":
+        """Read the catalog with column projections only - no ORM objects are built"""
+        rows = db.query(Product.id, Product.price, Product.stock).order_by(Product.id).all()
+        ids = np.array([r[0] for r in rows], dtype=np.int64)
+        prices = np.array([r[1] for r in rows], dtype=np.float32)
+        stock = np.array([r[2] or 0 for r in rows], dtype=np.int32)
+
+        links = db.query(product_category.c.product_id, product_category.c.category_id).all()
+        link_products = np.array([l[0] for l in links], dtype=np.int64)
+        link_categories = np.array([l[1] for l in links], dtype=np.int32)
+
+        # Group category links by product row, dropping links to unknown products
+        rows_for_links = np.searchsorted(ids, link_products)
+        known = rows_for_links < len(ids)
+        known[known] = ids[rows_for_links[known]] == link_products[known]
+        rows_for_links = rows_for_links[known]
+        order = np.argsort(rows_for_links, kind='stable')
+        category_indptr = np.zeros(len(ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows_for_links, minlength=len(ids)), out=category_indptr[1:])
+
+        return cls(ids, prices, stock, category_indptr, link_categories[known][order])
+
+    def rows(self, product_ids) -> np.ndarray:
+        """Map product IDs to snapshot rows, -1 for products not in the catalog"""
+        product_ids = np.asarray(product_ids, dtype=np.int64)
+        if not len(self.ids):
+            return np.full(len(product_ids), -1, dtype=np.int64)
+        rows = np.minimum(np.searchsorted(self.ids, product_ids), len(self.ids) - 1)
+        return np.where(self.ids[rows] == product_ids, rows, -1)
+
+    def available(self, product_ids) -> np.ndarray:
+        """Boolean mask of which product IDs exist and are in stock"""
+        rows = self.rows(product_ids)
+        return (rows >= 0) & self.in_stock[np.maximum(rows, 0)]
+
+    def in_stock_ids(self) -> np.ndarray:
+        return self.ids[self.in_stock]
+
+    def category_mask(self, category_id: int) -> np.ndarray:
+        """Rows of the products in a category"""
+        mask = self._category_masks.get(category_id)
+        if mask is None:
+            mask = np.zeros(len(self.ids), dtype=bool)
+            owners = np.repeat(np.arange(len(self.ids)), np.diff(self.category_indptr))
+            mask[owners[self.category_ids == category_id]] = True
+            self._category_masks[category_id] = mask
+        return mask
+
+    def filter_mask(self, product_filter: "ProductFilter") -> np.ndarray:
+        """Rows passing the filter's stock, category and price rules; cached per rule set"""
+        key = product_filter.key
+        mask = self._filter_masks.get(key)
+        if mask is not None:
+            return mask
+
+        mask = self.in_stock.copy()
+        if product_filter.categories:
+            allowed = np.zeros(len(self.ids), dtype=bool)
+            for category_id in product_filter.categories:
+                allowed |= self.category_mask(category_id)
+            mask &= allowed
+        for category_id in product_filter.exclude_categories or ():
+            mask &= ~self.category_mask(category_id)
+        if product_filter.min_price is not None:
+            mask &= self.prices >= product_filter.min_price
+        if product_filter.max_price is not None:
+            mask &= self.prices <= product_filter.max_price
+
+        if len(self._filter_masks) >= MAX_CACHED_MASKS:
+            self._filter_masks.clear()
+        self._filter_masks[key] = mask
+        return mask
+
+    def index_mask(self, product_ids: np.ndarray, product_filter: "ProductFilter") -> np.ndarray:
+        """
+        The filter mask translated to another ID order, e.g. a model's item
+        index; cached per (array, rule set), so the translation is paid once
+        per model version and snapshot. Treat the result as read-only.
+        """
+        key = (id(product_ids), product_filter.key)
+        cached = self._index_masks.get(key)
+        # The array is kept with its mask, so its id cannot be reused while cached
+        if cached is not None and cached[0] is product_ids:
+            return cached[1]
+
+        rows = self.rows(product_ids)
+        mask = (rows >= 0) & self.filter_mask(product_filter)[np.maximum(rows, 0)]
+        if len(self._index_masks) >= MAX_CACHED_MASKS:
+            self._index_masks.clear()
+        self._index_masks[key] = (product_ids, mask)
+        return mask
+
+class ProductFilter:
+    """
+    Business rules for which products may be recommended.
+
+    Products are always required to be in stock. The rules that depend only
+    on the catalog (categories, price range) are evaluated as cached bitsets,
+    see CatalogSnapshot.filter_mask; exclude_ids (e.g. the user's recent
+    purchases) is per request and is applied by the scoring code on top.
+    """
+
+    def __init__(self, categories: Optional[Iterable[int]] = None, exclude_categories: Optional[Iterable[int]] = None,
+                 min_price: Optional[float] = None, max_price: Optional[float] = None,
+                 exclude_purchased: bool = False, exclude_ids: Optional[Iterable[int]] = None):
+        self.categories = sorted(set(categories)) if categories else None
+        self.exclude_categories = sorted(set(exclude_categories)) if exclude_categories else None
+        self.min_price = min_price
+        self.max_price = max_price
+        self.exclude_purchased = exclude_purchased
+        self.exclude_ids = np.fromiter(exclude_ids or (), dtype=np.int64)
+
+    @property
+    def key(self) -> tuple:
+        """Identifies the catalog rules, for mask caching"""
+        return (tuple(self.categories or ()), tuple(self.exclude_categories or ()), self.min_price, self.max_price)
+
+    @property
+    def restricts_catalog(self) -> bool:
+        """Whether any rule beyond stock applies"""
+        return self.key != ((), (), None, None)
+
+    def cache_variant(self) -> str:
+        """Suffix for recommendation cache keys, naming only the rules that differ from the default"""
+        parts = []
+        if self.categories:
+            parts.append("c" + ",".join(map(str, self.categories)))
+        if self.exclude_categories:
+            parts.append("x" + ",".join(map(str, self.exclude_categories)))
+        if self.min_price is not None:
+            parts.append(f"min{self.min_price}")
+        if self.max_price is not None:
+            parts.append(f"max{self.max_price}")
+        if self.exclude_purchased:
+            parts.append("np")
+        return "-".join(parts)
+
+    def with_excluded(self, product_ids: Iterable[int]) -> "ProductFilter":
+        """A copy that also excludes the given products"""
+        copy = ProductFilter(self.categories, self.exclude_categories, self.min_price, self.max_price,
+                             self.exclude_purchased)
+        copy.exclude_ids = np.union1d(self.exclude_ids, np.fromiter(product_ids, dtype=np.int64))
+        return copy
+
+    def allows(self, catalog: CatalogSnapshot, product_ids) -> np.ndarray:
+        """Boolean mask of which product IDs pass every rule, for short candidate lists"""
+        product_ids = np.asarray(product_ids, dtype=np.int64)
+        rows = catalog.rows(product_ids)
+        mask = (rows >= 0) & catalog.filter_mask(self)[np.maximum(rows, 0)]
+        if len(self.exclude_ids):
+            mask &= ~np.isin(product_ids, self.exclude_ids)
+        return mask
+
+    def apply(self, catalog: CatalogSnapshot, recommendations: List[tuple]) -> List[tuple]:
+        """Keep the (product_id, score) pairs that pass every rule"""
+        if not recommendations:
+            return recommendations
+        mask = self.allows(catalog, [pid for pid, _ in recommendations])
+        return [rec for rec, keep in zip(recommendations, mask) if keep]
+
+class ProductCatalog:
+    """
+    Holder for the shared catalog snapshot.
+
+    Readers get the current snapshot without locking. A snapshot is rebuilt when
+    it is older than CATALOG_REFRESH_SECONDS or after invalidate() is called by
+    the product write endpoints; only one caller rebuilds while the others keep
+    reading the previous snapshot.
+    """
+
+    def __init__(self, refresh_seconds: Optional[float] = None):
+        self.refresh_seconds = settings.CATALOG_REFRESH_SECONDS if refresh_seconds is None else refresh_seconds
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._dirty = True
+        self._refresh_lock = threading.Lock()
+
+    def invalidate(self):
+        """Signal that products changed; the next reader rebuilds the snapshot"""
+        self._dirty = True
+
+    def _stale(self) -> bool:
+        snapshot = self._snapshot
+        return self._dirty or snapshot is None or time.monotonic() - snapshot.loaded_at > self.refresh_seconds
+
+    def current(self) -> Optional[CatalogSnapshot]:
+        """The snapshot if it is fresh, else None; never touches the database"""
+        return None if self._stale() else self._snapshot
+
+    def get(self, db: Session) -> CatalogSnapshot:
+        if not self._stale():
+            return self._snapshot
+
+        # The first load must block; later refreshes are skipped if one is already running
+        if not self._refresh_lock.acquire(blocking=self._snapshot is None):
+            return self._snapshot
+        try:
+            if self._stale():
+                self._dirty = False
+                try:
+                    self._snapshot = CatalogSnapshot.load(db)
+                    logger.info(f"Loaded catalog snapshot with {len(self._snapshot)} products")
+                except Exception:
+                    self._dirty = True
+                    raise
+            return self._snapshot
+        finally:
+            self._refresh_lock.release()
+
+# Singleton instance
+product_catalog = ProductCatalog()
@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Marks a local cache miss, since None can be a cached value
+_MISSING = object()
+
+class _Flight:
+    """A computation in progress, waited on by the requests that arrived during it"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error: Optional[BaseException] = None
+
+class RequestCoalescer:
+    """
+    Single-flight deduplication in front of a small in-process LRU cache.
+
+    run(key, compute) first looks the key up in the LRU. On a miss, the first
+    caller (the leader) runs compute while every identical call that arrives
+    before it finishes waits for the leader's result instead of repeating the
+    cache, database and model work. The result is then kept in the LRU for
+    LOCAL_CACHE_TTL seconds. Keys are the recommendation cache keys, so they
+    already carry the user or product, the filters and the model version.
+
+    The TTL is short because cache invalidation happens in the event consumer,
+    which cannot reach this process; the Redis cache behind it is the one
+    that is invalidated. If a leader fails its waiters get the same exception,
+    and if it takes longer than COALESCE_WAIT_SECONDS they compute on their own.
+
+    Threads (sync endpoints) and coroutines (async endpoints) have separate
+    flights, since a coroutine must not block the event loop on a thread event.
+    """
+
+    def __init__(self, enabled: bool = None, max_entries: int = None, ttl: float = None,
+                 wait_timeout: float = None):
+        self.enabled = settings.LOCAL_CACHE_ENABLED if enabled is None else enabled
+        self.max_entries = max_entries or settings.LOCAL_CACHE_MAX_ENTRIES
+        self.ttl = settings.LOCAL_CACHE_TTL if ttl is None else ttl
+        self.wait_timeout = settings.COALESCE_WAIT_SECONDS if wait_timeout is None else wait_timeout
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._flights: Dict[str, _Flight] = {}
+        self._async_flights: Dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.computed = 0
+        self.timeouts = 0
+
+    def _get(self, key: str):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return _MISSING
+
+    def _set(self, key: str, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _count(self, field: str):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def run(self, key: str, compute: Callable[[], T]) -> T:
+        """Return the cached value for key, join an identical computation in flight, or run compute"""
+        if not self.enabled:
+            return compute()
+        value = self._get(key)
+        if value is not _MISSING:
+            return value
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.computed += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            if not flight.done.wait(self.wait_timeout):
+                self._count("timeouts")
+                logger.warning(f"Gave up waiting for in-flight request {key}")
+                return compute()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = compute()
+            self._set(key, flight.value)
+            return flight.value
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    async def run_async(self, key: str, compute: Callable[[], Awaitable[T]]) -> T:
+        """run for coroutines; compute is called to create the awaitable, and only by the leader"""
+        if not self.enabled:
+            return await compute()
+        value = self._get(key)
+        if value is not _MISSING:
+            return value
+
+        # Only the event loop thread touches the async flights, so no lock is needed
+        future = self._async_flights.get(key)
+        if future is not None:
+            self._count("coalesced")
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), self.wait_timeout)
+            except asyncio.TimeoutError:
+                self._count("timeouts")
+                logger.warning(f"Gave up waiting for in-flight request {key}")
+                return await compute()
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # The leader's client went away; this request still wants an answer
+                return await compute()
+
+        self._count("computed")
+        future = asyncio.get_running_loop().create_future()
+        self._async_flights[key] = future
+        try:
+            value = await compute()
+            self._set(key, value)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Retrieve it, so asyncio does not log it when no one was waiting
+            future.exception()
+            raise
+        finally:
+            del self._async_flights[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "computed": self.computed,
+                "timeouts": self.timeouts,
+                "hit_rate": self.hits / requests if requests else 0.0,
+                # Share of requests that neither hit the LRU nor ran their own computation
+                "coalesced_rate": self.coalesced / requests if requests else 0.0
+            }
+
+# Singleton instance
+request_coalescer = RequestCoalescer()
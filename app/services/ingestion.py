@@ -0,0 +1,227 @@
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.exc import DataError, IntegrityError
+
+from app.core.config import settings
+from app.core.metrics import RequestTimer
+from app.db.session import SessionLocal
+from app.kafka.producer import EventProducer, event_producer
+from app.models.user_event import UserEvent
+
+logger = logging.getLogger(__name__)
+
+# Seconds between attempts while the database is unavailable
+RETRY_BACKOFF_SECONDS = 1.0
+
+_COLUMNS = ("user_id", "product_id", "event_type", "session_id", "timestamp", "metadata")
+
+class EventIngestor:
+    """
+    Write-behind buffer for POST /recommendations/event/ (EVENT_INGESTION_BUFFERED).
+
+    The endpoint validates an event and submit()s it to a bounded queue, then
+    answers 202; when the queue is full submit() returns False and the
+    endpoint answers 429, so clients back off instead of the event table
+    taking the connection pool. A flusher thread takes up to batch_size
+    events, waiting at most flush_interval for a batch to fill, writes them
+    with one multi-row INSERT and publishes them to KAFKA_TOPIC_EVENTS in one
+    EventProducer.send_events call.
+
+    A batch rejected by a constraint (unknown user or product) is retried row
+    by row, so one bad event does not lose the others. Any other database
+    error retries the whole batch after a backoff; meanwhile the queue fills
+    and the endpoint pushes back. stop() stops accepting events and drains
+    the queue within drain_timeout seconds; what is left is logged and
+    counted as dropped.
+    """
+
+    def __init__(self, max_size: Optional[int] = None, batch_size: Optional[int] = None,
+                 flush_interval: Optional[float] = None, drain_timeout: Optional[float] = None,
+                 session_factory=SessionLocal, producer: Optional[EventProducer] = None):
+        self.queue = queue.Queue(maxsize=max_size or settings.EVENT_QUEUE_SIZE)
+        self.batch_size = batch_size or settings.EVENT_FLUSH_BATCH_SIZE
+        self.flush_interval = settings.EVENT_FLUSH_INTERVAL_MS / 1000 if flush_interval is None else flush_interval
+        self.drain_timeout = settings.EVENT_DRAIN_TIMEOUT_SECONDS if drain_timeout is None else drain_timeout
+        self.session_factory = session_factory
+        self.producer = producer or event_producer
+        self.accepted = 0
+        self.rejected = 0
+        self.written = 0
+        self.invalid = 0
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._accepting = False
+        self._deadline: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def submit(self, event: Dict[str, Any]) -> bool:
+        """
+        Queue an event (a dict with the user_events columns); False when the
+        queue is full or the ingestor is not running
+        """
+        if not self._accepting:
+            return False
+        # An explicit None (e.g. an unset field of the request schema) gets the arrival time too
+        if event.get("timestamp") is None:
+            event["timestamp"] = datetime.now()
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            return False
+        with self._lock:
+            self.accepted += 1
+        return True
+
+    def _next_batch(self, wait: bool = True) -> List[Dict[str, Any]]:
+        batch = []
+        try:
+            batch.append(self.queue.get(timeout=self.flush_interval) if wait else self.queue.get_nowait())
+        except queue.Empty:
+            return batch
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self.queue.get(timeout=remaining) if wait and remaining > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _insert(self, rows: List[Dict[str, Any]]):
+        db = self.session_factory()
+        try:
+            db.execute(insert(UserEvent.__table__), rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _insert_rows(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Insert one row per transaction, skipping those the database rejects"""
+        written = []
+        for row in rows:
+            try:
+                self._insert([row])
+                written.append(row)
+            except (IntegrityError, DataError) as e:
+                with self._lock:
+                    self.invalid += 1
+                logger.error(f"Dropping invalid event for user {row.get('user_id')}: {str(e.orig)}")
+        return written
+
+    def _write(self, rows: List[Dict[str, Any]], timer: RequestTimer) -> List[Dict[str, Any]]:
+        """Insert the batch, returning the rows that were written"""
+        while True:
+            try:
+                with timer.stage("db_write"):
+                    self._insert(rows)
+                return rows
+            except (IntegrityError, DataError) as e:
+                logger.error(f"Event batch of {len(rows)} rejected, inserting row by row: {str(e.orig)}")
+                timer.fallback(e)
+                with timer.stage("db_write_rows"):
+                    return self._insert_rows(rows)
+            except Exception as e:
+                logger.error(f"Error writing event batch of {len(rows)} events: {str(e)}")
+                timer.fallback(e)
+                if self._deadline is not None and time.monotonic() >= self._deadline:
+                    # Shutting down and the database is still unavailable
+                    with self._lock:
+                        self.dropped += len(rows)
+                    return []
+                time.sleep(RETRY_BACKOFF_SECONDS)
+
+    @staticmethod
+    def _message(row: Dict[str, Any]) -> tuple:
+        """(event_type, data, key) of a written row, for EventProducer.send_events"""
+        timestamp = row["timestamp"]
+        data = {**row, "timestamp": timestamp.isoformat() if hasattr(timestamp, "isoformat") else timestamp}
+        return row["event_type"], data, str(row["user_id"]) if row["user_id"] is not None else None
+
+    def _messages(self, rows: List[Dict[str, Any]]) -> List[tuple]:
+        """Messages of the rows that can be published; a bad row is logged, not allowed to lose the batch"""
+        messages = []
+        for row in rows:
+            try:
+                messages.append(self._message(row))
+            except Exception as e:
+                logger.error(f"Not publishing event for user {row.get('user_id')}: {str(e)}")
+        return messages
+
+    def flush(self, batch: List[Dict[str, Any]]):
+        """Write a batch to the database, then publish what was written to Kafka"""
+        rows = [{column: event.get(column) for column in _COLUMNS} for event in batch]
+        with RequestTimer("ingestion_flush") as timer:
+            written = self._write(rows, timer)
+            with self._lock:
+                self.written += len(written)
+            if not written:
+                return
+            with timer.stage("kafka_publish"):
+                self.producer.send_events(self._messages(written))
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                batch = self._next_batch()
+                if batch:
+                    self.flush(batch)
+            except Exception as e:
+                logger.error(f"Error flushing events: {str(e)}")
+
+        # Drain what was accepted before stop(), within the deadline
+        while time.monotonic() < self._deadline:
+            batch = self._next_batch(wait=False)
+            if not batch:
+                break
+            try:
+                self.flush(batch)
+            except Exception as e:
+                logger.error(f"Error flushing events: {str(e)}")
+        left = self.queue.qsize()
+        if left:
+            with self._lock:
+                self.dropped += left
+            logger.error(f"Dropped {left} queued events that were not written within {self.drain_timeout}s")
+        self.producer.flush(timeout=max(0.0, self._deadline - time.monotonic()))
+
+    def start(self):
+        if self._thread is None:
+            self._accepting = True
+            self._thread = threading.Thread(target=self._run, name="event-ingestion", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop accepting events and block until the queue is drained or drain_timeout passes"""
+        self._accepting = False
+        self._deadline = time.monotonic() + self.drain_timeout
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(self.drain_timeout + RETRY_BACKOFF_SECONDS)
+            self._thread = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queued": self.queue.qsize(),
+                "capacity": self.queue.maxsize,
+                "accepted": self.accepted,
+                "rejected": self.rejected,
+                "written": self.written,
+                "invalid": self.invalid,
+                "dropped": self.dropped,
+            }
+
+# Singleton instance
+event_ingestor = EventIngestor()
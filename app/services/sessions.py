@@ -0,0 +1,164 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import redis
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class SessionProfileStore:
+    """
+    Recent items of anonymous sessions, for session-based recommendations.
+
+    A profile maps product IDs to a weight: each event adds its
+    settings.EVENT_WEIGHTS entry, and older weights decay exponentially with a
+    half-life of SESSION_HALF_LIFE_SECONDS, so the last few items dominate. Only
+    the SESSION_MAX_ITEMS heaviest items are kept.
+
+    Profiles live in an in-process dict ordered by last update. Sessions idle
+    for SESSION_TTL_SECONDS expire, and beyond SESSION_MAX_PROFILES the least
+    recently updated session is evicted. With SESSION_STORE_REDIS the profiles
+    are also written to Redis with the same TTL, so API workers see what a
+    separate consumer process recorded; local copies are re-read after
+    SESSION_REDIS_REFRESH_SECONDS.
+    """
+
+    def __init__(self, client: Optional[redis.Redis] = None, use_redis: bool = None, prefix: str = "session",
+                 max_profiles: int = None, ttl: int = None, max_items: int = None, half_life: float = None):
+        use_redis = settings.SESSION_STORE_REDIS if use_redis is None else use_redis
+        self.client = client or (redis.Redis(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            socket_timeout=settings.CACHE_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.CACHE_SOCKET_TIMEOUT
+        ) if use_redis else None)
+        self.prefix = prefix
+        self.max_profiles = max_profiles or settings.SESSION_MAX_PROFILES
+        self.ttl = ttl or settings.SESSION_TTL_SECONDS
+        self.max_items = max_items or settings.SESSION_MAX_ITEMS
+        self.half_life = half_life or settings.SESSION_HALF_LIFE_SECONDS
+        # session_id -> (profile, time the local copy was read from or written to Redis)
+        self._profiles: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.errors = 0
+
+    def key(self, session_id: str) -> str:
+        return f"{self.prefix}:{session_id}"
+
+    def _decay(self, profile: dict, now: float) -> Dict[int, float]:
+        factor = 0.5 ** (max(now - profile["updated"], 0.0) / self.half_life)
+        return {product_id: weight * factor for product_id, weight in profile["items"].items()}
+
+    def _evict(self, now: float):
+        """Drop expired and surplus profiles; callers must hold _lock"""
+        # Ordered by last update, so expired profiles are at the front
+        while self._profiles:
+            session_id, (profile, _) = next(iter(self._profiles.items()))
+            if now - profile["updated"] < self.ttl and len(self._profiles) <= self.max_profiles:
+                break
+            del self._profiles[session_id]
+            self.evictions += 1
+
+    def _read_redis(self, session_ids: List[str]) -> Dict[str, dict]:
+        try:
+            values = self.client.mget([self.key(session_id) for session_id in session_ids])
+        except redis.RedisError as e:
+            self.errors += 1
+            logger.warning(f"Session profile read failed: {str(e)}")
+            return {}
+        profiles = {}
+        for session_id, value in zip(session_ids, values):
+            if value is not None:
+                profile = json.loads(value)
+                profile["items"] = {int(product_id): weight for product_id, weight in profile["items"].items()}
+                profiles[session_id] = profile
+        return profiles
+
+    def _write_redis(self, profiles: Dict[str, dict]):
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for session_id, profile in profiles.items():
+                pipe.set(self.key(session_id), json.dumps(profile), ex=self.ttl)
+            pipe.execute()
+        except redis.RedisError as e:
+            self.errors += 1
+            logger.warning(f"Session profile write failed: {str(e)}")
+
+    def _load(self, session_ids: List[str], now: float) -> Dict[str, dict]:
+        """Current profiles of the given sessions, refreshing stale local copies from Redis"""
+        found, missing = {}, []
+        with self._lock:
+            for session_id in session_ids:
+                entry = self._profiles.get(session_id)
+                if entry is not None and now - entry[0]["updated"] >= self.ttl:
+                    entry = None
+                if entry is None or (self.client is not None and now - entry[1] >= settings.SESSION_REDIS_REFRESH_SECONDS):
+                    missing.append(session_id)
+                if entry is not None:
+                    found[session_id] = entry[0]
+
+        if missing and self.client is not None:
+            loaded = self._read_redis(missing)
+            with self._lock:
+                for session_id, profile in loaded.items():
+                    local = found.get(session_id)
+                    if local is None or local["updated"] <= profile["updated"]:
+                        # Another process recorded newer events
+                        self._profiles[session_id] = (profile, now)
+                        self._profiles.move_to_end(session_id)
+                        found[session_id] = profile
+                self._evict(now)
+        return found
+
+    def record_batch(self, events_by_session: Dict[str, List[tuple]]):
+        """Fold (product_id, event_type) pairs, in arrival order, into each session's profile"""
+        if not events_by_session:
+            return
+        now = time.time()
+        current = self._load(list(events_by_session), now)
+
+        updated = {}
+        for session_id, events in events_by_session.items():
+            profile = current.get(session_id)
+            items = self._decay(profile, now) if profile else {}
+            for product_id, event_type in events:
+                weight = settings.EVENT_WEIGHTS.get(event_type, 0.0)
+                if product_id and weight:
+                    items[int(product_id)] = items.get(int(product_id), 0.0) + weight
+            if len(items) > self.max_items:
+                items = dict(sorted(items.items(), key=lambda item: item[1], reverse=True)[:self.max_items])
+            updated[session_id] = {"updated": now, "items": items}
+
+        with self._lock:
+            for session_id, profile in updated.items():
+                self._profiles[session_id] = (profile, now)
+                self._profiles.move_to_end(session_id)
+            self._evict(now)
+        if self.client is not None:
+            self._write_redis(updated)
+
+    def record(self, session_id: str, product_id: int, event_type: str):
+        self.record_batch({session_id: [(product_id, event_type)]})
+
+    def get(self, session_id: str) -> Dict[int, float]:
+        """The session's {product_id: weight}, decayed to now; empty for unknown or expired sessions"""
+        now = time.time()
+        profile = self._load([session_id], now).get(session_id)
+        return self._decay(profile, now) if profile else {}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "sessions": len(self._profiles),
+                "evictions": self.evictions,
+                "errors": self.errors
+            }
+
+# Singleton instance
+session_store = SessionProfileStore()
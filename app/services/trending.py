@@ -0,0 +1,261 @@
+import json
+import logging
+import math
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import redis
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class TrendingCounters:
+    """
+    Exponentially decayed popularity of products, fed by the event consumer.
+
+    Every event adds its settings.EVENT_WEIGHTS entry to the product's counter,
+    and counters halve every TRENDING_HALF_LIFE_SECONDS. Decay uses forward
+    decay: an event at time t adds weight * exp(rate * (t - landmark)) and
+    nothing is ever decayed in place, so recording is a dict update; the
+    common factor exp(-rate * (now - landmark)) is only applied when
+    counters are read. The landmark moves forward before the factors could
+    overflow.
+
+    At most TRENDING_MAX_TRACKED products keep a counter; once the dict grows
+    past that, the lowest counters are pruned, which only drops products far
+    below anything that would be published.
+
+    A background thread (start/stop, run by the consumer) publishes a snapshot
+    every TRENDING_SNAPSHOT_SECONDS to Redis or TRENDING_SNAPSHOT_PATH: the
+    TRENDING_TOP_K products, category totals, and the top
+    TRENDING_CATEGORY_TOP_K products per category. API workers read that
+    snapshot, re-reading it after TRENDING_REFRESH_SECONDS, so a trending
+    lookup is a list slice with no database query.
+    """
+
+    def __init__(self, client: Optional[redis.Redis] = None, use_redis: bool = None, path: str = None,
+                 half_life: float = None, max_tracked: int = None, prefix: str = "trending"):
+        use_redis = settings.TRENDING_SNAPSHOT_REDIS if use_redis is None else use_redis
+        self.client = client or (redis.Redis(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            socket_timeout=settings.CACHE_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.CACHE_SOCKET_TIMEOUT
+        ) if use_redis else None)
+        self.path = path or settings.TRENDING_SNAPSHOT_PATH
+        self.prefix = prefix
+        self.rate = math.log(2) / (half_life or settings.TRENDING_HALF_LIFE_SECONDS)
+        self.max_tracked = max_tracked or settings.TRENDING_MAX_TRACKED
+        self._landmark = time.time()
+        self._scores: Dict[int, float] = {}
+        self._lock = threading.Lock()
+        self._snapshot: Optional[dict] = None
+        self._snapshot_read_at = 0.0
+        self._publishing = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def counters_path(self) -> str:
+        return f"{os.path.splitext(self.path)[0]}.counters.json"
+
+    def _rescale(self, now: float):
+        """Move the landmark to now; callers must hold _lock"""
+        factor = math.exp(-self.rate * (now - self._landmark))
+        self._scores = {product_id: score * factor for product_id, score in self._scores.items()}
+        self._landmark = now
+
+    def _prune(self):
+        """Keep the max_tracked highest counters; callers must hold _lock"""
+        ids = np.fromiter(self._scores.keys(), dtype=np.int64, count=len(self._scores))
+        scores = np.fromiter(self._scores.values(), dtype=np.float64, count=len(self._scores))
+        keep = np.argpartition(-scores, self.max_tracked - 1)[:self.max_tracked]
+        self._scores = dict(zip(ids[keep].tolist(), scores[keep].tolist()))
+
+    def record_batch(self, events: Iterable[tuple], now: Optional[float] = None):
+        """Count (product_id, event_type) pairs"""
+        now = time.time() if now is None else now
+        with self._lock:
+            if self.rate * (now - self._landmark) > 100:
+                self._rescale(now)
+            boost = math.exp(self.rate * (now - self._landmark))
+            scores = self._scores
+            for product_id, event_type in events:
+                weight = settings.EVENT_WEIGHTS.get(event_type, 0.0)
+                if product_id and weight:
+                    scores[int(product_id)] = scores.get(int(product_id), 0.0) + weight * boost
+            # Pruning sorts the whole dict, so let it overshoot a little first
+            if len(scores) > self.max_tracked * 1.25:
+                self._prune()
+
+    def counters(self, now: Optional[float] = None) -> tuple:
+        """(product_ids, scores) of every tracked product, decayed to now"""
+        now = time.time() if now is None else now
+        with self._lock:
+            ids = np.fromiter(self._scores.keys(), dtype=np.int64, count=len(self._scores))
+            scores = np.fromiter(self._scores.values(), dtype=np.float64, count=len(self._scores))
+            landmark = self._landmark
+        return ids, scores * math.exp(-self.rate * (now - landmark))
+
+    def build_snapshot(self, catalog=None, now: Optional[float] = None) -> dict:
+        """Rank the current counters; categories need a CatalogSnapshot"""
+        now = time.time() if now is None else now
+        ids, scores = self.counters(now)
+        top = np.argsort(-scores, kind='stable')[:settings.TRENDING_TOP_K]
+        snapshot = {
+            "created_at": now,
+            "products": [[int(i), float(s)] for i, s in zip(ids[top], scores[top])],
+            "categories": [],
+            "by_category": {}
+        }
+        if catalog is None or not len(ids):
+            return snapshot
+
+        # Expand every tracked product into one (category, product, score) entry per category
+        rows = catalog.rows(ids)
+        known = rows >= 0
+        ids, scores, rows = ids[known], scores[known], rows[known]
+        starts = catalog.category_indptr[rows]
+        lengths = catalog.category_indptr[rows + 1] - starts
+        owner = np.repeat(np.arange(len(rows)), lengths)
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        categories = catalog.category_ids[np.repeat(starts, lengths) + offsets]
+        if not len(categories):
+            return snapshot
+
+        category_ids, inverse = np.unique(categories, return_inverse=True)
+        totals = np.bincount(inverse, weights=scores[owner])
+        snapshot["categories"] = [[int(c), float(t)] for c, t in
+                                  sorted(zip(category_ids, totals), key=lambda ct: ct[1], reverse=True)]
+
+        # Sorted by category, then best first within each category
+        order = np.lexsort((-scores[owner], categories))
+        bounds = np.searchsorted(categories[order], category_ids, side='left').tolist() + [len(order)]
+        for position, category_id in enumerate(category_ids.tolist()):
+            entries = order[bounds[position]:bounds[position + 1]][:settings.TRENDING_CATEGORY_TOP_K]
+            snapshot["by_category"][str(category_id)] = [
+                [int(ids[owner[e]]), float(scores[owner[e]])] for e in entries
+            ]
+        return snapshot
+
+    def _write(self, name: str, path: str, value: str):
+        if self.client is not None:
+            self.client.set(f"{self.prefix}:{name}", value)
+            return
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(value)
+        # Readers see the old or the new file, never a partial one
+        os.replace(tmp_path, path)
+
+    def _read(self, name: str, path: str) -> Optional[dict]:
+        if self.client is not None:
+            value = self.client.get(f"{self.prefix}:{name}")
+            return None if value is None else json.loads(value)
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def publish(self, catalog=None):
+        """Rebuild the snapshot and write it, together with the counters for a restart"""
+        now = time.time()
+        snapshot = self.build_snapshot(catalog, now)
+        self._snapshot = snapshot
+        ids, scores = self.counters(now)
+        self._write("snapshot", self.path, json.dumps(snapshot))
+        self._write("counters", self.counters_path, json.dumps({
+            "created_at": now,
+            "counters": [[int(i), float(s)] for i, s in zip(ids, scores)]
+        }))
+
+    def restore(self) -> int:
+        """Load the counters written by the last publish, decayed to now; returns the number loaded"""
+        state = self._read("counters", self.counters_path)
+        if not state:
+            return 0
+        now = time.time()
+        factor = math.exp(-self.rate * (now - state["created_at"]))
+        with self._lock:
+            self._landmark = now
+            self._scores = {int(product_id): score * factor for product_id, score in state["counters"]}
+        return len(self._scores)
+
+    def _current(self) -> Optional[dict]:
+        if self._publishing:
+            # This process owns the counters; its own snapshot is always the newest
+            return self._snapshot
+        if self._snapshot is None or time.monotonic() - self._snapshot_read_at > settings.TRENDING_REFRESH_SECONDS:
+            self._snapshot_read_at = time.monotonic()
+            try:
+                self._snapshot = self._read("snapshot", self.path) or self._snapshot
+            except Exception as e:
+                logger.warning(f"Could not read the trending snapshot: {str(e)}")
+        return self._snapshot
+
+    def top(self, limit: int, category_id: Optional[int] = None) -> List[tuple]:
+        """Best (product_id, score) pairs, overall or within one category; empty before the first snapshot"""
+        snapshot = self._current()
+        if snapshot is None:
+            return []
+        ranked = snapshot["products"] if category_id is None else snapshot["by_category"].get(str(category_id), [])
+        return [tuple(entry) for entry in ranked[:limit]]
+
+    def top_categories(self, limit: int) -> List[tuple]:
+        snapshot = self._current()
+        return [] if snapshot is None else [tuple(entry) for entry in snapshot["categories"][:limit]]
+
+    def _load_catalog(self):
+        # Imported here so readers of the snapshot do not need a database session
+        from app.db.session import SessionLocal
+        from app.services.catalog import product_catalog
+
+        db = SessionLocal()
+        try:
+            return product_catalog.get(db)
+        finally:
+            db.close()
+
+    def _publish_safely(self):
+        try:
+            self.publish(self._load_catalog())
+        except Exception as e:
+            logger.error(f"Error publishing the trending snapshot: {str(e)}")
+
+    def _run(self):
+        while not self._stop.wait(settings.TRENDING_SNAPSHOT_SECONDS):
+            self._publish_safely()
+
+    def start(self):
+        """Resume from the last published counters and publish periodically from this process"""
+        if self._thread is not None:
+            return
+        try:
+            restored = self.restore()
+            logger.info(f"Restored {restored} trending counters")
+        except Exception as e:
+            logger.error(f"Could not restore the trending counters: {str(e)}")
+        self._publishing = True
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="trending-snapshot", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the publishing thread and write a final snapshot"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self._publish_safely()
+
+# Singleton instance
+trending_counters = TrendingCounters()
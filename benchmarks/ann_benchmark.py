@@ -0,0 +1,63 @@
+"""
+Recall@K and QPS of the IVF index against exact brute-force scoring.
+
+Usage:
+    python -m benchmarks.ann_benchmark [--items N] [--dim D] [--queries Q] [--k K]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.ml.ann import IVFIndex
+
+def synthetic_factors(n: int, dim: int, clusters: int = 64, seed: int = 0) -> np.ndarray:
+    """Clustered float32 vectors, closer to trained factors than isotropic noise"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    labels = rng.integers(0, clusters, size=n)
+    return (centers[labels] + 0.5 * rng.normal(size=(n, dim))).astype(np.float32)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=64)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    args = parser.parse_args()
+
+    vectors = synthetic_factors(args.items, args.dim)
+    queries = synthetic_factors(args.queries, args.dim, seed=1)
+    ids = np.arange(args.items, dtype=np.int64)
+
+    start = time.perf_counter()
+    index = IVFIndex.build(ids, vectors, nlist=args.nlist)
+    print(f"built IVF index: {args.items} items, nlist={index.nlist}, {time.perf_counter() - start:.2f}s")
+
+    # Exact baseline, one query at a time to match the request path
+    start = time.perf_counter()
+    truth = []
+    for query in queries:
+        scores = vectors @ query
+        truth.append(set(np.argpartition(-scores, args.k - 1)[:args.k].tolist()))
+    exact_qps = len(queries) / (time.perf_counter() - start)
+
+    print(f"{'method':<16}{'recall@' + str(args.k):>12}{'QPS':>12}{'speedup':>10}")
+    print(f"{'exact':<16}{1.0:>12.3f}{exact_qps:>12.0f}{1.0:>10.1f}")
+
+    for nprobe in args.nprobe:
+        if nprobe > index.nlist:
+            continue
+        hits = 0
+        start = time.perf_counter()
+        for query, expected in zip(queries, truth):
+            found, _ = index.search(query, args.k, nprobe=nprobe)
+            hits += len(expected.intersection(found.tolist()))
+        qps = len(queries) / (time.perf_counter() - start)
+        recall = hits / (len(queries) * args.k)
+        print(f"{'ivf nprobe=' + str(nprobe):<16}{recall:>12.3f}{qps:>12.0f}{qps / exact_qps:>10.1f}")
+
+if __name__ == "__main__":
+    main()
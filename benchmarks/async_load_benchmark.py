@@ -0,0 +1,203 @@
+"""
+Load test of the sync and async database stacks behind the recommendation functions.
+
+Seeds a database with synthetic users, products and events, publishes a
+synthetic model version, and serves the same two lookups through both stacks
+in one uvicorn process:
+
+    /sync/...   plain `def` routes on get_db (threadpool + sync engine)
+    /async/...  `async def` routes on get_async_db (event loop + async engine)
+
+The server runs in a child process so the load generator does not compete
+for its GIL. Requests are driven with a fixed number of concurrent httpx
+clients; the recommendation cache is disabled so every request reaches the
+database.
+SQLite (the default) is only a stand-in: point --database-url at a local
+PostgreSQL to measure asyncpg against psycopg2.
+
+Usage:
+    python -m benchmarks.async_load_benchmark [--database-url URL] [--requests N] [--concurrency C]
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+def seed(users: int, products: int, events: int, model_path: str):
+    from sqlalchemy import insert
+
+    from app.db.session import Base, SessionLocal, engine
+    from app.ml.neighbors import build_model_index
+    from app.ml.train import save_artifacts
+    from app.models.product import Product
+    from app.models.user import User
+    from app.models.user_event import UserEvent
+
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    rng = np.random.default_rng(0)
+    db = SessionLocal()
+    try:
+        db.execute(insert(User), [
+            {"id": i, "email": f"user{i}@example.com", "username": f"user{i}", "hashed_password": "x"}
+            for i in range(1, users + 1)
+        ])
+        db.execute(insert(Product), [
+            {"id": i, "name": f"Product {i}", "price": float(rng.uniform(1, 500)), "stock": int(rng.integers(0, 20))}
+            for i in range(1, products + 1)
+        ])
+        db.execute(insert(UserEvent), [
+            {"user_id": int(u), "product_id": int(p), "event_type": "view", "session_id": "load-test"}
+            for u, p in zip(rng.integers(1, users + 1, events), rng.integers(1, products + 1, events))
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+    cf = {
+        "user_ids": np.arange(1, users + 1, dtype=np.int64),
+        "user_factors": rng.standard_normal((users, 32), dtype=np.float32),
+        "item_ids": np.arange(1, products + 1, dtype=np.int64),
+        "item_factors": rng.standard_normal((products, 32), dtype=np.float32),
+        "global_mean": 0.0,
+    }
+    cb = build_model_index({
+        "product_ids": np.arange(1, products + 1, dtype=np.int64),
+        "product_vectors": rng.standard_normal((products, 32), dtype=np.float32),
+    }, top_n=20)
+    save_artifacts(cf, cb, model_path, version="load-test", ann=False)
+
+def build_app():
+    from fastapi import Depends, FastAPI
+    from sqlalchemy.ext.asyncio import AsyncSession
+    from sqlalchemy.orm import Session
+
+    from app.db.session import get_async_db, get_db
+    from app.ml.recommender import (
+        get_personalized_recommendations,
+        get_personalized_recommendations_async,
+        get_similar_products,
+        get_similar_products_async
+    )
+
+    app = FastAPI()
+
+    @app.get("/sync/similar/{product_id}")
+    def sync_similar(product_id: int, db: Session = Depends(get_db)):
+        return [p.id for p in get_similar_products(db, product_id)]
+
+    @app.get("/async/similar/{product_id}")
+    async def async_similar(product_id: int, db: AsyncSession = Depends(get_async_db)):
+        return [p.id for p in await get_similar_products_async(db, product_id)]
+
+    @app.get("/sync/user/{user_id}")
+    def sync_user(user_id: int, db: Session = Depends(get_db)):
+        return [p.id for p in get_personalized_recommendations(db, user_id, algorithm="content")]
+
+    @app.get("/async/user/{user_id}")
+    async def async_user(user_id: int, db: AsyncSession = Depends(get_async_db)):
+        return [p.id for p in await get_personalized_recommendations_async(db, user_id, algorithm="content")]
+
+    return app
+
+async def drive(base_url: str, path: str, ids: np.ndarray, total: int, concurrency: int) -> dict:
+    import httpx
+
+    latencies = []
+    errors = 0
+    counter = iter(range(total))
+
+    async def client_loop(client):
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            response = await client.get(f"{path}/{ids[i % len(ids)]}")
+            latencies.append(time.perf_counter() - start)
+            errors += response.status_code != 200
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        # Warm up connections, the catalog snapshot and the model pages
+        await asyncio.gather(*[client.get(f"{path}/{ids[0]}") for _ in range(concurrency)])
+        start = time.perf_counter()
+        await asyncio.gather(*[client_loop(client) for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+
+    latencies = np.array(latencies) * 1000
+    return {
+        "rps": total / elapsed,
+        "p50": np.percentile(latencies, 50),
+        "p99": np.percentile(latencies, 99),
+        "errors": errors,
+    }
+
+def wait_for_port(port: int, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Server did not start on port {port}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=None, help="Defaults to a temporary SQLite file")
+    parser.add_argument("--users", type=int, default=2_000)
+    parser.add_argument("--products", type=int, default=5_000)
+    parser.add_argument("--events", type=int, default=50_000)
+    parser.add_argument("--requests", type=int, default=3_000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8, 64])
+    parser.add_argument("--serve", type=int, metavar="PORT", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        # Child process: the environment was prepared by the parent
+        import uvicorn
+        uvicorn.run(build_app(), host="127.0.0.1", port=args.serve, log_level="warning")
+        return
+
+    workdir = tempfile.mkdtemp(prefix="async-load-")
+    # The app reads these at import time
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(workdir, 'load.db')}"
+    os.environ["MODEL_PATH"] = os.path.join(workdir, "models")
+    os.environ["CACHE_ENABLED"] = "False"
+    os.environ["PRECOMPUTED_ENABLED"] = "False"
+    os.environ["MODEL_WATCH_INTERVAL"] = "0"
+
+    seed(args.users, args.products, args.events, os.environ["MODEL_PATH"])
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = subprocess.Popen([sys.executable, "-m", "benchmarks.async_load_benchmark", "--serve", str(port)])
+    wait_for_port(port)
+
+    base_url = f"http://127.0.0.1:{port}"
+    rng = np.random.default_rng(1)
+    targets = {
+        "similar": rng.integers(1, args.products + 1, args.requests),
+        "user": rng.integers(1, args.users + 1, args.requests),
+    }
+
+    print(f"database: {os.environ['DATABASE_URL'].split('://')[0]}, {args.requests} requests per run")
+    print(f"{'route':<16}{'stack':<8}{'conc':>6}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for concurrency in args.concurrency:
+        for route, ids in targets.items():
+            for stack in ("sync", "async"):
+                r = asyncio.run(drive(base_url, f"/{stack}/{route}", ids, args.requests, concurrency))
+                print(f"{route:<16}{stack:<8}{concurrency:>6}{r['rps']:>10.0f}{r['p50']:>10.1f}"
+                      f"{r['p99']:>10.1f}{r['errors']:>8}")
+
+    server.terminate()
+    server.wait()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Throughput of batch CF scoring against looping over the single-user path.
+
+The single-user baseline calls top_k() once per user with exact scoring (ANN
+off), which is one matrix-vector product per user. The batch path scores a
+block of users with one matrix-matrix product and a row-wise partial top-k.
+Both exclude the same set of out-of-stock products, and the overlap of the
+two top-k lists is reported as a sanity check.
+
+Usage:
+    python -m benchmarks.batch_benchmark [--users N] [--items N] [--blocks 64 256 1024]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from app.ml.artifacts import save_model
+from app.ml.recommender import CollaborativeFilteringModel
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--items", type=int, default=50_000)
+    parser.add_argument("--factors", type=int, default=64)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--blocks", type=int, nargs="+", default=[64, 256, 1024])
+    parser.add_argument("--out-of-stock", type=float, default=0.05, help="Fraction of items excluded")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    user_ids = np.arange(1, args.users + 1, dtype=np.int64)
+    item_ids = np.arange(1, args.items + 1, dtype=np.int64)
+    excluded = rng.choice(item_ids, size=int(args.items * args.out_of_stock), replace=False)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "cf")
+        save_model(path, {
+            "user_ids": user_ids,
+            "user_factors": rng.standard_normal((args.users, args.factors), dtype=np.float32),
+            "item_ids": item_ids,
+            "item_factors": rng.standard_normal((args.items, args.factors), dtype=np.float32),
+            "global_mean": 0.0,
+        })
+        model = CollaborativeFilteringModel(path)
+        model.ann = None
+        users = user_ids.tolist()
+
+        start = time.perf_counter()
+        single = {user_id: model.top_k(user_id, args.k, exclude=excluded) for user_id in users}
+        loop_rate = len(users) / (time.perf_counter() - start)
+
+        print(f"{args.users} users x {args.items} items, {args.factors} factors, k={args.k}")
+        print(f"{'method':<16}{'users/s':>12}{'speedup':>10}{'overlap':>10}")
+        print(f"{'single-user':<16}{loop_rate:>12.0f}{1.0:>10.1f}{1.0:>10.4f}")
+
+        for block_size in args.blocks:
+            start = time.perf_counter()
+            batch = dict(model.top_k_batch(users, args.k, exclude=excluded, block_size=block_size))
+            rate = len(users) / (time.perf_counter() - start)
+            # GEMM and GEMV round differently, so near-ties at the cut-off may swap
+            overlap = np.mean([len({p for p, _ in batch[u]} & {p for p, _ in single[u]}) / max(1, len(single[u]))
+                               for u in users])
+            print(f"{'batch ' + str(block_size):<16}{rate:>12.0f}{rate / loop_rate:>10.1f}{overlap:>10.4f}")
+
+if __name__ == "__main__":
+    main()
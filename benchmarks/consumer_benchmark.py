@@ -0,0 +1,97 @@
+"""
+Throughput and end-to-end lag of the batched EventConsumer against an
+in-memory fake broker, used to size topic partitions.
+
+Events are produced at --rate events/sec into --partitions partitions while a
+single EventConsumer drains them. Lag is measured from produce time to the
+offset commit that covers the event. Run against SQLite by setting
+DATABASE_URL, e.g.:
+
+    DATABASE_URL=sqlite:///bench.db python -m benchmarks.consumer_benchmark --batch-sizes 1 50 500
+"""
+import argparse
+import math
+import random
+import time
+
+import numpy as np
+
+from app.db.session import Base, SessionLocal, engine
+from app.kafka.consumer import EventConsumer
+from app.models.product import Product
+from app.models.user import User
+from benchmarks.fake_kafka import FakeBroker
+
+def seed_database(users: int, products: int):
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        if db.query(User).count() >= users:
+            return
+        db.add_all(User(email=f"bench{i}@example.com", username=f"bench{i}", hashed_password="x") for i in range(users))
+        db.add_all(Product(name=f"product {i}", price=10.0, stock=10) for i in range(products))
+        db.commit()
+    finally:
+        db.close()
+
+def run(batch_size: int, args) -> dict:
+    broker = FakeBroker(args.partitions)
+    consumer = EventConsumer(batch_size=batch_size, poll_timeout_ms=10, consumer=broker)
+    consumer.start()
+
+    event_types = ["view", "view", "view", "cart_add", "purchase"]
+    interval = 1.0 / args.rate
+    start = time.perf_counter()
+    for i in range(args.events):
+        user_id = random.randint(1, args.users)
+        broker.produce(user_id, {
+            "event_type": random.choice(event_types),
+            "data": {"user_id": user_id, "product_id": random.randint(1, args.products)}
+        })
+        # Pace the producer to the target rate
+        delay = start + (i + 1) * interval - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+    while len(broker.lags) < args.events:
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    consumer.stop()
+    consumer.join(timeout=5)
+
+    lags = np.array(broker.lags) * 1000
+    return {
+        "batch_size": batch_size,
+        "events_per_sec": args.events / elapsed,
+        "lag_p50_ms": float(np.percentile(lags, 50)),
+        "lag_p99_ms": float(np.percentile(lags, 99)),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=20_000)
+    parser.add_argument("--rate", type=float, default=5_000, help="Producer rate in events/sec")
+    parser.add_argument("--partitions", type=int, default=6)
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 50, 500])
+    parser.add_argument("--target-rate", type=float, default=None,
+                        help="Peak production events/sec, used to suggest a partition count")
+    args = parser.parse_args()
+
+    seed_database(args.users, args.products)
+
+    print(f"{'batch':>8}{'events/s':>12}{'lag p50 ms':>12}{'lag p99 ms':>12}")
+    results = [run(batch_size, args) for batch_size in args.batch_sizes]
+    for r in results:
+        print(f"{r['batch_size']:>8}{r['events_per_sec']:>12.0f}{r['lag_p50_ms']:>12.1f}{r['lag_p99_ms']:>12.1f}")
+
+    if args.target_rate:
+        best = max(results, key=lambda r: r["events_per_sec"])
+        # One consumer per partition at most, so partitions bound consumer parallelism
+        partitions = math.ceil(args.target_rate / best["events_per_sec"])
+        print(f"~{partitions} partitions needed for {args.target_rate:.0f} events/s "
+              f"at batch size {best['batch_size']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Synthetic data for the benchmarks.
+
+Generates the same shape of data as app/scripts/init_data.py - categories,
+products in one or more categories, users, and view / cart_add / purchase
+events over the last 30 days with session IDs and metadata - scaled to any
+size. Product popularity is Zipf-distributed, so a few products dominate the
+events the way they do in production, and a small share of products is out
+of stock. build_models publishes CF and content model artifacts for the
+same IDs.
+
+The app reads its settings at import time, so callers set DATABASE_URL and
+MODEL_PATH before calling anything here; app modules are imported lazily.
+
+Usage:
+    DATABASE_URL=sqlite:///bench.db python -m benchmarks.data [--users N] [--products N] [--events N]
+        [--model-path DIR]
+"""
+import argparse
+import os
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+EVENT_TYPES = ("view", "cart_add", "purchase")
+EVENT_PROBABILITIES = (0.85, 0.11, 0.04)
+DEVICES = ("mobile", "desktop", "tablet")
+REFERRERS = ("search", "home", "email", "ads")
+DAYS = 30
+
+def product_popularity(products: int, rng: np.random.Generator, exponent: float = 1.1) -> np.ndarray:
+    """Zipf-like probability of each product (by position) being the subject of an event"""
+    weights = 1.0 / np.arange(1, products + 1) ** exponent
+    # Shuffle, so popularity is not correlated with product ID
+    return rng.permutation(weights / weights.sum())
+
+def generate(users: int, products: int, events: int, categories: int = 20, seed: int = 0,
+             chunk_size: int = 10_000, drop: bool = True) -> dict:
+    """
+    Create the tables and fill them; returns the row counts and the popularity
+    array used for events, so workloads can sample products the same way.
+    User and product IDs are 1..users and 1..products.
+    """
+    from sqlalchemy import insert
+
+    from app.db.session import Base, SessionLocal, engine
+    from app.models.product import Category, Product, product_category
+    from app.models.recommendation import Recommendation  # noqa: F401 - registers the table
+    from app.models.user import User
+    from app.models.user_event import UserEvent
+
+    if drop:
+        Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    rng = np.random.default_rng(seed)
+    popularity = product_popularity(products, rng)
+    now = datetime.now()
+
+    db = SessionLocal()
+    try:
+        db.execute(insert(Category), [
+            {"id": c, "name": f"Category {c}", "description": f"Synthetic category {c}"}
+            for c in range(1, categories + 1)
+        ])
+
+        prices = np.round(rng.lognormal(3.5, 1.0, products), 2)
+        # About 5% out of stock, so availability filtering is exercised
+        stock = np.where(rng.random(products) < 0.05, 0, rng.integers(1, 200, products))
+        for start in range(0, products, chunk_size):
+            ids = range(start + 1, min(start + chunk_size, products) + 1)
+            db.execute(insert(Product), [
+                {"id": i, "name": f"Product {i}", "description": f"Synthetic product {i}",
+                 "price": float(prices[i - 1]), "image_url": f"product{i}.jpg", "stock": int(stock[i - 1])}
+                for i in ids
+            ])
+            # One main category, and a second one for a quarter of the products
+            links = [{"product_id": i, "category_id": int(rng.integers(1, categories + 1))} for i in ids]
+            links += [{"product_id": link["product_id"], "category_id": link["category_id"] % categories + 1}
+                      for link in links if rng.random() < 0.25 and categories > 1]
+            db.execute(insert(product_category), links)
+
+        for start in range(0, users, chunk_size):
+            db.execute(insert(User), [
+                {"id": i, "email": f"user{i}@example.com", "username": f"user{i}",
+                 "hashed_password": "password123hash", "is_admin": i == 1}
+                for i in range(start + 1, min(start + chunk_size, users) + 1)
+            ])
+
+        for start in range(0, events, chunk_size):
+            n = min(chunk_size, events - start)
+            user_ids = rng.integers(1, users + 1, n)
+            product_ids = rng.choice(products, n, p=popularity) + 1
+            event_types = rng.choice(len(EVENT_TYPES), n, p=EVENT_PROBABILITIES)
+            seconds_ago = rng.integers(0, DAYS * 86400, n)
+            sessions = rng.integers(0, 5, n)
+            devices = rng.integers(0, len(DEVICES), n)
+            referrers = rng.integers(0, len(REFERRERS), n)
+            db.execute(insert(UserEvent), [
+                {
+                    "user_id": int(user_ids[e]),
+                    "product_id": int(product_ids[e]),
+                    "event_type": EVENT_TYPES[event_types[e]],
+                    "session_id": f"session-{user_ids[e]}-{sessions[e]}",
+                    "timestamp": now - timedelta(seconds=int(seconds_ago[e])),
+                    "metadata": {"referrer": REFERRERS[referrers[e]], "device": DEVICES[devices[e]]}
+                }
+                for e in range(n)
+            ])
+            db.commit()
+        db.commit()
+    finally:
+        db.close()
+
+    return {"users": users, "products": products, "events": events, "categories": categories,
+            "popularity": popularity}
+
+def build_models(model_path: str, users: int, products: int, factors: int = 32, seed: int = 0,
+                 version: str = "bench", ann: bool = False) -> str:
+    """Publish random CF and content models covering every generated user and product"""
+    from app.ml.neighbors import build_model_index
+    from app.ml.train import save_artifacts
+
+    rng = np.random.default_rng(seed)
+    cf = {
+        "user_ids": np.arange(1, users + 1, dtype=np.int64),
+        "user_factors": rng.standard_normal((users, factors), dtype=np.float32),
+        "item_ids": np.arange(1, products + 1, dtype=np.int64),
+        "item_factors": rng.standard_normal((products, factors), dtype=np.float32),
+        "global_mean": 0.0,
+    }
+    cb = build_model_index({
+        "product_ids": np.arange(1, products + 1, dtype=np.int64),
+        "product_vectors": rng.standard_normal((products, factors), dtype=np.float32),
+    }, top_n=20)
+    return save_artifacts(cf, cb, model_path, version=version, ann=ann)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--products", type=int, default=20_000)
+    parser.add_argument("--events", type=int, default=500_000)
+    parser.add_argument("--categories", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--model-path", default=None, help="Also publish matching model artifacts here")
+    args = parser.parse_args()
+
+    if not os.getenv("DATABASE_URL"):
+        parser.error("set DATABASE_URL to the database to fill; its tables are dropped and recreated")
+
+    start = time.perf_counter()
+    generate(args.users, args.products, args.events, args.categories, args.seed)
+    print(f"Generated {args.users} users, {args.products} products and {args.events} events "
+          f"in {time.perf_counter() - start:.1f}s")
+    if args.model_path:
+        build_models(args.model_path, args.users, args.products, seed=args.seed)
+        print(f"Published models to {args.model_path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Latency of the two hot user_events lookups before and after the composite indexes.
+
+Seeds a synthetic user_events table and times:
+
+    content  user_id = ? AND event_type IN (...) AND timestamp >= now - 30 days
+             ORDER BY timestamp DESC LIMIT 5
+    session  session_id = ? ORDER BY timestamp
+
+first on the bare table (primary key only), then with
+(user_id, timestamp DESC) and (session_id, timestamp). On PostgreSQL the
+indexed table is also rebuilt partitioned by month, the layout of the
+Alembic migration, so plain and partitioned can be compared.
+
+The default of 50M rows matches production scale and takes a while to seed;
+pass --rows for a quick run. SQLite (the default) is only a stand-in: point
+--database-url at a scratch PostgreSQL database, the benchmark drops and
+recreates its tables.
+
+Usage:
+    python -m benchmarks.events_query_benchmark [--database-url URL] [--rows N] [--queries Q]
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+from sqlalchemy import create_engine, text
+
+TABLE = "bench_user_events"
+EVENT_TYPES = ("view", "click", "add_to_cart", "purchase")
+DAYS = 365
+
+CONTENT_QUERY = text(
+    f'SELECT product_id FROM {TABLE} WHERE user_id = :user_id AND event_type IN (\'view\', \'purchase\') '
+    f'AND "timestamp" >= :since ORDER BY "timestamp" DESC LIMIT 5'
+)
+SESSION_QUERY = text(f'SELECT product_id FROM {TABLE} WHERE session_id = :session_id ORDER BY "timestamp"')
+
+INDEXES = (
+    f'CREATE INDEX IF NOT EXISTS {TABLE}_user_id_timestamp ON {TABLE} (user_id, "timestamp" DESC)',
+    f'CREATE INDEX IF NOT EXISTS {TABLE}_session_id_timestamp ON {TABLE} (session_id, "timestamp")',
+)
+
+def create_table(connection, partitioned: bool = False):
+    connection.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+    key = 'PRIMARY KEY (id, "timestamp")' if partitioned else "PRIMARY KEY (id)"
+    connection.execute(text(
+        f"CREATE TABLE {TABLE} (id BIGINT NOT NULL, user_id INTEGER NOT NULL, event_type VARCHAR NOT NULL, "
+        f'product_id INTEGER, session_id VARCHAR NOT NULL, "timestamp" TIMESTAMP NOT NULL, {key})'
+        + (' PARTITION BY RANGE ("timestamp")' if partitioned else "")
+    ))
+    if partitioned:
+        from app.db.partitions import add_months, month_start
+
+        month = month_start(date.today() - timedelta(days=DAYS))
+        while month <= date.today():
+            connection.execute(text(
+                f"CREATE TABLE {TABLE}_{month:%Y%m} PARTITION OF {TABLE} "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+            ))
+            month = add_months(month, 1)
+
+def seed(engine, rows: int, users: int, products: int, chunk: int = 100_000):
+    """~20 events per session; timestamps spread uniformly over the last year"""
+    with engine.begin() as connection:
+        if engine.dialect.name == "postgresql":
+            connection.execute(text(
+                f'INSERT INTO {TABLE} (id, user_id, event_type, product_id, session_id, "timestamp") '
+                f"SELECT g, 1 + (hashint4(g) & 2147483647) % :users, "
+                f"(ARRAY{list(EVENT_TYPES)})[1 + g % {len(EVENT_TYPES)}], "
+                f"1 + (hashint4(g + 1) & 2147483647) % :products, 's' || (g / 20), "
+                f"now() - (g % 20) * interval '1 minute' - (hashint4(g / 20) & 2147483647) % {DAYS * 86400} * interval '1 second' "
+                f"FROM generate_series(1, :rows) g"
+            ), {"rows": rows, "users": users, "products": products})
+            connection.execute(text(f"ANALYZE {TABLE}"))
+            return
+
+        rng = np.random.default_rng(0)
+        now = datetime.now()
+        insert = text(
+            f'INSERT INTO {TABLE} (id, user_id, event_type, product_id, session_id, "timestamp") '
+            f"VALUES (:id, :user_id, :event_type, :product_id, :session_id, :timestamp)"
+        )
+        for start in range(0, rows, chunk):
+            ids = np.arange(start + 1, min(start + chunk, rows) + 1)
+            user_ids = rng.integers(1, users + 1, len(ids))
+            product_ids = rng.integers(1, products + 1, len(ids))
+            offsets = rng.integers(0, DAYS * 86400, len(ids))
+            connection.execute(insert, [
+                {"id": int(i), "user_id": int(u), "event_type": EVENT_TYPES[i % len(EVENT_TYPES)],
+                 "product_id": int(p), "session_id": f"s{i // 20}", "timestamp": now - timedelta(seconds=int(s))}
+                for i, u, p, s in zip(ids, user_ids, product_ids, offsets)
+            ])
+
+def time_queries(engine, rows: int, users: int, queries: int) -> dict:
+    rng = np.random.default_rng(1)
+    since = datetime.now() - timedelta(days=30)
+    workloads = {
+        "content": (CONTENT_QUERY, [{"user_id": int(u), "since": since} for u in rng.integers(1, users + 1, queries)]),
+        "session": (SESSION_QUERY, [{"session_id": f"s{s}"} for s in rng.integers(0, rows // 20 + 1, queries)]),
+    }
+    results = {}
+    with engine.connect() as connection:
+        for name, (query, params) in workloads.items():
+            connection.execute(query, params[0]).all()
+            latencies = []
+            for p in params:
+                start = time.perf_counter()
+                connection.execute(query, p).all()
+                latencies.append(time.perf_counter() - start)
+            latencies = np.array(latencies) * 1000
+            results[name] = (np.percentile(latencies, 50), np.percentile(latencies, 99))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=None, help="Defaults to a temporary SQLite file")
+    parser.add_argument("--rows", type=int, default=50_000_000)
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--products", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='events-bench-'), 'events.db')}"
+    engine = create_engine(url)
+    layouts = [("no indexes", False, False), ("indexed", False, True)]
+    if engine.dialect.name == "postgresql":
+        layouts.append(("partitioned", True, True))
+
+    print(f"database: {engine.dialect.name}, {args.rows} rows, {args.queries} queries per lookup")
+    print(f"{'layout':<14}{'query':<10}{'p50 ms':>10}{'p99 ms':>10}")
+    seeded = None
+    for name, partitioned, indexed in layouts:
+        if seeded != partitioned:
+            with engine.begin() as connection:
+                create_table(connection, partitioned)
+            start = time.perf_counter()
+            seed(engine, args.rows, args.users, args.products)
+            print(f"(seeded {args.rows} rows in {time.perf_counter() - start:.1f}s)")
+            seeded = partitioned
+        if indexed:
+            with engine.begin() as connection:
+                for statement in INDEXES:
+                    connection.execute(text(statement))
+                connection.execute(text(f"ANALYZE {TABLE}"))
+        for query, (p50, p99) in time_queries(engine, args.rows, args.users, args.queries).items():
+            print(f"{name:<14}{query:<10}{p50:>10.2f}{p99:>10.2f}")
+
+    with engine.begin() as connection:
+        connection.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+In-memory stand-ins for Kafka, used by the consumer and load benchmarks.
+
+FakeBroker is a partitioned log with the KafkaConsumer calls EventConsumer
+uses (poll / commit / seek / close) and records the produce-to-commit lag of
+every event. FakeProducer has the KafkaProducer calls EventProducer uses
+(send / flush) and appends to a FakeBroker, so events sent by the API reach
+an EventConsumer in the same process without a broker.
+"""
+import threading
+import time
+from collections import namedtuple
+
+FakeMessage = namedtuple("FakeMessage", ["topic", "partition", "offset", "value", "produced_at"])
+FakePartition = namedtuple("FakePartition", ["topic", "partition"])
+
+class FakeBroker:
+    """Partitioned in-memory log with KafkaConsumer-compatible poll/commit/seek"""
+
+    def __init__(self, partitions: int, topic: str = "user-events"):
+        self.partitions = [FakePartition(topic, p) for p in range(partitions)]
+        self.logs = {tp: [] for tp in self.partitions}
+        self.positions = {tp: 0 for tp in self.partitions}
+        self.committed = {tp: 0 for tp in self.partitions}
+        self.lags = []
+        self.lock = threading.Lock()
+
+    def produce(self, key: int, value: dict):
+        tp = self.partitions[key % len(self.partitions)]
+        with self.lock:
+            log = self.logs[tp]
+            log.append(FakeMessage(tp.topic, tp.partition, len(log), value, time.perf_counter()))
+
+    # KafkaConsumer interface
+    def poll(self, timeout_ms: int = 0, max_records: int = 500):
+        records = {}
+        with self.lock:
+            remaining = max_records
+            for tp in self.partitions:
+                if remaining <= 0:
+                    break
+                start = self.positions[tp]
+                batch = self.logs[tp][start:start + remaining]
+                if batch:
+                    records[tp] = batch
+                    self.positions[tp] += len(batch)
+                    remaining -= len(batch)
+        if not records:
+            time.sleep(min(timeout_ms, 5) / 1000)
+        return records
+
+    def commit(self):
+        now = time.perf_counter()
+        with self.lock:
+            for tp, position in self.positions.items():
+                self.lags.extend(now - m.produced_at for m in self.logs[tp][self.committed[tp]:position])
+                self.committed[tp] = position
+
+    def seek(self, tp, offset: int):
+        with self.lock:
+            self.positions[tp] = offset
+
+    def close(self):
+        pass
+
+class FakeFuture:
+    """Already-completed send result with the callback API of kafka-python's FutureRecordMetadata"""
+
+    def __init__(self, metadata):
+        self.metadata = metadata
+
+    def add_callback(self, fn, *args, **kwargs):
+        fn(*args, self.metadata, **kwargs)
+        return self
+
+    def add_errback(self, fn, *args, **kwargs):
+        return self
+
+    def get(self, timeout=None):
+        return self.metadata
+
+class FakeProducer:
+    def __init__(self, broker: FakeBroker):
+        self.broker = broker
+        self.sent = 0
+
+    def send(self, topic: str, key=None, value=None):
+        # EventProducer keys by user ID; anonymous events spread by session
+        key = int(key) if key and str(key).isdigit() else hash(key or self.sent)
+        self.broker.produce(key, value)
+        self.sent += 1
+        return FakeFuture(None)
+
+    def flush(self, timeout=None):
+        pass
+
+    def close(self, timeout=None):
+        pass
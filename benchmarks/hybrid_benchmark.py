@@ -0,0 +1,110 @@
+"""
+Per-request scoring cost of the hybrid ranker against each single source.
+
+Builds synthetic CF and content models, a catalog snapshot and a published
+trending snapshot, then times the in-memory scoring step of each algorithm
+for the same users (database queries are not included):
+
+    collaborative  CF top-k over the whole catalog
+    content        find_similar per recent product, merged
+    trending       trending snapshot slice
+    hybrid         CF top-k + content neighbours + trending, blended
+
+Hybrid runs the CF top-k as one of its sources, so it should cost about as
+much as the slowest single source plus the blend over a few hundred
+candidates.
+
+Usage:
+    python -m benchmarks.hybrid_benchmark [--users N] [--items N] [--requests N]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from app.ml.artifacts import save_model
+from app.ml.neighbors import build_model_index
+from app.ml.recommender import (
+    CollaborativeFilteringModel,
+    ContentBasedModel,
+    _score_collaborative,
+    _score_content,
+    _score_hybrid,
+    _trending_ids
+)
+from app.services.catalog import CatalogSnapshot
+from app.services.trending import trending_counters
+
+def timed(fn, calls) -> np.ndarray:
+    latencies = []
+    for args in calls:
+        start = time.perf_counter()
+        fn(*args)
+        latencies.append(time.perf_counter() - start)
+    return np.array(latencies) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--items", type=int, default=50_000)
+    parser.add_argument("--factors", type=int, default=64)
+    parser.add_argument("--categories", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=2_000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    item_ids = np.arange(1, args.items + 1, dtype=np.int64)
+    catalog = CatalogSnapshot(
+        ids=item_ids,
+        prices=rng.uniform(1, 500, args.items).astype(np.float32),
+        stock=rng.integers(0, 20, args.items).astype(np.int32),
+        category_indptr=np.arange(args.items + 1, dtype=np.int64),
+        category_ids=rng.integers(1, args.categories + 1, args.items).astype(np.int32)
+    )
+
+    with tempfile.TemporaryDirectory() as directory:
+        save_model(os.path.join(directory, "cf"), {
+            "user_ids": np.arange(1, args.users + 1, dtype=np.int64),
+            "user_factors": rng.standard_normal((args.users, args.factors), dtype=np.float32),
+            "item_ids": item_ids,
+            "item_factors": rng.standard_normal((args.items, args.factors), dtype=np.float32),
+            "global_mean": 0.0,
+        })
+        save_model(os.path.join(directory, "cb"), build_model_index({
+            "product_ids": item_ids,
+            "product_vectors": rng.standard_normal((args.items, 32), dtype=np.float32),
+        }, top_n=50))
+        cf = CollaborativeFilteringModel(os.path.join(directory, "cf"))
+        cb = ContentBasedModel(os.path.join(directory, "cb"))
+
+        # Zipf-like traffic, so a few products dominate the trending list
+        trending_counters.path = os.path.join(directory, "trending.json")
+        popular = np.minimum(rng.zipf(1.3, 200_000), args.items)
+        trending_counters.record_batch((int(pid), "view") for pid in popular)
+        trending_counters.publish(catalog)
+
+        users = rng.integers(1, args.users + 1, args.requests).tolist()
+        recent = [rng.integers(1, args.items + 1, 5).tolist() for _ in users]
+        limit = args.limit
+        workloads = {
+            "collaborative": (_score_collaborative, [(cf, catalog, u, limit) for u in users]),
+            "content": (_score_content, [(cb, catalog, r) for r in recent]),
+            "trending": (_trending_ids, [(catalog, limit)] * len(users)),
+            "hybrid": (_score_hybrid, [(cf, cb, catalog, u, r, limit) for u, r in zip(users, recent)]),
+        }
+
+        print(f"{args.users} users x {args.items} items, {args.factors} factors, limit={limit}, "
+              f"{args.requests} requests")
+        print(f"{'algorithm':<16}{'mean ms':>10}{'p50 ms':>10}{'p99 ms':>10}")
+        for name, (fn, calls) in workloads.items():
+            # Warm up the memory-mapped arrays
+            fn(*calls[0])
+            latencies = timed(fn, calls)
+            print(f"{name:<16}{latencies.mean():>10.3f}{np.percentile(latencies, 50):>10.3f}"
+                  f"{np.percentile(latencies, 99):>10.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+HTTP load driver for the recommendation API.
+
+Seeds a database with benchmarks.data, publishes matching models, and serves
+the real FastAPI app (main:app) with uvicorn in a child process, so the load
+generator does not compete for the server's GIL. Kafka is replaced by the
+in-memory broker from benchmarks.fake_kafka: events the API produces are
+consumed by an EventConsumer inside the server process, which keeps session
+profiles and trending counters moving as they would in production.
+Authentication is bypassed with an X-Bench-User header naming the user.
+
+A fixed number of concurrent clients send a weighted mix of requests:
+
+    similar     GET  /api/recommendations/similar/{product_id}
+    user        GET  /api/recommendations/user/
+    anonymous   GET  /api/recommendations/anonymous/?session_id=...
+    trending    GET  /api/products/trending/
+    event       POST /api/recommendations/event/
+
+Products are sampled with the event popularity; --hot-keys restricts users
+and products to the N most popular, which makes identical concurrent
+requests common (see RequestCoalescer). The Redis cache is off unless
+--redis is given; the in-process cache stays on unless --no-local-cache.
+--buffered-events queues events for write-behind ingestion, where a 429
+(queue full) is counted as an error.
+
+SQLite (the default) is only a stand-in: point --database-url at a scratch
+PostgreSQL database for production-like numbers. Its tables are dropped and
+recreated.
+
+Usage:
+    python -m benchmarks.load_benchmark [--requests N] [--concurrency C ...] [--mix similar=4,user=3,...]
+        [--hot-keys N] [--output results/load.json]
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from benchmarks.results import print_table, summarize, write_results
+
+DEFAULT_MIX = "similar=4,user=3,anonymous=1,trending=1,event=1"
+EVENT_TYPES = ("view", "view", "view", "cart_add", "purchase")
+
+def build_app(partitions: int):
+    from typing import Optional
+
+    from fastapi import Header, HTTPException
+
+    from app.core.auth import get_current_user, get_optional_user
+    from app.kafka.consumer import EventConsumer
+    from app.kafka.producer import event_producer
+    from app.models.user import User
+    from app.services.cache import recommendation_cache
+    from app.services.coalescing import request_coalescer
+    from app.services.ingestion import event_ingestor
+    from benchmarks.fake_kafka import FakeBroker, FakeProducer
+    from main import app
+
+    broker = FakeBroker(partitions)
+    event_producer.producer = FakeProducer(broker)
+    event_producer.connected = True
+    consumer = EventConsumer(poll_timeout_ms=50, consumer=broker)
+
+    def bench_user(x_bench_user: Optional[int] = Header(None)) -> Optional[User]:
+        return User(id=x_bench_user, username=f"user{x_bench_user}", is_admin=False) if x_bench_user else None
+
+    def required_bench_user(x_bench_user: Optional[int] = Header(None)) -> User:
+        user = bench_user(x_bench_user)
+        if user is None:
+            raise HTTPException(status_code=401, detail="X-Bench-User header required")
+        return user
+
+    app.dependency_overrides[get_current_user] = required_bench_user
+    app.dependency_overrides[get_optional_user] = bench_user
+
+    @app.on_event("startup")
+    async def start_consumer():
+        consumer.start()
+
+    @app.on_event("shutdown")
+    async def stop_consumer():
+        consumer.stop()
+        consumer.join(timeout=5)
+
+    @app.get("/bench/stats", include_in_schema=False)
+    def bench_stats():
+        lags = np.array(broker.lags) * 1000
+        return {
+            "events_produced": sum(len(log) for log in broker.logs.values()),
+            "events_committed": len(lags),
+            "consumer_lag_p50_ms": float(np.percentile(lags, 50)) if len(lags) else None,
+            "consumer_lag_p99_ms": float(np.percentile(lags, 99)) if len(lags) else None,
+            "local_cache": request_coalescer.stats(),
+            "redis_cache": recommendation_cache.stats(),
+            "ingestion": event_ingestor.stats(),
+        }
+
+    return app
+
+def build_requests(mix: dict, total: int, users: int, products: int, popularity: np.ndarray,
+                   hot_keys: int, rng: np.random.Generator) -> list:
+    """(route, method, path, headers, body) tuples in random order, following the mix weights"""
+    routes = list(mix)
+    weights = np.array([mix[r] for r in routes], dtype=np.float64)
+    chosen = rng.choice(len(routes), total, p=weights / weights.sum())
+    if hot_keys:
+        hot = np.argsort(-popularity)[:hot_keys]
+        product_ids = rng.choice(hot, total) + 1
+        user_ids = rng.integers(1, min(hot_keys, users) + 1, total)
+    else:
+        product_ids = rng.choice(products, total, p=popularity) + 1
+        user_ids = rng.integers(1, users + 1, total)
+    sessions = rng.integers(0, 5, total)
+
+    requests = []
+    for i, route_index in enumerate(chosen):
+        route = routes[route_index]
+        user_id, product_id = int(user_ids[i]), int(product_ids[i])
+        headers = {"X-Bench-User": str(user_id)}
+        session_id = f"session-{user_id}-{sessions[i]}"
+        if route == "similar":
+            requests.append((route, "GET", f"/api/recommendations/similar/{product_id}", headers, None))
+        elif route == "user":
+            requests.append((route, "GET", "/api/recommendations/user/?limit=10", headers, None))
+        elif route == "anonymous":
+            requests.append((route, "GET", f"/api/recommendations/anonymous/?session_id={session_id}", {}, None))
+        elif route == "trending":
+            requests.append((route, "GET", "/api/products/trending/?limit=10", {}, None))
+        elif route == "event":
+            body = {"user_id": user_id, "product_id": product_id, "session_id": session_id,
+                    "event_type": EVENT_TYPES[i % len(EVENT_TYPES)], "metadata": {"source": "load-test"}}
+            requests.append((route, "POST", "/api/recommendations/event/", headers, body))
+        else:
+            raise ValueError(f"Unknown route in --mix: {route}")
+    return requests
+
+async def drive(base_url: str, requests: list, concurrency: int) -> dict:
+    import httpx
+
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    pending = iter(requests)
+
+    async def client_loop(client):
+        for route, method, path, headers, body in pending:
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, headers=headers, json=body)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            latencies[route].append(time.perf_counter() - start)
+            errors[route] += failed
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        # Warm up connections, the catalog snapshot and the model pages
+        warmup = requests[:concurrency]
+        await asyncio.gather(*[client.request(m, p, headers=h, json=b) for _, m, p, h, b in warmup])
+        start = time.perf_counter()
+        await asyncio.gather(*[client_loop(client) for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+        server = (await client.get("/bench/stats")).json()
+
+    results = {}
+    for route, values in latencies.items():
+        # Route throughput is its share of the run, so the routes add up to the total
+        results[route] = {**summarize(values, elapsed), "errors": errors[route]}
+    results["all"] = {**summarize((v for values in latencies.values() for v in values), elapsed),
+                      "errors": sum(errors.values())}
+    return {"results": results, "server": server}
+
+def wait_for_port(port: int, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Server did not start on port {port}")
+
+def parse_mix(value: str) -> dict:
+    mix = {}
+    for part in value.split(","):
+        route, _, weight = part.partition("=")
+        mix[route.strip()] = float(weight or 1)
+    return mix
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=None, help="Defaults to a temporary SQLite file")
+    parser.add_argument("--users", type=int, default=2_000)
+    parser.add_argument("--products", type=int, default=10_000)
+    parser.add_argument("--events", type=int, default=100_000)
+    parser.add_argument("--requests", type=int, default=5_000, help="Requests per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[16, 64])
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Route weights, e.g. similar=1 for one route")
+    parser.add_argument("--hot-keys", type=int, default=0, help="Only request the N most popular products/users")
+    parser.add_argument("--partitions", type=int, default=6, help="Partitions of the in-memory Kafka topic")
+    parser.add_argument("--redis", action="store_true", help="Enable the Redis recommendation cache")
+    parser.add_argument("--no-local-cache", action="store_true", help="Disable the in-process cache and coalescing")
+    parser.add_argument("--buffered-events", action="store_true", help="Write-behind event ingestion (202/429)")
+    parser.add_argument("--output", default=None, help="Write the results as JSON")
+    parser.add_argument("--serve", type=int, metavar="PORT", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        # Child process: the environment was prepared by the parent
+        import uvicorn
+        uvicorn.run(build_app(args.partitions), host="127.0.0.1", port=args.serve, log_level="warning")
+        return
+
+    workdir = tempfile.mkdtemp(prefix="load-bench-")
+    # The app reads these at import time, in this process and in the server
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(workdir, 'load.db')}"
+    os.environ["MODEL_PATH"] = os.path.join(workdir, "models")
+    os.environ["CACHE_ENABLED"] = str(args.redis)
+    os.environ["LOCAL_CACHE_ENABLED"] = str(not args.no_local_cache)
+    os.environ["EVENT_INGESTION_BUFFERED"] = str(args.buffered_events)
+    os.environ["PRECOMPUTED_ENABLED"] = "False"
+    os.environ["MODEL_WATCH_INTERVAL"] = "0"
+    os.environ["TRENDING_SNAPSHOT_PATH"] = os.path.join(workdir, "trending.json")
+    os.environ["TRENDING_SNAPSHOT_REDIS"] = "False"
+    os.environ["SESSION_STORE_REDIS"] = "False"
+    os.environ["KAFKA_SPOOL_PATH"] = os.path.join(workdir, "spool")
+
+    from benchmarks.data import build_models, generate
+
+    data = generate(args.users, args.products, args.events)
+    build_models(os.environ["MODEL_PATH"], args.users, args.products)
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = subprocess.Popen([sys.executable, "-m", "benchmarks.load_benchmark", "--serve", str(port),
+                               "--partitions", str(args.partitions)])
+    try:
+        wait_for_port(port)
+        base_url = f"http://127.0.0.1:{port}"
+        mix = parse_mix(args.mix)
+        rng = np.random.default_rng(1)
+
+        print(f"database: {os.environ['DATABASE_URL'].split('://')[0]}, {args.requests} requests per level, "
+              f"mix {args.mix}, hot keys {args.hot_keys or 'off'}")
+        results, servers = {}, {}
+        for concurrency in args.concurrency:
+            requests = build_requests(mix, args.requests, args.users, args.products, data["popularity"],
+                                      args.hot_keys, rng)
+            run = asyncio.run(drive(base_url, requests, concurrency))
+            print(f"\nconcurrency {concurrency}")
+            print_table(run["results"], extra=["errors"])
+            local = run["server"]["local_cache"]
+            print(f"server: {run['server']['events_committed']}/{run['server']['events_produced']} events consumed, "
+                  f"local cache hits {local['hits']}, coalesced {local['coalesced']}, computed {local['computed']}")
+            results.update({f"{route}@c{concurrency}": r for route, r in run["results"].items()})
+            servers[f"c{concurrency}"] = run["server"]
+    finally:
+        server.terminate()
+        server.wait()
+
+    if args.output:
+        params = {k: v for k, v in vars(args).items() if k not in ("output", "database_url", "serve")}
+        params["database"] = os.environ["DATABASE_URL"].split("://")[0]
+        # Server counters are cumulative across concurrency levels
+        write_results(args.output, "load", params, results, extra={"server": servers})
+
+if __name__ == "__main__":
+    main()
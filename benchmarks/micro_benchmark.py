@@ -0,0 +1,114 @@
+"""
+Micro-benchmarks of the recommendation hot paths.
+
+Fills a database with benchmarks.data, publishes matching models, and times
+one call at a time:
+
+    cf.predict             score --candidates products for a user
+    cf.top_k               best products over the whole model for a user
+    cb.find_similar        precomputed neighbours of a product
+    personalized/<alg>     get_personalized_recommendations, end to end
+    similar                get_similar_products, end to end
+
+The end-to-end cases include the database queries, with the Redis cache,
+the in-process cache and the precomputed rows disabled so every call does
+the full work. Users and products are sampled with the event popularity.
+
+SQLite (the default) keeps the run self-contained; point --database-url at
+a scratch PostgreSQL database for production-like query costs. Its tables
+are dropped and recreated.
+
+Usage:
+    python -m benchmarks.micro_benchmark [--users N] [--products N] [--events N] [--calls N]
+        [--output results/micro.json]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.results import print_table, summarize, write_results
+
+def timed(fn, calls: list, warmup: int = 10) -> dict:
+    for args in calls[:warmup]:
+        fn(*args)
+    latencies = []
+    for args in calls:
+        start = time.perf_counter()
+        fn(*args)
+        latencies.append(time.perf_counter() - start)
+    return summarize(latencies)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=None, help="Defaults to a temporary SQLite file")
+    parser.add_argument("--users", type=int, default=5_000)
+    parser.add_argument("--products", type=int, default=20_000)
+    parser.add_argument("--events", type=int, default=200_000)
+    parser.add_argument("--calls", type=int, default=1_000)
+    parser.add_argument("--candidates", type=int, default=500, help="Products scored per predict call")
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--output", default=None, help="Write the results as JSON")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="micro-bench-")
+    # The app reads these at import time
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["MODEL_PATH"] = os.path.join(workdir, "models")
+    os.environ["CACHE_ENABLED"] = "False"
+    os.environ["LOCAL_CACHE_ENABLED"] = "False"
+    os.environ["PRECOMPUTED_ENABLED"] = "False"
+    os.environ["MODEL_WATCH_INTERVAL"] = "0"
+
+    from benchmarks.data import build_models, generate
+
+    start = time.perf_counter()
+    data = generate(args.users, args.products, args.events)
+    build_models(os.environ["MODEL_PATH"], args.users, args.products)
+    print(f"Seeded {args.users} users, {args.products} products, {args.events} events "
+          f"in {time.perf_counter() - start:.1f}s")
+
+    from app.db.session import SessionLocal
+    from app.ml import recommender
+
+    recommender.reload_models()
+    cf, cb = recommender.cf_model, recommender.cb_model
+    rng = np.random.default_rng(1)
+    users = rng.integers(1, args.users + 1, args.calls).tolist()
+    products = (rng.choice(args.products, args.calls, p=data["popularity"]) + 1).tolist()
+    candidates = [rng.integers(1, args.products + 1, args.candidates).tolist() for _ in range(min(args.calls, 100))]
+    limit = args.limit
+
+    db = SessionLocal()
+    try:
+        cases = {
+            "cf.predict": (cf.predict, [(u, candidates[i % len(candidates)], limit) for i, u in enumerate(users)]),
+            "cf.top_k": (cf.top_k, [(u, limit) for u in users]),
+            "cb.find_similar": (cb.find_similar, [(p, limit) for p in products]),
+        }
+        for algorithm in ("collaborative", "content", "hybrid"):
+            cases[f"personalized/{algorithm}"] = (
+                recommender.get_personalized_recommendations, [(db, u, limit, algorithm) for u in users]
+            )
+        cases["similar"] = (recommender.get_similar_products, [(db, p, None, limit) for p in products])
+
+        results = {}
+        for name, (fn, calls) in cases.items():
+            results[name] = timed(fn, calls)
+            # Keep the session from accumulating every product loaded so far
+            db.expunge_all()
+    finally:
+        db.close()
+
+    print(f"{args.users} users x {args.products} products, {args.events} events, limit={limit}, "
+          f"database: {os.environ['DATABASE_URL'].split('://')[0]}")
+    print_table(results)
+    if args.output:
+        params = {k: v for k, v in vars(args).items() if k not in ("output", "database_url")}
+        params["database"] = os.environ["DATABASE_URL"].split("://")[0]
+        write_results(args.output, "micro", params, results)
+
+if __name__ == "__main__":
+    main()
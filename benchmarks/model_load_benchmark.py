@@ -0,0 +1,106 @@
+"""
+Startup time and per-worker memory of memory-mapped vs pickled model artifacts.
+
+Writes one synthetic CF model in both formats, then starts N worker processes
+that load it and score every item for a few users (touching every page of the
+factor matrices), the way N API workers on one host would. While all workers
+are alive each one reports its load time, RSS and PSS. PSS splits shared pages
+between the processes mapping them, so with mmap it drops roughly by N while
+pickled copies stay private to each worker.
+
+PSS comes from /proc/self/smaps_rollup and is only reported on Linux.
+
+Usage:
+    python -m benchmarks.model_load_benchmark --users 2000000 --items 200000 --workers 4
+"""
+import argparse
+import multiprocessing
+import os
+import pickle
+import tempfile
+import time
+
+import numpy as np
+
+from app.ml.artifacts import load_arrays, save_model
+
+def memory_mb() -> dict:
+    usage = {"rss": None, "pss": None}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                key, value = line.split(":", 1)
+                if key in ("Rss", "Pss"):
+                    usage[key.lower()] = int(value.split()[0]) / 1024
+    except OSError:
+        pass
+    return usage
+
+def worker(fmt: str, path: str, ready, done, results):
+    start = time.perf_counter()
+    if fmt == "mmap":
+        model = load_arrays(path)
+    else:
+        with open(path, "rb") as f:
+            model = pickle.load(f)
+    load_seconds = time.perf_counter() - start
+
+    # Serve a few requests so every page of both matrices is resident
+    for row in range(8):
+        model["item_factors"] @ model["user_factors"][row]
+    model["user_factors"].sum()
+
+    ready.wait()
+    results.put({"load_s": load_seconds, **memory_mb()})
+    done.wait()
+
+def run(fmt: str, path: str, workers: int) -> list:
+    context = multiprocessing.get_context("spawn")
+    ready, done = context.Barrier(workers), context.Barrier(workers + 1)
+    results = context.Queue()
+    processes = [context.Process(target=worker, args=(fmt, path, ready, done, results)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    measured = [results.get() for _ in range(workers)]
+    done.wait()
+    for process in processes:
+        process.join()
+    return measured
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--items", type=int, default=100_000)
+    parser.add_argument("--factors", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    model = {
+        "user_ids": np.arange(1, args.users + 1, dtype=np.int64),
+        "user_factors": rng.standard_normal((args.users, args.factors), dtype=np.float32),
+        "item_ids": np.arange(1, args.items + 1, dtype=np.int64),
+        "item_factors": rng.standard_normal((args.items, args.factors), dtype=np.float32),
+        "global_mean": 0.0,
+    }
+    size_mb = sum(v.nbytes for v in model.values() if isinstance(v, np.ndarray)) / (1024 * 1024)
+
+    with tempfile.TemporaryDirectory() as directory:
+        pickle_path = os.path.join(directory, "cf_model.pkl")
+        with open(pickle_path, "wb") as f:
+            pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL)
+        artifact_path = os.path.join(directory, "cf")
+        save_model(artifact_path, model)
+        del model
+
+        print(f"model: {size_mb:.0f} MB, {args.workers} workers")
+        print(f"{'format':>8}{'load ms':>10}{'RSS MB':>10}{'PSS MB':>10}{'total PSS MB':>14}")
+        for fmt, path in (("pickle", pickle_path), ("mmap", artifact_path)):
+            measured = run(fmt, path, args.workers)
+            load_ms = np.mean([m["load_s"] for m in measured]) * 1000
+            rss = np.mean([m["rss"] or 0 for m in measured])
+            pss = [m["pss"] or 0 for m in measured]
+            print(f"{fmt:>8}{load_ms:>10.1f}{rss:>10.0f}{np.mean(pss):>10.0f}{sum(pss):>14.0f}")
+
+if __name__ == "__main__":
+    main()
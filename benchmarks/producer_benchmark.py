@@ -0,0 +1,129 @@
+"""
+Events/sec and added request latency of EventProducer in sync and async mode.
+
+An in-memory broker stands in for KafkaProducer: sends are acknowledged by a
+background thread after --ack-ms, roughly one acks='all' round trip, and
+acknowledgements are batched the way linger_ms batches real sends.
+
+Usage:
+    python -m benchmarks.producer_benchmark [--events N] [--ack-ms MS]
+"""
+import argparse
+import queue
+import tempfile
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from app.kafka.producer import EventProducer
+from app.kafka.spool import EventSpool
+
+RecordMetadata = namedtuple("RecordMetadata", ["topic", "partition", "offset"])
+
+class FakeFuture:
+    """Subset of kafka-python's FutureRecordMetadata used by EventProducer"""
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._callbacks = []
+        self._errbacks = []
+        self.value = None
+        self.exception = None
+
+    def add_callback(self, fn, *args):
+        self._callbacks.append((fn, args))
+
+    def add_errback(self, fn, *args):
+        self._errbacks.append((fn, args))
+
+    def resolve(self, value=None, exception=None):
+        self.value, self.exception = value, exception
+        self._done.set()
+        for fn, args in (self._errbacks if exception else self._callbacks):
+            # Like kafka-python: bound arguments first, then the result or exception
+            fn(*args, exception or value)
+
+    def get(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise TimeoutError("No acknowledgement from fake broker")
+        if self.exception:
+            raise self.exception
+        return self.value
+
+class InMemoryBroker:
+    """Acknowledges every send after a fixed delay from a single I/O thread"""
+
+    def __init__(self, ack_seconds: float, linger_seconds: float):
+        self.ack_seconds = ack_seconds
+        self.linger_seconds = linger_seconds
+        self.pending = queue.Queue()
+        self.offset = 0
+        self.running = True
+        threading.Thread(target=self._io_loop, daemon=True).start()
+
+    def send(self, topic, key=None, value=None):
+        future = FakeFuture()
+        self.pending.put((topic, future))
+        return future
+
+    def _io_loop(self):
+        while self.running:
+            try:
+                batch = [self.pending.get(timeout=0.1)]
+            except queue.Empty:
+                continue
+            # Everything queued within the linger window shares one round trip
+            time.sleep(self.linger_seconds)
+            while not self.pending.empty():
+                batch.append(self.pending.get_nowait())
+            time.sleep(self.ack_seconds)
+            for topic, future in batch:
+                self.offset += 1
+                future.resolve(RecordMetadata(topic, 0, self.offset))
+
+    def flush(self, timeout=None):
+        while not self.pending.empty():
+            time.sleep(0.001)
+
+    def close(self):
+        self.running = False
+
+def run(async_send: bool, args) -> dict:
+    broker = InMemoryBroker(args.ack_ms / 1000, args.linger_ms / 1000)
+    with tempfile.TemporaryDirectory() as spool_dir:
+        producer = EventProducer(async_send=async_send, producer=broker,
+                                 spool=EventSpool(f"{spool_dir}/events.jsonl", 10 * 1024 * 1024))
+        latencies = np.empty(args.events)
+        start = time.perf_counter()
+        for i in range(args.events):
+            call_start = time.perf_counter()
+            producer.send_event("view", {"user_id": i % 1000, "product_id": i % 500})
+            latencies[i] = time.perf_counter() - call_start
+        producer.flush()
+        elapsed = time.perf_counter() - start
+    broker.close()
+
+    latencies *= 1000
+    return {
+        "mode": "async" if async_send else "sync",
+        "events_per_sec": args.events / elapsed,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=2_000)
+    parser.add_argument("--ack-ms", type=float, default=2.0, help="Simulated broker acknowledgement latency")
+    parser.add_argument("--linger-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    print(f"{'mode':<8}{'events/s':>12}{'call p50 ms':>14}{'call p99 ms':>14}")
+    for async_send in (False, True):
+        r = run(async_send, args)
+        print(f"{r['mode']:<8}{r['events_per_sec']:>12.0f}{r['p50_ms']:>14.3f}{r['p99_ms']:>14.3f}")
+
+if __name__ == "__main__":
+    main()
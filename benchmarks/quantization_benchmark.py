@@ -0,0 +1,92 @@
+"""
+Memory, throughput and recall of quantized item factors against float32.
+
+A CF artifact of synthetic clustered factors is saved to a temporary
+directory, given float16 and int8 copies the way `python -m app.ml.quantize`
+stores them, and loaded with ANN off so every query is a full scan. For each
+representation, with and without the exact float32 re-rank, the benchmark
+reports the bytes a scan reads, single-user top_k() queries per second,
+batch top_k_batch() users per second, and recall@K against the float32
+results.
+
+Usage:
+    python -m benchmarks.quantization_benchmark [--items N] [--dim D] [--queries Q] [--k K] [--rerank 4]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from app.core.config import settings
+from app.ml.artifacts import save_model
+from app.ml.quantize import QUANTIZED_DTYPES, load_quantized, quantize_artifacts
+from app.ml.recommender import CollaborativeFilteringModel
+from benchmarks.ann_benchmark import synthetic_factors
+
+def _run(model: CollaborativeFilteringModel, users: list, k: int, block_size: int) -> tuple:
+    start = time.perf_counter()
+    single = {user_id: model.top_k(user_id, k) for user_id in users}
+    qps = len(users) / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    dict(model.top_k_batch(users, k, block_size=block_size))
+    batch_rate = len(users) / (time.perf_counter() - start)
+    return single, qps, batch_rate
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=64)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--rerank", type=int, default=4, help="Re-rank depth multiplier for the re-ranked runs")
+    parser.add_argument("--block-size", type=int, default=256)
+    args = parser.parse_args()
+
+    user_ids = np.arange(1, args.queries + 1, dtype=np.int64)
+    item_ids = np.arange(1, args.items + 1, dtype=np.int64)
+    users = user_ids.tolist()
+    rerank_setting = settings.QUANTIZED_RERANK
+
+    with tempfile.TemporaryDirectory() as directory:
+        save_model(os.path.join(directory, "cf"), {
+            "user_ids": user_ids,
+            "user_factors": synthetic_factors(args.queries, args.dim, seed=1),
+            "item_ids": item_ids,
+            "item_factors": synthetic_factors(args.items, args.dim),
+            "global_mean": 0.0,
+        })
+        for dtype in QUANTIZED_DTYPES:
+            quantize_artifacts(directory, dtype)
+
+        model = CollaborativeFilteringModel(os.path.join(directory, "cf"))
+        model.ann = None
+        model.quantized = None
+        truth, exact_qps, exact_batch = _run(model, users, args.k, args.block_size)
+        float32_bytes = model.model["item_factors"].nbytes
+
+        print(f"{args.items} items x {args.dim} factors, {args.queries} users, k={args.k}")
+        print(f"{'method':<20}{'scan MiB':>10}{'memory':>8}{'recall@' + str(args.k):>11}"
+              f"{'QPS':>9}{'speedup':>9}{'batch/s':>10}{'speedup':>9}")
+        print(f"{'float32':<20}{float32_bytes / 2**20:>10.1f}{1.0:>8.2f}{1.0:>11.3f}"
+              f"{exact_qps:>9.0f}{1.0:>9.2f}{exact_batch:>10.0f}{1.0:>9.2f}")
+
+        try:
+            for dtype in QUANTIZED_DTYPES:
+                model.quantized = load_quantized(model.model, "item_factors", dtype)
+                for rerank in (0, args.rerank):
+                    settings.QUANTIZED_RERANK = rerank
+                    found, qps, batch_rate = _run(model, users, args.k, args.block_size)
+                    hits = sum(len({p for p, _ in truth[u]} & {p for p, _ in found[u]}) for u in users)
+                    recall = hits / max(1, sum(len(truth[u]) for u in users))
+                    name = f"{dtype} rerank={rerank}" if rerank else dtype
+                    print(f"{name:<20}{model.quantized.nbytes / 2**20:>10.1f}"
+                          f"{model.quantized.nbytes / float32_bytes:>8.2f}{recall:>11.3f}"
+                          f"{qps:>9.0f}{qps / exact_qps:>9.2f}{batch_rate:>10.0f}{batch_rate / exact_batch:>9.2f}")
+        finally:
+            settings.QUANTIZED_RERANK = rerank_setting
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Latency summaries and machine-readable results for the benchmark suite.
+
+Benchmarks that take --output write a JSON document:
+
+    {"suite": "micro", "created_at": "...", "git_commit": "...", "python": "3.11.7",
+     "platform": "...", "params": {...},
+     "results": {"<case>": {"count": ..., "mean_ms": ..., "p50_ms": ..., "p95_ms": ...,
+                            "p99_ms": ..., "max_ms": ..., "throughput": ...}}}
+
+Two such files can be compared case by case; the exit status is 1 when any
+p95 or p99 latency regressed by more than --threshold percent, so the
+comparison can gate a CI job.
+
+Usage:
+    python -m benchmarks.results BASELINE.json CURRENT.json [--threshold 10]
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+# Metrics where a higher value is worse
+LATENCY_METRICS = ("mean_ms", "p50_ms", "p95_ms", "p99_ms")
+GATED_METRICS = ("p95_ms", "p99_ms")
+
+def summarize(latencies: Iterable[float], elapsed: Optional[float] = None) -> dict:
+    """
+    Summary of per-call latencies given in seconds. throughput is calls per
+    second over elapsed wall-clock seconds, or over the summed latencies for
+    sequential runs.
+    """
+    latencies = np.fromiter(latencies, dtype=np.float64) * 1000
+    if not len(latencies):
+        return {"count": 0}
+    elapsed = elapsed if elapsed is not None else latencies.sum() / 1000
+    return {
+        "count": int(len(latencies)),
+        "mean_ms": float(latencies.mean()),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "max_ms": float(latencies.max()),
+        "throughput": float(len(latencies) / elapsed) if elapsed > 0 else 0.0,
+    }
+
+def print_table(results: Dict[str, dict], extra: Iterable[str] = ()):
+    """One line per case; extra names additional per-case fields, e.g. errors"""
+    extra = list(extra)
+    print(f"{'case':<28}{'count':>8}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ops/s':>10}"
+          + "".join(f"{name:>10}" for name in extra))
+    for case, r in results.items():
+        if not r.get("count"):
+            print(f"{case:<28}{0:>8}")
+            continue
+        print(f"{case:<28}{r['count']:>8}{r['mean_ms']:>10.3f}{r['p50_ms']:>10.3f}{r['p95_ms']:>10.3f}"
+              f"{r['p99_ms']:>10.3f}{r['throughput']:>10.0f}" + "".join(f"{r.get(name, ''):>10}" for name in extra))
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+def write_results(path: str, suite: str, params: dict, results: Dict[str, dict], extra: Optional[dict] = None):
+    """extra holds sections that are recorded but not compared, e.g. server-side counters"""
+    document = {
+        "suite": suite,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "params": params,
+        "results": results,
+        **(extra or {}),
+    }
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(document, f, indent=2)
+    print(f"Wrote {path}")
+
+def compare(baseline: dict, current: dict, threshold: float) -> bool:
+    """Print per-case changes; returns True when a gated metric regressed beyond threshold percent"""
+    regressed = False
+    print(f"baseline {baseline.get('git_commit')} ({baseline.get('created_at')}), "
+          f"current {current.get('git_commit')} ({current.get('created_at')})")
+    print(f"{'case':<28}{'metric':<12}{'baseline':>12}{'current':>12}{'change':>10}")
+    for case, new in current["results"].items():
+        old = baseline["results"].get(case)
+        if not old or not old.get("count") or not new.get("count"):
+            print(f"{case:<28}{'(new or empty)':<12}")
+            continue
+        for metric in LATENCY_METRICS + ("throughput",):
+            before, after = old[metric], new[metric]
+            change = (after - before) / before * 100 if before else 0.0
+            worse = change > threshold if metric in GATED_METRICS else False
+            regressed |= worse
+            print(f"{case:<28}{metric:<12}{before:>12.3f}{after:>12.3f}{change:>+9.1f}%" + ("  <-" if worse else ""))
+    return regressed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Allowed p95/p99 regression in percent")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    if baseline.get("suite") != current.get("suite"):
+        print(f"Warning: comparing suite {baseline.get('suite')} with {current.get('suite')}")
+    if baseline.get("params") != current.get("params"):
+        print("Warning: the runs used different parameters")
+    sys.exit(1 if compare(baseline, current, args.threshold) else 0)
+
+if __name__ == "__main__":
+    main()
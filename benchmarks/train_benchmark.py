@@ -0,0 +1,81 @@
+"""
+Training wall time and peak memory of the ALS pipeline on synthetic events.
+
+Each dataset size runs in a fresh process so peak RSS is measured per size.
+Events are generated in cursor-sized chunks with Zipf-distributed user and
+product popularity, which mirrors stream_interactions() without a database.
+
+Usage:
+    python -m benchmarks.train_benchmark --sizes 1000000 10000000 100000000
+"""
+import argparse
+import multiprocessing
+import resource
+import sys
+import time
+
+import numpy as np
+
+def synthetic_chunks(events: int, users: int, products: int, chunk_size: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    weights = np.array([1.0, 3.0, 5.0], dtype=np.float32)
+    for start in range(0, events, chunk_size):
+        n = min(chunk_size, events - start)
+        # Zipf ranks, folded into the id range, give a long-tailed popularity curve
+        user_ids = (rng.zipf(1.2, n) - 1) % users + 1
+        product_ids = (rng.zipf(1.3, n) - 1) % products + 1
+        yield user_ids.astype(np.int64), product_ids.astype(np.int64), weights[rng.choice(3, n, p=[0.8, 0.15, 0.05])]
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def run(events: int, args, results):
+    from app.ml.train import build_interaction_matrix, train_als
+
+    users = max(1_000, events // 20)
+    products = max(1_000, events // 500)
+
+    start = time.perf_counter()
+    matrix, user_ids, product_ids = build_interaction_matrix(
+        synthetic_chunks(events, users, products, args.chunk_size)
+    )
+    build_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    train_als(matrix, factors=args.factors, iterations=args.iterations, workers=args.workers)
+    als_seconds = time.perf_counter() - start
+
+    results.put({
+        "events": events,
+        "users": len(user_ids),
+        "products": len(product_ids),
+        "pairs": matrix.nnz,
+        "build_s": build_seconds,
+        "als_s": als_seconds,
+        "peak_rss_mb": peak_rss_mb(),
+    })
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000_000, 10_000_000, 100_000_000])
+    parser.add_argument("--factors", type=int, default=64)
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=100_000)
+    args = parser.parse_args()
+
+    print(f"{'events':>12}{'users':>10}{'products':>10}{'pairs':>12}{'matrix s':>10}{'ALS s':>10}{'peak MB':>10}")
+    context = multiprocessing.get_context("spawn")
+    for events in args.sizes:
+        results = context.Queue()
+        process = context.Process(target=run, args=(events, args, results))
+        process.start()
+        r = results.get()
+        process.join()
+        print(f"{r['events']:>12}{r['users']:>10}{r['products']:>10}{r['pairs']:>12}"
+              f"{r['build_s']:>10.1f}{r['als_s']:>10.1f}{r['peak_rss_mb']:>10.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 from fastapi import FastAPI, Depends, HTTPException, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
 from typing import List, Optional
+import asyncio
 import uvicorn
 import time
 import logging
@@ -8,6 +10,11 @@ import logging
 from app.api.routes import router as api_router
 from app.core.config import settings
 from app.core.auth import get_current_user
+from app.core.metrics import render_metrics
+from app.db import profiler
+from app.db.session import async_engine, engine
+from app.ml.recommender import model_watcher
+from app.services.ingestion import event_ingestor
 from app.schemas.health import HealthResponse
 
 app = FastAPI(
@@ -25,6 +32,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if settings.DB_PROFILING_ENABLED:
+    # Query counts, DB time and N+1 shapes per request, as X-DB-* headers and warnings
+    profiler.install(engine, async_engine.sync_engine)
+    app.add_middleware(profiler.QueryProfilerMiddleware)
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -32,6 +44,26 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def start_model_watcher():
+    """Hot-swap the recommendation models when training publishes a new version"""
+    model_watcher.start()
+
+@app.on_event("shutdown")
+async def stop_model_watcher():
+    model_watcher.stop()
+
+@app.on_event("startup")
+async def start_event_ingestion():
+    """Write-behind event writes for POST /recommendations/event/"""
+    if settings.EVENT_INGESTION_BUFFERED:
+        event_ingestor.start()
+
+@app.on_event("shutdown")
+async def stop_event_ingestion():
+    # Blocks until the accepted events are written, so it runs off the event loop
+    await asyncio.to_thread(event_ingestor.stop)
+
 @app.get("/health", response_model=HealthResponse, tags=["Health"])
 async def health_check():
     """Health check endpoint for the API"""
@@ -41,6 +73,12 @@ async def health_check():
         "timestamp": time.time()
     }
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus scrape endpoint: request and per-stage latency histograms, fallback counts"""
+    body, content_type = render_metrics()
+    return Response(body, media_type=content_type)
+
 # Include API routes
 app.include_router(api_router, prefix="/api")
 
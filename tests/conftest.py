@@ -0,0 +1,39 @@
+"""
+Test environment: a throwaway SQLite database, model directory and event
+spool, the Redis cache off, and no Kafka broker. Set before any app module
+is imported, since app.core.config reads the environment once.
+"""
+import os
+import tempfile
+
+import kafka
+import pytest
+from kafka.errors import KafkaConnectionError
+
+_scratch = tempfile.mkdtemp(prefix="recommendation-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_scratch, 'test.db')}")
+os.environ.setdefault("MODEL_PATH", os.path.join(_scratch, "models"))
+os.environ.setdefault("KAFKA_SPOOL_PATH", os.path.join(_scratch, "spool", "events.jsonl"))
+os.environ.setdefault("CACHE_ENABLED", "false")
+
+class _NoBroker:
+    """Stands in for KafkaProducer so the module-level EventProducer spools instead of waiting to bootstrap"""
+
+    def __init__(self, *args, **kwargs):
+        raise KafkaConnectionError("No broker in tests")
+
+kafka.KafkaProducer = _NoBroker
+
+@pytest.fixture
+def db():
+    """A session on freshly created tables, dropped again after the test"""
+    from app.db.session import Base, SessionLocal, engine
+    import app.models.product, app.models.recommendation, app.models.user, app.models.user_event  # noqa: F401
+
+    Base.metadata.create_all(engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        Base.metadata.drop_all(engine)
@@ -0,0 +1,127 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from app.ml.ann import IVFIndex
+
+@pytest.fixture
+def vectors():
+    rng = np.random.default_rng(0)
+    return np.arange(1000, 1500, dtype=np.int64), rng.standard_normal((500, 16)).astype(np.float32)
+
+def _exact(ids, vectors, query, k):
+    scores = vectors @ query
+    return ids[np.argsort(-scores, kind="stable")[:k]].tolist()
+
+def test_probing_every_list_is_exact(vectors):
+    ids, matrix = vectors
+    index = IVFIndex.build(ids, matrix, nlist=16)
+    query = matrix[3]
+
+    found, scores = index.search(query, 10, nprobe=index.nlist)
+
+    assert found.tolist() == _exact(ids, matrix, query, 10)
+    assert (np.diff(scores) <= 0).all()
+
+def test_recall_at_default_nprobe(vectors):
+    ids, matrix = vectors
+    index = IVFIndex.build(ids, matrix)
+    rng = np.random.default_rng(1)
+
+    hits = 0
+    for query in rng.standard_normal((20, 16)).astype(np.float32):
+        hits += len(set(index.search(query, 10, nprobe=8)[0].tolist()) & set(_exact(ids, matrix, query, 10)))
+
+    assert hits / 200 >= 0.8
+
+def test_excluded_ids_are_never_returned(vectors):
+    ids, matrix = vectors
+    index = IVFIndex.build(ids, matrix, nlist=8)
+    query = matrix[0]
+    best = _exact(ids, matrix, query, 5)
+
+    found, _ = index.search(query, 5, nprobe=8, exclude=np.array(best[:3]))
+
+    assert not set(found.tolist()) & set(best[:3])
+    assert len(found) == 5
+
+def test_normalized_index_scores_cosine(vectors):
+    ids, matrix = vectors
+    index = IVFIndex.build(ids, matrix, nlist=4, normalize=True)
+
+    found, scores = index.search(matrix[7] * 10, 1, nprobe=4)
+
+    assert found.tolist() == [ids[7]]
+    assert scores[0] == pytest.approx(1.0, abs=1e-5)
+
+def test_nlist_is_clamped_to_the_item_count():
+    index = IVFIndex.build(np.array([1, 2, 3]), np.eye(3, dtype=np.float32), nlist=10)
+
+    assert index.nlist == 3
+    assert index.search(np.ones(3), 10, nprobe=3)[0].size == 3
+
+def test_save_and_load_round_trip(tmp_path, vectors):
+    ids, matrix = vectors
+    index = IVFIndex.build(ids, matrix, nlist=8, normalize=True)
+    path = str(tmp_path / "cb_ann")
+
+    index.save(path)
+    loaded = IVFIndex.load(path)
+
+    assert loaded.normalize
+    np.testing.assert_array_equal(loaded.offsets, index.offsets)
+    assert loaded.search(matrix[0], 5, nprobe=3)[0].tolist() == index.search(matrix[0], 5, nprobe=3)[0].tolist()
+
+def test_load_legacy_pickle_and_missing_index(tmp_path):
+    path = str(tmp_path / "cf_ann")
+    assert IVFIndex.load(path) is None
+
+    index = IVFIndex.build(np.array([1, 2]), np.eye(2, dtype=np.float32), nlist=2)
+    with open(f"{path}.pkl", "wb") as f:
+        pickle.dump({"centroids": index.centroids, "offsets": index.offsets, "ids": index.ids,
+                     "vectors": index.vectors}, f)
+
+    assert IVFIndex.load(path).search(np.array([0.0, 1.0]), 1, nprobe=2)[0].tolist() == [2]
+
+def test_masked_cf_top_k_filters_ann_candidates(tmp_path, vectors, monkeypatch):
+    recommender = pytest.importorskip("app.ml.recommender")
+    ids, matrix = vectors
+    path = tmp_path / "cf_model.pkl"
+    user = np.random.default_rng(2).standard_normal(16)
+    with open(path, "wb") as f:
+        pickle.dump({"user_factors": {1: user}, "item_factors": dict(zip(ids.tolist(), matrix)), "global_mean": 0.0}, f)
+    cf = recommender.CollaborativeFilteringModel(str(path))
+    cf.ann = IVFIndex.build(ids, matrix, nlist=16)
+    monkeypatch.setattr(recommender.settings, "ANN_NPROBE", 16)
+    mask = cf.model["item_ids"] % 3 == 0
+
+    result = [pid for pid, _ in cf.top_k(1, 5, mask=mask)]
+    assert result == [pid for pid in _exact(ids, matrix, user.astype(np.float32), 500) if pid % 3 == 0][:5]
+
+    # A mask that leaves almost nothing among the probed clusters falls back to the exact scan
+    mask = cf.model["item_ids"] == ids[-1]
+    monkeypatch.setattr(recommender.settings, "ANN_NPROBE", 1)
+    assert [pid for pid, _ in cf.top_k(1, 1, mask=mask)] == [ids[-1]]
+
+def test_masked_find_similar_uses_ann_past_the_precomputed_list(tmp_path, vectors, monkeypatch):
+    recommender = pytest.importorskip("app.ml.recommender")
+    ids, matrix = vectors
+    path = tmp_path / "cb_model.pkl"
+    with open(path, "wb") as f:
+        pickle.dump({"product_vectors": dict(zip(ids.tolist(), matrix)), "similarity_matrix": {}}, f)
+    monkeypatch.setattr(recommender.settings, "SIMILAR_TOP_N", 10)
+    cb = recommender.ContentBasedModel(str(path))
+    cb.ann = IVFIndex.build(ids, matrix, nlist=8, normalize=True)
+    monkeypatch.setattr(recommender.settings, "ANN_NPROBE", 8)
+    mask = cb.model["product_ids"] % 2 == 0
+    calls = []
+    search = cb.ann.search
+    monkeypatch.setattr(cb.ann, "search", lambda *args, **kwargs: calls.append(args) or search(*args, **kwargs))
+
+    result = [pid for pid, _ in cb.find_similar(int(ids[0]), limit=60, mask=mask)]
+
+    normalized = matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+    expected = [pid for pid in _exact(ids, normalized, normalized[0], 500) if pid % 2 == 0 and pid != ids[0]]
+    assert calls
+    assert result == expected[:60]
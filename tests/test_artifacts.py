@@ -0,0 +1,102 @@
+import os
+
+import numpy as np
+import pytest
+
+from app.ml.artifacts import (
+    add_arrays,
+    current_version,
+    is_artifact_dir,
+    load_arrays,
+    publish_version,
+    resolve_artifact,
+    save_arrays,
+    save_model,
+    version_dir,
+)
+
+def test_model_round_trip_splits_arrays_and_meta(tmp_path):
+    directory = str(tmp_path / "cf")
+
+    save_model(directory, {"item_ids": np.array([3, 1]), "item_factors": np.eye(2, dtype=np.float32),
+                           "global_mean": 0.25, "version": "v1"})
+    loaded = load_arrays(directory)
+
+    assert is_artifact_dir(directory)
+    assert loaded["global_mean"] == 0.25 and loaded["version"] == "v1"
+    assert loaded["item_ids"].tolist() == [3, 1]
+    assert isinstance(loaded["item_factors"], np.memmap)
+    assert not loaded["item_factors"].flags.writeable
+    assert not isinstance(load_arrays(directory, mmap=False)["item_factors"], np.memmap)
+    assert not [name for name in os.listdir(directory) if name.endswith(".tmp")]
+
+def test_directory_without_manifest_is_not_an_artifact(tmp_path):
+    os.makedirs(tmp_path / "cf")
+    np.save(tmp_path / "cf" / "item_ids.npy", np.arange(3))
+
+    assert not is_artifact_dir(str(tmp_path / "cf"))
+
+def test_add_arrays_keeps_existing_arrays_and_meta(tmp_path):
+    directory = str(tmp_path / "cb")
+    save_arrays(directory, {"product_ids": np.arange(4)}, meta={"version": "v2"})
+
+    add_arrays(directory, {"product_vectors_int8": np.ones((4, 2), dtype=np.int8)})
+    loaded = load_arrays(directory)
+
+    assert loaded["version"] == "v2"
+    assert loaded["product_ids"].tolist() == [0, 1, 2, 3]
+    assert loaded["product_vectors_int8"].dtype == np.int8
+
+def test_rewritten_array_leaves_existing_maps_intact(tmp_path):
+    directory = str(tmp_path / "cf")
+    save_arrays(directory, {"item_factors": np.zeros(4, dtype=np.float32)})
+    mapped = load_arrays(directory)["item_factors"]
+
+    save_arrays(directory, {"item_factors": np.ones(4, dtype=np.float32)})
+
+    assert mapped.tolist() == [0.0] * 4
+    assert load_arrays(directory)["item_factors"].tolist() == [1.0] * 4
+
+def test_publish_version_moves_current_and_resolves_artifacts(tmp_path):
+    model_path = str(tmp_path)
+    assert current_version(model_path) is None
+    assert resolve_artifact(model_path, "cf", "cf_model.pkl") == os.path.join(model_path, "cf_model.pkl")
+
+    publish_version(model_path, "20240101000000")
+    publish_version(model_path, "20240102000000")
+
+    assert current_version(model_path) == "20240102000000"
+    assert resolve_artifact(model_path, "cf", "cf_model.pkl") == os.path.join(
+        version_dir(model_path, "20240102000000"), "cf")
+    assert sorted(os.listdir(model_path)) == ["CURRENT"]
+
+def _publish(model_path, version, item_ids):
+    from app.ml.train import save_artifacts
+
+    cf = {"user_ids": np.array([1]), "user_factors": np.ones((1, 2), dtype=np.float32),
+          "item_ids": np.array(item_ids), "item_factors": np.ones((len(item_ids), 2), dtype=np.float32),
+          "global_mean": 0.0}
+    cb = {"product_ids": np.array(item_ids), "product_vectors": np.ones((len(item_ids), 2), dtype=np.float32)}
+    return save_artifacts(cf, cb, model_path, version=version, ann=False)
+
+def test_model_watcher_swaps_in_new_versions_only_when_they_load(tmp_path, monkeypatch):
+    recommender = pytest.importorskip("app.ml.recommender")
+    model_path = str(tmp_path)
+    monkeypatch.setattr(recommender.settings, "MODEL_PATH", model_path)
+    monkeypatch.setattr(recommender, "cf_model", recommender.cf_model)
+    monkeypatch.setattr(recommender, "cb_model", recommender.cb_model)
+    watcher = recommender.ModelWatcher(interval=0, model_path=model_path)
+
+    assert not watcher.check()
+    _publish(model_path, "v1", [5, 6])
+    assert watcher.check()
+    assert recommender.cf_model.version == "v1"
+    assert recommender.cf_model.model["item_ids"].tolist() == [5, 6]
+    assert not watcher.check()
+
+    # A published version whose CB artifact is missing is not swapped in
+    os.makedirs(version_dir(model_path, "v2"))
+    save_model(os.path.join(version_dir(model_path, "v2"), "cf"), {"item_ids": np.array([7])})
+    publish_version(model_path, "v2")
+    assert not watcher.check()
+    assert recommender.cf_model.version == "v1"
@@ -0,0 +1,81 @@
+import asyncio
+import pickle
+
+import numpy as np
+import pytest
+
+from app.db.session import _async_url
+
+@pytest.mark.parametrize("url, expected", [
+    ("postgresql://u:p@db/app", "postgresql+asyncpg://u:p@db/app"),
+    ("postgresql+psycopg2://u:p@db/app", "postgresql+asyncpg://u:p@db/app"),
+    ("sqlite:////tmp/test.db", "sqlite+aiosqlite:////tmp/test.db"),
+    ("mysql://u:p@db/app", "mysql://u:p@db/app"),
+])
+def test_async_url_swaps_in_an_asyncio_driver(url, expected):
+    assert _async_url(url) == expected
+
+@pytest.fixture
+def recommender(db, tmp_path, monkeypatch):
+    """The recommender module on a small catalog with CF and CB models, caching off"""
+    recommender = pytest.importorskip("app.ml.recommender")
+    from app.models.product import Product
+    from app.models.user_event import UserEvent
+    from app.services.catalog import ProductCatalog
+
+    rng = np.random.default_rng(0)
+    items = {pid: rng.standard_normal(4) for pid in range(1, 41)}
+    with open(tmp_path / "cf_model.pkl", "wb") as f:
+        pickle.dump({"user_factors": {1: rng.standard_normal(4)}, "item_factors": items, "global_mean": 0.0}, f)
+    with open(tmp_path / "cb_model.pkl", "wb") as f:
+        pickle.dump({"product_vectors": {pid: rng.standard_normal(6) for pid in items}, "similarity_matrix": {}}, f)
+    db.add_all([Product(id=pid, name=str(pid), price=float(pid), stock=0 if pid % 7 == 0 else 1) for pid in items])
+    db.add_all([UserEvent(user_id=1, product_id=pid, event_type="view", session_id="s") for pid in (3, 9)])
+    db.commit()
+
+    monkeypatch.setattr(recommender.settings, "PRECOMPUTED_ENABLED", False)
+    monkeypatch.setattr(recommender, "cf_model", recommender.CollaborativeFilteringModel(str(tmp_path / "cf_model.pkl")))
+    monkeypatch.setattr(recommender, "cb_model", recommender.ContentBasedModel(str(tmp_path / "cb_model.pkl")))
+    monkeypatch.setattr(recommender, "product_catalog", ProductCatalog())
+    recommender.cf_model.ann = recommender.cb_model.ann = None
+    return recommender
+
+def _run(coroutine_function, *args, **kwargs):
+    from app.db.session import AsyncSessionLocal, async_engine
+
+    async def run():
+        try:
+            async with AsyncSessionLocal() as session:
+                return [product.id for product in await coroutine_function(session, *args, **kwargs)]
+        finally:
+            # Connections belong to this event loop
+            await async_engine.dispose()
+
+    return asyncio.run(run())
+
+@pytest.mark.parametrize("user_id, algorithm", [(1, None), (1, "content"), (1, "hybrid"), (99, None)])
+def test_async_personalized_matches_sync(recommender, db, user_id, algorithm, caplog):
+    from app.services.catalog import ProductFilter
+
+    filters = ProductFilter(max_price=30)
+    expected = [p.id for p in recommender.get_personalized_recommendations(db, user_id, 5, algorithm, filters)]
+
+    result = _run(recommender.get_personalized_recommendations_async, user_id, 5, algorithm, filters)
+
+    assert result == expected
+    assert len(result) == 5
+    assert all(pid <= 30 and pid % 7 for pid in result)
+    # Neither path fell back to trending products
+    assert "Error" not in caplog.text
+
+def test_async_similar_matches_sync(recommender, db, caplog):
+    expected = [p.id for p in recommender.get_similar_products(db, 3, limit=6)]
+
+    assert _run(recommender.get_similar_products_async, 3, limit=6) == expected
+    assert 3 not in expected and len(expected) == 6
+    assert "Error" not in caplog.text
+
+def test_async_trending_falls_back_to_newest_products(recommender, db):
+    expected = [p.id for p in recommender.get_trending_products(db, 4)]
+
+    assert _run(recommender.get_trending_products_async, 4) == expected
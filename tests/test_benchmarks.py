@@ -0,0 +1,77 @@
+import json
+import sys
+
+import numpy as np
+import pytest
+
+from benchmarks import results
+from benchmarks.data import product_popularity
+from benchmarks.fake_kafka import FakeBroker
+
+def _run(p95, p99=None, count=100):
+    return {"count": count, "mean_ms": 1.0, "p50_ms": 1.0, "p95_ms": p95, "p99_ms": p99 or p95,
+            "max_ms": 10.0, "throughput": 100.0}
+
+def test_summarize_reports_milliseconds_and_throughput():
+    summary = results.summarize([0.001] * 99 + [0.101])
+
+    assert summary["count"] == 100
+    assert summary["p50_ms"] == pytest.approx(1.0)
+    assert summary["max_ms"] == pytest.approx(101.0)
+    assert summary["mean_ms"] == pytest.approx(2.0)
+    # Sequential runs: 100 calls over the summed 0.2 seconds
+    assert summary["throughput"] == pytest.approx(500.0)
+    assert results.summarize([0.001] * 10, elapsed=0.5)["throughput"] == pytest.approx(20.0)
+    assert results.summarize([]) == {"count": 0}
+
+def test_compare_gates_only_tail_latency_beyond_the_threshold(capsys):
+    baseline = {"results": {"a": _run(10.0), "b": _run(10.0)}}
+
+    assert not results.compare(baseline, {"results": {"a": _run(10.9), "b": _run(5.0)}}, threshold=10)
+    assert results.compare(baseline, {"results": {"a": _run(10.0, p99=11.5), "b": _run(10.0)}}, threshold=10)
+    # New and empty cases are reported but never gate
+    assert not results.compare(baseline, {"results": {"c": _run(50.0), "b": {"count": 0}}}, threshold=10)
+    assert "(new or empty)" in capsys.readouterr().out
+
+def test_written_results_compare_from_the_command_line(tmp_path, monkeypatch):
+    baseline, current = str(tmp_path / "base.json"), str(tmp_path / "out" / "current.json")
+    results.write_results(baseline, "micro", {"n": 1}, {"a": _run(10.0)})
+    results.write_results(current, "micro", {"n": 1}, {"a": _run(12.0)}, extra={"server": {"errors": 0}})
+
+    with open(current) as f:
+        document = json.load(f)
+    assert document["suite"] == "micro" and document["server"] == {"errors": 0}
+    assert document["results"]["a"]["p95_ms"] == 12.0
+
+    monkeypatch.setattr(sys, "argv", ["results", baseline, current, "--threshold", "25"])
+    with pytest.raises(SystemExit) as exit_info:
+        results.main()
+    assert exit_info.value.code == 0
+
+    monkeypatch.setattr(sys, "argv", ["results", baseline, current])
+    with pytest.raises(SystemExit) as exit_info:
+        results.main()
+    assert exit_info.value.code == 1
+
+def test_fake_broker_redelivers_after_a_seek_and_tracks_commit_lag():
+    broker = FakeBroker(partitions=2)
+    for key in range(5):
+        broker.produce(key, {"n": key})
+
+    first = broker.poll(max_records=3)
+    assert sum(len(batch) for batch in first.values()) == 3
+    partition = next(iter(first))
+    broker.seek(partition, 0)
+    again = broker.poll(max_records=10)
+
+    assert [m.value["n"] for m in again[partition]] == [m.value["n"] for m in broker.logs[partition]]
+    broker.commit()
+    assert len(broker.lags) == 5
+    assert broker.poll(timeout_ms=0) == {}
+
+def test_product_popularity_is_a_shuffled_distribution():
+    popularity = product_popularity(1000, np.random.default_rng(0))
+
+    assert popularity.sum() == pytest.approx(1.0)
+    assert popularity.max() == pytest.approx(1.0 / (1.0 / np.arange(1, 1001) ** 1.1).sum())
+    assert np.argmax(popularity) != 0
@@ -0,0 +1,121 @@
+import asyncio
+
+import fakeredis
+import httpx
+import pytest
+import redis
+
+from app.services.cache import RecommendationCache
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+@pytest.fixture
+def cache(server):
+    return RecommendationCache(client=fakeredis.FakeRedis(server=server), enabled=True)
+
+def test_get_set_round_trip(cache):
+    key = cache.user_key(1, None, 10, "v1")
+    assert cache.get(key) is None
+
+    cache.set(key, [3, 1, 2], ttl=60, user_id=1)
+
+    assert cache.get(key) == [3, 1, 2]
+    assert 0 < cache.client.ttl(key) <= 60
+
+def test_keys_embed_algorithm_limit_version_and_variant(cache):
+    key = cache.user_key(1, "Collaborative", 10, "v1")
+    assert key == cache.user_key(1, None, 10, "v1")
+    assert len({key, cache.user_key(1, "content", 10, "v1"), cache.user_key(1, None, 5, "v1"),
+                cache.user_key(1, None, 10, "v2"), cache.user_key(1, None, 10, "v1", "c1")}) == 5
+
+    cache.set(key, [1, 2], ttl=60, user_id=1)
+    assert cache.get(cache.user_key(1, None, 10, "v2")) is None
+
+def test_invalidate_user_drops_only_that_users_keys(cache):
+    first = cache.user_key(1, None, 10, "v1")
+    second = cache.user_key(1, "content", 5, "v1", "c2")
+    other_user = cache.user_key(2, None, 10, "v1")
+    similar = cache.similar_key(7, 5, "v1")
+    cache.set(first, [1], ttl=60, user_id=1)
+    cache.set(second, [2], ttl=60, user_id=1)
+    cache.set(other_user, [3], ttl=60, user_id=2)
+    cache.set(similar, [4], ttl=60)
+
+    cache.invalidate_user(1)
+
+    assert cache.get(first) is None
+    assert cache.get(second) is None
+    assert cache.get(other_user) == [3]
+    assert cache.get(similar) == [4]
+    assert not cache.client.exists(cache._user_keys_set(1))
+    assert cache.stats()["invalidations"] == 1
+
+def test_redis_error_is_a_miss(server, cache):
+    key = cache.user_key(1, None, 10, "v1")
+    cache.set(key, [1, 2], ttl=60, user_id=1)
+    server.connected = False
+
+    assert cache.get(key) is None
+    cache.set(key, [3], ttl=60, user_id=1)
+    cache.invalidate_user(1)
+
+    stats = cache.stats()
+    assert stats["errors"] == 3
+    assert stats["hits"] == stats["misses"] == 0
+
+def test_redis_timeout_is_a_miss():
+    class TimingOut(fakeredis.FakeRedis):
+        def get(self, name):
+            raise redis.TimeoutError("Timeout reading from socket")
+
+    cache = RecommendationCache(client=TimingOut(), enabled=True)
+
+    assert cache.get("rec:user:1:collaborative:10:v1") is None
+    assert cache.stats()["errors"] == 1
+
+def test_disabled_cache_does_nothing(server):
+    cache = RecommendationCache(client=fakeredis.FakeRedis(server=server), enabled=False)
+    key = cache.user_key(1, None, 10, "v1")
+
+    cache.set(key, [1], ttl=60, user_id=1)
+
+    assert cache.get(key) is None
+    assert not cache.client.exists(key)
+    assert cache.stats() == {"hits": 0, "misses": 0, "errors": 0, "invalidations": 0, "hit_rate": 0.0}
+
+def test_hit_and_miss_counters(cache):
+    key = cache.user_key(1, None, 10, "v1")
+    cache.get(key)
+    cache.set(key, [1], ttl=60)
+    cache.get(key)
+    cache.get(key)
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (2, 1)
+    assert stats["hit_rate"] == pytest.approx(2 / 3)
+
+def test_cache_stats_endpoint(cache, monkeypatch):
+    endpoints = pytest.importorskip("app.api.endpoints.recommendation")
+    from fastapi import FastAPI
+
+    monkeypatch.setattr(endpoints, "recommendation_cache", cache)
+    app = FastAPI()
+    app.include_router(endpoints.router, prefix="/recommendations")
+    key = cache.user_key(1, None, 10, "v1")
+    cache.get(key)
+    cache.set(key, [1], ttl=60, user_id=1)
+    cache.get(key)
+
+    async def fetch():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await client.get("/recommendations/cache/stats")
+
+    response = asyncio.run(fetch())
+
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["hits"], body["misses"], body["errors"]) == (1, 1, 0)
+    assert body["hit_rate"] == 0.5
+    assert "local" in body
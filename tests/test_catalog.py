@@ -0,0 +1,110 @@
+import numpy as np
+import pytest
+
+from app.services.catalog import CatalogSnapshot, ProductCatalog, ProductFilter
+
+@pytest.fixture
+def snapshot():
+    # Products 10..50; 30 is out of stock. Categories: 10 -> {1}, 20 -> {1, 2}, 40 -> {2}
+    return CatalogSnapshot(
+        ids=np.array([10, 20, 30, 40, 50], dtype=np.int64),
+        prices=np.array([5.0, 15.0, 25.0, 35.0, 45.0], dtype=np.float32),
+        stock=np.array([1, 3, 0, 2, 7], dtype=np.int32),
+        category_indptr=np.array([0, 1, 3, 3, 4, 4], dtype=np.int64),
+        category_ids=np.array([1, 1, 2, 2], dtype=np.int32),
+    )
+
+def _allowed(snapshot, product_filter):
+    return snapshot.ids[snapshot.filter_mask(product_filter)].tolist()
+
+def test_rows_and_availability(snapshot):
+    assert snapshot.rows([50, 10, 11, 99]).tolist() == [4, 0, -1, -1]
+    assert snapshot.available([10, 30, 99]).tolist() == [True, False, False]
+    assert snapshot.in_stock_ids().tolist() == [10, 20, 40, 50]
+    assert snapshot.out_of_stock_ids.tolist() == [30]
+
+def test_category_masks(snapshot):
+    assert snapshot.ids[snapshot.category_mask(1)].tolist() == [10, 20]
+    assert snapshot.ids[snapshot.category_mask(2)].tolist() == [20, 40]
+    assert not snapshot.category_mask(3).any()
+
+@pytest.mark.parametrize("product_filter, expected", [
+    (ProductFilter(), [10, 20, 40, 50]),
+    (ProductFilter(categories=[1]), [10, 20]),
+    (ProductFilter(categories=[1, 2]), [10, 20, 40]),
+    (ProductFilter(exclude_categories=[2]), [10, 50]),
+    (ProductFilter(min_price=15, max_price=40), [20, 40]),
+    (ProductFilter(categories=[2], max_price=20), [20]),
+])
+def test_filter_masks(snapshot, product_filter, expected):
+    assert _allowed(snapshot, product_filter) == expected
+
+def test_filter_mask_is_cached_per_rule_set(snapshot):
+    mask = snapshot.filter_mask(ProductFilter(categories=[2, 1]))
+
+    assert snapshot.filter_mask(ProductFilter(categories=[1, 2], exclude_purchased=True)) is mask
+    assert snapshot.filter_mask(ProductFilter(categories=[1])) is not mask
+
+def test_index_mask_follows_the_other_id_order(snapshot):
+    item_ids = np.array([50, 30, 99, 20])
+
+    mask = snapshot.index_mask(item_ids, ProductFilter(min_price=10))
+
+    assert mask.tolist() == [True, False, False, True]
+    assert snapshot.index_mask(item_ids, ProductFilter(min_price=10)) is mask
+
+def test_allows_and_apply_honour_excluded_ids(snapshot):
+    product_filter = ProductFilter(categories=[1, 2]).with_excluded([20])
+
+    assert product_filter.allows(snapshot, [10, 20, 30, 40, 77]).tolist() == [True, False, False, True, False]
+    assert product_filter.apply(snapshot, [(40, 0.9), (20, 0.8), (10, 0.1)]) == [(40, 0.9), (10, 0.1)]
+
+def test_filter_keys_and_cache_variants():
+    assert not ProductFilter().restricts_catalog
+    assert not ProductFilter(exclude_purchased=True).restricts_catalog
+    assert ProductFilter(max_price=10).restricts_catalog
+    assert ProductFilter().cache_variant() == ""
+    assert ProductFilter(categories=[3, 1], min_price=2.5, exclude_purchased=True).cache_variant() == "c1,3-min2.5-np"
+
+    base = ProductFilter(categories=[1], exclude_ids=[5])
+    copy = base.with_excluded([7, 5])
+    assert copy.exclude_ids.tolist() == [5, 7]
+    assert base.exclude_ids.tolist() == [5]
+    assert copy.key == base.key
+
+def test_snapshot_load_reads_columns_and_links(db):
+    from app.models.product import Category, Product
+
+    electronics, books = Category(id=1, name="Electronics"), Category(id=2, name="Books")
+    db.add_all([
+        Product(id=3, name="c", price=30.0, stock=None, categories=[books]),
+        Product(id=1, name="a", price=10.0, stock=4, categories=[electronics, books]),
+        Product(id=2, name="b", price=20.0, stock=0),
+    ])
+    db.commit()
+
+    snapshot = CatalogSnapshot.load(db)
+
+    assert snapshot.ids.tolist() == [1, 2, 3]
+    assert snapshot.stock.tolist() == [4, 0, 0]
+    assert snapshot.ids[snapshot.category_mask(2)].tolist() == [1, 3]
+    assert _allowed(snapshot, ProductFilter(categories=[2])) == [1]
+
+def test_product_catalog_reloads_after_invalidate(db):
+    from app.models.product import Product
+
+    db.add(Product(id=1, name="a", price=1.0, stock=1))
+    db.commit()
+    catalog = ProductCatalog(refresh_seconds=3600)
+
+    assert catalog.current() is None
+    first = catalog.get(db)
+    assert catalog.current() is first
+    assert catalog.get(db) is first
+
+    db.add(Product(id=2, name="b", price=1.0, stock=1))
+    db.commit()
+    catalog.invalidate()
+
+    assert catalog.current() is None
+    assert catalog.get(db).ids.tolist() == [1, 2]
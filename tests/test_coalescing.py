@@ -0,0 +1,133 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.services.coalescing import RequestCoalescer
+
+def _coalescer(**kwargs):
+    options = {"enabled": True, "max_entries": 10, "ttl": 60, "wait_timeout": 5}
+    options.update(kwargs)
+    return RequestCoalescer(**options)
+
+def test_concurrent_identical_calls_compute_once():
+    coalescer = _coalescer()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return [1, 2, 3]
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        leader = pool.submit(coalescer.run, "k", compute)
+        started.wait(5)
+        waiters = [pool.submit(coalescer.run, "k", compute) for _ in range(3)]
+        while coalescer.stats()["coalesced"] < 3:
+            time.sleep(0.01)
+        release.set()
+        results = [leader.result()] + [waiter.result() for waiter in waiters]
+
+    assert results == [[1, 2, 3]] * 4
+    assert len(calls) == 1
+    assert coalescer.run("k", compute) == [1, 2, 3]
+    stats = coalescer.stats()
+    assert (stats["computed"], stats["coalesced"], stats["hits"]) == (1, 3, 1)
+
+def test_waiters_get_the_leaders_error_and_nothing_is_cached():
+    coalescer = _coalescer()
+    started, release = threading.Event(), threading.Event()
+
+    def failing():
+        started.set()
+        release.wait(5)
+        raise ValueError("model not loaded")
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        leader = pool.submit(coalescer.run, "k", failing)
+        started.wait(5)
+        waiter = pool.submit(coalescer.run, "k", failing)
+        while not coalescer.stats()["coalesced"]:
+            time.sleep(0.01)
+        release.set()
+        for future in (leader, waiter):
+            with pytest.raises(ValueError):
+                future.result()
+
+    assert coalescer.run("k", lambda: "ok") == "ok"
+
+def test_waiter_computes_itself_after_the_timeout():
+    coalescer = _coalescer(wait_timeout=0.05)
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return "slow"
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        leader = pool.submit(coalescer.run, "k", slow)
+        started.wait(5)
+        assert coalescer.run("k", lambda: "own") == "own"
+        release.set()
+        assert leader.result() == "slow"
+
+    assert coalescer.stats()["timeouts"] == 1
+
+def test_lru_evicts_the_oldest_and_expires_entries():
+    coalescer = _coalescer(max_entries=2)
+    for key in ("a", "b", "c"):
+        coalescer.run(key, lambda: key)
+
+    assert coalescer.run("a", lambda: "recomputed") == "recomputed"
+    assert coalescer.run("c", lambda: "recomputed") == "c"
+
+    expired = _coalescer(ttl=0)
+    expired.run("a", lambda: 1)
+    assert expired.run("a", lambda: 2) == 2
+
+def test_disabled_coalescer_always_computes():
+    coalescer = _coalescer(enabled=False)
+
+    assert [coalescer.run("k", lambda: n) for n in range(2)] == [0, 1]
+    assert coalescer.stats()["entries"] == 0
+
+def test_async_calls_share_one_computation():
+    coalescer = _coalescer()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "value"
+
+    async def run():
+        return await asyncio.gather(*[coalescer.run_async("k", compute) for _ in range(5)])
+
+    assert asyncio.run(run()) == ["value"] * 5
+    assert len(calls) == 1
+    assert coalescer.stats()["coalesced"] == 4
+
+def test_async_waiters_survive_a_cancelled_leader():
+    coalescer = _coalescer()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "value"
+
+    async def run():
+        leader = asyncio.ensure_future(coalescer.run_async("k", compute))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(coalescer.run_async("k", compute))
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await waiter
+
+    assert asyncio.run(run()) == "value"
+    assert len(calls) == 2
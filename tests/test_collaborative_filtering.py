@@ -0,0 +1,182 @@
+import pickle
+
+import numpy as np
+import pytest
+
+# The recommender module needs the full app package (schemas, crud)
+recommender = pytest.importorskip("app.ml.recommender")
+
+def _write_legacy_model(path, user_factors: dict, item_factors: dict, global_mean: float = 0.0):
+    with open(path, "wb") as f:
+        pickle.dump({"user_factors": user_factors, "item_factors": item_factors, "global_mean": global_mean}, f)
+    return str(path)
+
+@pytest.fixture
+def factors():
+    rng = np.random.default_rng(0)
+    # Unsorted IDs, as dict-of-vectors pickles store them
+    item_ids = rng.permutation(np.arange(1, 201))
+    items = {int(i): rng.standard_normal(8) for i in item_ids}
+    users = {u: rng.standard_normal(8) for u in (3, 1, 2)}
+    return users, items
+
+@pytest.fixture
+def model(tmp_path, factors):
+    users, items = factors
+    cf = recommender.CollaborativeFilteringModel(_write_legacy_model(tmp_path / "cf_model.pkl", users, items, 0.5))
+    cf.ann = None
+    return cf
+
+def _brute_force(users, items, user_id, k, allowed=None):
+    scores = {pid: float(vector @ users[user_id]) + 0.5 for pid, vector in items.items()
+              if allowed is None or pid in allowed}
+    return sorted(scores, key=scores.get, reverse=True)[:k]
+
+def test_select_top_k_returns_best_first():
+    scores = np.array([0.1, 0.9, 0.5, 0.7, 0.3])
+
+    assert recommender._select_top_k(scores, 3).tolist() == [1, 3, 2]
+    assert recommender._select_top_k(scores, 10).tolist() == [1, 3, 2, 4, 0]
+    assert recommender._select_top_k(scores, 0).tolist() == []
+    assert recommender._select_top_k(np.empty(0), 3).tolist() == []
+
+def test_legacy_dicts_are_stacked_in_id_order(model, factors):
+    users, items = factors
+
+    assert model.loaded
+    assert model.model["item_ids"].tolist() == sorted(items)
+    assert model.model["item_factors"].dtype == np.float32
+    np.testing.assert_allclose(model.model["item_factors"][model.item_index[17]], items[17], rtol=1e-6)
+
+def test_top_k_matches_brute_force(model, factors):
+    users, items = factors
+
+    for user_id in users:
+        assert [pid for pid, _ in model.top_k(user_id, 10)] == _brute_force(users, items, user_id, 10)
+
+def test_top_k_honours_exclude_and_mask(model, factors):
+    users, items = factors
+    excluded = _brute_force(users, items, 1, 5)
+    mask = model.model["item_ids"] % 2 == 0
+
+    result = [pid for pid, _ in model.top_k(1, 10, exclude=excluded, mask=mask)]
+
+    allowed = {pid for pid in items if pid % 2 == 0 and pid not in excluded}
+    assert result == _brute_force(users, items, 1, 10, allowed)
+
+def test_top_k_without_user_factors_is_empty(model):
+    assert model.top_k(999, 10) == []
+
+def test_predict_scores_known_products_and_keeps_global_mean_for_unknown(model, factors):
+    users, items = factors
+
+    scores = dict(model.predict(2, [5, 10_000, 7]))
+
+    assert scores[10_000] == pytest.approx(0.5)
+    assert scores[5] == pytest.approx(items[5] @ users[2] + 0.5, rel=1e-5)
+    assert [pid for pid, _ in model.predict(2, [5, 10_000, 7], limit=1)] == [max(scores, key=scores.get)]
+
+def test_predict_cold_start_returns_global_mean(model):
+    assert model.predict(999, [1, 2, 3], limit=2) == [(1, 0.5), (2, 0.5)]
+
+def test_score_candidates(model, factors):
+    users, items = factors
+
+    scores = model.score_candidates(3, np.array([4, 10_000]))
+
+    assert scores[0] == pytest.approx(items[4] @ users[3], rel=1e-5)
+    assert np.isnan(scores[1])
+    assert model.score_candidates(999, np.array([4])) is None
+
+def test_missing_model_file_falls_back(tmp_path):
+    cf = recommender.CollaborativeFilteringModel(str(tmp_path / "missing.pkl"))
+
+    assert not cf.loaded
+    assert cf.top_k(1, 5) == []
+
+def test_fold_in_solves_one_weighted_least_squares_step(model, factors, monkeypatch):
+    users, items = factors
+    monkeypatch.setattr(recommender.settings, "EVENT_WEIGHTS", {"view": 1.0, "purchase": 5.0})
+    events = {1: [(5, "view"), (9, "purchase"), (5, "view"), (10_000, "view")], 7: [(3, "purchase")], 8: [(10_000, "view")]}
+
+    vectors = model.fold_in(events, regularization=2.0)
+
+    y = np.stack([items[5], items[9]])
+    c = np.array([2.0, 5.0])
+    expected = np.linalg.solve((y.T * c) @ y + 2.0 * np.eye(8), y.T @ c + 2.0 * users[1])
+    np.testing.assert_allclose(vectors[1], expected, rtol=1e-4)
+    # New users start from zero; users without known products are left out
+    assert set(vectors) == {1, 7}
+    # Nothing is applied until apply_user_vectors
+    np.testing.assert_allclose(model._user_vector(1), users[1], rtol=1e-6)
+    assert model._user_vector(7) is None
+
+def test_partial_fit_applies_to_existing_and_new_users(model, factors):
+    users, items = factors
+
+    assert model.partial_fit({1: [(5, "purchase")], 42: [(6, "view")]}) == 2
+
+    assert model._user_vector(1) @ items[5] > users[1] @ items[5]
+    assert model._user_vector(42) is not None
+    assert model.top_k(42, 3)
+
+def test_batch_update_folds_in_only_after_the_commit(db, model, monkeypatch):
+    from app.models.product import Product
+    from app.models.recommendation import Recommendation
+    from app.services.catalog import ProductCatalog
+
+    db.add_all([Product(id=pid, name=str(pid), price=1.0, stock=1) for pid in range(1, 201)])
+    db.commit()
+    monkeypatch.setattr(recommender, "cf_model", model)
+    monkeypatch.setattr(recommender, "product_catalog", ProductCatalog())
+    monkeypatch.setattr(recommender.settings, "ONLINE_UPDATES_ENABLED", True)
+    before = model._user_vector(1).copy()
+    events = {1: [(5, "purchase")], 42: [(6, "view")]}
+
+    def failing_commit():
+        raise RuntimeError("write failed")
+
+    commit = db.commit
+    monkeypatch.setattr(db, "commit", failing_commit)
+    with pytest.raises(RuntimeError):
+        recommender.update_recommendations_batch(db, events)
+    db.rollback()
+
+    np.testing.assert_array_equal(model._user_vector(1), before)
+    assert model._user_vector(42) is None
+
+    monkeypatch.setattr(db, "commit", commit)
+    recommender.update_recommendations_batch(db, events)
+
+    assert not np.array_equal(model._user_vector(1), before)
+    stored = db.query(Recommendation).filter(Recommendation.user_id == 42).order_by(Recommendation.score.desc()).all()
+    assert [row.product_id for row in stored] == [pid for pid, _ in model.top_k(42, len(stored))]
+
+@pytest.mark.parametrize("block_size", [1, 2, 100])
+def test_top_k_batch_matches_top_k_in_input_order(model, block_size):
+    user_ids = [2, 999, 1, 3]
+    exclude = [pid for pid, _ in model.top_k(1, 3)]
+
+    results = list(model.top_k_batch(user_ids, 10, exclude=exclude, block_size=block_size))
+
+    assert [user_id for user_id, _ in results] == user_ids
+    for user_id, recommendations in results:
+        expected = model.top_k(user_id, 10, exclude=exclude)
+        assert [pid for pid, _ in recommendations] == [pid for pid, _ in expected]
+        assert [score for _, score in recommendations] == pytest.approx([score for _, score in expected], rel=1e-5)
+
+def test_batch_recommendations_skip_unavailable_products_and_cold_start(db, model, monkeypatch):
+    from app.models.product import Product
+    from app.services.catalog import ProductCatalog
+
+    # Products 1-10 are in the catalog, and 4 of them are out of stock
+    db.add_all([Product(id=pid, name=str(pid), price=1.0, stock=0 if pid in (1, 2, 3, 4) else 5) for pid in range(1, 11)])
+    db.commit()
+    monkeypatch.setattr(recommender, "cf_model", model)
+    monkeypatch.setattr(recommender, "product_catalog", ProductCatalog())
+    monkeypatch.setattr(recommender.settings, "CANDIDATE_OVERFETCH", 100)
+
+    results = dict(recommender.get_personalized_recommendations_batch(db, [1, 999], limit=3))
+
+    assert [pid for pid, _ in results[1]] == [pid for pid, _ in model.top_k(1, 200) if 5 <= pid <= 10][:3]
+    assert results[999] == [(5, 0.5), (6, 0.5), (7, 0.5)]
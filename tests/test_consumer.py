@@ -0,0 +1,146 @@
+import pytest
+from sqlalchemy.exc import OperationalError
+
+consumer_module = pytest.importorskip("app.kafka.consumer")
+from benchmarks.fake_kafka import FakeBroker  # noqa: E402
+
+POISON = 666
+
+@pytest.fixture
+def applied(monkeypatch):
+    """Records the user events written; a batch holding the POISON product fails"""
+    batches = []
+
+    def update(db, events_by_user):
+        if any(pid == POISON for events in events_by_user.values() for pid, _ in events):
+            raise ValueError("bad product")
+        batches.append(dict(events_by_user))
+
+    monkeypatch.setattr(consumer_module, "update_recommendations_batch", update)
+    return batches
+
+@pytest.fixture
+def broker():
+    return FakeBroker(partitions=2)
+
+def _produce(broker, user_id, product_id, event_type="view"):
+    broker.produce(user_id, {"event_type": event_type, "data": {"user_id": user_id, "product_id": product_id}})
+
+def _applied_products(batches):
+    return sorted(pid for batch in batches for events in batch.values() for pid, _ in events)
+
+def test_batch_is_grouped_by_user_and_committed(broker, applied):
+    for user_id, product_id in [(1, 10), (2, 20), (1, 11), (3, 30)]:
+        _produce(broker, user_id, product_id)
+    _produce(broker, 4, 40, "search")
+    consumer = consumer_module.EventConsumer(batch_size=10, consumer=broker)
+
+    assert consumer.consume(broker.poll(max_records=10))
+
+    assert len(applied) == 1
+    assert applied[0][1] == [(10, "view"), (11, "view")]
+    assert 4 not in applied[0]
+    assert sum(broker.committed.values()) == 5
+
+def test_failed_batch_is_rewound_until_the_retry_cap(broker, applied):
+    for product_id in (1, 2, POISON, 3):
+        _produce(broker, 2, product_id)
+    dead_letters = []
+    consumer = consumer_module.EventConsumer(batch_size=10, consumer=broker, max_retries=2,
+                                             dead_letter=lambda record: dead_letters.append(record) or True)
+
+    for attempt in range(2):
+        assert not consumer.consume(broker.poll(max_records=10))
+        assert broker.positions == broker.committed
+
+    assert consumer.consume(broker.poll(max_records=10))
+
+    assert _applied_products(applied) == [1, 2, 3]
+    assert [record["offset"] for record in dead_letters] == [2]
+    assert dead_letters[0]["value"]["data"]["product_id"] == POISON
+    assert "bad product" in dead_letters[0]["error"]
+    assert broker.committed[broker.partitions[0]] == 4
+    assert (consumer.failures, consumer.skipped) == (0, 1)
+
+def test_skipped_record_is_logged_without_a_dead_letter_topic(broker, applied, caplog):
+    _produce(broker, 1, POISON)
+    consumer = consumer_module.EventConsumer(consumer=broker, max_retries=0, dead_letter=lambda record: False)
+
+    assert consumer.consume(broker.poll())
+
+    assert str(POISON) in caplog.text
+    assert broker.committed[broker.partitions[1]] == 1
+
+def test_database_outage_never_dead_letters(broker, monkeypatch):
+    def update(db, events_by_user):
+        raise OperationalError("INSERT", {}, Exception("connection refused"))
+
+    monkeypatch.setattr(consumer_module, "update_recommendations_batch", update)
+    for product_id in (1, 2, 3):
+        _produce(broker, 2, product_id)
+    dead_letters = []
+    consumer = consumer_module.EventConsumer(consumer=broker, max_retries=0, dead_letter=dead_letters.append)
+
+    assert not consumer.consume(broker.poll())
+
+    assert dead_letters == []
+    assert broker.positions[broker.partitions[0]] == 0
+
+def test_outage_during_bisection_rewinds_to_the_first_unapplied_record(broker, monkeypatch):
+    def update(db, events_by_user):
+        products = [pid for events in events_by_user.values() for pid, _ in events]
+        if POISON in products:
+            raise ValueError("bad product")
+        if 4 in products:
+            raise OperationalError("INSERT", {}, Exception("connection lost"))
+
+    monkeypatch.setattr(consumer_module, "update_recommendations_batch", update)
+    for product_id in (1, POISON, 3, 4):
+        _produce(broker, 2, product_id)
+    consumer = consumer_module.EventConsumer(consumer=broker, max_retries=0, dead_letter=lambda record: True)
+
+    assert not consumer.consume(broker.poll())
+
+    # 1 was applied, POISON skipped, 3 and 4 are retried
+    assert broker.positions[broker.partitions[0]] == 2
+    assert broker.committed[broker.partitions[0]] == 0
+    assert consumer.skipped == 1
+
+def test_retry_delay_doubles_per_failure_up_to_the_cap(broker):
+    consumer = consumer_module.EventConsumer(consumer=broker, backoff=0.5, max_backoff=3.0)
+
+    delays = []
+    for failures in range(6):
+        consumer.failures = failures
+        delays.append(consumer.retry_delay())
+
+    assert delays == [0.0, 0.5, 1.0, 2.0, 3.0, 3.0]
+    consumer.failures = 10_000
+    assert consumer.retry_delay() == 3.0
+
+def test_run_backs_off_between_failed_attempts(broker, monkeypatch, tmp_path):
+    from app.services.trending import TrendingCounters
+
+    def update(db, events_by_user):
+        raise OperationalError("INSERT", {}, Exception("connection refused"))
+
+    monkeypatch.setattr(consumer_module, "update_recommendations_batch", update)
+    monkeypatch.setattr(consumer_module, "trending_counters",
+                        TrendingCounters(use_redis=False, path=str(tmp_path / "trending.json")))
+    _produce(broker, 2, 1)
+    consumer = consumer_module.EventConsumer(consumer=broker, max_retries=2, backoff=0.25, max_backoff=1.0)
+    waits = []
+
+    def wait(timeout):
+        waits.append(timeout)
+        if len(waits) == 5:
+            consumer.stop()
+        return consumer.stop_event.is_set()
+
+    monkeypatch.setattr(consumer.stop_event, "wait", wait)
+    consumer.run()
+
+    # The outage outlasts the retry cap, so the waits keep growing until max_backoff
+    assert waits == [0.25, 0.5, 1.0, 1.0, 1.0]
+    assert consumer.failures == 5
+    assert sum(broker.committed.values()) == 0
@@ -0,0 +1,98 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from app.services.catalog import ProductCatalog, ProductFilter
+from app.services.trending import TrendingCounters
+
+recommender = pytest.importorskip("app.ml.recommender")
+
+@pytest.fixture
+def models(db, tmp_path, monkeypatch):
+    """40 products, the even ones in category 1, every seventh out of stock; user 1 ranks all of them"""
+    from app.models.product import Category, Product
+
+    rng = np.random.default_rng(5)
+    items = {pid: rng.standard_normal(4) for pid in range(1, 41)}
+    with open(tmp_path / "cf_model.pkl", "wb") as f:
+        pickle.dump({"user_factors": {1: rng.standard_normal(4)}, "item_factors": items, "global_mean": 0.0}, f)
+    with open(tmp_path / "cb_model.pkl", "wb") as f:
+        pickle.dump({"product_vectors": {pid: rng.standard_normal(6) for pid in items}, "similarity_matrix": {}}, f)
+    category = Category(id=1, name="even")
+    db.add_all([Product(id=pid, name=str(pid), price=float(pid), stock=0 if pid % 7 == 0 else 1,
+                        categories=[category] if pid % 2 == 0 else []) for pid in items])
+    db.commit()
+
+    monkeypatch.setattr(recommender.settings, "PRECOMPUTED_ENABLED", False)
+    monkeypatch.setattr(recommender, "cf_model", recommender.CollaborativeFilteringModel(str(tmp_path / "cf_model.pkl")))
+    monkeypatch.setattr(recommender, "cb_model", recommender.ContentBasedModel(str(tmp_path / "cb_model.pkl")))
+    monkeypatch.setattr(recommender, "product_catalog", ProductCatalog())
+    monkeypatch.setattr(recommender, "trending_counters",
+                        TrendingCounters(use_redis=False, path=str(tmp_path / "trending.json")))
+    recommender.cf_model.ann = recommender.cb_model.ann = None
+    return recommender.cf_model, recommender.cb_model
+
+def _ids(products):
+    return [product.id for product in products]
+
+def _ranking(cf, allowed):
+    return [pid for pid, _ in cf.top_k(1, 40) if allowed(pid)]
+
+def test_narrow_filter_still_fills_the_page(db, models):
+    cf, _ = models
+
+    result = _ids(recommender.get_personalized_recommendations(db, 1, 6, filters=ProductFilter(categories=[1],
+                                                                                              max_price=30)))
+
+    assert result == _ranking(cf, lambda pid: pid % 2 == 0 and pid % 7 and pid <= 30)[:6]
+
+def test_recent_purchases_are_excluded(db, models):
+    from app.models.user_event import UserEvent
+
+    cf, _ = models
+    best = _ranking(cf, lambda pid: pid % 7)
+    db.add_all([UserEvent(user_id=1, product_id=pid, event_type=event_type, session_id="s")
+                for pid, event_type in [(best[0], "purchase"), (best[1], "view")]])
+    db.commit()
+
+    result = _ids(recommender.get_personalized_recommendations(db, 1, 5, filters=ProductFilter(exclude_purchased=True)))
+
+    assert result == best[1:6]
+
+def test_short_stored_rows_are_scored_live(db, models, monkeypatch):
+    from app.models.recommendation import Recommendation
+
+    cf, _ = models
+    monkeypatch.setattr(recommender.settings, "PRECOMPUTED_ENABLED", True)
+    # Only two of the stored products are in category 1
+    db.add_all([Recommendation(user_id=1, product_id=pid, score=1.0 / pid, algorithm="collaborative")
+                for pid in (1, 2, 3, 4, 5)])
+    db.commit()
+    product_filter = ProductFilter(categories=[1])
+
+    result = _ids(recommender.get_personalized_recommendations(db, 1, 4, filters=product_filter))
+
+    assert result == _ranking(cf, lambda pid: pid % 2 == 0 and pid % 7)[:4]
+    assert _ids(recommender.get_personalized_recommendations(db, 1, 2, filters=product_filter)) == [2, 4]
+
+def test_masked_find_similar_scans_past_the_neighbour_list(models, tmp_path, monkeypatch):
+    monkeypatch.setattr(recommender.settings, "SIMILAR_TOP_N", 5)
+    cb = recommender.ContentBasedModel(str(tmp_path / "cb_model.pkl"))
+    cb.ann = None
+    vectors = cb.model["product_vectors"] / np.linalg.norm(cb.model["product_vectors"], axis=1, keepdims=True)
+    similarities = vectors @ vectors[cb.product_index[3]]
+    mask = cb.model["product_ids"] % 5 == 0
+    expected = [int(pid) for pid in cb.model["product_ids"][np.argsort(-similarities)] if pid % 5 == 0 and pid != 10]
+
+    result = cb.find_similar(3, limit=6, mask=mask, exclude=np.array([10]))
+
+    assert [pid for pid, _ in result] == expected[:6]
+
+def test_trending_fallback_applies_the_filters_in_sql(db, models):
+    product_filter = ProductFilter(categories=[1], min_price=10, max_price=30)
+
+    result = _ids(recommender.get_trending_products(db, 5, filters=product_filter))
+
+    # No trending snapshot yet: the newest products passing every rule
+    assert result == [30, 26, 24, 22, 20]
@@ -0,0 +1,85 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from app.services.catalog import CatalogSnapshot, ProductFilter
+from app.services.trending import TrendingCounters
+
+recommender = pytest.importorskip("app.ml.recommender")
+
+PRODUCT_IDS = np.arange(1, 31)
+RECENT = [4, 11]
+
+@pytest.fixture
+def models(tmp_path, monkeypatch):
+    rng = np.random.default_rng(3)
+    items = {pid: rng.standard_normal(4) for pid in PRODUCT_IDS.tolist()}
+    vectors = {pid: rng.standard_normal(6) for pid in PRODUCT_IDS.tolist()}
+    with open(tmp_path / "cf_model.pkl", "wb") as f:
+        pickle.dump({"user_factors": {1: rng.standard_normal(4)}, "item_factors": items, "global_mean": 0.0}, f)
+    with open(tmp_path / "cb_model.pkl", "wb") as f:
+        pickle.dump({"product_vectors": vectors, "similarity_matrix": {}}, f)
+    cf = recommender.CollaborativeFilteringModel(str(tmp_path / "cf_model.pkl"))
+    cb = recommender.ContentBasedModel(str(tmp_path / "cb_model.pkl"))
+    cf.ann = cb.ann = None
+
+    trending = TrendingCounters(use_redis=False, path=str(tmp_path / "trending.json"), half_life=3600)
+    trending.record_batch([(pid, "purchase") for pid in (2, 4, 4, 17, 23, 23, 23)])
+    trending.publish()
+    monkeypatch.setattr(recommender, "trending_counters", trending)
+    return cf, cb, items, vectors, trending
+
+def _catalog():
+    # Every fifth product is out of stock; prices equal the IDs
+    return CatalogSnapshot(PRODUCT_IDS, PRODUCT_IDS.astype(np.float32), (PRODUCT_IDS % 5 != 0).astype(np.int32),
+                           np.zeros(len(PRODUCT_IDS) + 1, dtype=np.int64), np.empty(0, dtype=np.int32))
+
+def _scaled(values):
+    peak = values.max()
+    return values / peak if peak > 0 else values
+
+def _reference(items, vectors, trending, user_vector, candidates):
+    """The documented blend, computed directly over every candidate"""
+    raw = np.array([items[pid] @ user_vector for pid in candidates])
+    cf = (raw - raw.min()) / (raw.max() - raw.min())
+
+    def cosine(a, b):
+        return vectors[a] @ vectors[b] / (np.linalg.norm(vectors[a]) * np.linalg.norm(vectors[b]))
+
+    # A product is not its own neighbour, and only positive similarities count
+    content = _scaled(np.array([max([cosine(pid, r) for r in RECENT if r != pid] + [0.0]) for pid in candidates]))
+    counters = dict(trending.top(100))
+    popularity = _scaled(np.array([counters.get(pid, 0.0) for pid in candidates]))
+
+    settings = recommender.settings
+    blended = (settings.HYBRID_CF_WEIGHT * cf + settings.HYBRID_CONTENT_WEIGHT * content
+               + settings.HYBRID_POPULARITY_WEIGHT * popularity)
+    return sorted(zip(candidates, blended), key=lambda pair: pair[1], reverse=True)
+
+@pytest.mark.parametrize("filters", [recommender.IN_STOCK, ProductFilter(max_price=20)])
+def test_hybrid_blends_every_source_over_the_allowed_candidates(models, filters):
+    cf, cb, items, vectors, trending = models
+    catalog = _catalog()
+    candidates = [pid for pid in PRODUCT_IDS.tolist() if filters.allows(catalog, np.array([pid]))[0]]
+
+    result = recommender._score_hybrid(cf, cb, catalog, 1, RECENT, 8, filters)
+
+    expected = _reference(items, vectors, trending, cf._user_vector(1), candidates)[:8]
+    assert [pid for pid, _ in result] == [pid for pid, _ in expected]
+    assert [score for _, score in result] == pytest.approx([score for _, score in expected], rel=1e-4)
+
+def test_hybrid_without_user_factors_or_content_weight_ranks_by_popularity(models, monkeypatch):
+    cf, cb, _, _, _ = models
+    monkeypatch.setattr(recommender.settings, "HYBRID_CONTENT_WEIGHT", 0.0)
+
+    result = recommender._score_hybrid(cf, cb, _catalog(), 99, RECENT, 3)
+
+    # Only trending counters are left: 23 (x3), 4 (x2), then 2 and 17
+    assert [pid for pid, _ in result][:2] == [23, 4]
+    assert result[0][1] == pytest.approx(recommender.settings.HYBRID_POPULARITY_WEIGHT)
+
+def test_hybrid_with_nothing_allowed_is_empty(models):
+    cf, cb, _, _, _ = models
+
+    assert recommender._score_hybrid(cf, cb, _catalog(), 1, RECENT, 5, ProductFilter(max_price=0.5)) == []
@@ -0,0 +1,149 @@
+import asyncio
+from datetime import date, datetime
+
+import httpx
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from app.services import ingestion
+from app.services.ingestion import EventIngestor
+
+class RecordingProducer:
+    """EventProducer stand-in keeping what send_events was given"""
+
+    def __init__(self):
+        self.sent = []
+        self.flushed = 0
+
+    def send_events(self, events):
+        self.sent.extend(events)
+        return len(events)
+
+    def flush(self, timeout=None):
+        self.flushed += 1
+
+@pytest.fixture
+def producer():
+    return RecordingProducer()
+
+def _event(user_id=1, product_id=None, event_type="view", **extra):
+    return {"user_id": user_id, "product_id": product_id, "event_type": event_type, "session_id": "s",
+            "metadata": {"device": "mobile"}, **extra}
+
+def _stored(db):
+    from app.models.user_event import UserEvent
+
+    return sorted((event.user_id, event.event_type) for event in db.query(UserEvent).all())
+
+def test_submit_timestamps_events_without_one(producer):
+    ingestor = EventIngestor(max_size=10, producer=producer)
+    ingestor._accepting = True
+    given = datetime(2024, 1, 2, 3, 4, 5)
+    events = [_event(), _event(timestamp=None), _event(timestamp=given)]
+
+    assert all(ingestor.submit(event) for event in events)
+
+    assert all(isinstance(event["timestamp"], datetime) for event in events)
+    assert events[2]["timestamp"] == given
+
+def test_full_queue_and_stopped_ingestor_refuse_events(producer):
+    ingestor = EventIngestor(max_size=2, producer=producer)
+    assert not ingestor.submit(_event())
+
+    ingestor._accepting = True
+    assert [ingestor.submit(_event()) for _ in range(3)] == [True, True, False]
+
+    stats = ingestor.stats()
+    assert (stats["queued"], stats["accepted"], stats["rejected"]) == (2, 2, 1)
+
+def test_flush_writes_one_batch_and_publishes_it(db, producer):
+    ingestor = EventIngestor(producer=producer)
+    batch = [_event(1, timestamp=datetime(2024, 1, 1)), _event(2, event_type="purchase", timestamp=datetime(2024, 1, 2))]
+
+    ingestor.flush(batch)
+
+    assert _stored(db) == [(1, "view"), (2, "purchase")]
+    assert [(event_type, key) for event_type, _, key in producer.sent] == [("view", "1"), ("purchase", "2")]
+    assert producer.sent[0][1]["timestamp"] == "2024-01-01T00:00:00"
+    assert producer.sent[0][1]["metadata"] == {"device": "mobile"}
+    assert ingestor.stats()["written"] == 2
+
+def test_rejected_rows_do_not_lose_the_rest_of_the_batch(db, producer):
+    ingestor = EventIngestor(producer=producer)
+    now = datetime.now()
+
+    ingestor.flush([_event(1, timestamp=now), _event(2, event_type=None, timestamp=now), _event(3, timestamp=now)])
+
+    assert _stored(db) == [(1, "view"), (3, "view")]
+    assert [key for _, _, key in producer.sent] == ["1", "3"]
+    assert (ingestor.stats()["written"], ingestor.stats()["invalid"]) == (2, 1)
+
+def test_row_that_cannot_be_published_does_not_lose_the_others(producer, monkeypatch, caplog):
+    class Unformattable:
+        def isoformat(self):
+            raise ValueError("no timestamp")
+
+    ingestor = EventIngestor(producer=producer)
+    monkeypatch.setattr(ingestor, "_write", lambda rows, timer: rows)
+
+    ingestor.flush([_event(1, timestamp=Unformattable()), _event(2, timestamp=date(2024, 1, 1)),
+                    _event(3, timestamp="2024-01-01T00:00:00")])
+
+    assert [(key, data["timestamp"]) for _, data, key in producer.sent] == [
+        ("2", "2024-01-01"), ("3", "2024-01-01T00:00:00")]
+    assert "Not publishing event for user 1" in caplog.text
+
+def test_stop_drains_the_queue(db, producer):
+    ingestor = EventIngestor(max_size=100, batch_size=7, flush_interval=0.01, drain_timeout=5, producer=producer)
+    ingestor.start()
+    for user_id in range(20):
+        assert ingestor.submit(_event(user_id))
+
+    ingestor.stop()
+
+    assert len(_stored(db)) == 20
+    assert len(producer.sent) == 20
+    assert producer.flushed == 1
+    assert not ingestor.submit(_event())
+    assert ingestor.stats()["dropped"] == 0
+
+def test_events_left_when_the_database_stays_down_are_dropped(producer, monkeypatch):
+    def unavailable(rows):
+        raise OperationalError("INSERT", {}, Exception("connection refused"))
+
+    monkeypatch.setattr(ingestion, "RETRY_BACKOFF_SECONDS", 0.01)
+    ingestor = EventIngestor(max_size=100, batch_size=5, flush_interval=0.01, drain_timeout=0.2, producer=producer)
+    monkeypatch.setattr(ingestor, "_insert", unavailable)
+    ingestor.start()
+    for user_id in range(12):
+        assert ingestor.submit(_event(user_id))
+
+    ingestor.stop()
+
+    assert ingestor.stats()["dropped"] == 12
+    assert producer.sent == []
+
+def test_buffered_endpoint_answers_202_then_429(producer, monkeypatch):
+    endpoints = pytest.importorskip("app.api.endpoints.recommendation")
+    from fastapi import FastAPI
+
+    ingestor = EventIngestor(max_size=1, producer=producer)
+    ingestor._accepting = True
+    monkeypatch.setattr(endpoints, "event_ingestor", ingestor)
+    monkeypatch.setattr(endpoints.settings, "EVENT_INGESTION_BUFFERED", True)
+    app = FastAPI()
+    app.include_router(endpoints.router, prefix="/recommendations")
+    app.dependency_overrides[endpoints.get_db] = lambda: None
+    body = {"user_id": 1, "product_id": 2, "event_type": "view", "session_id": "s"}
+
+    async def post(*bodies):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return [await client.post("/recommendations/event/", json=b) for b in bodies]
+
+    accepted, refused, incomplete = asyncio.run(post(body, body, {**body, "session_id": ""}))
+
+    assert accepted.status_code == 202
+    assert refused.status_code == 429
+    assert refused.headers["Retry-After"] == "1"
+    assert incomplete.status_code == 422
+    assert ingestor.queue.get_nowait()["timestamp"] is not None
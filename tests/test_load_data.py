@@ -0,0 +1,141 @@
+import gzip
+import json
+import os
+
+import pytest
+
+from app.scripts.load_data import BulkLoader, IdMap, read_rows
+
+def _write_jsonl(path, records, compress=False):
+    opener = gzip.open if compress else open
+    with opener(path, "wt") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+    return str(path)
+
+def _write_csv(path, text):
+    path.write_text(text)
+    return str(path)
+
+@pytest.fixture
+def files(tmp_path):
+    return {
+        "categories": _write_csv(tmp_path / "categories.csv",
+                                 "id,name,description\nC1,Shoes,\nC2,Books,paper\nC3,,no name\n"),
+        "products": _write_jsonl(tmp_path / "products.jsonl", [
+            {"id": "P1", "name": "runner", "price": "59.5", "stock": 3, "categories": ["C1"]},
+            {"id": "P2", "name": "novel", "price": 12, "categories": ["C2", "C9"]},
+            {"id": "P3", "name": "broken", "price": "n/a"},
+        ]),
+        "users": _write_csv(tmp_path / "users.csv",
+                            "id,email,username,hashed_password,is_active\n"
+                            "U1,a@x.com,a,h,true\nU2,b@x.com,b,h,no\nU3,,c,h,true\n"),
+        "events": _write_jsonl(tmp_path / "events.jsonl.gz", [
+            {"user_id": "U1", "product_id": "P1", "event_type": "view", "session_id": "s",
+             "timestamp": "2024-01-02T03:04:05Z", "metadata": '{"device": "mobile"}'},
+            {"user_id": "U2", "product_id": "P2", "event_type": "purchase", "session_id": "s",
+             "timestamp": 1704164645000},
+            {"user_id": "U2", "product_id": None, "event_type": "search", "session_id": "s"},
+            {"user_id": "U9", "product_id": "P1", "event_type": "view", "session_id": "s"},
+            {"user_id": "U1", "product_id": "P7", "event_type": "view", "session_id": "s"},
+            {"user_id": "U1", "product_id": "P1", "event_type": "view", "session_id": "s", "timestamp": "yesterday"},
+        ], compress=True),
+    }
+
+def _load_all(loader, files):
+    loader.load_categories(files["categories"])
+    loader.load_products(files["products"])
+    loader.load_users(files["users"])
+    loader.load_events(files["events"])
+
+def test_files_are_loaded_with_remapped_ids(db, files, tmp_path):
+    from app.models.product import Product
+    from app.models.user import User
+    from app.models.user_event import UserEvent
+
+    # An existing product: loaded rows get IDs after it
+    db.add(Product(id=1, name="existing", price=1.0))
+    db.commit()
+    id_map = IdMap(str(tmp_path / "maps" / "ids.json"))
+
+    _load_all(BulkLoader(id_map, chunk_size=2), files)
+
+    assert id_map.ids["products"] == {"P1": 2, "P2": 3}
+    assert set(id_map.ids["categories"]) == {"C1", "C2"}
+    runner = db.get(Product, 2)
+    assert (runner.price, runner.stock) == (59.5, 3)
+    assert [c.name for c in runner.categories] == ["Shoes"]
+    # The unknown category C9 is dropped from the product's links
+    assert [c.name for c in db.get(Product, 3).categories] == ["Books"]
+    assert [(u.email, u.is_active) for u in db.query(User).order_by(User.id)] == [("a@x.com", True), ("b@x.com", False)]
+
+    events = db.query(UserEvent).order_by(UserEvent.id).all()
+    users = id_map.ids["users"]
+    assert [(e.user_id, e.product_id, e.event_type) for e in events] == [
+        (users["U1"], 2, "view"), (users["U2"], 3, "purchase"), (users["U2"], None, "search")]
+    assert events[0].metadata == {"device": "mobile"}
+    assert events[1].timestamp.year == 2024
+
+    with open(tmp_path / "maps" / "ids.json") as f:
+        assert json.load(f) == id_map.ids
+
+def test_rerun_skips_rows_already_in_the_map(db, files, tmp_path):
+    from app.models.product import Product
+
+    path = str(tmp_path / "ids.json")
+    BulkLoader(IdMap(path)).load_products(files["products"])
+
+    loader = BulkLoader(IdMap(path))
+    loader.load_products(files["products"])
+
+    assert db.query(Product).count() == 2
+    assert loader.results["products"]["rows"] == 0
+    assert loader.results["products"]["skipped"] == 3
+
+def test_map_keeps_only_ids_of_written_chunks(db, files, tmp_path, monkeypatch):
+    path = str(tmp_path / "ids.json")
+    loader = BulkLoader(IdMap(path), chunk_size=1)
+    write = loader.writer.write
+    calls = []
+
+    def fail_on_second_chunk(table, columns, rows):
+        calls.append(rows)
+        if len(calls) == 2:
+            raise RuntimeError("connection lost")
+        write(table, columns, rows)
+
+    monkeypatch.setattr(loader.writer, "write", fail_on_second_chunk)
+
+    with pytest.raises(RuntimeError):
+        loader.load_users(files["users"])
+
+    assert list(IdMap(path).ids["users"]) == ["U1"]
+
+def test_without_remap_file_ids_are_database_ids(db, tmp_path):
+    from app.models.product import Product
+
+    products = _write_jsonl(tmp_path / "products.jsonl", [{"id": 40, "name": "a", "price": 1.0},
+                                                         {"id": "41", "name": "b", "price": 2.0}])
+
+    BulkLoader(IdMap(), remap=False).load_products(products)
+
+    assert [p.id for p in db.query(Product).order_by(Product.id)] == [40, 41]
+
+def test_read_rows_streams_chunks(tmp_path):
+    path = _write_csv(tmp_path / "rows.csv", "a\n" + "".join(f"{n}\n" for n in range(5)))
+
+    assert [[row["a"] for row in chunk] for chunk in read_rows(path, chunk_size=2)] == [["0", "1"], ["2", "3"], ["4"]]
+    with pytest.raises(ValueError):
+        next(read_rows(_write_csv(tmp_path / "rows.xml", "<rows/>")))
+
+def test_id_map_round_trip_leaves_no_temporary_file(tmp_path):
+    path = str(tmp_path / "ids.json")
+    id_map = IdMap(path)
+    id_map.table("users")["U1"] = 7
+
+    id_map.save()
+
+    assert IdMap(path).ids == {"users": {"U1": 7}}
+    assert os.listdir(tmp_path) == ["ids.json"]
+    # Without a path the map lives for one run only
+    IdMap().save()
@@ -0,0 +1,62 @@
+import pytest
+from prometheus_client import REGISTRY
+
+from app.core import metrics
+from app.core.metrics import RequestTimer, render_metrics
+
+def _count(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+def test_stages_are_recorded_on_the_primary_path_until_fallback():
+    before = {
+        "score": _count("recommendation_stage_seconds_count", operation="test_op", stage="score", path="primary"),
+        "trending": _count("recommendation_stage_seconds_count", operation="test_op", stage="trending", path="fallback"),
+        "request": _count("recommendation_request_seconds_count", operation="test_op", outcome="fallback"),
+        "fallback": _count("recommendation_fallbacks_total", operation="test_op", reason="TimeoutError"),
+    }
+
+    with RequestTimer("test_op") as timer:
+        with timer.stage("score"):
+            pass
+        timer.fallback(TimeoutError())
+        with timer.stage("trending"):
+            pass
+
+    assert _count("recommendation_stage_seconds_count", operation="test_op", stage="score",
+                  path="primary") == before["score"] + 1
+    assert _count("recommendation_stage_seconds_count", operation="test_op", stage="trending",
+                  path="fallback") == before["trending"] + 1
+    assert _count("recommendation_request_seconds_count", operation="test_op",
+                  outcome="fallback") == before["request"] + 1
+    assert _count("recommendation_fallbacks_total", operation="test_op",
+                  reason="TimeoutError") == before["fallback"] + 1
+
+def test_escaping_exception_is_an_error_outcome():
+    before = _count("recommendation_request_seconds_count", operation="test_error", outcome="error")
+
+    with pytest.raises(ValueError):
+        with RequestTimer("test_error"):
+            raise ValueError("boom")
+
+    assert _count("recommendation_request_seconds_count", operation="test_error", outcome="error") == before + 1
+
+def test_disabled_metrics_record_nothing(monkeypatch):
+    monkeypatch.setattr(metrics.settings, "METRICS_ENABLED", False)
+
+    with RequestTimer("test_disabled") as timer:
+        with timer.stage("score"):
+            pass
+        timer.fallback(reason="manual")
+
+    assert _count("recommendation_request_seconds_count", operation="test_disabled", outcome="fallback") == 0
+    assert _count("recommendation_fallbacks_total", operation="test_disabled", reason="manual") == 0
+
+def test_render_metrics_exposes_the_histograms(monkeypatch):
+    monkeypatch.delenv("PROMETHEUS_MULTIPROC_DIR", raising=False)
+    with RequestTimer("test_render"):
+        pass
+
+    body, content_type = render_metrics()
+
+    assert content_type.startswith("text/plain")
+    assert b'recommendation_request_seconds_bucket{le="0.00025",operation="test_render",outcome="primary"}' in body
@@ -0,0 +1,87 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from app.ml.neighbors import (
+    NO_NEIGHBOR,
+    build_model_index,
+    build_neighbor_index,
+    index_from_similarity_matrix,
+    stack_vectors,
+)
+
+def _cosine_neighbours(product_ids, vectors, top_n):
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    similarities = normalized @ normalized.T
+    np.fill_diagonal(similarities, -np.inf)
+    return [product_ids[np.argsort(-row, kind="stable")[:top_n]].tolist() for row in similarities]
+
+@pytest.fixture
+def catalog():
+    rng = np.random.default_rng(0)
+    return np.arange(10, 110, dtype=np.int64), rng.standard_normal((100, 16)).astype(np.float32)
+
+def test_stack_vectors_sorts_by_id():
+    ids, matrix = stack_vectors({3: np.ones(2), 1: np.zeros(2), 2: np.full(2, 2.0)})
+
+    assert ids.tolist() == [1, 2, 3]
+    assert matrix.dtype == np.float32
+    assert matrix[:, 0].tolist() == [0.0, 2.0, 1.0]
+    assert stack_vectors({})[0].size == 0
+
+@pytest.mark.parametrize("block_size", [7, 1024])
+def test_neighbour_index_matches_exact_cosine(catalog, block_size):
+    product_ids, vectors = catalog
+
+    neighbor_ids, neighbor_scores = build_neighbor_index(product_ids, vectors, top_n=5, block_size=block_size)
+
+    assert neighbor_ids.shape == neighbor_scores.shape == (100, 5)
+    assert neighbor_ids.tolist() == _cosine_neighbours(product_ids, vectors, 5)
+    assert (np.diff(neighbor_scores, axis=1) <= 0).all()
+    assert not (neighbor_ids == product_ids[:, None]).any()
+
+def test_neighbour_index_pads_small_catalogs():
+    product_ids = np.array([1, 2, 3])
+    vectors = np.array([[1.0, 0.0], [0.9, 0.1], [0.0, 0.0]], dtype=np.float32)
+
+    neighbor_ids, neighbor_scores = build_neighbor_index(product_ids, vectors, top_n=4)
+
+    assert neighbor_ids[0].tolist() == [2, 3, NO_NEIGHBOR, NO_NEIGHBOR]
+    assert np.isneginf(neighbor_scores[:, 2:]).all()
+    # A zero vector has similarity 0 to everything, not NaN
+    assert not np.isnan(neighbor_scores).any()
+
+def test_index_from_legacy_similarity_matrix():
+    matrix = {2: {1: 0.2, 2: 1.0, 3: 0.9}, 1: {2: 0.2, 3: 0.5}, 3: {}}
+
+    product_ids, neighbor_ids, neighbor_scores = index_from_similarity_matrix(matrix, top_n=2)
+
+    assert product_ids.tolist() == [1, 2, 3]
+    assert neighbor_ids.tolist() == [[3, 2], [3, 1], [NO_NEIGHBOR, NO_NEIGHBOR]]
+    assert neighbor_scores[1].tolist() == pytest.approx([0.9, 0.2])
+
+def test_build_model_index_replaces_similarity_matrix_and_keeps_other_keys():
+    model = build_model_index({"product_vectors": {2: np.array([1.0, 0.0]), 1: np.array([0.0, 1.0])},
+                               "similarity_matrix": {}, "version": "v1"}, top_n=3)
+
+    assert "similarity_matrix" not in model
+    assert model["version"] == "v1"
+    assert model["product_ids"].tolist() == [1, 2]
+    assert model["neighbor_ids"].tolist() == [[2, NO_NEIGHBOR, NO_NEIGHBOR], [1, NO_NEIGHBOR, NO_NEIGHBOR]]
+
+def test_find_similar_slices_the_precomputed_row(tmp_path, catalog):
+    recommender = pytest.importorskip("app.ml.recommender")
+    product_ids, vectors = catalog
+    path = tmp_path / "cb_model.pkl"
+    with open(path, "wb") as f:
+        pickle.dump({"product_vectors": dict(zip(product_ids.tolist(), vectors)), "similarity_matrix": {}}, f)
+
+    cb = recommender.ContentBasedModel(str(path))
+    cb.ann = None
+
+    expected = _cosine_neighbours(product_ids, vectors, 5)[0]
+    assert [pid for pid, _ in cb.find_similar(10, limit=5)] == expected
+    assert len(cb.find_similar(10, limit=3)) == 3
+    # Unknown products get a random sample instead of an error
+    assert len(cb.find_similar(10_000, limit=4)) == 4
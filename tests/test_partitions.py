@@ -0,0 +1,47 @@
+from datetime import date
+
+from app.db import partitions
+from app.db.partitions import add_months, expired_partitions, month_start, partition_name
+
+class RecordingConnection:
+    """Connection stand-in that records executed statements"""
+
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, statement, parameters=None):
+        self.statements.append(str(statement))
+
+def _existing(monkeypatch, *months):
+    monkeypatch.setattr(partitions, "existing_partitions",
+                        lambda connection: {month: partition_name(month) for month in months})
+
+def test_month_arithmetic_crosses_years():
+    assert month_start(date(2024, 2, 29)) == date(2024, 2, 1)
+    assert add_months(date(2024, 11, 1), 2) == date(2025, 1, 1)
+    assert add_months(date(2024, 1, 1), -1) == date(2023, 12, 1)
+    assert partition_name(date(2024, 3, 1)) == "user_events_y2024m03"
+
+def test_ensure_partitions_creates_only_missing_months(monkeypatch):
+    _existing(monkeypatch, date(2024, 12, 1))
+    connection = RecordingConnection()
+
+    created = partitions.ensure_partitions(connection, date(2024, 11, 15), date(2025, 1, 1))
+
+    assert created == ["user_events_y2024m11", "user_events_y2025m01"]
+    assert connection.statements[0] == (
+        "CREATE TABLE user_events_y2024m11 PARTITION OF user_events "
+        "FOR VALUES FROM ('2024-11-01') TO ('2024-12-01')")
+    assert len(connection.statements) == 2
+
+def test_expired_partitions_need_the_whole_month_past_the_cutoff(monkeypatch):
+    _existing(monkeypatch, date(2024, 3, 1), date(2024, 1, 1), date(2024, 2, 1))
+
+    # Cut-off 2024-03-01: February ends exactly on it, March does not
+    expired = expired_partitions(None, retention_days=10, today=date(2024, 3, 11))
+
+    assert expired == ["user_events_y2024m01", "user_events_y2024m02"]
+
+def test_maintenance_skips_tables_that_are_not_partitioned():
+    # The test database is SQLite, which has no partitioned tables
+    assert partitions.run_maintenance(retention_days=1, ahead=1) == {"created": [], "dropped": []}
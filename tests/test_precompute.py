@@ -0,0 +1,95 @@
+import pickle
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from app.db.session import engine
+from app.ml import precompute
+
+def _rows(db, algorithm="collaborative"):
+    from app.models.recommendation import Recommendation
+
+    rows = db.query(Recommendation).filter(Recommendation.algorithm == algorithm).all()
+    return sorted((row.user_id, row.product_id) for row in rows)
+
+def test_active_user_ids_only_counts_the_window(db):
+    from app.models.user_event import UserEvent
+
+    now = datetime.now()
+    db.add_all([UserEvent(user_id=1, product_id=1, event_type="view", session_id="s", timestamp=now),
+                UserEvent(user_id=1, product_id=2, event_type="view", session_id="s", timestamp=now),
+                UserEvent(user_id=2, product_id=1, event_type="view", session_id="s", timestamp=now - timedelta(days=40))])
+    db.commit()
+
+    assert precompute.active_user_ids(db, days=30) == [1]
+    assert sorted(precompute.active_user_ids(db, days=60)) == [1, 2]
+
+def test_replace_in_place_keeps_other_algorithms_and_fresh_rows(db):
+    from app.models.recommendation import Recommendation
+
+    started = datetime.now()
+    db.add_all([Recommendation(user_id=1, product_id=10, score=1.0, algorithm="collaborative",
+                               created_at=started - timedelta(hours=1)),
+                # Written by the event consumer while the job was running
+                Recommendation(user_id=2, product_id=20, score=1.0, algorithm="collaborative",
+                               created_at=started + timedelta(seconds=1)),
+                Recommendation(user_id=1, product_id=30, score=1.0, algorithm="content",
+                               created_at=started - timedelta(hours=1))])
+    db.commit()
+    new_rows = [(1, 11, 0.9, "collaborative", started), (1, 12, 0.8, "collaborative", started),
+                (2, 21, 0.7, "collaborative", started)]
+
+    with engine.begin() as connection:
+        precompute._replace_in_place(connection, new_rows, started)
+
+    assert _rows(db) == [(1, 11), (1, 12), (2, 20)]
+    assert _rows(db, "content") == [(1, 30)]
+
+def test_precompute_writes_top_k_of_in_stock_products(db, tmp_path, monkeypatch):
+    recommender = pytest.importorskip("app.ml.recommender")
+    from app.models.product import Product
+    from app.models.user_event import UserEvent
+    from app.services.catalog import ProductCatalog
+
+    rng = np.random.default_rng(0)
+    items = {pid: rng.standard_normal(4) for pid in range(1, 31)}
+    users = {1: rng.standard_normal(4), 2: rng.standard_normal(4)}
+    # Pool workers are spawned and read MODEL_PATH from the environment
+    monkeypatch.setenv("MODEL_PATH", str(tmp_path))
+    with open(tmp_path / "cf_model.pkl", "wb") as f:
+        pickle.dump({"user_factors": users, "item_factors": items, "global_mean": 0.0}, f)
+    db.add_all([Product(id=pid, name=str(pid), price=1.0, stock=0 if pid % 5 == 0 else 1) for pid in items])
+    db.add_all([UserEvent(user_id=user_id, product_id=1, event_type="view", session_id="s") for user_id in (1, 2, 3)])
+    db.commit()
+    monkeypatch.setattr(precompute, "product_catalog", ProductCatalog())
+
+    written = precompute.precompute(workers=1, chunk_size=2, top_k=5)
+
+    assert written == 10
+    model = recommender.CollaborativeFilteringModel(str(tmp_path / "cf_model.pkl"))
+    for user_id in (1, 2):
+        expected = [pid for pid, _ in model.top_k(user_id, 30) if pid % 5][:5]
+        assert [pid for uid, pid in _rows(db) if uid == user_id] == sorted(expected)
+
+def test_stored_rows_are_used_only_for_full_pages_within_the_stored_depth(db, monkeypatch):
+    recommender = pytest.importorskip("app.ml.recommender")
+    from app.models.product import Product
+    from app.models.recommendation import Recommendation
+
+    monkeypatch.setattr(recommender.settings, "PRECOMPUTED_ENABLED", True)
+    monkeypatch.setattr(recommender.settings, "RECOMMENDATIONS_PER_USER", 3)
+    db.add_all([Product(id=pid, name=str(pid), price=1.0, stock=0 if pid == 2 else 1) for pid in range(1, 5)])
+    db.add_all([Recommendation(user_id=7, product_id=pid, score=score, algorithm="collaborative")
+                for pid, score in [(1, 0.5), (2, 0.9), (3, 0.7), (4, 0.1)]])
+    db.commit()
+
+    stored = db.execute(recommender._stored_query(7, 3).with_only_columns(Product.id)).scalars().all()
+
+    # Out-of-stock product 2 is filtered in SQL
+    assert stored == [3, 1, 4]
+    assert recommender._stored_is_enough(stored, 3)
+    assert not recommender._stored_is_enough(stored[:2], 3)
+    assert recommender._uses_stored(None, 3) and recommender._uses_stored("Collaborative", 3)
+    assert not recommender._uses_stored(None, 4)
+    assert not recommender._uses_stored("content", 3)
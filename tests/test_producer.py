@@ -0,0 +1,117 @@
+import json
+from collections import namedtuple
+
+import pytest
+from kafka.errors import KafkaTimeoutError
+from kafka.future import Future
+
+from app.kafka.producer import EventProducer
+from app.kafka.spool import EventSpool
+
+RecordMetadata = namedtuple("RecordMetadata", ["topic", "partition", "offset"])
+
+class PendingProducer:
+    """KafkaProducer stand-in whose sends stay pending until the test resolves them"""
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, topic, key=None, value=None):
+        future = Future()
+        self.sent.append((topic, key, value, future))
+        return future
+
+    def flush(self, timeout=None):
+        pass
+
+@pytest.fixture
+def spool(tmp_path):
+    return EventSpool(str(tmp_path / "spool" / "events.jsonl"), max_bytes=1024 * 1024)
+
+def _spooled(spool):
+    with open(spool.path) as f:
+        return [json.loads(line) for line in f]
+
+def test_delivery_failure_spools_the_event(spool):
+    client = PendingProducer()
+    producer = EventProducer(async_send=True, producer=client, spool=spool)
+
+    assert producer.send_event("view", {"user_id": 1, "product_id": 7}, key="1")
+    client.sent[0][3].failure(KafkaTimeoutError("Batch expired"))
+
+    assert producer.failed == 1
+    [event] = _spooled(spool)
+    assert event["key"] == "1"
+    assert event["payload"]["event_type"] == "view"
+    assert event["payload"]["data"] == {"user_id": 1, "product_id": 7}
+
+def test_delivery_success_counts_and_replays_the_spool(spool, monkeypatch):
+    spool.append({"payload": {"event_type": "view", "data": {"product_id": 1}}, "key": None})
+    client = PendingProducer()
+    producer = EventProducer(async_send=True, producer=client, spool=spool)
+    replays = []
+    monkeypatch.setattr(producer, "_replay_spool", lambda: replays.append(True))
+
+    producer.send_event("purchase", {"user_id": 2, "product_id": 3}, key="2")
+    client.sent[0][3].success(RecordMetadata("user-events", 0, 41))
+
+    assert producer.delivered == 1
+    assert replays == [True]
+
+def test_send_events_publishes_a_batch_and_spools_failures(spool):
+    client = PendingProducer()
+    producer = EventProducer(async_send=True, producer=client, spool=spool)
+
+    sent = producer.send_events([("view", {"product_id": 1}, "1"), ("cart_add", {"product_id": 2}, None)])
+    client.sent[1][3].failure(KafkaTimeoutError())
+
+    assert sent == 2
+    assert [value["event_type"] for _, _, value, _ in client.sent] == ["view", "cart_add"]
+    assert [event["payload"]["data"] for event in _spooled(spool)] == [{"product_id": 2}]
+
+def test_disconnected_async_producer_spools(spool, monkeypatch):
+    producer = EventProducer(async_send=True, producer=PendingProducer(), spool=spool)
+    producer.connected = False
+    monkeypatch.setattr(producer, "_ensure_connected", lambda: False)
+
+    assert producer.send_event("view", {"product_id": 5})
+    assert producer.send_events([("view", {"product_id": 6}, None)]) == 0
+
+    assert [event["payload"]["data"]["product_id"] for event in _spooled(spool)] == [5, 6]
+
+def test_spool_drops_events_past_max_bytes(tmp_path):
+    spool = EventSpool(str(tmp_path / "events.jsonl"), max_bytes=60)
+
+    assert spool.append({"payload": {"n": 1}, "key": None})
+    assert not spool.append({"payload": {"n": 2, "padding": "x" * 40}, "key": None})
+    assert spool.dropped == 1
+
+def test_spool_replay_sends_in_order_and_skips_corrupt_lines(spool):
+    for n in range(3):
+        spool.append({"payload": {"n": n}, "key": None})
+    with open(spool.path, "a") as f:
+        f.write("{not json\n")
+
+    replayed = []
+    assert spool.replay(lambda event: replayed.append(event["payload"]["n"])) == 3
+
+    assert replayed == [0, 1, 2]
+    assert not spool.has_events()
+    assert spool.replay(replayed.append) == 0
+
+def test_failed_replay_keeps_events_for_the_next_one(spool):
+    spool.append({"payload": {"n": 0}, "key": None})
+
+    def broken(event):
+        raise ConnectionError("broker went away")
+
+    with pytest.raises(ConnectionError):
+        spool.replay(broken)
+    spool.append({"payload": {"n": 1}, "key": None})
+
+    replayed = []
+    spool.replay(lambda event: replayed.append(event["payload"]["n"]))
+    # The interrupted replay is finished first; events spooled meanwhile wait for the next replay
+    assert replayed == [0]
+    spool.replay(lambda event: replayed.append(event["payload"]["n"]))
+    assert replayed == [0, 1]
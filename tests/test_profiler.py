@@ -0,0 +1,96 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from sqlalchemy import create_engine, text
+
+from app.db import profiler
+from app.db.profiler import QueryProfilerMiddleware, profile_queries, statement_shape
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiler.settings, "DB_N_PLUS_ONE_THRESHOLD", 3)
+    monkeypatch.setattr(profiler.settings, "DB_SLOW_QUERY_MS", 10_000)
+    # A file, so the threadpool running sync endpoints sees the same database
+    engine = create_engine(f"sqlite:///{tmp_path / 'profile.db'}")
+    profiler.install(engine)
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE products (id INTEGER PRIMARY KEY, name TEXT)"))
+        connection.execute(text("INSERT INTO products (id, name) VALUES (1, 'a'), (2, 'b'), (3, 'c')"))
+    yield engine
+    engine.dispose()
+
+@pytest.mark.parametrize("statement, shape", [
+    ("SELECT *\n  FROM products\n WHERE id = ?", "SELECT * FROM products WHERE id = ?"),
+    ("SELECT * FROM products WHERE id IN (?, ?, ?)", "SELECT * FROM products WHERE id IN (?)"),
+    ("SELECT * FROM products WHERE id IN (%(id_1)s, %(id_2)s)", "SELECT * FROM products WHERE id IN (?)"),
+    ("INSERT INTO t (a, b) VALUES ($1, $2), ($3, $4)", "INSERT INTO t (a, b) VALUES (?)"),
+    ("SELECT * FROM t WHERE a = :a AND (b, c) IN ((1, 2))", "SELECT * FROM t WHERE a = :a AND (b, c) IN ((1, 2))"),
+])
+def test_statement_shape_collapses_placeholder_lists(statement, shape):
+    assert statement_shape(statement) == shape
+
+def test_repeated_statement_shape_is_reported_as_n_plus_one(engine, caplog):
+    with profile_queries("product page") as profile:
+        with engine.connect() as connection:
+            for product_id in (1, 2, 3):
+                connection.execute(text("SELECT name FROM products WHERE id = :id"), {"id": product_id})
+            connection.execute(text("SELECT count(*) FROM products"))
+
+    assert profile.count == 4
+    assert profile.seconds > 0
+    [(shape, executions)] = profile.n_plus_one()
+    assert executions == 3 and shape.startswith("SELECT name FROM products WHERE id =")
+    assert profile.headers()["X-DB-N-Plus-One"] == "1"
+    assert "Possible N+1 in product page" in caplog.text
+
+def test_statements_outside_a_profile_are_not_counted(engine):
+    with profile_queries("outer") as outer:
+        pass
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+
+    assert outer.count == 0
+    assert profiler.current_profile() is None
+
+def test_slow_queries_are_kept_and_logged(engine, monkeypatch, caplog):
+    monkeypatch.setattr(profiler.settings, "DB_SLOW_QUERY_MS", 0)
+
+    with profile_queries("report") as profile:
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+
+    assert [statement for _, statement, _ in profile.slow] == ["SELECT 1"]
+    assert "Slow query in report" in caplog.text
+
+def test_failed_statement_does_not_skew_the_next_timing(engine):
+    with profile_queries("errors") as profile:
+        with engine.connect() as connection:
+            with pytest.raises(Exception):
+                connection.execute(text("SELECT * FROM missing_table"))
+            connection.execute(text("SELECT 1"))
+            assert connection.info["query_start_time"] == []
+
+    assert profile.count == 1
+
+def test_middleware_adds_query_headers(engine):
+    app = FastAPI()
+    app.add_middleware(QueryProfilerMiddleware)
+
+    @app.get("/products")
+    def products():
+        with engine.connect() as connection:
+            return [connection.execute(text("SELECT name FROM products WHERE id = :id"), {"id": i}).scalar()
+                    for i in (1, 2, 3)]
+
+    async def get():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await client.get("/products")
+
+    response = asyncio.run(get())
+
+    assert response.json() == ["a", "b", "c"]
+    assert response.headers["X-DB-Query-Count"] == "3"
+    assert float(response.headers["X-DB-Time-Ms"]) > 0
+    assert response.headers["X-DB-N-Plus-One"] == "1"
@@ -0,0 +1,106 @@
+import os
+
+import numpy as np
+import pytest
+
+from app.ml import quantize
+from app.ml.artifacts import load_arrays, save_model
+from app.ml.quantize import QuantizedMatrix, candidate_depth, load_quantized, quantize_artifacts, reranks
+
+@pytest.fixture
+def matrix():
+    rng = np.random.default_rng(0)
+    matrix = rng.standard_normal((300, 16)).astype(np.float32)
+    matrix[7] = 0.0
+    return matrix
+
+@pytest.mark.parametrize("dtype, tolerance", [("float16", 1e-3), ("int8", 1 / 127)])
+def test_round_trip_stays_within_the_step_size(matrix, dtype, tolerance):
+    quantized = QuantizedMatrix.quantize(matrix, dtype, block_size=64)
+
+    restored = quantized.take(np.arange(len(matrix)))
+
+    peaks = np.abs(matrix).max(axis=1, keepdims=True)
+    assert quantized.dtype == dtype and quantized.shape == matrix.shape
+    assert (np.abs(restored - matrix) <= tolerance * np.maximum(peaks, 1e-6)).all()
+    assert not restored[7].any()
+
+def test_int8_stores_a_quarter_of_float32(matrix):
+    quantized = QuantizedMatrix.quantize(matrix, "int8")
+
+    assert quantized.codes.dtype == np.int8
+    assert quantized.nbytes == matrix.size + 4 * len(matrix)
+    assert quantized.scales[7] == 1.0
+    assert set(quantized.arrays("item_factors")) == {"item_factors_int8", "item_factors_int8_scale"}
+    assert set(QuantizedMatrix.quantize(matrix, "float16").arrays("item_factors")) == {"item_factors_float16"}
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_blocked_scores_and_norms_match_the_dequantized_matrix(matrix, dtype):
+    quantized = QuantizedMatrix.quantize(matrix, dtype)
+    restored = quantized.take(np.arange(len(matrix)))
+    queries = np.random.default_rng(1).standard_normal((3, 16)).astype(np.float32)
+
+    np.testing.assert_allclose(quantized.scores(queries[0], block_size=50), restored @ queries[0], rtol=1e-4, atol=1e-4)
+    np.testing.assert_allclose(quantized.scores(queries, block_size=50), queries @ restored.T, rtol=1e-4, atol=1e-4)
+    np.testing.assert_allclose(quantized.row_norms(block_size=50), np.linalg.norm(restored, axis=1), rtol=1e-5)
+
+def test_unknown_dtype_is_rejected(matrix):
+    with pytest.raises(ValueError):
+        QuantizedMatrix.quantize(matrix, "int4")
+
+def test_load_quantized_prefers_stored_codes(matrix, caplog):
+    stored = QuantizedMatrix.quantize(matrix, "int8")
+    model = {"item_factors": matrix, **stored.arrays("item_factors")}
+
+    loaded = load_quantized(model, "item_factors", "int8")
+    assert loaded.codes is stored.codes and loaded.scales is stored.scales
+
+    # Without a stored copy, or with one of another shape, the matrix is quantized at load time
+    assert load_quantized({"item_factors": matrix}, "item_factors", "float16").dtype == "float16"
+    stale = {"item_factors": matrix, **QuantizedMatrix.quantize(matrix[:10], "int8").arrays("item_factors")}
+    assert load_quantized(stale, "item_factors", "int8").shape == matrix.shape
+    assert "quantizing at load time" in caplog.text
+    assert load_quantized(model, "item_factors", "") is None
+    assert load_quantized(model, "item_factors", "int3") is None
+    assert load_quantized({"item_factors": np.empty((0, 4))}, "item_factors", "int8") is None
+
+def test_candidate_depth_follows_the_rerank_setting(matrix, monkeypatch):
+    quantized = QuantizedMatrix.quantize(matrix, "int8")
+    monkeypatch.setattr(quantize.settings, "QUANTIZED_RERANK", 4)
+
+    assert candidate_depth(quantized, 10) == 40 and reranks(quantized)
+    assert candidate_depth(None, 10) == 10 and not reranks(None)
+    monkeypatch.setattr(quantize.settings, "QUANTIZED_RERANK", 0)
+    assert candidate_depth(quantized, 10) == 10 and not reranks(quantized)
+
+def test_quantize_artifacts_adds_arrays_to_both_models(tmp_path, matrix):
+    directory = str(tmp_path / "v1")
+    save_model(os.path.join(directory, "cf"), {"item_ids": np.arange(300), "item_factors": matrix})
+    save_model(os.path.join(directory, "cb"), {"product_ids": np.arange(300), "product_vectors": matrix})
+
+    written = quantize_artifacts(directory, "int8")
+
+    assert sorted(written) == [os.path.join(directory, "cb"), os.path.join(directory, "cf")]
+    loaded = load_arrays(os.path.join(directory, "cf"))
+    assert loaded["item_factors_int8"].dtype == np.int8
+    assert load_quantized(loaded, "item_factors", "int8").codes.shape == matrix.shape
+    assert loaded["item_ids"].tolist() == list(range(300))
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_quantized_cf_scan_reranks_to_exact_scores(tmp_path, matrix, monkeypatch, dtype):
+    recommender = pytest.importorskip("app.ml.recommender")
+    monkeypatch.setattr(recommender.settings, "FACTOR_QUANTIZATION", dtype)
+    monkeypatch.setattr(recommender.settings, "QUANTIZED_RERANK", 4)
+    user = np.random.default_rng(2).standard_normal(16).astype(np.float32)
+    save_model(str(tmp_path / "cf"), {"user_ids": np.array([1]), "user_factors": user[None, :],
+                                      "item_ids": np.arange(100, 400), "item_factors": matrix, "global_mean": 0.0})
+    cf = recommender.CollaborativeFilteringModel(str(tmp_path / "cf"))
+    cf.ann = None
+
+    result = cf.top_k(1, 10)
+
+    assert cf.quantized is not None and cf.quantized.dtype == dtype
+    exact = matrix @ user
+    expected = np.argsort(-exact, kind="stable")[:10]
+    assert [pid for pid, _ in result] == (expected + 100).tolist()
+    np.testing.assert_allclose([score for _, score in result], exact[expected], rtol=1e-5)
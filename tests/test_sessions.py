@@ -0,0 +1,76 @@
+import fakeredis
+import pytest
+
+from app.services import sessions
+from app.services.sessions import SessionProfileStore
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(sessions.time, "time", clock)
+    return clock
+
+def _store(client=None, **kwargs):
+    options = {"max_profiles": 100, "ttl": 60, "max_items": 10, "half_life": 10.0}
+    options.update(kwargs)
+    return SessionProfileStore(client=client, use_redis=client is not None, **options)
+
+def test_weights_add_up_and_decay_with_the_half_life(clock):
+    store = _store()
+
+    store.record_batch({"s1": [(1, "view"), (2, "purchase"), (1, "view"), (3, "search")]})
+    assert store.get("s1") == {1: 2.0, 2: 5.0}
+
+    clock.now += 10
+    store.record("s1", 3, "cart_add")
+    assert store.get("s1") == {1: 1.0, 2: 2.5, 3: 3.0}
+
+def test_only_the_heaviest_items_are_kept(clock):
+    store = _store(max_items=2)
+
+    store.record_batch({"s1": [(1, "view"), (2, "purchase"), (3, "cart_add")]})
+
+    assert store.get("s1") == {2: 5.0, 3: 3.0}
+
+def test_idle_and_least_recently_updated_sessions_are_evicted(clock):
+    store = _store(max_profiles=2)
+    for session_id in ("a", "b", "c"):
+        store.record(session_id, 1, "view")
+        clock.now += 1
+
+    assert store.get("a") == {}
+    assert store.get("c")
+    assert store.evictions == 1
+
+    clock.now += 60
+    assert store.get("c") == {}
+
+def test_profiles_are_shared_through_redis(clock):
+    server = fakeredis.FakeServer()
+    consumer, api = _store(fakeredis.FakeRedis(server=server)), _store(fakeredis.FakeRedis(server=server))
+
+    consumer.record("s1", 7, "purchase")
+    assert api.get("s1") == {7: 5.0}
+    assert 0 < api.client.ttl(api.key("s1")) <= 60
+
+    # The API's local copy is re-read once it is older than SESSION_REDIS_REFRESH_SECONDS
+    consumer.record("s1", 8, "view")
+    clock.now += sessions.settings.SESSION_REDIS_REFRESH_SECONDS
+    assert set(api.get("s1")) == {7, 8}
+
+def test_redis_errors_fall_back_to_local_profiles(clock):
+    server = fakeredis.FakeServer()
+    store = _store(fakeredis.FakeRedis(server=server))
+    server.connected = False
+
+    store.record("s1", 7, "view")
+
+    assert store.get("s1") == {7: 1.0}
+    assert store.errors >= 1
@@ -0,0 +1,111 @@
+import numpy as np
+
+from app.ml.artifacts import current_version, load_arrays, version_dir
+from app.ml.train import (
+    _solve_side,
+    build_interaction_matrix,
+    build_product_vectors,
+    save_artifacts,
+    stream_interactions,
+    train_als,
+)
+
+# (user_id, product_id, weight) events, with repeated pairs
+PAIRS = [(7, 100, 1.0), (3, 100, 5.0), (7, 100, 3.0), (7, 205, 1.0), (3, 9, 1.0), (3, 100, 1.0)]
+
+def _chunks(pairs, size):
+    pairs = np.array(pairs, dtype=np.float64)
+    for start in range(0, len(pairs), size):
+        block = pairs[start:start + size]
+        yield block[:, 0].astype(np.int64), block[:, 1].astype(np.int64), block[:, 2].astype(np.float32)
+
+def test_interaction_matrix_sums_duplicates_and_compacts_ids():
+    interactions, user_ids, product_ids = build_interaction_matrix(_chunks(PAIRS, 100))
+
+    assert user_ids.tolist() == [3, 7]
+    assert product_ids.tolist() == [9, 100, 205]
+    assert interactions.dtype == np.float32
+    assert interactions.toarray().tolist() == [[1.0, 6.0, 0.0], [0.0, 4.0, 1.0]]
+
+def test_interaction_matrix_merges_the_same_in_small_steps():
+    expected = build_interaction_matrix(_chunks(PAIRS, 100))[0].toarray()
+
+    merged = build_interaction_matrix(_chunks(PAIRS, 1), merge_threshold=2)[0]
+
+    np.testing.assert_array_equal(merged.toarray(), expected)
+
+def test_interaction_matrix_without_events_is_empty():
+    interactions, user_ids, product_ids = build_interaction_matrix(iter(()))
+
+    assert interactions.shape == (0, 0)
+    assert user_ids.size == product_ids.size == 0
+
+def test_solve_side_matches_the_normal_equations():
+    interactions = build_interaction_matrix(_chunks(PAIRS, 100))[0]
+    fixed = np.random.default_rng(0).standard_normal((3, 4)).astype(np.float32)
+
+    solved = _solve_side(interactions, fixed, regularization=0.5, alpha=2.0, workers=2, block_size=1)
+
+    y = fixed.astype(np.float64)
+    confidence = 1.0 + 2.0 * np.array([1.0, 6.0])
+    observed = y[[0, 1]]
+    a = y.T @ y + (observed.T * (confidence - 1.0)) @ observed + 0.5 * np.eye(4)
+    np.testing.assert_allclose(solved[0], np.linalg.solve(a, observed.T @ confidence), rtol=1e-4)
+
+def test_als_ranks_a_users_own_block_first():
+    # Two groups of users, each interacting with its own half of the catalog
+    rng = np.random.default_rng(1)
+    pairs = [(user, item, 1.0) for user in range(40) for item in range(20)
+             if (user < 20) == (item < 10) and rng.random() < 0.6]
+    interactions, user_ids, product_ids = build_interaction_matrix(_chunks(pairs, 1000))
+
+    user_factors, item_factors = train_als(interactions, factors=4, iterations=5, regularization=0.1,
+                                           alpha=10.0, workers=2, block_size=8)
+
+    scores = user_factors @ item_factors.T
+    assert (scores[:20, :10].mean(axis=1) > scores[:20, 10:].mean(axis=1)).all()
+    assert (scores[20:, 10:].mean(axis=1) > scores[20:, :10].mean(axis=1)).all()
+
+def test_stream_interactions_weights_events_by_type(db, monkeypatch):
+    from app.models.user_event import UserEvent
+
+    monkeypatch.setattr("app.core.config.settings.EVENT_WEIGHTS", {"view": 1.0, "purchase": 5.0})
+    db.add_all([UserEvent(user_id=1, product_id=10, event_type="view", session_id="s"),
+                UserEvent(user_id=1, product_id=11, event_type="purchase", session_id="s"),
+                UserEvent(user_id=2, product_id=None, event_type="view", session_id="s"),
+                UserEvent(user_id=2, product_id=10, event_type="search", session_id="s")])
+    db.commit()
+
+    chunks = list(stream_interactions(db, chunk_size=1))
+
+    pairs = sorted((int(u), int(p), float(w)) for users, products, weights in chunks
+                   for u, p, w in zip(users, products, weights))
+    assert pairs == [(1, 10, 1.0), (1, 11, 5.0)]
+    assert len(chunks) == 2
+
+def test_product_vectors_place_similar_text_together(db):
+    from app.models.product import Product
+
+    db.add_all([Product(id=1, name="red running shoe", price=1.0),
+                Product(id=2, name="blue running shoe", description="light trail shoe", price=1.0),
+                Product(id=3, name="cast iron pan", description="heavy kitchen pan", price=1.0)])
+    db.commit()
+
+    product_ids, vectors = build_product_vectors(db, dim=2)
+
+    assert product_ids.tolist() == [1, 2, 3]
+    assert vectors.shape == (3, 2)
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    assert normalized[0] @ normalized[1] > normalized[0] @ normalized[2]
+
+def test_save_artifacts_publishes_a_new_version(tmp_path):
+    cf = {"user_ids": np.array([1]), "user_factors": np.ones((1, 2), dtype=np.float32),
+          "item_ids": np.array([5, 6]), "item_factors": np.eye(2, dtype=np.float32), "global_mean": 0.0}
+    cb = {"product_ids": np.array([5, 6]), "product_vectors": np.eye(2, dtype=np.float32)}
+
+    version = save_artifacts(cf, cb, str(tmp_path), version="v1", ann=False)
+
+    assert current_version(str(tmp_path)) == "v1"
+    loaded = load_arrays(f"{version_dir(str(tmp_path), version)}/cf")
+    assert loaded["item_ids"].tolist() == [5, 6]
+    assert loaded["version"] == "v1"
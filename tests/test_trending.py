@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from app.services.catalog import CatalogSnapshot
+from app.services.trending import TrendingCounters
+
+HALF_LIFE = 100.0
+
+@pytest.fixture
+def counters(tmp_path):
+    return TrendingCounters(use_redis=False, path=str(tmp_path / "trending.json"), half_life=HALF_LIFE)
+
+def _decayed(counters, now):
+    ids, scores = counters.counters(now)
+    return dict(zip(ids.tolist(), scores.tolist()))
+
+def test_counters_halve_every_half_life(counters):
+    start = counters._landmark
+
+    counters.record_batch([(1, "view"), (2, "purchase"), (1, "cart_add"), (3, "search")], now=start)
+    counters.record_batch([(2, "view")], now=start + HALF_LIFE)
+
+    assert _decayed(counters, start + HALF_LIFE) == pytest.approx({1: 2.0, 2: 3.5})
+    assert _decayed(counters, start + 2 * HALF_LIFE) == pytest.approx({1: 1.0, 2: 1.75})
+
+def test_moving_the_landmark_keeps_the_scores(counters):
+    start = counters._landmark
+    # Far enough that the forward-decay boost would overflow without a rescale
+    later = start + 2000 * HALF_LIFE
+
+    counters.record_batch([(1, "purchase")], now=start)
+    counters.record_batch([(2, "view")], now=later)
+
+    assert counters._landmark == later
+    scores = _decayed(counters, later + HALF_LIFE)
+    assert scores[2] == pytest.approx(0.5)
+    assert scores[1] == pytest.approx(0.0)
+    assert np.isfinite(list(scores.values())).all()
+
+def test_pruning_keeps_the_highest_counters(tmp_path):
+    counters = TrendingCounters(use_redis=False, path=str(tmp_path / "trending.json"), half_life=HALF_LIFE,
+                                max_tracked=4)
+
+    counters.record_batch([(product_id, "view") for product_id in range(1, 11) for _ in range(product_id)],
+                          now=counters._landmark)
+
+    assert sorted(_decayed(counters, counters._landmark)) == [7, 8, 9, 10]
+
+def test_snapshot_ranks_products_and_categories(counters):
+    # Products 1..4; 1 and 2 in category 10, 2 and 3 in category 20, 4 uncategorized
+    catalog = CatalogSnapshot(np.array([1, 2, 3, 4]), np.ones(4, dtype=np.float32), np.ones(4, dtype=np.int32),
+                              np.array([0, 1, 3, 4, 4]), np.array([10, 10, 20, 20], dtype=np.int32))
+    counters.record_batch([(1, "view"), (2, "cart_add"), (3, "purchase"), (4, "view"), (99, "purchase")],
+                          now=counters._landmark)
+
+    snapshot = counters.build_snapshot(catalog, now=counters._landmark)
+
+    assert [product_id for product_id, _ in snapshot["products"]] == [3, 99, 2, 1, 4]
+    assert snapshot["categories"] == [[20, 8.0], [10, 4.0]]
+    assert snapshot["by_category"] == {"10": [[2, 3.0], [1, 1.0]], "20": [[3, 5.0], [2, 3.0]]}
+
+def test_published_snapshot_is_read_by_other_processes_and_restored(counters):
+    counters.record_batch([(1, "view"), (2, "purchase")])
+    counters.publish()
+
+    reader = TrendingCounters(use_redis=False, path=counters.path, half_life=HALF_LIFE)
+    assert [product_id for product_id, _ in reader.top(5)] == [2, 1]
+    assert reader.top(5, category_id=10) == []
+
+    restarted = TrendingCounters(use_redis=False, path=counters.path, half_life=HALF_LIFE)
+    assert restarted.restore() == 2
+    assert _decayed(restarted, restarted._landmark) == pytest.approx({1: 1.0, 2: 5.0}, rel=1e-3)